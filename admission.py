@@ -0,0 +1,251 @@
+import hashlib
+import json
+import math
+import os
+import time
+from typing import Optional
+from metrics import registry, Counter
+
+# Priority classes for /api/funcs/<name>. Writes and offer responses must keep
+# working while technician apps poll; list reads are shed first.
+CRITICAL_FUNCS = {
+    "service.bookService", "technician.acceptAssignment", "technician.rejectAssignment",
+    "service.updateStatus", "user.cancelBooking", "user.register", "user.login",
+    "technician.register", "technician.login", "utils.registerPushToken",
+}
+LOW_FUNCS = {
+    "technician.viewAssignmentRequests", "technician.viewAssignedBookings", "technician.viewBookingHistory",
+    "notification.viewNotifications", "user.viewBookedServices",
+}
+# Never limited: health/scrape endpoints and docs
+EXEMPT_PATHS = {"/api/warm", "/api/metrics", "/api/docs", "/api/redoc", "/api/openapi.json"}
+# Long-lived streams: connecting is rate limited, but an open stream is mostly idle
+# and does not count towards the in-flight requests that trigger shedding
+STREAM_PATHS = {"/api/funcs/technician.offerStream", "/api/funcs/user.bookingUpdates"}
+# Admitted per inner call (BatchAdmission), in the class of each call's func
+BATCH_PATH = "/api/funcs/batch"
+
+# class -> (tokens per second, burst) per client; ADMISSION_RATES="low=2:10,normal=10:40,critical=10:20"
+DEFAULT_RATES = {"low": (2.0, 10.0), "normal": (10.0, 40.0), "critical": (10.0, 20.0)}
+# Per-IP bucket on top of the per-client one, so minting fresh tokens does not help
+DEFAULT_IP_RATE = (50.0, 200.0)
+# Shedding starts for a class once in-flight requests reach this share of ADMISSION_MAX_INFLIGHT
+SHED_THRESHOLDS = {"low": 0.5, "normal": 0.8, "critical": 1.0}
+
+admission_total = registry.register(Counter("fixel_admission_total", "Admission decisions by priority class and outcome (admitted, rate_limited, shed).", ("class", "outcome")))
+
+
+def parse_rates(value: Optional[str]) -> dict[str, tuple[float, float]]:
+    rates = dict(DEFAULT_RATES)
+    for part in (value or "").split(","):
+        name, _, spec = part.strip().partition("=")
+        if not spec:
+            continue
+        try:
+            rate, _, burst = spec.partition(":")
+            rates[name] = (float(rate), float(burst or rate))
+        except ValueError:
+            print(f"Warning: ignoring invalid ADMISSION_RATES entry {part!r}")
+    return rates
+
+
+def priority_class(path: str) -> Optional[str]:
+    """None means exempt."""
+    if path in EXEMPT_PATHS:
+        return None
+    if path.startswith("/api/funcs/"):
+        func = path[len("/api/funcs/"):]
+        if func in CRITICAL_FUNCS:
+            return "critical"
+        if func in LOW_FUNCS:
+            return "low"
+    return "normal"
+
+
+class TokenBuckets:
+    """
+    Token buckets keyed by an 8-byte digest, holding [tokens, last_refill].
+
+    At most max_entries buckets are kept; the least recently used is dropped
+    first. A dropped bucket comes back full, which only ever errs towards
+    admitting, so the cap bounds memory without locking anyone out.
+    """
+
+    def __init__(self, max_entries: int = 50_000):
+        self.max_entries = max_entries
+        self._buckets: dict[bytes, list[float]] = {}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key: bytes, rate: float, burst: float, now: Optional[float] = None) -> float:
+        """Takes one token. Returns 0 when admitted, otherwise seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = [burst, now]
+            if len(self._buckets) >= self.max_entries:
+                del self._buckets[next(iter(self._buckets))]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        # Re-inserting keeps the dict in least-recently-used order
+        self._buckets[key] = bucket
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate if rate > 0 else 60.0
+
+    def refund(self, key: bytes, burst: float):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(burst, bucket[0] + 1)
+
+
+def _digest(*parts: str) -> bytes:
+    return hashlib.blake2b("\0".join(parts).encode(), digest_size=8).digest()
+
+
+class BatchAdmission:
+    """
+    Admits the calls inside one /api/funcs/batch request as if each had come
+    on its own: one token from the client's bucket for the func's class plus
+    one from the IP bucket, and one in-flight slot held until the batch ends.
+    The middleware leaves it in scope["admission"] for the batch runner.
+    """
+
+    def __init__(self, middleware: "AdmissionMiddleware", client: tuple[str, str], ip: str):
+        self.middleware = middleware
+        self.client = client
+        self.ip = ip
+        self.held = 0
+
+    def admit(self, func: str) -> Optional[tuple[int, str, float]]:
+        """None when the call may run, else (status, detail, retry_after)."""
+        rejection = self.middleware.check(priority_class(f"/api/funcs/{func}"), self.client, self.ip)
+        if rejection is None:
+            self.middleware.inflight += 1
+            self.held += 1
+        return rejection
+
+    def release(self):
+        self.middleware.inflight -= self.held
+        self.held = 0
+
+
+class AdmissionMiddleware:
+    """
+    In-process admission control in front of the app:
+
+    1. Rate limit: one token bucket per (client, priority class) plus one per IP.
+       The client is the bearer token when present (hashed; it is not verified
+       here, so a forged token cannot drain someone else's bucket), else the IP.
+    2. Load shedding: when in-flight requests on this worker pass the class's
+       share of max_inflight, the request is rejected before any work is done.
+
+    Rejections are 429 (rate limited) or 503 (shed) with Retry-After.
+    """
+
+    def __init__(self, app, enabled: Optional[bool] = None, rates: Optional[dict] = None, ip_rate: Optional[tuple[float, float]] = None, max_inflight: Optional[int] = None, max_buckets: Optional[int] = None, trust_forwarded: Optional[bool] = None):
+        self.app = app
+        self.enabled = enabled if enabled is not None else os.environ.get("ADMISSION_ENABLED", "1").lower() not in ("0", "false", "no", "off")
+        self.rates = rates or parse_rates(os.environ.get("ADMISSION_RATES"))
+        self.ip_rate = ip_rate or DEFAULT_IP_RATE
+        self.max_inflight = max_inflight or int(os.environ.get("ADMISSION_MAX_INFLIGHT", "256"))
+        self.buckets = TokenBuckets(max_buckets or int(os.environ.get("ADMISSION_MAX_BUCKETS", "50000")))
+        # Only behind a proxy that sets X-Forwarded-For: on by default on Vercel,
+        # off elsewhere (the server.py mode talks to clients directly)
+        self.trust_forwarded = trust_forwarded if trust_forwarded is not None else os.environ.get("ADMISSION_TRUST_FORWARDED", "1" if os.environ.get("VERCEL") else "0") == "1"
+        self.inflight = 0
+
+    def client_ip(self, scope, headers: dict[bytes, bytes]) -> str:
+        forwarded = headers.get(b"x-forwarded-for")
+        if self.trust_forwarded and forwarded:
+            # The rightmost entry is the one our proxy appended; anything left of
+            # it came from the client and can be made up
+            return forwarded.split(b",")[-1].strip().decode("latin-1")
+        client = scope.get("client")
+        return client[0] if client else "unknown"
+
+    async def reject(self, scope, send, status: int, detail: str, retry_after: float):
+        if scope["type"] == "websocket":
+            # Closing before accept makes the server answer the handshake with 403
+            await send({"type": "websocket.close", "code": 1013, "reason": detail})
+            return
+        body = json.dumps({"detail": detail}).encode()
+        await send({"type": "http.response.start", "status": status, "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+        ]})
+        await send({"type": "http.response.body", "body": body})
+
+    def shed(self, klass: str) -> bool:
+        return self.inflight >= self.max_inflight * SHED_THRESHOLDS.get(klass, 1.0)
+
+    def check(self, klass: str, client: tuple[str, str], ip: str) -> Optional[tuple[int, str, float]]:
+        """None when admitted, else (status, detail, retry_after). Counts the decision."""
+        # 1. Shed before spending anything else on the request
+        if self.shed(klass):
+            admission_total.inc(klass, "shed")
+            return 503, "Server busy, retry later", 1
+
+        # 2. Per-client and per-IP token buckets
+        client_key = _digest(*client, klass)
+        rate, burst = self.rates.get(klass, DEFAULT_RATES["normal"])
+        wait = self.buckets.take(client_key, rate, burst)
+        if not wait:
+            ip_key = _digest("ip-total", ip)
+            wait = self.buckets.take(ip_key, *self.ip_rate)
+            if wait:
+                # Do not charge the client for a request that was not served
+                self.buckets.refund(client_key, burst)
+        if wait:
+            admission_total.inc(klass, "rate_limited")
+            return 429, "Too many requests", wait
+
+        admission_total.inc(klass, "admitted")
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+        klass = priority_class(scope.get("path", ""))
+        if klass is None:
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers", []))
+        ip = self.client_ip(scope, headers)
+        authorization = headers.get(b"authorization")
+        client = ("token", authorization.decode("latin-1")) if authorization else ("ip", ip)
+
+        if scope.get("path") == BATCH_PATH and scope["type"] == "http":
+            # The envelope costs nothing by itself; each call in it is charged
+            # by the runner. A busy worker still turns the whole batch away.
+            if self.shed(klass):
+                admission_total.inc(klass, "shed")
+                await self.reject(scope, send, 503, "Server busy, retry later", 1)
+                return
+            calls = scope["admission"] = BatchAdmission(self, client, ip)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                calls.release()
+            return
+
+        rejection = self.check(klass, client, ip)
+        if rejection is not None:
+            await self.reject(scope, send, *rejection)
+            return
+
+        if scope.get("path") in STREAM_PATHS:
+            await self.app(scope, receive, send)
+            return
+        self.inflight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.inflight -= 1
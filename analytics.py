@@ -0,0 +1,64 @@
+from typing import Optional
+from fastapi import HTTPException
+
+# Longest rolling window analytics_daily is read for
+ANALYTICS_MAX_DAYS = 90
+
+
+def analytics_ratio(numerator: float, denominator: float) -> Optional[float]:
+    return round(numerator / denominator, 4) if denominator else None
+
+
+def summarize_analytics(rows: list[dict]) -> dict:
+    """
+    Turns analytics_snapshot rows ({"metric", "key", "count", "total"}, see
+    supabase/migrations/*_analytics.sql) into the admin.analytics payload.
+    """
+    totals: dict[str, dict[str, tuple[float, float]]] = {}
+    for row in rows:
+        totals.setdefault(row["metric"], {})[row["key"]] = (float(row["count"] or 0), float(row["total"] or 0))
+
+    def count(metric: str) -> int:
+        return int(sum(c for c, _ in totals.get(metric, {}).values()))
+
+    technicians, busy = count("technicians"), count("technicians_busy")
+    answered = {status: count(f"offers_{status}") for status in ("accepted", "rejected", "expired")}
+    assigned = totals.get("time_to_assign", {})
+    assigned_count = sum(c for c, _ in assigned.values())
+
+    services = sorted(set(totals.get("bookings_created", {})) | set(totals.get("bookings_completed", {})) | set(assigned), key=lambda k: (len(k), k))
+    by_service = []
+    for key in services:
+        completed, revenue = totals.get("bookings_completed", {}).get(key, (0, 0))
+        to_assign, seconds = assigned.get(key, (0, 0))
+        by_service.append({
+            "service_id": int(key) if key.isdigit() else key,
+            "bookings": int(totals.get("bookings_created", {}).get(key, (0, 0))[0]),
+            "completed": int(completed),
+            "cancelled": int(totals.get("bookings_cancelled", {}).get(key, (0, 0))[0]),
+            "revenue": revenue,
+            "avg_time_to_assign_seconds": analytics_ratio(seconds, to_assign),
+        })
+
+    return {
+        "technicians": {"total": technicians, "busy": busy, "utilization": analytics_ratio(busy, technicians)},
+        "offers": {
+            "sent": count("offers_sent"),
+            **answered,
+            "acceptance_rate": analytics_ratio(answered["accepted"], sum(answered.values())),
+        },
+        "time_to_assign": {
+            "assigned": int(assigned_count),
+            "avg_seconds": analytics_ratio(sum(s for _, s in assigned.values()), assigned_count),
+        },
+        "revenue": sum(item["revenue"] for item in by_service),
+        "services": by_service,
+    }
+
+
+async def fetch_analytics(sbase, days: Optional[int] = None) -> dict:
+    """All-time figures, or the last `days` UTC days (technician counts are always current)."""
+    if days is not None and not 1 <= days <= ANALYTICS_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"days must be between 1 and {ANALYTICS_MAX_DAYS}")
+    res = await sbase.rpc("analytics_snapshot", {"p_days": days}).execute()
+    return {"days": days, **summarize_analytics(res.data or [])}
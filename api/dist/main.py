@@ -1,51 +1,701 @@
 # AUTO-GENERATED FILE. DO NOT EDIT MANUALLY.
-# Source: D:\application\project2\FixelBackend
+# Source: /root/package
 # This file is generated by merging multiple modules.
 
-# --- EXTERNAL IMPORTS ---
 from dotenv import load_dotenv
+from bisect import bisect_left
+from collections import deque
+from contextlib import asynccontextmanager
+from contextlib import contextmanager
 from datetime import datetime
-from email.message import EmailMessage
-from fastapi import BackgroundTasks, FastAPI, HTTPException
+from datetime import datetime, timezone
 from fastapi import Depends, HTTPException, Header
+from fastapi import Depends, HTTPException, Header, Request, WebSocket
+from fastapi import FastAPI, HTTPException
+from fastapi import HTTPException
+from fastapi import HTTPException, Request
+from fastapi.encoders import jsonable_encoder
+from fastapi.params import Depends as DependsParam, Header as HeaderParam
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.responses import StreamingResponse
+from fastapi.routing import APIRoute
+from importlib.util import find_spec
+from pathlib import Path
+from postgrest.exceptions import APIError
 from pydantic import BaseModel
-from supabase import AsyncClient, Client, create_async_client, create_client
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from pydantic import BaseModel, ValidationError
+from pydantic import TypeAdapter
+from starlette.requests import ClientDisconnect
+from supabase import AsyncClient, AsyncClientOptions, create_async_client
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+from typing import Any, Awaitable, Callable, Hashable, Optional
+from typing import Any, Awaitable, Callable, Iterable, Optional
+from typing import Any, Awaitable, Callable, Optional
+from typing import Any, Awaitable, Optional
+from typing import Any, Callable
+from typing import Any, Callable, Optional
 from typing import Any, Dict, List, Optional
+from typing import Any, Optional
+from typing import AsyncIterator, Callable, Optional
+from typing import AsyncIterator, Iterable, Iterator, Optional
+from typing import AsyncIterator, Optional
+from typing import Callable, Iterable, Optional
+from typing import Literal, Optional
 from typing import Optional
 from uuid import UUID
+import asyncio
+import contextvars
+import csv
+import hashlib
+import hmac
+import httpx
+import inspect
+import io
+import itertools
+import json
+import math
 import os
-import smtplib
-
-# Prioritizing load_dotenv as requested
+import random
+import re
+import struct
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
 try:
     load_dotenv()
 except NameError:
-    pass # load_dotenv not imported as bare name (e.g. maybe aliased or from dotenv import *)
+    pass
 except Exception as e:
     print(f'Warning: Early load_dotenv() failed: {e}')
+ANALYTICS_MAX_DAYS = 90
 
+def analytics_ratio(numerator: float, denominator: float) -> Optional[float]:
+    return round(numerator / denominator, 4) if denominator else None
 
-# --- MODULE: db (db.py) ---
+def summarize_analytics(rows: list[dict]) -> dict:
+    """
+    Turns analytics_snapshot rows ({"metric", "key", "count", "total"}, see
+    supabase/migrations/*_analytics.sql) into the admin.analytics payload.
+    """
+    totals: dict[str, dict[str, tuple[float, float]]] = {}
+    for row in rows:
+        totals.setdefault(row['metric'], {})[row['key']] = (float(row['count'] or 0), float(row['total'] or 0))
+
+    def count(metric: str) -> int:
+        return int(sum((c for c, _ in totals.get(metric, {}).values())))
+    technicians, busy = (count('technicians'), count('technicians_busy'))
+    answered = {status: count(f'offers_{status}') for status in ('accepted', 'rejected', 'expired')}
+    assigned = totals.get('time_to_assign', {})
+    assigned_count = sum((c for c, _ in assigned.values()))
+    services = sorted(set(totals.get('bookings_created', {})) | set(totals.get('bookings_completed', {})) | set(assigned), key=lambda k: (len(k), k))
+    by_service = []
+    for key in services:
+        completed, revenue = totals.get('bookings_completed', {}).get(key, (0, 0))
+        to_assign, seconds = assigned.get(key, (0, 0))
+        by_service.append({'service_id': int(key) if key.isdigit() else key, 'bookings': int(totals.get('bookings_created', {}).get(key, (0, 0))[0]), 'completed': int(completed), 'cancelled': int(totals.get('bookings_cancelled', {}).get(key, (0, 0))[0]), 'revenue': revenue, 'avg_time_to_assign_seconds': analytics_ratio(seconds, to_assign)})
+    return {'technicians': {'total': technicians, 'busy': busy, 'utilization': analytics_ratio(busy, technicians)}, 'offers': {'sent': count('offers_sent'), **answered, 'acceptance_rate': analytics_ratio(answered['accepted'], sum(answered.values()))}, 'time_to_assign': {'assigned': int(assigned_count), 'avg_seconds': analytics_ratio(sum((s for _, s in assigned.values())), assigned_count)}, 'revenue': sum((item['revenue'] for item in by_service)), 'services': by_service}
+
+async def fetch_analytics(sbase, days: Optional[int]=None) -> dict:
+    """All-time figures, or the last `days` UTC days (technician counts are always current)."""
+    if days is not None and (not 1 <= days <= ANALYTICS_MAX_DAYS):
+        raise HTTPException(status_code=400, detail=f'days must be between 1 and {ANALYTICS_MAX_DAYS}')
+    res = await sbase.rpc('analytics_snapshot', {'p_days': days}).execute()
+    return {'days': days, **summarize_analytics(res.data or [])}
+DEFAULT_CALL_TIMEOUT = 10.0
+
+class Step:
+    """An awaitable plus the per-call options used by fan_out."""
+
+    def __init__(self, awaitable: Awaitable, timeout: Optional[float]=DEFAULT_CALL_TIMEOUT, name: Optional[str]=None):
+        self.awaitable = awaitable
+        self.timeout = timeout
+        self.name = name
+
+def step(awaitable: Awaitable, timeout: Optional[float]=DEFAULT_CALL_TIMEOUT, name: Optional[str]=None) -> Step:
+    return Step(awaitable, timeout=timeout, name=name)
+
+async def _run_isolated(item: Step):
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(item.timeout):
+            return await item.awaitable
+    except TimeoutError as e:
+        elapsed = time.perf_counter() - started
+        print(f'Fan-out step {item.name or '?'} timed out after {elapsed:.2f}s')
+        return e
+    except Exception as e:
+        print(f'Fan-out step {item.name or '?'} failed: {e}')
+        return e
 
-load_dotenv()
+async def fan_out(*items: Awaitable | Step) -> list[Any]:
+    """
+    Runs independent awaitables concurrently inside a TaskGroup.
 
-url: str = os.environ.get("SUPABASE_URL")
-key: str = os.environ.get("SUPABASE_KEY")
+    Each call gets its own timeout and its failures are isolated: the result list
+    (in argument order) holds either the value or the exception instance, and one
+    failing step never cancels its siblings. Cancelling the caller still cancels
+    every child, which plain asyncio.gather does not guarantee.
+    """
+    steps = [item if isinstance(item, Step) else Step(item) for item in items]
+    if not steps:
+        return []
+    async with asyncio.TaskGroup() as tg:
+        tasks = [tg.create_task(_run_isolated(s)) for s in steps]
+    return [t.result() for t in tasks]
+
+def unwrap(result: Any) -> Any:
+    """Re-raises an exception captured by fan_out, otherwise returns the value."""
+    if isinstance(result, BaseException):
+        raise result
+    return result
+BOOKING_EVENT_TYPES = ('booking_created', 'offer_sent', 'offer_rejected', 'accepted', 'status_changed', 'cancelled')
+EVENT_PAGE_ROWS = int(os.environ.get('EVENT_PAGE_ROWS', '5000'))
+SEGMENT_BLOCK_EVENTS = int(os.environ.get('SEGMENT_BLOCK_EVENTS', '4096'))
+SEGMENT_MAX_BYTES = int(os.environ.get('SEGMENT_MAX_BYTES', str(64 * 1024 * 1024)))
+SEGMENT_MAGIC = b'FXEV1\n'
+SEGMENT_BLOCK = struct.Struct('<III')
+SEGMENT_RECORD = struct.Struct('<QqqBd16s')
+NO_TECHIE = bytes(16)
+ASSIGNMENT_DONE = ('completed', 'cancelled')
+
+def event_time(value) -> float:
+    """created_at as epoch seconds (the log returns ISO strings, segments store floats)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp()
+
+def event_position(event: dict) -> tuple[int, int]:
+    """(xid, id): the order events are read and replayed in."""
+    return (int(event.get('xid') or 0), int(event['id']))
+
+class EventSegmentWriter:
+    """
+    Appends events to numbered segment files (00000001.seg, ...) in a directory.
 
-if not url or not key:
-    # Fail gracefully or warn if env vars are missing, but for now let's raise/print
-    print("Warning: SUPABASE_URL or SUPABASE_KEY not set in environment.")
-    print(f"DEBUG: URL={url}, KEY={key}")
+    Events are buffered and written SEGMENT_BLOCK_EVENTS at a time as one
+    zlib-compressed block, so a segment costs a few bytes per event and one
+    write per block. A writer never touches existing segments: it starts after
+    the highest number there, and rolls over past SEGMENT_MAX_BYTES.
+    """
 
-async def get_supabase():
-    return await create_async_client(url or "", key or "")
+    def __init__(self, directory, block_events: int=SEGMENT_BLOCK_EVENTS, max_bytes: int=SEGMENT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.block_events = block_events
+        self.max_bytes = max_bytes
+        self.pending: list[bytes] = []
+        self.pending_data: list[dict] = []
+        self.file = None
+        self.number = max((int(p.stem) for p in self.directory.glob('*.seg') if p.stem.isdigit()), default=0)
+        self.written = 0
+
+    def append(self, event: dict):
+        techie = event.get('techie_id')
+        self.pending.append(SEGMENT_RECORD.pack(int(event.get('xid') or 0), int(event['id']), int(event['booking_id']), BOOKING_EVENT_TYPES.index(event['type']), event_time(event['created_at']), uuid.UUID(str(techie)).bytes if techie else NO_TECHIE))
+        self.pending_data.append(event.get('data') or {})
+        if len(self.pending) >= self.block_events:
+            self.flush()
+
+    def extend(self, events: Iterable[dict]):
+        for event in events:
+            self.append(event)
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self.file is None or self.file.tell() >= self.max_bytes:
+            self._next_segment()
+        block = zlib.compress(b''.join(self.pending) + json.dumps(self.pending_data, separators=(',', ':')).encode(), 6)
+        self.file.write(SEGMENT_BLOCK.pack(len(block), zlib.crc32(block), len(self.pending)) + block)
+        self.file.flush()
+        self.written += len(self.pending)
+        self.pending, self.pending_data = ([], [])
+
+    def _next_segment(self):
+        if self.file is not None:
+            self.file.close()
+        self.number += 1
+        self.file = open(self.directory / f'{self.number:08d}.seg', 'xb')
+        self.file.write(SEGMENT_MAGIC)
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_event_segment(path) -> Iterator[dict]:
+    """Events of one segment file. A torn last block (the writer died mid-write) ends it."""
+    techies = {NO_TECHIE: None}
+    with open(path, 'rb') as f:
+        if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError(f'{path} is not an event segment')
+        while (header := f.read(SEGMENT_BLOCK.size)):
+            if len(header) < SEGMENT_BLOCK.size:
+                print(f'Event segment {path}: ignoring a torn block header')
+                return
+            size, crc, count = SEGMENT_BLOCK.unpack(header)
+            block = f.read(size)
+            if len(block) < size or zlib.crc32(block) != crc:
+                print(f'Event segment {path}: ignoring a torn or corrupt block')
+                return
+            raw = zlib.decompress(block)
+            split = count * SEGMENT_RECORD.size
+            for (xid, event_id, booking_id, kind, at, techie), data in zip(SEGMENT_RECORD.iter_unpack(raw[:split]), json.loads(raw[split:])):
+                if techie not in techies:
+                    techies[techie] = str(uuid.UUID(bytes=techie))
+                yield {'id': event_id, 'booking_id': booking_id, 'type': BOOKING_EVENT_TYPES[kind], 'techie_id': techies[techie], 'data': data, 'created_at': at, 'xid': xid}
+
+def event_segments(directory) -> list[Path]:
+    return sorted((p for p in Path(directory).glob('*.seg') if p.stem.isdigit()))
+
+def read_event_segments(directory) -> Iterator[dict]:
+    """Every event in a segment directory, in the order it was written."""
+    for path in event_segments(directory):
+        yield from read_event_segment(path)
+
+def last_segment_position(directory) -> Optional[tuple[int, int]]:
+    """(xid, id) of the last event written to a directory, to resume reading the log after."""
+    for path in reversed(event_segments(directory)):
+        last = None
+        for last in read_event_segment(path):
+            pass
+        if last is not None:
+            return event_position(last)
+    return None
+
+async def fetch_booking_history(sbase, booking_id: int) -> list[dict]:
+    """One booking's events, oldest first (booking_events_booking_idx)."""
+    res = await sbase.table('booking_events').select('id, type, techie_id, data, created_at').eq('booking_id', booking_id).order('id').execute()
+    return res.data or []
+
+async def fetch_booking_events(sbase, after: Optional[tuple[int, int]]=None, page_rows: Optional[int]=None) -> AsyncIterator[list[dict]]:
+    """
+    Pages of the log after `after` (an (xid, id) position), oldest first, up to
+    the database's current horizon. The next page is fetched while the caller
+    handles the current one.
+    """
+    limit = page_rows or EVENT_PAGE_ROWS
+
+    async def fetch(position):
+        params = {'p_after_xid': str(position[0]) if position else None, 'p_after_id': position[1] if position else None, 'p_limit': limit}
+        res = await sbase.rpc('read_booking_events', params).execute()
+        return (res.data or {}).get('events') or []
+    task = asyncio.create_task(fetch(after))
+    try:
+        while True:
+            page = await task
+            if len(page) < limit:
+                if page:
+                    yield page
+                return
+            task = asyncio.create_task(fetch(event_position(page[-1])))
+            yield page
+    finally:
+        task.cancel()
+
+class BookingEventReplay:
+    """
+    Rebuilds what the database derives from booking writes by folding the log:
+
+    - analytics_totals / analytics_daily, the same metrics as *_analytics.sql
+      except the technician count, which is not a booking event
+    - technician_counters (pending offers, active and completed assignments)
+    - the ids of the bookings seen, whose booking_documents get rebuilt
+
+    Only plain dicts and tuples are touched per event, so a replay costs a
+    few microseconds per event.
+    """
+
+    def __init__(self):
+        self.bookings: dict[int, list] = {}
+        self.offers: dict[int, tuple[int, str]] = {}
+        self.offer_by_pair: dict[tuple[int, str], int] = {}
+        self.assignments: dict[int, tuple[str, Optional[str]]] = {}
+        self.counters: dict[str, list[int]] = {}
+        self.totals: dict[tuple[str, str], list[float]] = {}
+        self.daily: dict[tuple[str, str, str], list[float]] = {}
+        self._days: dict[int, str] = {}
+        self.position: Optional[tuple[int, int]] = None
+        self.events = 0
+
+    def add(self, metric: str, key: str, at: float, count: int, total: float=0):
+        values = self.totals.setdefault((metric, key), [0, 0])
+        values[0] += count
+        values[1] += total
+        day = int(at // 86400)
+        if day not in self._days:
+            self._days[day] = datetime.fromtimestamp(day * 86400, timezone.utc).date().isoformat()
+        values = self.daily.setdefault((self._days[day], metric, key), [0, 0])
+        values[0] += count
+        values[1] += total
+
+    def bump(self, techie_id: Optional[str], pending: int=0, active: int=0, completed: int=0):
+        if techie_id is None:
+            return
+        counts = self.counters.setdefault(techie_id, [0, 0, 0])
+        counts[0] = max(counts[0] + pending, 0)
+        counts[1] = max(counts[1] + active, 0)
+        counts[2] = max(counts[2] + completed, 0)
+
+    def bump_assignment(self, techie_id: Optional[str], status: Optional[str], sign: int):
+        if status is not None:
+            self.bump(techie_id, 0, sign * (status not in ASSIGNMENT_DONE), sign * (status == 'completed'))
+
+    def apply(self, event: dict):
+        kind = event['type']
+        data = event.get('data') or {}
+        booking_id = event['booking_id']
+        techie_id = event.get('techie_id')
+        at = event_time(event['created_at'])
+        booking = self.bookings.get(booking_id)
+        self.position = event_position(event)
+        self.events += 1
+        if kind == 'booking_created':
+            service = str(data.get('service_id') or '')
+            self.bookings[booking_id] = [service, at, data.get('status'), False]
+            self.add('bookings_created', service, at, 1)
+        elif kind == 'offer_sent':
+            status = data.get('status') or 'pending'
+            self.add('offers_sent', '', at, 1)
+            if status == 'pending':
+                self.offers[data['request_id']] = (booking_id, techie_id)
+                self.offer_by_pair[booking_id, techie_id] = data['request_id']
+                self.bump(techie_id, 1)
+            else:
+                self.add(f'offers_{status}', '', at, 1)
+        elif kind == 'offer_rejected':
+            if self._close_offer(data.get('request_id')):
+                self.bump(techie_id, -1)
+            self.add(f'offers_{data.get('status') or 'rejected'}', '', at, 1)
+        elif kind == 'accepted':
+            if self._close_offer(self.offer_by_pair.get((booking_id, techie_id))):
+                self.bump(techie_id, -1)
+                self.add('offers_accepted', '', at, 1)
+            status = data.get('status')
+            self.assignments[data['assignment_id']] = (techie_id, status)
+            self.bump_assignment(techie_id, status, 1)
+            if booking is not None and (not booking[3]):
+                booking[3] = True
+                self.add('time_to_assign', booking[0], at, 1, at - booking[1])
+        elif 'assignment_id' in data:
+            techie_id, status = self.assignments.get(data['assignment_id'], (techie_id, data.get('from')))
+            self.bump_assignment(techie_id, status, -1)
+            self.bump_assignment(techie_id, data.get('to'), 1)
+            self.assignments[data['assignment_id']] = (techie_id, data.get('to'))
+        else:
+            service = booking[0] if booking is not None else str(data.get('service_id') or '')
+            old, new = (booking[2] if booking is not None else data.get('from'), data.get('to'))
+            revenue = float(data.get('revenue') or 0)
+            if old == 'completed':
+                self.add('bookings_completed', service, at, -1, -revenue)
+            elif old == 'cancelled':
+                self.add('bookings_cancelled', service, at, -1)
+            if new == 'completed':
+                self.add('bookings_completed', service, at, 1, revenue)
+            elif new == 'cancelled':
+                self.add('bookings_cancelled', service, at, 1)
+            if booking is not None:
+                booking[2] = new
+
+    def _close_offer(self, request_id: Optional[int]) -> bool:
+        pair = self.offers.pop(request_id, None)
+        if pair is None:
+            return False
+        if self.offer_by_pair.get(pair) == request_id:
+            del self.offer_by_pair[pair]
+        return True
+
+    def apply_all(self, events: Iterable[dict]) -> 'BookingEventReplay':
+        for event in events:
+            self.apply(event)
+        return self
+
+    def technician_counters(self) -> list[dict]:
+        return [{'techie_id': techie_id, 'pending_offers': p, 'active_assignments': a, 'completed_assignments': c} for techie_id, (p, a, c) in self.counters.items()]
+
+    def analytics_totals(self) -> list[dict]:
+        """analytics_totals rows, technicians_busy included."""
+        rows = [{'metric': m, 'key': k, 'count': c, 'total': t} for (m, k), (c, t) in self.totals.items() if c or t]
+        busy = sum((1 for _, active, _ in self.counters.values() if active > 0))
+        return rows + [{'metric': 'technicians_busy', 'key': '', 'count': busy, 'total': 0}]
+
+    def analytics_daily(self) -> list[dict]:
+        return [{'day': d, 'metric': m, 'key': k, 'count': c, 'total': t} for (d, m, k), (c, t) in self.daily.items() if c or t]
+
+    def analytics_rows(self, days: Optional[int]=None, today: Optional[str]=None) -> list[dict]:
+        """What analytics_snapshot(days) would return after these events (see analytics.summarize_analytics)."""
+        totals = self.analytics_totals()
+        if days is None:
+            return totals
+        today = today or datetime.now(timezone.utc).date().isoformat()
+        first = datetime.fromordinal(datetime.fromisoformat(today).toordinal() - days + 1).date().isoformat()
+        window: dict[tuple[str, str], list[float]] = {}
+        for (day, metric, key), (count, total) in self.daily.items():
+            if day >= first:
+                values = window.setdefault((metric, key), [0, 0])
+                values[0] += count
+                values[1] += total
+        rows = [{'metric': m, 'key': k, 'count': c, 'total': t} for (m, k), (c, t) in window.items() if c or t]
+        return rows + [row for row in totals if row['metric'] == 'technicians_busy']
+
+async def apply_booking_projections(sbase, replay: BookingEventReplay, refresh_rows: int=1000) -> dict:
+    """
+    Writes a replay back: analytics and technician_counters in one
+    transaction (replace_booking_projections), then the booking documents of
+    every booking in the log, refresh_rows at a time.
+    """
+    xid, event_id = replay.position or (None, None)
+    res = await sbase.rpc('replace_booking_projections', {'p_xid': str(xid) if xid is not None else None, 'p_id': event_id, 'p_totals': replay.analytics_totals(), 'p_daily': replay.analytics_daily(), 'p_counters': replay.technician_counters()}).execute()
+    outcome = res.data or {}
+    if outcome.get('result') != 'replaced':
+        return outcome
+    ids = sorted(replay.bookings)
+    for start in range(0, len(ids), refresh_rows):
+        await sbase.rpc('refresh_booking_documents', {'p_booking_ids': ids[start:start + refresh_rows]}).execute()
+    return {'result': 'replaced', 'events': replay.events, 'bookings': len(ids), 'technicians': len(replay.counters)}
+_start_hooks: list[Callable[[], Any]] = []
+_stop_hooks: list[Callable[[], Any]] = []
+
+def on_worker_start(fn: Callable[[], Any]) -> Callable[[], Any]:
+    _start_hooks.append(fn)
+    return fn
+
+def on_worker_stop(fn: Callable[[], Any]) -> Callable[[], Any]:
+    _stop_hooks.append(fn)
+    return fn
+
+async def _run_hooks(hooks: list[Callable[[], Any]], phase: str) -> dict[str, float]:
+    timings = {}
+    for hook in hooks:
+        started = time.perf_counter()
+        try:
+            result = hook()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            print(f'Worker {os.getpid()} {phase} hook {hook.__name__} failed: {e}')
+        timings[hook.__name__] = (time.perf_counter() - started) * 1000
+    return timings
+
+async def run_worker_start_hooks() -> dict[str, float]:
+    """Runs the start hooks in registration order and returns their timings in ms."""
+    return await _run_hooks(_start_hooks, 'start')
+
+async def run_worker_stop_hooks() -> dict[str, float]:
+    return await _run_hooks(list(reversed(_stop_hooks)), 'stop')
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _label_text(labelnames: tuple, labels: tuple, extra: str='') -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
 
-# --- MODULE: models (models.py) ---
+class Counter:
+    """
+    Monotonic counter keyed by a tuple of label values.
+
+    Metrics are only ever updated from the worker's event loop thread (blocking
+    work in asyncio.to_thread reports back after the await), so plain dict
+    updates are safe and no lock is taken on the hot path. Each worker process
+    keeps and serves its own values.
+    """
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str]=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float=1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        return [f'{self.name}{_label_text(self.labelnames, labels)} {_number(value)}' for labels, value in sorted(self.values.items())]
+
+class CallbackCounter(Counter):
+    """Counter whose values are read at scrape time from stats another module already keeps."""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str], collect: Callable[[], dict[tuple, float]]):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        try:
+            self.values = dict(self.collect())
+        except Exception as e:
+            print(f'Metrics collector {self.name} failed: {e}')
+        return super().render()
+
+class CallbackGauge(CallbackCounter):
+    """Current values (not totals) read at scrape time."""
+    kind = 'gauge'
+
+class Histogram:
+    """Fixed-bucket histogram; each series is [count per bucket..., +Inf count, sum]."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str]=(), buckets: tuple=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = []
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                le = '+Inf' if bound == float('inf') else _number(bound)
+                bucket_labels = _label_text(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f'{self.name}_bucket{bucket_labels} {cumulative}')
+            lines.append(f'{self.name}_sum{_label_text(self.labelnames, labels)} {_number(series[-1])}')
+            lines.append(f'{self.name}_count{_label_text(self.labelnames, labels)} {cumulative}')
+        return lines
+
+class Registry:
+
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+registry = Registry()
+request_duration = registry.register(Histogram('fixel_http_request_duration_seconds', 'Time spent serving a request, by route template.', ('method', 'route')))
+responses_total = registry.register(Counter('fixel_http_responses_total', 'Responses sent, by route template and status code.', ('method', 'route', 'status')))
+upstream_duration = registry.register(Histogram('fixel_upstream_request_duration_seconds', 'Supabase HTTP calls, by API, table (or rpc/auth endpoint) and operation.', ('api', 'table', 'op')))
+upstream_total = registry.register(Counter('fixel_upstream_requests_total', 'Supabase HTTP calls, by API, table, operation and status code.', ('api', 'table', 'op', 'status')))
+push_sends_total = registry.register(Counter('fixel_push_sends_total', 'Push notification attempts, by outcome.', ('outcome',)))
+upstream_observers: list[Callable[[str, str, str, str, float, float], None]] = []
+
+def cache_counter(name: str, help: str, labelnames: Iterable[str], collect: Callable[[], dict[tuple, float]]) -> CallbackCounter:
+    return registry.register(CallbackCounter(name, help, labelnames, collect))
+
+def callback_gauge(name: str, help: str, labelnames: Iterable[str], collect: Callable[[], dict[tuple, float]]) -> CallbackGauge:
+    return registry.register(CallbackGauge(name, help, labelnames, collect))
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware task/stream overhead) recording
+    latency and status per route template, so /api/funcs/* paths do not explode
+    label cardinality. Requests that match no route are grouped as "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get('route')
+            path = getattr(route, 'path', None) or 'unmatched'
+            method = scope.get('method', '')
+            request_duration.observe(time.perf_counter() - started, method, path)
+            responses_total.inc(method, path, str(status[0]))
+
+def classify_upstream(request: httpx.Request) -> tuple[str, str, str]:
+    """Maps a Supabase URL to (api, table, op), e.g. /rest/v1/bookings PATCH -> (rest, bookings, update)."""
+    parts = [p for p in request.url.path.split('/') if p]
+    method = request.method
+    if len(parts) >= 3 and parts[0] == 'rest':
+        if parts[2] == 'rpc' and len(parts) >= 4:
+            return ('rest', parts[3], 'rpc')
+        if method in ('GET', 'HEAD'):
+            op = 'select'
+        elif method == 'POST':
+            op = 'upsert' if 'merge-duplicates' in request.headers.get('prefer', '') else 'insert'
+        elif method == 'PATCH':
+            op = 'update'
+        else:
+            op = method.lower()
+        return ('rest', parts[2], op)
+    if len(parts) >= 3 and parts[0] == 'auth':
+        return ('auth', parts[2], method.lower())
+    return (parts[0] if parts else 'other', '', method.lower())
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """httpx transport wrapper that times every Supabase call (up to response headers)."""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport]=None):
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        api, table, op = classify_upstream(request)
+        started = time.perf_counter()
+        status = 'error'
+        try:
+            response = await self.transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            upstream_duration.observe(elapsed, api, table, op)
+            upstream_total.inc(api, table, op, status)
+            for observer in upstream_observers:
+                observer(api, table, op, status, started, elapsed)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+def metrics_enabled() -> bool:
+    return bool(os.environ.get('METRICS_TOKEN'))
+
+def metrics_authorized(authorization: Optional[str]) -> bool:
+    token = os.environ.get('METRICS_TOKEN')
+    return bool(token) and authorization is not None and hmac.compare_digest(authorization.encode(), f'Bearer {token}'.encode())
 
 class UserProfile(BaseModel):
     id: UUID
     name: str
-    mob_no: Optional[str] = None # Assuming snake_case consistency
+    mob_no: Optional[str] = None
     address: Optional[str] = None
 
 class Technician(BaseModel):
@@ -53,7 +703,7 @@ class Technician(BaseModel):
     created_at: datetime
     name: str
     phone: Optional[str] = None
-    provider_role_id: Optional[str] = None # Snake_case
+    provider_role_id: Optional[str] = None
 
 class Service(BaseModel):
     id: int
@@ -62,16 +712,16 @@ class Service(BaseModel):
     name: str
     price: int
     description: Optional[str] = None
-    provider_role_id: Optional[str] = None # Snake_case
+    provider_role_id: Optional[str] = None
 
 class Assignment(BaseModel):
     id: int
     created_at: datetime
-    techie_id: UUID # Snake_case
-    service_id: int # Snake_case
-    booking_id: int # Add booking_id
-    scheduled_at: Optional[datetime] = None # Snake_case
-    status: Optional[str] = "active"
+    techie_id: UUID
+    service_id: int
+    booking_id: int
+    scheduled_at: Optional[datetime] = None
+    status: Optional[str] = 'active'
 
 class Booking(BaseModel):
     id: int
@@ -80,15 +730,14 @@ class Booking(BaseModel):
     service_id: int
     scheduled_at: datetime
     assignment_id: Optional[int] = None
-    status: Optional[str] = "pending"
-
+    status: Optional[str] = 'pending'
 
 class AssignmentRequest(BaseModel):
     id: int
     created_at: datetime
     booking_id: int
     techie_id: UUID
-    status: Optional[str] = "pending" # pending, accepted, rejected, expired
+    status: Optional[str] = 'pending'
 
 class Notification(BaseModel):
     id: int
@@ -112,8 +761,6 @@ class BookingItem(BaseModel):
     sub_service_id: int
     price: int
 
-# --- Read/Response Models ---
-
 class SubServiceRead(SubService):
     pass
 
@@ -139,10 +786,914 @@ class AssignmentRequestRead(AssignmentRequest):
 class BookServiceResponse(BaseModel):
     booking: Booking
 
+class TechnicianCounts(BaseModel):
+    pending_offers: int = 0
+    active_assignments: int = 0
+    completed_assignments: int = 0
+
+class TechnicianDashboard(BaseModel):
+    profile: Optional[Technician] = None
+    assignment_requests: list[AssignmentRequestRead] = []
+    assigned_bookings: list[AssignmentRead] = []
+    counts: TechnicianCounts = TechnicianCounts()
+PUBSUB_REPLAY_EVENTS = int(os.environ.get('PUBSUB_REPLAY_EVENTS', '100'))
+PUBSUB_MAX_TOPICS = int(os.environ.get('PUBSUB_MAX_TOPICS', '10000'))
+PUBSUB_QUEUE_SIZE = int(os.environ.get('PUBSUB_QUEUE_SIZE', '64'))
+
+class Event:
+    __slots__ = ('id', 'seq', 'type', 'data')
+
+    def __init__(self, id: str, seq: int, type: str, data: Any):
+        self.id = id
+        self.seq = seq
+        self.type = type
+        self.data = data
+
+    def sse(self) -> str:
+        return format_sse(self.type, self.data, self.id)
+
+def format_sse(type: str, data: Any, id: Optional[str]=None) -> str:
+    lines = [f'id: {id}'] if id else []
+    lines.append(f'event: {type}')
+    lines.append(f'data: {json.dumps(data, default=str, separators=(',', ':'))}')
+    return '\n'.join(lines) + '\n\n'
+
+class Subscription:
+    """One listener's bounded queue. `overflowed` is set instead of blocking the publisher."""
+
+    def __init__(self, topic: str, size: int):
+        self.topic = topic
+        self.queue: asyncio.Queue[Event] = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def offer(self, event: Event) -> bool:
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.overflowed = True
+            return False
 
+class EventHub:
+    """
+    In-process pub/sub keyed by topic (e.g. "technician:<uuid>").
 
+    publish() never waits: every subscriber buffers a bounded amount, and a
+    subscriber that falls behind is flagged and should be disconnected, so one
+    slow phone cannot hold up the request that published. Each topic also keeps its last
+    `replay` events; event ids are "<epoch>-<seq>", where the epoch changes with
+    every process, so since() can tell whether it can fill the gap after a
+    client's Last-Event-ID or the client has to start from a fresh snapshot.
 
-# --- MODULE: schema (schema.py) ---
+    Only subscribers on the same worker process see an event.
+    """
+
+    def __init__(self, replay: int=PUBSUB_REPLAY_EVENTS, max_topics: int=PUBSUB_MAX_TOPICS, queue_size: int=PUBSUB_QUEUE_SIZE):
+        self.replay = replay
+        self.max_topics = max_topics
+        self.queue_size = queue_size
+        self.epoch = f'{os.getpid():x}{time.time_ns() // 1000:x}'
+        self._seq = itertools.count(1)
+        self.last_seq = 0
+        self._history: dict[str, tuple[deque, int]] = {}
+        self._subscribers: dict[str, set] = {}
+        self._evictions = 0
+        self.stats = {'published': 0, 'delivered': 0, 'overflowed': 0}
+
+    def cursor(self) -> str:
+        """An id meaning "everything up to now", for snapshots."""
+        return f'{self.epoch}-{self.last_seq}'
+
+    def publish(self, topic: str, type: str, data: Any) -> Event:
+        self.last_seq = seq = next(self._seq)
+        event = Event(f'{self.epoch}-{seq}', seq, type, data)
+        self.stats['published'] += 1
+        entry = self._history.pop(topic, None)
+        if entry is None:
+            entry = (deque(maxlen=self.replay), seq if self._evictions else 0)
+            if len(self._history) >= self.max_topics:
+                del self._history[next(iter(self._history))]
+                self._evictions += 1
+        events, floor = entry
+        if len(events) == events.maxlen:
+            floor = events[0].seq
+        events.append(event)
+        self._history[topic] = (events, floor)
+        for subscriber in self._subscribers.get(topic, ()):
+            if subscriber.offer(event):
+                self.stats['delivered'] += 1
+            else:
+                self.stats['overflowed'] += 1
+        return event
+
+    def since(self, topic: str, last_event_id: Optional[str]) -> Optional[list[Event]]:
+        """Events after last_event_id, or None when they cannot all be replayed."""
+        epoch, _, seq = (last_event_id or '').rpartition('-')
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        last = int(seq)
+        entry = self._history.get(topic)
+        if entry is None:
+            return None if self._evictions else []
+        events, floor = entry
+        if last < floor:
+            return None
+        return [e for e in events if e.seq > last]
+
+    def subscribe(self, topic: str) -> Subscription:
+        return self.attach(Subscription(topic, self.queue_size))
+
+    def unsubscribe(self, subscription: Subscription):
+        self.detach(subscription)
+
+    def attach(self, subscriber):
+        """Any object with a `topic` and an `offer(event) -> bool` that does not block."""
+        self._subscribers.setdefault(subscriber.topic, set()).add(subscriber)
+        return subscriber
+
+    def detach(self, subscriber):
+        listeners = self._subscribers.get(subscriber.topic)
+        if listeners is not None:
+            listeners.discard(subscriber)
+            if not listeners:
+                del self._subscribers[subscriber.topic]
+
+    def subscriber_count(self, prefix: str='') -> int:
+        return sum((len(s) for topic, s in self._subscribers.items() if topic.startswith(prefix)))
+event_hub = EventHub()
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        print(f'Warning: ignoring invalid {name}={value!r}')
+        return default
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, '').lower() in ('1', 'true', 'yes', 'on')
+
+def resolve_workers(value: str | None) -> int:
+    if not value:
+        return 1
+    if value == 'auto':
+        return os.cpu_count() or 1
+    try:
+        return max(1, int(value))
+    except ValueError:
+        print(f'Warning: ignoring invalid FIXEL_WORKERS={value!r}')
+        return 1
+
+def resolve_loop(value: str | None) -> str:
+    if value in (None, '', 'auto'):
+        return 'uvloop' if find_spec('uvloop') else 'asyncio'
+    return value
+
+def resolve_http(value: str | None) -> str:
+    if value in (None, '', 'auto'):
+        return 'httptools' if find_spec('httptools') else 'h11'
+    return value
+
+def server_config() -> dict:
+    """
+    uvicorn settings for `python main.py`, read from the environment:
+
+    FIXEL_HOST / FIXEL_PORT          bind address (0.0.0.0:8000)
+    FIXEL_WORKERS                    worker processes, a number or "auto" (1)
+    FIXEL_LOOP                       auto | uvloop | asyncio (auto)
+    FIXEL_HTTP                       auto | httptools | h11 (auto)
+    FIXEL_RELOAD                     restart on code changes, dev only, forces 1 worker
+    FIXEL_GRACEFUL_TIMEOUT           seconds to drain requests on shutdown (30)
+    FIXEL_KEEPALIVE                  keep-alive timeout in seconds (5)
+    FIXEL_BACKLOG                    listen backlog (2048)
+    FIXEL_MAX_REQUESTS               recycle a worker after this many requests (off)
+    FIXEL_WS_PING                    WebSocket ping interval in seconds, also the pong timeout (20)
+
+    WebSockets (user.bookingUpdates) are mostly idle, so per-connection memory
+    is what limits how many a worker holds: permessage-deflate (a zlib context
+    per socket) is off and incoming messages are capped at 64 KiB.
+    """
+    reload = _env_flag('FIXEL_RELOAD')
+    config = {'host': os.environ.get('FIXEL_HOST', '0.0.0.0'), 'port': _env_int('FIXEL_PORT', 8000), 'workers': 1 if reload else resolve_workers(os.environ.get('FIXEL_WORKERS')), 'loop': resolve_loop(os.environ.get('FIXEL_LOOP')), 'http': resolve_http(os.environ.get('FIXEL_HTTP')), 'reload': reload, 'timeout_graceful_shutdown': _env_int('FIXEL_GRACEFUL_TIMEOUT', 30), 'timeout_keep_alive': _env_int('FIXEL_KEEPALIVE', 5), 'backlog': _env_int('FIXEL_BACKLOG', 2048), 'ws': os.environ.get('FIXEL_WS') or 'auto', 'ws_ping_interval': _env_int('FIXEL_WS_PING', 20), 'ws_ping_timeout': _env_int('FIXEL_WS_PING', 20), 'ws_per_message_deflate': False, 'ws_max_size': 64 * 1024}
+    max_requests = _env_int('FIXEL_MAX_REQUESTS', 0)
+    if max_requests:
+        config['limit_max_requests'] = max_requests
+    return config
+
+def raise_open_files_limit():
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = 65536 if hard == resource.RLIM_INFINITY else hard
+    if soft != resource.RLIM_INFINITY and soft < target:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError) as e:
+            print(f'Warning: could not raise the open files limit: {e}')
+
+def serve():
+    """
+    Production entry point.
+
+    With FIXEL_WORKERS > 1 uvicorn binds the socket once in the supervisor and
+    starts the workers up front (pre-fork); each worker imports main:app and runs
+    the lifecycle start hooks. Sending SIGHUP to the supervisor restarts the
+    workers one by one (graceful reload), SIGTERM drains and stops them.
+    """
+    import uvicorn
+    raise_open_files_limit()
+    config = server_config()
+    print(f'Starting Fixel Backend: {config['workers']} worker(s), loop={config['loop']}, http={config['http']}')
+    uvicorn.run('main:app', **config)
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent reads into one in-flight call.
+
+    Each endpoint registers a key function; callers that arrive while a call with
+    the same key is still running await the same task instead of issuing their own
+    query. Nothing is cached once the call finishes, so results are never stale.
+    """
+
+    def __init__(self, disabled: Optional[set[str]]=None):
+        self._keys: dict[str, Callable[..., Hashable]] = {}
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        self._disabled = disabled or set()
+        self._stats: dict[str, dict[str, int]] = {}
+
+    def register(self, endpoint: str, key_fn: Callable[..., Hashable]):
+        """key_fn receives the same positional args as the read and returns its cache key."""
+        self._keys[endpoint] = key_fn
+        self._stats.setdefault(endpoint, {'calls': 0, 'executions': 0, 'collapsed': 0})
+
+    async def run(self, endpoint: str, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        key_fn = self._keys.get(endpoint)
+        if key_fn is None or endpoint in self._disabled:
+            return await fn(*args)
+        stats = self._stats[endpoint]
+        stats['calls'] += 1
+        key = (endpoint, key_fn(*args))
+        task = self._inflight.get(key)
+        if task is not None:
+            stats['collapsed'] += 1
+        else:
+            stats['executions'] += 1
+            task = asyncio.ensure_future(fn(*args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {endpoint: dict(s) for endpoint, s in self._stats.items()}
+flight = SingleFlight(disabled={e.strip() for e in os.environ.get('SINGLEFLIGHT_DISABLED', '').split(',') if e.strip()})
+flight.register('service.viewServices', lambda: 'all')
+flight.register('technician.viewProfile', lambda techie_id: str(techie_id))
+flight.register('auth.getUser', lambda token: token)
+SYNC_ENTITIES = {'user': ('bookings', 'notifications'), 'technician': ('booking_history', 'notifications')}
+SYNC_MAX_CURSOR_AGE = float(os.environ.get('SYNC_MAX_CURSOR_AGE', str(29 * 24 * 3600)))
+
+def encode_cursor(xid: str, now: Optional[float]=None) -> str:
+    return f'{xid}.{int(now or time.time())}'
+
+def decode_cursor(cursor: Optional[str], now: Optional[float]=None) -> Optional[str]:
+    """The transaction id to sync from, or None for a full download."""
+    if not cursor:
+        return None
+    xid, _, issued = cursor.partition('.')
+    if not xid.isdigit() or not issued.isdigit():
+        raise HTTPException(status_code=400, detail=f'Invalid sync cursor {cursor!r}')
+    if (now or time.time()) - int(issued) > SYNC_MAX_CURSOR_AGE:
+        return None
+    return xid
+
+async def sync_entity(sbase, entity: str, owner_id: str, cursor: Optional[str]) -> dict:
+    since = decode_cursor(cursor)
+    res = await sbase.rpc('sync_changes', {'p_entity': entity, 'p_owner': str(owner_id), 'p_since': since}).execute()
+    result = res.data or {}
+    return {'changed': result.get('changed') or [], 'removed': result.get('removed') or [], 'full': since is None, 'cursor': encode_cursor(result['cursor']) if result.get('cursor') else cursor}
+
+async def sync_entities(sbase, role: str, owner_id: str, cursors: dict[str, Optional[str]], entities: Optional[list[str]]=None) -> dict:
+    """
+    Syncs the requested entities (all of the role's by default) concurrently.
+    Each result carries its own cursor for the client to send next time.
+    """
+    allowed = SYNC_ENTITIES[role]
+    wanted = entities or list(allowed)
+    unknown = [e for e in [*wanted, *cursors] if e not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f'Cannot sync {', '.join(sorted(set(unknown)))} as {role}')
+    for entity in wanted:
+        decode_cursor(cursors.get(entity))
+    results = await fan_out(*[step(sync_entity(sbase, entity, owner_id, cursors.get(entity)), name=f'sync_{entity}') for entity in wanted])
+    return {entity: unwrap(result) for entity, result in zip(wanted, results)}
+CRITICAL_FUNCS = {'service.bookService', 'technician.acceptAssignment', 'technician.rejectAssignment', 'service.updateStatus', 'user.cancelBooking', 'user.register', 'user.login', 'technician.register', 'technician.login', 'utils.registerPushToken'}
+LOW_FUNCS = {'technician.viewAssignmentRequests', 'technician.viewAssignedBookings', 'technician.viewBookingHistory', 'notification.viewNotifications', 'user.viewBookedServices'}
+EXEMPT_PATHS = {'/api/warm', '/api/metrics', '/api/docs', '/api/redoc', '/api/openapi.json'}
+STREAM_PATHS = {'/api/funcs/technician.offerStream', '/api/funcs/user.bookingUpdates'}
+BATCH_PATH = '/api/funcs/batch'
+DEFAULT_RATES = {'low': (2.0, 10.0), 'normal': (10.0, 40.0), 'critical': (10.0, 20.0)}
+DEFAULT_IP_RATE = (50.0, 200.0)
+SHED_THRESHOLDS = {'low': 0.5, 'normal': 0.8, 'critical': 1.0}
+admission_total = registry.register(Counter('fixel_admission_total', 'Admission decisions by priority class and outcome (admitted, rate_limited, shed).', ('class', 'outcome')))
+
+def parse_rates(value: Optional[str]) -> dict[str, tuple[float, float]]:
+    rates = dict(DEFAULT_RATES)
+    for part in (value or '').split(','):
+        name, _, spec = part.strip().partition('=')
+        if not spec:
+            continue
+        try:
+            rate, _, burst = spec.partition(':')
+            rates[name] = (float(rate), float(burst or rate))
+        except ValueError:
+            print(f'Warning: ignoring invalid ADMISSION_RATES entry {part!r}')
+    return rates
+
+def priority_class(path: str) -> Optional[str]:
+    """None means exempt."""
+    if path in EXEMPT_PATHS:
+        return None
+    if path.startswith('/api/funcs/'):
+        func = path[len('/api/funcs/'):]
+        if func in CRITICAL_FUNCS:
+            return 'critical'
+        if func in LOW_FUNCS:
+            return 'low'
+    return 'normal'
+
+class TokenBuckets:
+    """
+    Token buckets keyed by an 8-byte digest, holding [tokens, last_refill].
+
+    At most max_entries buckets are kept; the least recently used is dropped
+    first. A dropped bucket comes back full, which only ever errs towards
+    admitting, so the cap bounds memory without locking anyone out.
+    """
+
+    def __init__(self, max_entries: int=50000):
+        self.max_entries = max_entries
+        self._buckets: dict[bytes, list[float]] = {}
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def take(self, key: bytes, rate: float, burst: float, now: Optional[float]=None) -> float:
+        """Takes one token. Returns 0 when admitted, otherwise seconds until a token is available."""
+        now = time.monotonic() if now is None else now
+        bucket = self._buckets.pop(key, None)
+        if bucket is None:
+            bucket = [burst, now]
+            if len(self._buckets) >= self.max_entries:
+                del self._buckets[next(iter(self._buckets))]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        self._buckets[key] = bucket
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / rate if rate > 0 else 60.0
+
+    def refund(self, key: bytes, burst: float):
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(burst, bucket[0] + 1)
+
+def _digest(*parts: str) -> bytes:
+    return hashlib.blake2b('\x00'.join(parts).encode(), digest_size=8).digest()
+
+class BatchAdmission:
+    """
+    Admits the calls inside one /api/funcs/batch request as if each had come
+    on its own: one token from the client's bucket for the func's class plus
+    one from the IP bucket, and one in-flight slot held until the batch ends.
+    The middleware leaves it in scope["admission"] for the batch runner.
+    """
+
+    def __init__(self, middleware: 'AdmissionMiddleware', client: tuple[str, str], ip: str):
+        self.middleware = middleware
+        self.client = client
+        self.ip = ip
+        self.held = 0
+
+    def admit(self, func: str) -> Optional[tuple[int, str, float]]:
+        """None when the call may run, else (status, detail, retry_after)."""
+        rejection = self.middleware.check(priority_class(f'/api/funcs/{func}'), self.client, self.ip)
+        if rejection is None:
+            self.middleware.inflight += 1
+            self.held += 1
+        return rejection
+
+    def release(self):
+        self.middleware.inflight -= self.held
+        self.held = 0
+
+class AdmissionMiddleware:
+    """
+    In-process admission control in front of the app:
+
+    1. Rate limit: one token bucket per (client, priority class) plus one per IP.
+       The client is the bearer token when present (hashed; it is not verified
+       here, so a forged token cannot drain someone else's bucket), else the IP.
+    2. Load shedding: when in-flight requests on this worker pass the class's
+       share of max_inflight, the request is rejected before any work is done.
+
+    Rejections are 429 (rate limited) or 503 (shed) with Retry-After.
+    """
+
+    def __init__(self, app, enabled: Optional[bool]=None, rates: Optional[dict]=None, ip_rate: Optional[tuple[float, float]]=None, max_inflight: Optional[int]=None, max_buckets: Optional[int]=None, trust_forwarded: Optional[bool]=None):
+        self.app = app
+        self.enabled = enabled if enabled is not None else os.environ.get('ADMISSION_ENABLED', '1').lower() not in ('0', 'false', 'no', 'off')
+        self.rates = rates or parse_rates(os.environ.get('ADMISSION_RATES'))
+        self.ip_rate = ip_rate or DEFAULT_IP_RATE
+        self.max_inflight = max_inflight or int(os.environ.get('ADMISSION_MAX_INFLIGHT', '256'))
+        self.buckets = TokenBuckets(max_buckets or int(os.environ.get('ADMISSION_MAX_BUCKETS', '50000')))
+        self.trust_forwarded = trust_forwarded if trust_forwarded is not None else os.environ.get('ADMISSION_TRUST_FORWARDED', '1' if os.environ.get('VERCEL') else '0') == '1'
+        self.inflight = 0
+
+    def client_ip(self, scope, headers: dict[bytes, bytes]) -> str:
+        forwarded = headers.get(b'x-forwarded-for')
+        if self.trust_forwarded and forwarded:
+            return forwarded.split(b',')[-1].strip().decode('latin-1')
+        client = scope.get('client')
+        return client[0] if client else 'unknown'
+
+    async def reject(self, scope, send, status: int, detail: str, retry_after: float):
+        if scope['type'] == 'websocket':
+            await send({'type': 'websocket.close', 'code': 1013, 'reason': detail})
+            return
+        body = json.dumps({'detail': detail}).encode()
+        await send({'type': 'http.response.start', 'status': status, 'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode()), (b'retry-after', str(max(1, math.ceil(retry_after))).encode())]})
+        await send({'type': 'http.response.body', 'body': body})
+
+    def shed(self, klass: str) -> bool:
+        return self.inflight >= self.max_inflight * SHED_THRESHOLDS.get(klass, 1.0)
+
+    def check(self, klass: str, client: tuple[str, str], ip: str) -> Optional[tuple[int, str, float]]:
+        """None when admitted, else (status, detail, retry_after). Counts the decision."""
+        if self.shed(klass):
+            admission_total.inc(klass, 'shed')
+            return (503, 'Server busy, retry later', 1)
+        client_key = _digest(*client, klass)
+        rate, burst = self.rates.get(klass, DEFAULT_RATES['normal'])
+        wait = self.buckets.take(client_key, rate, burst)
+        if not wait:
+            ip_key = _digest('ip-total', ip)
+            wait = self.buckets.take(ip_key, *self.ip_rate)
+            if wait:
+                self.buckets.refund(client_key, burst)
+        if wait:
+            admission_total.inc(klass, 'rate_limited')
+            return (429, 'Too many requests', wait)
+        admission_total.inc(klass, 'admitted')
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope['type'] not in ('http', 'websocket'):
+            await self.app(scope, receive, send)
+            return
+        klass = priority_class(scope.get('path', ''))
+        if klass is None:
+            await self.app(scope, receive, send)
+            return
+        headers = dict(scope.get('headers', []))
+        ip = self.client_ip(scope, headers)
+        authorization = headers.get(b'authorization')
+        client = ('token', authorization.decode('latin-1')) if authorization else ('ip', ip)
+        if scope.get('path') == BATCH_PATH and scope['type'] == 'http':
+            if self.shed(klass):
+                admission_total.inc(klass, 'shed')
+                await self.reject(scope, send, 503, 'Server busy, retry later', 1)
+                return
+            calls = scope['admission'] = BatchAdmission(self, client, ip)
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                calls.release()
+            return
+        rejection = self.check(klass, client, ip)
+        if rejection is not None:
+            await self.reject(scope, send, *rejection)
+            return
+        if scope.get('path') in STREAM_PATHS:
+            await self.app(scope, receive, send)
+            return
+        self.inflight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.inflight -= 1
+PROFILE_HEADER = 'x-fixel-profile'
+MAX_HEADER_TTL = 24 * 3600
+_active_profile: contextvars.ContextVar[Optional['Profile']] = contextvars.ContextVar('active_profile', default=None)
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        print(f'Warning: ignoring invalid {name}={os.environ.get(name)!r}')
+        return default
+
+def sign_profile_header(secret: str, ttl: int=300, now: Optional[float]=None) -> str:
+    """Value for the X-Fixel-Profile header: '<expiry>.<hmac-sha256(secret, expiry)>'."""
+    expiry = str(int((now or time.time()) + ttl))
+    return f'{expiry}.{hmac.new(secret.encode(), expiry.encode(), hashlib.sha256).hexdigest()}'
+
+def verify_profile_header(value: Optional[str], secret: Optional[str], now: Optional[float]=None) -> bool:
+    if not value or not secret:
+        return False
+    expiry, _, signature = value.partition('.')
+    if not expiry.isdigit():
+        return False
+    remaining = int(expiry) - (now or time.time())
+    if remaining <= 0 or remaining > MAX_HEADER_TTL:
+        return False
+    expected = hmac.new(secret.encode(), expiry.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f'{code.co_qualname} ({Path(code.co_filename).name}:{frame.f_lineno})'
+
+class Profile:
+    """Samples and upstream calls collected for one request."""
+
+    def __init__(self, method: str, path: str, max_seconds: float):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.deadline = self.started + max_seconds
+        self.stacks: dict[str, int] = {}
+        self.samples = 0
+        self.upstream: list[dict] = []
+        self.status: Optional[int] = None
+        self.route: Optional[str] = None
+        self.id = f'{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{random.randrange(16 ** 6):06x}'
+
+    def add_sample(self, stack: str):
+        self.samples += 1
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def add_upstream(self, api: str, table: str, op: str, status: str, started: float, seconds: float):
+        self.upstream.append({'start_ms': round((started - self.started) * 1000, 2), 'duration_ms': round(seconds * 1000, 2), 'api': api, 'table': table, 'op': op, 'status': status})
+
+    def collapsed(self) -> str:
+        return ''.join((f'{stack} {count}\n' for stack, count in sorted(self.stacks.items())))
+
+    def timeline(self) -> dict:
+        return {'id': self.id, 'method': self.method, 'path': self.path, 'route': self.route, 'status': self.status, 'started_at': self.wall_started, 'duration_ms': round((time.perf_counter() - self.started) * 1000, 2), 'samples': self.samples, 'upstream': sorted(self.upstream, key=lambda u: u['start_ms'])}
+
+class Sampler:
+    """
+    One background thread that, while any profile is active, periodically grabs
+    the event loop thread's stack and charges it to the profile whose task is
+    running. Samples taken while another request's task runs, or while the loop
+    waits for I/O, are recorded as "(other requests)" / "(idle)" so the output
+    adds up to wall time.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.profiles: set[Profile] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+
+    def add(self, profile: Profile):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self.profiles.add(profile)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name='fixel-profiler', daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def remove(self, profile: Profile):
+        self.profiles.discard(profile)
+
+    def _run(self):
+        while True:
+            if not self.profiles:
+                self._wake.clear()
+                if not self._wake.wait(timeout=5.0):
+                    if not self.profiles:
+                        self._thread = None
+                        return
+            time.sleep(self.interval)
+            self.sample()
+
+    def sample(self):
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        task = asyncio.current_task(self._loop)
+        owner = task.get_context().get(_active_profile) if task is not None else None
+        if owner is not None:
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            stack = ';'.join(reversed(labels))
+        else:
+            stack = '(idle)' if task is None else '(other requests)'
+        now = time.perf_counter()
+        for profile in list(self.profiles):
+            if now > profile.deadline:
+                continue
+            profile.add_sample(stack if profile is owner else '(other requests)' if owner is not None else stack)
+
+def _record_upstream(api: str, table: str, op: str, status: str, started: float, seconds: float):
+    profile = _active_profile.get()
+    if profile is not None:
+        profile.add_upstream(api, table, op, status, started, seconds)
+upstream_observers.append(_record_upstream)
+
+class ProfilerMiddleware:
+    """
+    Opt-in per-request profiling. A request is profiled when it carries a valid
+    signed X-Fixel-Profile header, or is picked by PROFILE_SAMPLE_RATE, and fewer
+    than PROFILE_MAX_CONCURRENT profiles are running. Each profile writes
+    <id>.collapsed (stack samples) and <id>.json (upstream call timeline) to
+    PROFILE_DIR; the response carries the id in X-Fixel-Profile-Id.
+    """
+
+    def __init__(self, app, sample_rate: Optional[float]=None, secret: Optional[str]=None, output_dir: Optional[str]=None, interval_ms: Optional[float]=None, max_concurrent: Optional[int]=None, max_seconds: Optional[float]=None):
+        self.app = app
+        self.sample_rate = sample_rate if sample_rate is not None else _env_float('PROFILE_SAMPLE_RATE', 0.0)
+        self.secret = secret if secret is not None else os.environ.get('PROFILE_SECRET') or None
+        self.output_dir = Path(output_dir or os.environ.get('PROFILE_DIR') or Path(tempfile.gettempdir()) / 'fixel-profiles')
+        self.max_concurrent = max_concurrent if max_concurrent is not None else int(_env_float('PROFILE_MAX_CONCURRENT', 1))
+        self.max_seconds = max_seconds if max_seconds is not None else _env_float('PROFILE_MAX_SECONDS', 30.0)
+        self.sampler = Sampler((interval_ms if interval_ms is not None else _env_float('PROFILE_INTERVAL_MS', 5.0)) / 1000)
+        self.enabled = self.sample_rate > 0 or bool(self.secret)
+
+    def wants_profile(self, scope) -> bool:
+        if len(self.sampler.profiles) >= self.max_concurrent:
+            return False
+        if self.secret:
+            for name, value in scope.get('headers', []):
+                if name == PROFILE_HEADER.encode():
+                    return verify_profile_header(value.decode('latin-1'), self.secret)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope['type'] != 'http' or (not self.wants_profile(scope)):
+            await self.app(scope, receive, send)
+            return
+        profile = Profile(scope.get('method', ''), scope.get('path', ''), self.max_seconds)
+
+        async def send_with_id(message):
+            if message['type'] == 'http.response.start':
+                profile.status = message['status']
+                message['headers'] = list(message.get('headers', [])) + [(b'x-fixel-profile-id', profile.id.encode())]
+            await send(message)
+        token = _active_profile.set(profile)
+        self.sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            self.sampler.remove(profile)
+            _active_profile.reset(token)
+            profile.route = getattr(scope.get('route'), 'path', None)
+            await asyncio.to_thread(self.write, profile)
+
+    def write(self, profile: Profile):
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            name = f'{profile.id}-{re.sub('[^A-Za-z0-9_.-]+', '_', profile.path.strip('/'))[:80]}'
+            (self.output_dir / f'{name}.collapsed').write_text(profile.collapsed(), encoding='utf-8')
+            (self.output_dir / f'{name}.json').write_text(json.dumps(profile.timeline(), indent=2), encoding='utf-8')
+        except OSError as e:
+            print(f'Failed to write profile {profile.id}: {e}')
+REQUEST_BUDGET = float(os.environ.get('REQUEST_BUDGET', '50'))
+UPSTREAM_CALL_TIMEOUT = float(os.environ.get('UPSTREAM_CALL_TIMEOUT', '10'))
+UPSTREAM_MAX_RETRIES = int(os.environ.get('UPSTREAM_MAX_RETRIES', '2'))
+RETRY_BUDGET_RATIO = float(os.environ.get('RETRY_BUDGET_RATIO', '0.1'))
+BREAKER_FAILURES = int(os.environ.get('BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN = float(os.environ.get('BREAKER_COOLDOWN', '5'))
+RETRYABLE_METHODS = {'GET', 'HEAD'}
+RETRYABLE_STATUSES = {502, 503, 504}
+BACKOFF_BASE = 0.05
+BACKOFF_CAP = 1.0
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar('request_deadline', default=None)
+retries_total = registry.register(Counter('fixel_upstream_retries_total', 'Retried Supabase calls, by API and table.', ('api', 'table')))
+retries_denied_total = registry.register(Counter('fixel_upstream_retries_denied_total', 'Retries skipped because the retry budget was empty.', ('api', 'table')))
+circuit_rejections_total = registry.register(Counter('fixel_circuit_rejections_total', 'Supabase calls failed fast by an open circuit.', ('api', 'table')))
+circuit_transitions_total = registry.register(Counter('fixel_circuit_transitions_total', 'Circuit state changes.', ('api', 'table', 'state')))
+deadline_exceeded_total = registry.register(Counter('fixel_deadline_exceeded_total', 'Supabase calls cut off by the request deadline.', ('api', 'table')))
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling Supabase while the circuit for that table is open."""
+
+    def __init__(self, key: tuple[str, str], retry_after: float):
+        super().__init__(f'{key[0]}/{key[1]} is unavailable (circuit open)')
+        self.key = key
+        self.retry_after = retry_after
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before (or while) calling Supabase."""
+
+def remaining_budget() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """Narrows the current deadline (never extends it) for the calls made inside."""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive failures; open -> half_open after
+    `cooldown`, letting a single probe through; the probe's result closes or
+    re-opens it. Only transport errors, timeouts and 5xx count as failures.
+    """
+    STATES = {'closed': 0, 'half_open': 1, 'open': 2}
+
+    def __init__(self, key: tuple[str, str], failures: int=BREAKER_FAILURES, cooldown: float=BREAKER_COOLDOWN):
+        self.key = key
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.state = 'closed'
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def _move(self, state: str):
+        if state != self.state:
+            self.state = state
+            circuit_transitions_total.inc(*self.key, state)
+
+    def allow(self, now: Optional[float]=None) -> bool:
+        now = time.monotonic() if now is None else now
+        if self.state == 'open' and now - self.opened_at >= self.cooldown:
+            self._move('half_open')
+        if self.state == 'closed':
+            return True
+        if self.state == 'half_open' and (not self.probing):
+            self.probing = True
+            return True
+        return False
+
+    def retry_after(self, now: Optional[float]=None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.cooldown - (now - self.opened_at))
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        self._move('closed')
+
+    def record_failure(self, now: Optional[float]=None):
+        self.failures += 1
+        self.probing = False
+        if self.state == 'half_open' or self.failures >= self.threshold:
+            self.opened_at = time.monotonic() if now is None else now
+            self._move('open')
+
+class RetryBudget:
+    """Every first attempt deposits `ratio` tokens and every retry spends one, capped at `cap`."""
+
+    def __init__(self, ratio: float=RETRY_BUDGET_RATIO, cap: float=10.0):
+        self.ratio = ratio
+        self.cap = cap
+        self.tokens = cap
+
+    def deposit(self):
+        self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+def _shrink_timeouts(request: httpx.Request, seconds: float):
+    timeouts = dict(request.extensions.get('timeout') or {})
+    for phase in ('connect', 'read', 'write', 'pool'):
+        current = timeouts.get(phase)
+        timeouts[phase] = seconds if current is None else min(current, seconds)
+    request.extensions['timeout'] = timeouts
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps the Supabase transport with, per call:
+
+    1. a circuit breaker per (api, table) that fails fast while the table is down,
+    2. a timeout of min(UPSTREAM_CALL_TIMEOUT, what is left of the request budget),
+    3. bounded retries with full-jitter backoff for idempotent reads (GET/HEAD)
+       on transport errors and 502/503/504, limited by a worker-wide retry budget.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, call_timeout: float=UPSTREAM_CALL_TIMEOUT, max_retries: int=UPSTREAM_MAX_RETRIES, budget: Optional[RetryBudget]=None):
+        self.transport = transport
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.budget = budget or RetryBudget()
+        self.breakers: dict[tuple[str, str], CircuitBreaker] = {}
+
+    def breaker(self, key: tuple[str, str]) -> CircuitBreaker:
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = self.breakers[key] = CircuitBreaker(key)
+        return breaker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        api, table, _ = classify_upstream(request)
+        key = (api, table)
+        breaker = self.breaker(key)
+        retryable = request.method in RETRYABLE_METHODS
+        self.budget.deposit()
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                circuit_rejections_total.inc(api, table)
+                raise UpstreamUnavailable(key, breaker.retry_after())
+            remaining = remaining_budget()
+            timeout = self.call_timeout if remaining is None else min(self.call_timeout, remaining)
+            if timeout <= 0:
+                breaker.probing = False
+                deadline_exceeded_total.inc(api, table)
+                raise DeadlineExceeded(f'request budget exhausted before calling {api}/{table}')
+            _shrink_timeouts(request, timeout)
+            failure: Optional[Exception] = None
+            response = None
+            try:
+                async with asyncio.timeout(timeout):
+                    response = await self.transport.handle_async_request(request)
+            except TimeoutError:
+                failure = httpx.ReadTimeout(f'{api}/{table} timed out after {timeout:.2f}s', request=request)
+            except httpx.TransportError as e:
+                failure = e
+            except BaseException:
+                if breaker.state == 'half_open' and breaker.probing:
+                    breaker.record_failure()
+                raise
+            if response is not None and response.status_code not in RETRYABLE_STATUSES:
+                breaker.record_success()
+                return response
+            cut_by_deadline = isinstance(failure, httpx.TimeoutException) and timeout < self.call_timeout
+            if cut_by_deadline:
+                breaker.probing = False
+                deadline_exceeded_total.inc(api, table)
+                raise DeadlineExceeded(f'request budget exhausted while calling {api}/{table}') from failure
+            breaker.record_failure()
+            left = remaining_budget()
+            out_of_time = left is not None and left <= BACKOFF_BASE
+            if not retryable or attempt >= self.max_retries or out_of_time:
+                if failure is not None:
+                    raise failure
+                return response
+            if not self.budget.withdraw():
+                retries_denied_total.inc(api, table)
+                if failure is not None:
+                    raise failure
+                return response
+            if response is not None:
+                await response.aclose()
+            attempt += 1
+            retries_total.inc(api, table)
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            left = remaining_budget()
+            await asyncio.sleep(delay if left is None else max(0.0, min(delay, left - BACKOFF_BASE)))
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+class DeadlineMiddleware:
+    """
+    Starts every request's budget; upstream calls made on its behalf inherit it.
+    exempt_paths (long-lived streams) only get the per-call timeout.
+    """
+
+    def __init__(self, app, budget: float=REQUEST_BUDGET, exempt_paths: frozenset=frozenset()):
+        self.app = app
+        self.budget = budget
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope.get('path') in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        with deadline_scope(self.budget):
+            await self.app(scope, receive, send)
+
+def breaker_states(transport: ResilientTransport) -> dict[tuple, float]:
+    return {key: CircuitBreaker.STATES[b.state] for key, b in transport.breakers.items()}
+
+def register_breaker_metrics(transport: ResilientTransport):
+    callback_gauge('fixel_circuit_state', 'Circuit breaker state per API and table (0 closed, 1 half-open, 2 open).', ('api', 'table'), lambda: breaker_states(transport))
+    callback_gauge('fixel_retry_budget_tokens', "Retries currently available in the worker's retry budget.", (), lambda: {(): transport.budget.tokens})
 
 class BookServiceRequest(BaseModel):
     service_id: int
@@ -195,818 +1746,1668 @@ class AssignmentResponseRequest(BaseModel):
 
 class RegisterPushTokenRequest(BaseModel):
     token: str
-    user_type: str # "user" or "technician"
+    user_type: str
 
 class TestNotificationRequest(BaseModel):
     token: str
-    title: str = "Test Notification"
-    message: str = "This is a test notification"
+    title: str = 'Test Notification'
+    message: str = 'This is a test notification'
     data: dict | None = None
 
-# --- MODULE: utils (utils.py) ---
-
-def send_email(to_email: str, subject: str, content: str):
-    # Email logic mocked for now as per request
-    print(f"MOCK EMAIL to {to_email}: [{subject}] {content}")
-    return
+class SyncRequest(BaseModel):
+    cursors: dict[str, str | None] = {}
+    entities: list[str] | None = None
+
+class BatchCall(BaseModel):
+    func: str
+    args: dict | None = None
+
+class ServiceImport(Service):
+    id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+class SubServiceImport(SubService):
+    id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+class TechnicianImport(Technician):
+    created_at: Optional[datetime] = None
+
+class ExportBookingsRequest(BaseModel):
+    from_date: datetime
+    to_date: datetime
+    statuses: list[str] | None = None
+    format: Literal['ndjson', 'csv'] = 'ndjson'
+    after_created_at: datetime | None = None
+    after_id: int | None = None
+
+class AnalyticsRequest(BaseModel):
+    days: int | None = None
+LIVE_SEND_TIMEOUT = float(os.environ.get('LIVE_SEND_TIMEOUT', '10'))
+LIVE_MAX_PENDING = int(os.environ.get('LIVE_MAX_PENDING', '256'))
+LIVE_AUTH_TIMEOUT = 10.0
+CLOSE_UNAUTHORIZED = 1008
+CLOSE_TOO_SLOW = 1013
+live_frames_total = registry.register(Counter('fixel_live_frames_total', 'Booking update frames, by outcome (sent, slow_consumer, send_failed).', ('outcome',)))
+callback_gauge('fixel_live_sockets', 'Open booking update WebSockets on this worker.', (), lambda: {(): event_hub.subscriber_count('user:')})
+
+def user_topic(user_id) -> str:
+    return f'user:{user_id}'
+
+def publish_booking_status(booking: Optional[dict]):
+    """Pushes a booking row's status to its owner's sockets. Call after every booking write."""
+    if not booking or not booking.get('user_id'):
+        return
+    event_hub.publish(user_topic(booking['user_id']), 'booking', {'id': booking['id'], 'status': booking.get('status'), 'assignment_id': booking.get('assignment_id')})
 
-    # import os # os must only be imported later, messes with load_dotenv
-    # smtp_host = os.environ.get("SUPABASE_SMTP_HOST") or os.environ.get("SMTP_HOST")
-    # smtp_port = os.environ.get("SUPABASE_SMTP_PORT") or os.environ.get("SMTP_PORT")
-    # smtp_user = os.environ.get("SUPABASE_SMTP_USER") or os.environ.get("SMTP_USER")
-    # smtp_pass = os.environ.get("SUPABASE_SMTP_PASS") or os.environ.get("SMTP_PASS")
-    # smtp_sender = os.environ.get("SUPABASE_SMTP_SENDER") or "noreply@fixel.com"
-
-    # if not (smtp_host and smtp_port and smtp_user and smtp_pass):
-    #     print(f"MOCK EMAIL to {to_email}: [{subject}] {content}")
-    #     return
-
-    # try:
-    #     msg = EmailMessage()
-    #     msg.set_content(content)
-    #     msg["Subject"] = subject
-    #     msg["From"] = smtp_sender
-    #     msg["To"] = to_email
-
-    #     with smtplib.SMTP(smtp_host, int(smtp_port)) as server:
-    #         server.starttls()
-    #         server.login(smtp_user, smtp_pass)
-    #         server.send_message(msg)
-    #     print(f"Email sent to {to_email}")
-    # except Exception as e:
-    #     print(f"Failed to send email: {e}")
-
-def send_push_notification(token: str, title: str, message: str, data: Optional[dict] = None):
-    from exponent_server_sdk import (
-        PushClient,
-        PushMessage,
-        PushServerError,
-        DeviceNotRegisteredError,
-    )
-    import os
+class BookingSocket:
+    """
+    One user's WebSocket as an EventHub subscriber.
+
+    An idle socket costs this object and the connection's own receive task:
+    there is no queue and no timer. offer() only records the latest change per
+    booking (a newer status replaces one that was not sent yet) and, if no send
+    is running, starts one task that sends everything pending as one frame.
+    A client that stops reading is disconnected with 1013 once a send times
+    out or LIVE_MAX_PENDING bookings are waiting; it reconnects and resumes.
+    """
+    __slots__ = ('topic', 'websocket', 'pending', 'flushing', 'closed')
+
+    def __init__(self, user_id: str, websocket):
+        self.topic = user_topic(user_id)
+        self.websocket = websocket
+        self.pending: dict[int, Event] = {}
+        self.flushing = False
+        self.closed = False
+
+    def offer(self, event: Event) -> bool:
+        if self.closed:
+            return False
+        self.pending[event.data['id']] = event
+        if len(self.pending) > LIVE_MAX_PENDING:
+            self.drop('slow_consumer')
+            return False
+        if not self.flushing:
+            self.flushing = True
+            asyncio.get_running_loop().create_task(self.flush())
+        return True
+
+    async def flush(self):
+        try:
+            while self.pending and (not self.closed):
+                batch, self.pending = (self.pending, {})
+                events = sorted(batch.values(), key=lambda e: e.seq)
+                frame = json.dumps({'type': 'bookings', 'id': events[-1].id, 'changes': [e.data for e in events]}, default=str, separators=(',', ':'))
+                try:
+                    async with asyncio.timeout(LIVE_SEND_TIMEOUT):
+                        await self.websocket.send_text(frame)
+                except TimeoutError:
+                    self.drop('slow_consumer')
+                    return
+                except Exception:
+                    live_frames_total.inc('send_failed')
+                    self.closed = True
+                    return
+                live_frames_total.inc('sent')
+        finally:
+            self.flushing = False
+
+    def drop(self, reason: str):
+        if self.closed:
+            return
+        self.closed = True
+        self.pending = {}
+        live_frames_total.inc(reason)
+        asyncio.get_running_loop().create_task(self._close())
+
+    async def _close(self):
+        try:
+            await self.websocket.close(code=CLOSE_TOO_SLOW, reason='too slow, reconnect')
+        except Exception:
+            pass
 
-    if not token:
-        print("No push token provided.")
-        return
+    async def send_json(self, message: dict):
+        await self.websocket.send_text(json.dumps(message, default=str, separators=(',', ':')))
 
+async def run_booking_socket(websocket, user_id: str, last_event_id: Optional[str]):
+    """Subscribes an accepted, authenticated socket and holds it until the client leaves."""
+    socket = BookingSocket(user_id, websocket)
+    event_hub.attach(socket)
     try:
-        response = PushClient().publish(
-            PushMessage(to=token, title=title, body=message, data=data)
-        )
-    except PushServerError as exc:
-        # Encountered some likely formatting/validation error.
-        print(f"Push Server Error: {exc.errors}")
-        # raise exc
-    except (ConnectionError, ValueError) as exc:
-        # Encountered some Connection or Request API error
-        print(f"Push Connection/Value Error: {exc}")
-        # raise exc
+        if last_event_id:
+            replay = event_hub.since(socket.topic, last_event_id)
+            if replay is None:
+                await socket.send_json({'type': 'resync'})
+            for event in replay or ():
+                socket.offer(event)
+        while not socket.closed:
+            message = await websocket.receive()
+            if message['type'] == 'websocket.disconnect':
+                break
+    finally:
+        socket.closed = True
+        event_hub.detach(socket)
+OFFER_STREAM_HEARTBEAT = float(os.environ.get('OFFER_STREAM_HEARTBEAT', '15'))
+OFFER_STREAM_MAX_SECONDS = float(os.environ.get('OFFER_STREAM_MAX_SECONDS', '55'))
+OFFER_STREAM_RESYNC = float(os.environ.get('OFFER_STREAM_RESYNC', '30'))
+OFFER_STREAM_RETRY_MS = 2000
+offer_events_total = registry.register(Counter('fixel_offer_events_total', 'Technician offer events published, by type and reason.', ('type', 'reason')))
+callback_gauge('fixel_offer_streams', 'Open technician offer streams on this worker.', (), lambda: {(): event_hub.subscriber_count('technician:')})
+
+def offer_topic(techie_id) -> str:
+    return f'technician:{techie_id}'
+
+def publish_offer(techie_id, offer: dict):
+    """offer is shaped like a technician.viewAssignmentRequests item (booking and service embedded)."""
+    offer_events_total.inc('offer', '')
+    event_hub.publish(offer_topic(techie_id), 'offer', offer)
+
+def publish_offer_closed(techie_id, request_id: int, booking_id: Optional[int], reason: str):
+    """reason: accepted, rejected, expired or cancelled. The client drops the offer."""
+    offer_events_total.inc('offer_closed', reason)
+    event_hub.publish(offer_topic(techie_id), 'offer_closed', {'id': request_id, 'booking_id': booking_id, 'reason': reason})
+
+class OfferStream:
+    """
+    One technician's SSE stream:
+
+    1. Subscribe first, so nothing published while catching up is lost.
+    2. Catch up: replay the events after Last-Event-ID if this worker still has
+       them all, otherwise send a `snapshot` event with every pending offer.
+    3. Forward live `offer` / `offer_closed` events, with a heartbeat comment
+       whenever the line has been quiet for `heartbeat` seconds.
+    4. Every `resync` seconds re-read the pending offers and send a new snapshot
+       if they differ from what the client has been told.
+
+    The stream ends after `max_seconds`, or as soon as the client falls so far
+    behind that its queue overflows; either way it reconnects and resumes.
+    Clients treat `snapshot` as "replace all" and `offer` as an upsert by id, so
+    an offer that arrives both ways is harmless.
+    """
 
-    try:
-        # We got a response back, but we don't know whether it's an error yet.
-        # This call raises errors so we can handle them with normal exception flows.
-        response.validate_response()
-    except DeviceNotRegisteredError:
-        # Mark the push token as inactive
-        print(f"Device not registered: {token}")
-        # In a real app, you'd update your DB here to remove the token
-    except Exception as exc:
-        # Encountered some other Error
-        print(f"Push Notification Error: {exc}")
-        # raise exc
-    else:
-        print(f"Push Notification sent to {token}: {title} - {message}")
+    def __init__(self, techie_id: str, snapshot: Callable[[], Awaitable[list[dict]]], heartbeat: float=OFFER_STREAM_HEARTBEAT, max_seconds: float=OFFER_STREAM_MAX_SECONDS, resync: float=OFFER_STREAM_RESYNC):
+        self.techie_id = str(techie_id)
+        self.snapshot = snapshot
+        self.heartbeat = heartbeat
+        self.max_seconds = max_seconds
+        self.resync = resync
+        self.known: Optional[set] = None
+        self.subscription: Optional[Subscription] = None
+        self._backlog: list[str] = []
+
+    async def open(self, last_event_id: Optional[str]):
+        """Runs before the response starts, so a failing snapshot is still a normal HTTP error."""
+        self.subscription = event_hub.subscribe(offer_topic(self.techie_id))
+        try:
+            replay = event_hub.since(self.subscription.topic, last_event_id)
+            if replay is None:
+                self._backlog.append(await self._snapshot_event())
+            else:
+                self._backlog.extend((e.sse() for e in replay))
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.subscription is not None:
+            event_hub.unsubscribe(self.subscription)
+            self.subscription = None
+
+    def _track(self, type: str, data: Any):
+        if self.known is None:
+            return
+        if type == 'offer':
+            self.known.add(data.get('id'))
+        elif type == 'offer_closed':
+            self.known.discard(data.get('id'))
+
+    async def _snapshot_event(self) -> str:
+        cursor = event_hub.cursor()
+        offers = await self.snapshot()
+        self.known = {o.get('id') for o in offers}
+        return format_sse('snapshot', offers, cursor)
+
+    async def _resync(self) -> Optional[str]:
+        try:
+            cursor = event_hub.cursor()
+            offers = await self.snapshot()
+        except Exception as e:
+            print(f'Offer stream resync for {self.techie_id} failed: {e}')
+            return None
+        ids = {o.get('id') for o in offers}
+        if ids == self.known:
+            return None
+        self.known = ids
+        return format_sse('snapshot', offers, cursor)
+
+    async def events(self) -> AsyncIterator[str]:
+        subscription = self.subscription
+        try:
+            yield f'retry: {OFFER_STREAM_RETRY_MS}\n\n'
+            for chunk in self._backlog:
+                yield chunk
+            self._backlog = []
+            now = time.monotonic()
+            ends_at = now + self.max_seconds
+            resync_at = now + self.resync if self.resync > 0 else float('inf')
+            while not subscription.overflowed:
+                now = time.monotonic()
+                if now >= ends_at:
+                    return
+                if now >= resync_at:
+                    resync_at = now + self.resync
+                    chunk = await self._resync()
+                    if chunk:
+                        yield chunk
+                    continue
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=min(self.heartbeat, ends_at - now, resync_at - now))
+                except TimeoutError:
+                    yield ': ping\n\n'
+                    continue
+                self._track(event.type, event.data)
+                yield event.sse()
+        finally:
+            self.close()
+load_dotenv()
+url: str = os.environ.get('SUPABASE_URL')
+key: str = os.environ.get('SUPABASE_KEY')
+if not url or not key:
+    print('Warning: SUPABASE_URL or SUPABASE_KEY not set in environment.')
+    print(f'DEBUG: URL={url}, KEY={key}')
+upstream_transport = ResilientTransport(MeteredTransport(httpx.AsyncHTTPTransport(http2=find_spec('h2') is not None)))
+register_breaker_metrics(upstream_transport)
+http_client = httpx.AsyncClient(transport=upstream_transport, timeout=120, follow_redirects=True)
+
+def client_options() -> AsyncClientOptions:
+    return AsyncClientOptions(httpx_client=http_client)
+
+async def get_supabase():
+    return await create_async_client(url or '', key or '', options=client_options())
+_shared_client: AsyncClient | None = None
+
+@on_worker_start
+async def get_shared_supabase():
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = await create_async_client(url or '', key or '', options=client_options())
+    return _shared_client
+IMPORT_CHUNK_ROWS = int(os.environ.get('IMPORT_CHUNK_ROWS', '500'))
+IMPORT_MAX_LINE_BYTES = int(os.environ.get('IMPORT_MAX_LINE_BYTES', str(64 * 1024)))
+IMPORT_TABLES: dict[str, type[BaseModel]] = {'service': ServiceImport, 'sub_service': SubServiceImport, 'technician': TechnicianImport}
+IMPORT_PATHS = frozenset((f'/api/funcs/admin.{table}.import' for table in IMPORT_TABLES))
+CSV_TYPES = {'text/csv', 'application/csv'}
+NDJSON_TYPES = {'application/x-ndjson', 'application/ndjson', 'application/jsonl', 'application/x-jsonlines'}
+import_rows_total = registry.register(Counter('fixel_import_rows_total', 'Rows processed by admin.*.import, by table and status (ok, invalid, failed).', ('table', 'status')))
+
+def import_format(content_type: Optional[str]) -> str:
+    media_type = (content_type or '').split(';')[0].strip().lower()
+    if media_type in CSV_TYPES:
+        return 'csv'
+    if media_type in NDJSON_TYPES:
+        return 'ndjson'
+    raise HTTPException(status_code=415, detail='Send NDJSON (application/x-ndjson) or CSV (text/csv)')
+
+async def split_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Optional[bytes]]:
+    """Complete lines from a byte stream; None stands for a line over IMPORT_MAX_LINE_BYTES."""
+    buffer = bytearray()
+    oversized = False
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b'\n', start)) >= 0:
+            yield (None if oversized else bytes(buffer[start:end]).rstrip(b'\r'))
+            oversized = False
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > IMPORT_MAX_LINE_BYTES:
+            oversized = True
+            buffer.clear()
+    if oversized or buffer:
+        yield (None if oversized else bytes(buffer).rstrip(b'\r'))
+
+async def read_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[tuple[int, Optional[dict], Optional[str]]]:
+    """
+    (line, record, error) for every non-blank record, line being where it starts.
+    CSV needs a header row; a quoted CSV field may span lines. Empty CSV fields
+    are left out, so the model's defaults apply.
+    """
+    header: Optional[list[str]] = None
+    pending: list[str] = []
+    line_no = 0
+    async for raw in split_lines(chunks):
+        line_no += 1
+        if raw is None:
+            pending = []
+            yield (line_no, None, f'Line longer than {IMPORT_MAX_LINE_BYTES} bytes')
+            continue
+        try:
+            text = raw.decode('utf-8-sig' if line_no == 1 else 'utf-8')
+        except UnicodeDecodeError:
+            pending = []
+            yield (line_no, None, 'Not valid UTF-8')
+            continue
+        if fmt == 'ndjson':
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError as e:
+                yield (line_no, None, f'Invalid JSON: {e}')
+                continue
+            if not isinstance(record, dict):
+                yield (line_no, None, 'Each line must be a JSON object')
+                continue
+            yield (line_no, record, None)
+            continue
+        pending.append(text)
+        if sum((part.count('"') for part in pending)) % 2:
+            if sum((len(part) for part in pending)) > IMPORT_MAX_LINE_BYTES:
+                pending = []
+                yield (line_no, None, f'Record longer than {IMPORT_MAX_LINE_BYTES} bytes')
+            continue
+        first_line = line_no - len(pending) + 1
+        record_text = '\n'.join(pending)
+        pending = []
+        if not record_text.strip():
+            continue
+        try:
+            values = next(csv.reader([record_text]))
+        except csv.Error as e:
+            yield (first_line, None, f'Invalid CSV: {e}')
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield (first_line, None, f'Expected {len(header)} fields, got {len(values)}')
+            continue
+        yield (first_line, {name: value for name, value in zip(header, values) if value != ''}, None)
+    if pending:
+        yield (line_no - len(pending) + 1, None, 'Unterminated quoted field')
+
+class BulkImport:
+    """
+    Streams an NDJSON or CSV upload into one table:
+
+    1. Records are parsed and validated one at a time as the body arrives.
+       Invalid rows are reported straight away and never reach the database.
+    2. Valid rows are written IMPORT_CHUNK_ROWS at a time: upserted by id, or
+       inserted when they have none. When the database rejects a chunk, it is
+       split in halves until the rows at fault are isolated, so one bad row does
+       not fail its neighbours.
+    3. The report is NDJSON, one entry per row ({"line", "status", ...}) in
+       the order rows are settled, then {"summary": {...}}.
+
+    At most one chunk of each kind is held in memory, whatever the size of the
+    upload.
+    """
+
+    def __init__(self, sbase, table: str, on_complete: Optional[Callable[[], None]]=None):
+        self.sbase = sbase
+        self.table = table
+        self.on_complete = on_complete
+        self.model = IMPORT_TABLES[table]
+        self.counts = {'ok': 0, 'invalid': 0, 'failed': 0}
+
+    def entry(self, line: int, status: str, **fields) -> str:
+        self.counts[status] += 1
+        import_rows_total.inc(self.table, status)
+        return json.dumps({'line': line, 'status': status, **fields}) + '\n'
+
+    async def run(self, chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[str]:
+        keyed: list[tuple[int, dict]] = []
+        new: list[tuple[int, dict]] = []
+        keyed_ids: set = set()
+        async for line, record, error in read_records(chunks, fmt):
+            if error is not None:
+                yield self.entry(line, 'invalid', errors=[error])
+                continue
+            try:
+                row = self.model.model_validate(record)
+            except ValidationError as e:
+                yield self.entry(line, 'invalid', errors=jsonable_encoder(e.errors(include_url=False, include_context=False)))
+                continue
+            data = row.model_dump(mode='json', exclude={'created_at', 'updated_at'})
+            if data.get('id') is None:
+                data.pop('id', None)
+                new.append((line, data))
+            else:
+                if data['id'] in keyed_ids:
+                    async for report in self.flush(keyed, upsert=True):
+                        yield report
+                    keyed, keyed_ids = ([], set())
+                keyed.append((line, data))
+                keyed_ids.add(data['id'])
+            if len(keyed) >= IMPORT_CHUNK_ROWS:
+                async for report in self.flush(keyed, upsert=True):
+                    yield report
+                keyed, keyed_ids = ([], set())
+            if len(new) >= IMPORT_CHUNK_ROWS:
+                async for report in self.flush(new, upsert=False):
+                    yield report
+                new = []
+        async for report in self.flush(keyed, upsert=True):
+            yield report
+        async for report in self.flush(new, upsert=False):
+            yield report
+        if self.counts['ok'] and self.on_complete:
+            self.on_complete()
+        yield (json.dumps({'summary': {'table': self.table, **self.counts}}) + '\n')
+
+    async def flush(self, rows: list[tuple[int, dict]], upsert: bool) -> AsyncIterator[str]:
+        if not rows:
+            return
+        try:
+            query = self.sbase.table(self.table)
+            payload = [data for _, data in rows]
+            res = await (query.upsert(payload, on_conflict='id') if upsert else query.insert(payload)).execute()
+        except APIError as e:
+            if len(rows) > 1:
+                middle = len(rows) // 2
+                async for report in self.flush(rows[:middle], upsert):
+                    yield report
+                async for report in self.flush(rows[middle:], upsert):
+                    yield report
+                return
+            yield self.entry(rows[0][0], 'failed', error=e.message or str(e))
+            return
+        except Exception as e:
+            print(f'Import into {self.table} failed for {len(rows)} rows: {e}')
+            for line, _ in rows:
+                yield self.entry(line, 'failed', error='Write failed, retry these rows')
+            return
+        written = res.data or []
+        for index, (line, data) in enumerate(rows):
+            row_id = written[index].get('id') if index < len(written) else data.get('id')
+            yield self.entry(line, 'ok', id=row_id)
+
+class ImportResponse(StreamingResponse):
+    """
+    A StreamingResponse that leaves the request body alone. The stock one reads
+    the body in the background to notice disconnects (ASGI < 2.4, uvicorn), which
+    would swallow the upload the report is written from; here the upload reader
+    sees the disconnect instead (ClientDisconnect from request.stream()).
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+
+def import_response(request: Request, sbase, table: str, on_complete: Optional[Callable[[], None]]=None) -> StreamingResponse:
+    fmt = import_format(request.headers.get('content-type'))
+    importer = BulkImport(sbase, table, on_complete)
+    return ImportResponse(importer.run(request.stream(), fmt), media_type='application/x-ndjson')
+EXPORT_PAGE_ROWS = int(os.environ.get('EXPORT_PAGE_ROWS', '1000'))
+EXPORT_MAX_SECONDS = float(os.environ.get('EXPORT_MAX_SECONDS', '50'))
+EXPORT_PATHS = frozenset({'/api/funcs/admin.bookings.export'})
+CSV_COLUMNS = ['id', 'created_at', 'scheduled_at', 'status', 'user_id', 'service_id', 'service_name', 'assignment_id', 'assignment_status', 'techie_id', 'technician_name', 'item_count', 'items_total', 'sub_service_ids']
+export_rows_total = registry.register(Counter('fixel_export_rows_total', 'Bookings streamed by admin.bookings.export, by format.', ('format',)))
+
+def csv_row(doc: dict) -> list:
+    service = doc.get('service') or {}
+    assignment = doc.get('assignment') or {}
+    technician = assignment.get('technician') or {}
+    items = doc.get('booking_item') or []
+    return [doc.get('id'), doc.get('created_at'), doc.get('scheduled_at'), doc.get('status'), doc.get('user_id'), doc.get('service_id'), service.get('name'), doc.get('assignment_id'), assignment.get('status'), assignment.get('techie_id'), technician.get('name'), len(items), sum((item.get('price') or 0 for item in items)), ' '.join((str(item.get('sub_service_id')) for item in items))]
+
+class BookingExport:
+    """
+    Streams every booking matching the filters, one export_bookings page at a time:
+
+    1. Pages are keyset-paged on (created_at, id) by the database, and the next
+       page is fetched while the current one is being sent, so at most two pages
+       are in memory however many rows match.
+    2. NDJSON rows are user.viewBooking documents; CSV rows flatten them
+       (CSV_COLUMNS). Rows come out in (created_at, id) order.
+    3. After EXPORT_MAX_SECONDS no new page is started. NDJSON ends with
+       {"summary": {"rows", "complete", "next"}}, `next` holding the after_*
+       values to resume with; CSV ends after the last full page, and a client
+       resumes from its last row's created_at and id until a page is empty.
+    """
+
+    def __init__(self, sbase, request: ExportBookingsRequest):
+        if request.to_date <= request.from_date:
+            raise HTTPException(status_code=400, detail='to_date must be after from_date')
+        if (request.after_created_at is None) != (request.after_id is None):
+            raise HTTPException(status_code=400, detail='after_created_at and after_id go together')
+        self.sbase = sbase
+        self.request = request
+        self.rows = 0
+
+    async def fetch(self, after: Optional[tuple[str, int]]) -> list[dict]:
+        params = {'p_from': self.request.from_date.isoformat(), 'p_to': self.request.to_date.isoformat(), 'p_statuses': self.request.statuses, 'p_after_created': after[0] if after else None, 'p_after_id': after[1] if after else None, 'p_limit': EXPORT_PAGE_ROWS}
+        res = await self.sbase.rpc('export_bookings', params).execute()
+        return res.data or []
+
+    async def pages(self, stop_at: Optional[float]) -> AsyncIterator[list[dict]]:
+        request = self.request
+        after = (request.after_created_at.isoformat(), request.after_id) if request.after_created_at else None
+        task = asyncio.create_task(self.fetch(after))
+        try:
+            while True:
+                page = await task
+                if len(page) < EXPORT_PAGE_ROWS or (stop_at and time.monotonic() >= stop_at):
+                    yield page
+                    return
+                after = (page[-1]['created_at'], page[-1]['id'])
+                task = asyncio.create_task(self.fetch(after))
+                yield page
+        finally:
+            task.cancel()
+
+    async def run(self) -> AsyncIterator[str]:
+        fmt = self.request.format
+        stop_at = time.monotonic() + EXPORT_MAX_SECONDS if EXPORT_MAX_SECONDS > 0 else None
+        last: Optional[dict] = None
+        complete = False
+        if fmt == 'csv':
+            yield self.csv_lines([CSV_COLUMNS])
+        try:
+            async for page in self.pages(stop_at):
+                if page:
+                    last = page[-1]
+                    self.rows += len(page)
+                    export_rows_total.inc(fmt, amount=len(page))
+                    yield (self.csv_lines([csv_row(doc) for doc in page]) if fmt == 'csv' else ''.join((json.dumps(doc) + '\n' for doc in page)))
+                complete = len(page) < EXPORT_PAGE_ROWS
+        except Exception as e:
+            print(f'Bookings export stopped after {self.rows} rows: {e}')
+        if fmt == 'ndjson':
+            resume = None
+            if not complete and last:
+                resume = {'after_created_at': last['created_at'], 'after_id': last['id']}
+            elif not complete and self.request.after_created_at:
+                resume = {'after_created_at': self.request.after_created_at.isoformat(), 'after_id': self.request.after_id}
+            yield (json.dumps({'summary': {'rows': self.rows, 'complete': complete, 'next': resume}}) + '\n')
+
+    @staticmethod
+    def csv_lines(rows: list[list]) -> str:
+        out = io.StringIO()
+        csv.writer(out).writerows(rows)
+        return out.getvalue()
+
+def export_response(sbase, request: ExportBookingsRequest) -> StreamingResponse:
+    export = BookingExport(sbase, request)
+    media_type = 'text/csv' if request.format == 'csv' else 'application/x-ndjson'
+    filename = f'bookings-{request.from_date:%Y%m%d}-{request.to_date:%Y%m%d}.{request.format}'
+    return StreamingResponse(export.run(), media_type=media_type, headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+CATALOG_TTL = float(os.environ.get('CATALOG_TTL', '60'))
+CATALOG_MISS_RELOAD = float(os.environ.get('CATALOG_MISS_RELOAD', '5'))
+
+class CatalogCache:
+    """
+    Per-worker copy of the service catalog (services with their sub-services).
+
+    Reads within the TTL are served from memory; a refresh goes through the
+    singleflight so a burst of app opens after expiry still sends one query.
+    """
+
+    def __init__(self, ttl: float=CATALOG_TTL, client_factory: Callable[[], Awaitable[Any]]=get_shared_supabase):
+        self.ttl = ttl
+        self.client_factory = client_factory
+        self._rows: Optional[list[dict]] = None
+        self._loaded_at = 0.0
+        self._stats = {'hits': 0, 'misses': 0}
+        self._index: Optional[tuple[list[dict], dict[str, dict], dict[str, dict]]] = None
+
+    def fresh(self) -> bool:
+        return self._rows is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def get(self) -> list[dict]:
+        if self.fresh():
+            self._stats['hits'] += 1
+            return self._rows
+        self._stats['misses'] += 1
+        return await flight.run('service.viewServices', self._fetch)
+
+    async def _fetch(self) -> list[dict]:
+        sbase = await self.client_factory()
+        response = await sbase.table('service').select('*, sub_service(*)').order('id').execute()
+        self._rows = response.data or []
+        self._loaded_at = time.monotonic()
+        return self._rows
+
+    async def lookup(self) -> tuple[dict[str, dict], dict[str, dict]]:
+        """Services (without their sub-services) and sub-services, each keyed by str(id)."""
+        rows = await self.get()
+        if self._index is None or self._index[0] is not rows:
+            services = {str(s['id']): {k: v for k, v in s.items() if k != 'sub_service'} for s in rows}
+            sub_services = {str(ss['id']): ss for s in rows for ss in s.get('sub_service') or []}
+            self._index = (rows, services, sub_services)
+        return (self._index[1], self._index[2])
+
+    def age(self) -> float:
+        """Seconds since the current copy was loaded (infinite without one)."""
+        return time.monotonic() - self._loaded_at if self._rows is not None else float('inf')
+
+    def invalidate(self):
+        self._rows = None
+
+    def stats(self) -> dict[str, int]:
+        return dict(self._stats)
+catalog = CatalogCache()
+BATCH_WINDOW = 0.002
+MAX_BATCH_SIZE = 200
+
+class BatchLoader:
+    """
+    DataLoader-style per-table row loader.
+
+    Ids requested within BATCH_WINDOW (across all concurrent requests) are fetched
+    with one `.in_(key, [...])` query and the rows fanned back out to each caller.
+    An id that is already part of an in-flight batch joins that batch instead of
+    being queued again. Rows are never kept after their batch resolves.
+    """
+
+    def __init__(self, table: str, key: str='id', columns: str='*', window: float=BATCH_WINDOW, max_batch: int=MAX_BATCH_SIZE, client_factory: Callable[[], Awaitable[Any]]=get_shared_supabase, name: Optional[str]=None):
+        self.table = table
+        self.name = name or table
+        self.key = key
+        self.columns = columns
+        self.window = window
+        self.max_batch = max_batch
+        self.client_factory = client_factory
+        self._pending: dict[str, asyncio.Future] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._stats = {'loads': 0, 'queries': 0, 'ids_fetched': 0, 'collapsed': 0}
+
+    async def load(self, id: Any) -> Optional[dict]:
+        """Returns the row whose key column equals id, or None."""
+        key = str(id)
+        self._stats['loads'] += 1
+        fut = self._pending.get(key) or self._inflight.get(key)
+        if fut is not None:
+            self._stats['collapsed'] += 1
+        else:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            self._pending[key] = fut
+            if len(self._pending) >= self.max_batch:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._dispatch)
+        return await asyncio.shield(fut)
+
+    async def load_many(self, ids: Iterable[Any]) -> list[Optional[dict]]:
+        return list(await asyncio.gather(*[self.load(i) for i in ids]))
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = (self._pending, {})
+        self._inflight.update(batch)
+        task = asyncio.ensure_future(self._fetch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, batch: dict[str, asyncio.Future]):
+        self._stats['queries'] += 1
+        self._stats['ids_fetched'] += len(batch)
+        try:
+            sbase = await self.client_factory()
+            res = await sbase.table(self.table).select(self.columns).in_(self.key, list(batch)).execute()
+            rows = {str(row[self.key]): row for row in res.data or []}
+            for key, fut in batch.items():
+                if not fut.done():
+                    fut.set_result(rows.get(key))
+        except Exception as e:
+            print(f'Batch load from {self.table} failed: {e}')
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_exception(e)
+        finally:
+            for key, fut in batch.items():
+                if self._inflight.get(key) is fut:
+                    del self._inflight[key]
+
+    def stats(self) -> dict[str, int]:
+        return dict(self._stats)
+userprofile_loader = BatchLoader('userprofile')
+technician_loader = BatchLoader('technician')
+assignment_loader = BatchLoader('assignment')
+bookings_loader = BatchLoader('bookings')
+service_loader = BatchLoader('service')
+loaders = {ldr.table: ldr for ldr in (userprofile_loader, technician_loader, assignment_loader, bookings_loader, service_loader)}
+userprofile_exists_loader = BatchLoader('userprofile', columns='id', name='userprofile.exists')
+technician_exists_loader = BatchLoader('technician', columns='id', name='technician.exists')
+
+def loader_stats() -> dict[str, dict[str, int]]:
+    return {ldr.name: ldr.stats() for ldr in (*loaders.values(), userprofile_exists_loader, technician_exists_loader)}
+BOOKING_DOCUMENTS = os.environ.get('BOOKING_DOCUMENTS', '1') != '0'
+BOOKING_SELECT = '*, service:service_id(*), assignment:assignment_id(*, technician:techie_id(id, created_at, name, phone, provider_role_id)), booking_item(*, sub_service(*))'
+
+async def fetch_user_bookings(sbase, user_id: str, documents: Optional[bool]=None) -> list[dict]:
+    """The user's bookings, newest first."""
+    if documents if documents is not None else BOOKING_DOCUMENTS:
+        response = await sbase.table('booking_documents').select('doc').eq('user_id', user_id).order('created_at', desc=True).execute()
+        return await with_catalog([row['doc'] for row in response.data])
+    response = await sbase.table('bookings').select(BOOKING_SELECT).eq('user_id', user_id).order('created_at', desc=True).execute()
+    return response.data
+
+async def fetch_user_booking(sbase, user_id: str, booking_id: int, documents: Optional[bool]=None) -> Optional[dict]:
+    """One booking of the user's, or None."""
+    if documents if documents is not None else BOOKING_DOCUMENTS:
+        response = await sbase.table('booking_documents').select('doc').eq('booking_id', booking_id).eq('user_id', user_id).execute()
+        return (await with_catalog([response.data[0]['doc']]))[0] if response.data else None
+    response = await sbase.table('bookings').select(BOOKING_SELECT).eq('id', booking_id).eq('user_id', user_id).execute()
+    return response.data[0] if response.data else None
+
+async def with_catalog(docs: list[dict]) -> list[dict]:
+    """Fills in `service` and each item's `sub_service` from the catalog, as the embedded select returns them."""
+    services, sub_services = await catalog.lookup()
+    wanted = {str(d['service_id']) for d in docs if d.get('service_id') is not None}
+    wanted_subs = {str(i['sub_service_id']) for d in docs for i in d.get('booking_item') or [] if i.get('sub_service_id') is not None}
+    missing = not wanted <= services.keys() or not wanted_subs <= sub_services.keys()
+    if missing and catalog.age() >= CATALOG_MISS_RELOAD:
+        catalog.invalidate()
+        services, sub_services = await catalog.lookup()
+    for doc in docs:
+        doc['service'] = services.get(str(doc.get('service_id')))
+        for item in doc.get('booking_item') or []:
+            item['sub_service'] = sub_services.get(str(item.get('sub_service_id')))
+    return docs
+
+class WarmUp:
+    """
+    Eager per-instance initialization.
 
-async def verify_user(
-    authorization: Optional[str] = Header(None), 
-    sbase: AsyncClient = Depends(get_supabase)
-) -> str:
+    Steps run in registration order from the worker start hook and again (if
+    they never ran, e.g. the platform skipped the ASGI lifespan) from the first
+    /api/warm call. A failing step is reported but does not stop the others;
+    the next run retries only the steps that failed, and the instance counts as
+    warmed once every step has succeeded.
+    """
+
+    def __init__(self):
+        self._steps: list[tuple[str, Callable[[], Any]]] = []
+        self._timings: dict[str, float] = {}
+        self._errors: dict[str, str] = {}
+        self._done: set[str] = set()
+        self._runs = 0
+        self._finished_at: Optional[float] = None
+        self._started = time.time()
+        self._lock = asyncio.Lock()
+
+    def step(self, fn: Callable[[], Any]) -> Callable[[], Any]:
+        self._steps.append((fn.__name__, fn))
+        return fn
+
+    @property
+    def ready(self) -> bool:
+        return self._finished_at is not None and (not self._errors)
+
+    async def run(self, force: bool=False) -> dict:
+        runs = self._runs
+        async with self._lock:
+            if not force and (self._finished_at is not None or self._runs != runs):
+                return self.status()
+            if force:
+                self._done, self._timings = (set(), {})
+            for name, fn in self._steps:
+                if name in self._done:
+                    continue
+                started = time.perf_counter()
+                try:
+                    await fn()
+                    self._done.add(name)
+                    self._errors.pop(name, None)
+                except Exception as e:
+                    print(f'Warm-up step {name} failed: {e}')
+                    self._errors[name] = str(e)
+                self._timings[name] = round((time.perf_counter() - started) * 1000, 2)
+            self._runs += 1
+            if not self._errors:
+                self._finished_at = time.time()
+            return self.status()
+
+    def status(self) -> dict:
+        return {'ready': self.ready, 'pid': os.getpid(), 'uptime_s': round(time.time() - self._started, 1), 'warmed_at': self._finished_at, 'timings_ms': dict(self._timings), 'errors': dict(self._errors)}
+warmup = WarmUp()
+
+@warmup.step
+async def supabase_client():
+    await get_shared_supabase()
+
+@warmup.step
+async def pydantic_adapters():
+    TypeAdapter(list[BookingRead]).validate_python([{'id': 0, 'created_at': '2026-01-01T00:00:00Z', 'user_id': '00000000-0000-0000-0000-000000000000', 'service_id': 0, 'scheduled_at': '2026-01-01T00:00:00Z', 'booking_item': []}])
+    TypeAdapter(list[ServiceRead]).validate_python([{'id': 0, 'created_at': '2026-01-01T00:00:00Z', 'name': '', 'price': 0, 'sub_service': []}])
+
+@warmup.step
+async def catalog_cache():
+    await catalog.get()
+
+@on_worker_start
+async def warm_up_worker():
+    await warmup.run()
+identity_stats = {'hits': 0, 'misses': 0}
+
+class IdentityMap:
+    """
+    Request-scoped cache of rows keyed by (table, primary key).
+
+    Handlers and helpers pass the same map around during one request, so a row
+    that was already read (or returned by a write) is not fetched again. Misses go
+    through the shared batch loaders. Writes must be recorded with record_write,
+    which replaces the cached rows with the returned representation, or drops the
+    table when the write did not return rows.
+    """
+
+    def __init__(self):
+        self._rows: dict[tuple[str, str], dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, table: str, pk: Any) -> Optional[dict]:
+        return self._rows.get((table, str(pk)))
+
+    def put(self, table: str, row: Optional[dict], pk: str='id') -> Optional[dict]:
+        if row is not None and pk in row:
+            self._rows[table, str(row[pk])] = row
+        return row
+
+    def put_many(self, table: str, rows: Optional[list[dict]], pk: str='id') -> list[dict]:
+        for row in rows or []:
+            self.put(table, row, pk)
+        return rows or []
+
+    def invalidate(self, table: str, pk: Any=None):
+        if pk is not None:
+            self._rows.pop((table, str(pk)), None)
+            return
+        for key in [k for k in self._rows if k[0] == table]:
+            del self._rows[key]
+
+    def record_write(self, table: str, rows: Optional[list[dict]], pk: str='id'):
+        if rows:
+            self.put_many(table, rows, pk)
+        else:
+            self.invalidate(table)
+
+    async def load(self, table: str, pk: Any) -> Optional[dict]:
+        key = (table, str(pk))
+        if key in self._rows:
+            self.hits += 1
+            identity_stats['hits'] += 1
+            return self._rows[key]
+        self.misses += 1
+        identity_stats['misses'] += 1
+        row = await loaders[table].load(pk)
+        if row is not None:
+            self._rows[key] = row
+        return row
+
+async def get_identity_map() -> IdentityMap:
+    return IdentityMap()
+
+def send_email(to_email: str, subject: str, content: str):
+    print(f'MOCK EMAIL to {to_email}: [{subject}] {content}')
+    return
+
+def verify_admin(authorization: Optional[str]=Header(None)):
+    """
+    Guards the bulk admin functions (import, export, analytics, event history)
+    with `Authorization: Bearer <ADMIN_TOKEN>`. Without ADMIN_TOKEN they are off.
+    """
+    token = os.environ.get('ADMIN_TOKEN')
+    if not token:
+        raise HTTPException(status_code=403, detail='Admin functions are disabled')
+    if not authorization or not hmac.compare_digest(authorization, f'Bearer {token}'):
+        raise HTTPException(status_code=401, detail='Invalid admin token')
+
+async def verify_user(authorization: Optional[str]=Header(None), sbase: AsyncClient=Depends(get_supabase)) -> str:
     """
     Verifies the user is authenticated and exists in the userprofile table.
     Returns the user_id (UUID string).
     """
     if not authorization:
-        raise HTTPException(status_code=401, detail="Missing Authorization Header")
-    
-    token = authorization.replace("Bearer ", "")
-    
+        raise HTTPException(status_code=401, detail='Missing Authorization Header')
+    token = authorization.replace('Bearer ', '')
     try:
-        # 1. Verify Token with Supabase Auth
-        user_res = await sbase.auth.get_user(token)
+        user_res = await flight.run('auth.getUser', sbase.auth.get_user, token)
         if not user_res.user:
-             raise HTTPException(status_code=401, detail="Invalid Token")
-        
+            raise HTTPException(status_code=401, detail='Invalid Token')
         user_id = user_res.user.id
-        
-        # 2. Verify User Profile exists
-        profile_res = await sbase.table("userprofile").select("id").eq("id", user_id).execute()
-        if not profile_res.data:
-            raise HTTPException(status_code=403, detail="User profile not found. Please register.")
-            
+        profile = await userprofile_exists_loader.load(user_id)
+        if not profile:
+            raise HTTPException(status_code=403, detail='User profile not found. Please register.')
         return user_id
-
+    except (UpstreamUnavailable, DeadlineExceeded):
+        raise
     except Exception as e:
-        print(f"Auth Error: {e}")
-        raise HTTPException(status_code=401, detail="Authentication Failed")
+        print(f'Auth Error: {e}')
+        raise HTTPException(status_code=401, detail='Authentication Failed')
 
-async def verify_technician(
-    authorization: Optional[str] = Header(None), 
-    sbase: AsyncClient = Depends(get_supabase)
-) -> str:
+async def verify_technician(authorization: Optional[str]=Header(None), sbase: AsyncClient=Depends(get_supabase)) -> str:
     """
     Verifies the user is authenticated and exists in the technician table.
     Returns the technician's UUID string (techie_id).
     """
     if not authorization:
-        raise HTTPException(status_code=401, detail="Missing Authorization Header")
-    
-    token = authorization.replace("Bearer ", "")
-    
+        raise HTTPException(status_code=401, detail='Missing Authorization Header')
+    token = authorization.replace('Bearer ', '')
     try:
-        # 1. Verify Token with Supabase Auth
-        user_res = await sbase.auth.get_user(token)
+        user_res = await flight.run('auth.getUser', sbase.auth.get_user, token)
         if not user_res.user:
-             raise HTTPException(status_code=401, detail="Invalid Token")
-        
+            raise HTTPException(status_code=401, detail='Invalid Token')
         user_id = user_res.user.id
-        
-        # 2. Verify Technician exists
-        # Note: We assume the 'id' in technician table matches the Supabase Auth ID (UUID)
-        tech_res = await sbase.table("technician").select("id").eq("id", user_id).execute()
-        if not tech_res.data:
-            raise HTTPException(status_code=403, detail="Technician profile not found.")
-            
+        technician = await technician_exists_loader.load(user_id)
+        if not technician:
+            raise HTTPException(status_code=403, detail='Technician profile not found.')
         return user_id
-
+    except (UpstreamUnavailable, DeadlineExceeded):
+        raise
     except Exception as e:
-        print(f"Auth Error: {e}")
-        raise HTTPException(status_code=401, detail="Authentication Failed")
-
-def send_push_notification(token: str, title: str, message: str, data: Optional[dict] = None):
-    from exponent_server_sdk import (
-        PushClient,
-        PushMessage,
-        PushServerError,
-        DeviceNotRegisteredError,
-    )
+        print(f'Auth Error: {e}')
+        raise HTTPException(status_code=401, detail='Authentication Failed')
 
+def send_push_notification(token: str, title: str, message: str, data: Optional[dict]=None):
+    from exponent_server_sdk import PushClient, PushMessage, PushServerError, DeviceNotRegisteredError
     if not token:
-        print("No push token provided.")
-        return
-
+        print('No push token provided.')
+        return 'no_token'
     try:
-        # Check for access token in env (optional, for enhanced security)
         session_args = {}
-        access_token = os.environ.get("EXPO_ACCESS_TOKEN")
+        access_token = os.environ.get('EXPO_ACCESS_TOKEN')
         if access_token:
-            session_args["access_token"] = access_token
-
-        response = PushClient(**session_args).publish(
-            PushMessage(to=token, title=title, body=message, data=data)
-        )
+            session_args['access_token'] = access_token
+        response = PushClient(**session_args).publish(PushMessage(to=token, title=title, body=message, data=data))
     except PushServerError as exc:
-        print(f"Push Server Error: {exc.errors}")
+        print(f'Push Server Error: {exc.errors}')
+        return 'server_error'
     except (ConnectionError, ValueError) as exc:
-        print(f"Push Connection/Value Error: {exc}")
-
+        print(f'Push Connection/Value Error: {exc}')
+        return 'connection_error'
     try:
         response.validate_response()
     except DeviceNotRegisteredError:
-        print(f"Device not registered: {token}")
+        print(f'Device not registered: {token}')
+        return 'device_not_registered'
     except Exception as exc:
-        print(f"Push Notification Error: {exc}")
+        print(f'Push Notification Error: {exc}')
+        return 'error'
     else:
-        print(f"Push Notification sent to {token}: {title} - {message}")
-
-# --- MODULE: main (main.py) ---
-
-app = FastAPI(title="Fixel Backend", docs_url="/api/docs", redoc_url="/api/redoc", openapi_url="/api/openapi.json")
-
-# --- User Functions ---
+        print(f'Push Notification sent to {token}: {title} - {message}')
+        return 'sent'
+BATCH_MAX_CALLS = int(os.environ.get('BATCH_MAX_CALLS', '10'))
+BATCH_DEADLINE = float(os.environ.get('BATCH_DEADLINE', '20'))
+FUNCS_PREFIX = '/api/funcs/'
+BATCH_EXCLUDED = {'batch', 'user.register', 'user.login', 'technician.register', 'technician.login', 'technician.offerStream'}
+batch_calls_total = registry.register(Counter('fixel_batch_calls_total', 'Calls made through /api/funcs/batch, by func and status.', ('func', 'status')))
+
+class BatchTarget:
+    """How to call one /api/funcs route outside FastAPI's request handling."""
+
+    def __init__(self, route: APIRoute, body: Optional[tuple[str, type]], roles: dict[str, str], resources: dict[str, str], headers: dict[str, str]):
+        self.func = route.path[len(FUNCS_PREFIX):]
+        self.endpoint = route.endpoint
+        self.body = body
+        self.roles = roles
+        self.resources = resources
+        self.headers = headers
+        self.response = TypeAdapter(route.response_model) if route.response_model is not None else None
+ROLE_DEPENDENCIES: dict[Callable, str] = {verify_user: 'user', verify_technician: 'technician'}
+RESOURCE_DEPENDENCIES: dict[Callable, str] = {get_supabase: 'sbase', get_identity_map: 'identity'}
+
+def plan_route(route: APIRoute) -> Optional[BatchTarget]:
+    """None when the route has a parameter or dependency a batch cannot supply."""
+    if route.dependencies:
+        return None
+    body, roles, resources, headers = (None, {}, {}, {})
+    for name, param in inspect.signature(route.endpoint).parameters.items():
+        default = param.default
+        if isinstance(default, DependsParam):
+            if default.dependency in ROLE_DEPENDENCIES:
+                roles[name] = ROLE_DEPENDENCIES[default.dependency]
+            elif default.dependency in RESOURCE_DEPENDENCIES:
+                resources[name] = RESOURCE_DEPENDENCIES[default.dependency]
+            else:
+                return None
+        elif isinstance(default, HeaderParam):
+            headers[name] = default.alias or name.replace('_', '-')
+        elif inspect.isclass(param.annotation) and issubclass(param.annotation, BaseModel) and (body is None):
+            body = (name, param.annotation)
+        else:
+            return None
+    return BatchTarget(route, body, roles, resources, headers)
+
+def error_entry(status: int, detail: Any) -> dict:
+    return {'ok': False, 'status': status, 'error': detail}
+
+class BatchRunner:
+    """
+    Runs several /api/funcs calls for one HTTP request:
+
+    1. Each func is looked up among the app's own routes and its handler is
+       called directly, with its body model validated from `args`.
+    2. Authentication happens once per batch: verify_user / verify_technician
+       run at most once each (concurrently, so they share one auth.getUser call)
+       and every call gets the same result, or the same 401/403.
+    3. All calls share one Supabase client and one identity map, run
+       concurrently, and are bounded by one deadline; a call that does not
+       finish in time gets a 504 entry. Results come back in request order.
+
+    Admission is per call: with `admission` (the BatchAdmission the middleware
+    left in scope) each call takes a token in its func's priority class, as it
+    would on its own, and a rejected call gets a 429/503 entry.
+
+    Calls are independent: a batch is not a transaction and gives no ordering
+    between writes.
+    """
 
-@app.post("/api/funcs/user.register")
-async def register_user(data: RegisterRequest, sbase: AsyncClient = Depends(get_supabase)):
-    # 1. Sign up with Supabase Auth
+    def __init__(self, app):
+        self.app = app
+        self._targets: Optional[dict[str, Optional[BatchTarget]]] = None
+
+    def targets(self) -> dict[str, Optional[BatchTarget]]:
+        if self._targets is None:
+            self._targets = {}
+            for route in self.app.routes:
+                if isinstance(route, APIRoute) and route.path.startswith(FUNCS_PREFIX) and ('POST' in route.methods):
+                    func = route.path[len(FUNCS_PREFIX):]
+                    if func not in BATCH_EXCLUDED and (not func.startswith('admin.')):
+                        self._targets[func] = plan_route(route)
+        return self._targets
+
+    async def authenticate(self, roles: set[str], authorization: Optional[str], sbase) -> dict[str, Any]:
+        """role -> user id, or the exception that role's check raised."""
+        checks = {'user': verify_user, 'technician': verify_technician}
+        wanted = sorted(roles)
+        results = await asyncio.gather(*[checks[role](authorization, sbase) for role in wanted], return_exceptions=True)
+        return dict(zip(wanted, results))
+
+    async def call(self, target: BatchTarget, args: dict, identities: dict[str, Any], resources: dict[str, Any], headers: dict[str, Optional[str]]) -> dict:
+        kwargs = {}
+        for name, role in target.roles.items():
+            identity = identities[role]
+            if isinstance(identity, BaseException):
+                raise identity
+            kwargs[name] = identity
+        for name, resource in target.resources.items():
+            kwargs[name] = resources[resource]
+        for name, header in target.headers.items():
+            kwargs[name] = headers.get(header)
+        if target.body is not None:
+            name, model = target.body
+            kwargs[name] = model.model_validate(args)
+        result = await target.endpoint(**kwargs)
+        if target.response is not None:
+            result = target.response.dump_python(target.response.validate_python(result), mode='json')
+        return {'ok': True, 'status': 200, 'result': jsonable_encoder(result)}
+
+    async def run(self, calls: list, headers: dict[str, Optional[str]], sbase, identity, deadline: Optional[float]=None, admission=None) -> list[dict]:
+        if len(calls) > BATCH_MAX_CALLS:
+            raise HTTPException(status_code=400, detail=f'At most {BATCH_MAX_CALLS} calls per batch')
+        budget = min(deadline or BATCH_DEADLINE, BATCH_DEADLINE)
+        started = time.monotonic()
+        targets = self.targets()
+        entries: list[Optional[dict]] = [None] * len(calls)
+        planned = []
+        for index, call in enumerate(calls):
+            target = targets.get(call.func)
+            if call.func not in targets:
+                entries[index] = error_entry(404, f'Unknown func {call.func}')
+            elif target is None:
+                entries[index] = error_entry(400, f'{call.func} cannot be called in a batch')
+            elif admission is not None and (rejection := admission.admit(call.func)) is not None:
+                entries[index] = error_entry(*rejection[:2])
+                batch_calls_total.inc(call.func, str(rejection[0]))
+            else:
+                planned.append((index, target, call.args or {}))
+        with deadline_scope(budget):
+            roles = {role for _, target, _ in planned for role in target.roles.values()}
+            identities = await self.authenticate(roles, headers.get('authorization'), sbase) if roles else {}
+            remaining = max(0.0, budget - (time.monotonic() - started))
+            resources = {'sbase': sbase, 'identity': identity}
+            results = await fan_out(*[step(self.call(target, args, identities, resources, headers), timeout=remaining, name=f'batch:{target.func}') for _, target, args in planned])
+        for (index, target, _), result in zip(planned, results):
+            entries[index] = result if isinstance(result, dict) else self.error_for(result)
+            batch_calls_total.inc(target.func, str(entries[index]['status']))
+        return entries
+
+    @staticmethod
+    def error_for(error: BaseException) -> dict:
+        if isinstance(error, HTTPException):
+            return error_entry(error.status_code, error.detail)
+        if isinstance(error, ValidationError):
+            return error_entry(422, jsonable_encoder(error.errors(include_url=False)))
+        if isinstance(error, UpstreamUnavailable):
+            return error_entry(503, 'Service temporarily unavailable')
+        if isinstance(error, (DeadlineExceeded, TimeoutError)):
+            return error_entry(504, 'Batch deadline exceeded')
+        return error_entry(500, 'Internal error')
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await run_worker_start_hooks()
+    yield
+    await run_worker_stop_hooks()
+app = FastAPI(title='Fixel Backend', docs_url='/api/docs', redoc_url='/api/redoc', openapi_url='/api/openapi.json', lifespan=lifespan)
+app.add_middleware(DeadlineMiddleware, exempt_paths=STREAM_PATHS | IMPORT_PATHS | EXPORT_PATHS)
+app.add_middleware(AdmissionMiddleware)
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request, exc: UpstreamUnavailable):
+    return JSONResponse(status_code=503, content={'detail': 'Service temporarily unavailable'}, headers={'Retry-After': str(max(1, math.ceil(exc.retry_after)))})
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={'detail': 'Upstream timed out'})
+
+@app.post('/api/funcs/user.register')
+async def register_user(data: RegisterRequest, sbase: AsyncClient=Depends(get_supabase)):
     try:
-        auth_res = await sbase.auth.sign_up({
-            "email": data.email,
-            "password": data.password,
-        })
+        auth_res = await sbase.auth.sign_up({'email': data.email, 'password': data.password})
     except Exception as e:
-        print("Error: ", e)
+        print('Error: ', e)
         raise HTTPException(status_code=400, detail=str(e))
-
     if not auth_res.user:
-        print("Error: User not found")
-        # Depending on config, sign_up might return a user but require email confirmation.
-        # If no user is returned, something went wrong.
-        raise HTTPException(status_code=400, detail="Registration failed")
-
+        print('Error: User not found')
+        raise HTTPException(status_code=400, detail='Registration failed')
     user_id = auth_res.user.id
-
-    # 2. Create UserProfile
-    profile_data = {
-        "id": user_id,
-        "name": data.name,
-        "mob_no": data.mob_no,
-        "address": data.address
-    }
-    
-    # Use upsert=True just in case, though it should be new
-    profile_res = await sbase.table("userprofile").upsert(profile_data).execute()
-    
+    profile_data = {'id': user_id, 'name': data.name, 'mob_no': data.mob_no, 'address': data.address}
+    profile_res = await sbase.table('userprofile').upsert(profile_data).execute()
     if not profile_res.data:
-        print("Error: Profile not found")
-        # Note: If automatic trigger exists, this might fail or be redundant.
-        # Provided schema implies we manage this manually for now?
-        # If fail, we might technically have an orphan auth user. 
-        # For this task, we assume happy path or simple error.
+        print('Error: Profile not found')
         pass
+    return {'user': auth_res.user, 'session': auth_res.session, 'profile': profile_res.data[0] if profile_res.data else None}
 
-    return {
-        "user": auth_res.user,
-        "session": auth_res.session,
-        "profile": profile_res.data[0] if profile_res.data else None
-    }
-
-@app.post("/api/funcs/user.login")
-async def login_user(data: LoginRequest, sbase: AsyncClient = Depends(get_supabase)):
+@app.post('/api/funcs/user.login')
+async def login_user(data: LoginRequest, sbase: AsyncClient=Depends(get_supabase)):
     try:
-        auth_res = await sbase.auth.sign_in_with_password({
-            "email": data.email,
-            "password": data.password
-        })
-        # Fetch User Profile
+        auth_res = await sbase.auth.sign_in_with_password({'email': data.email, 'password': data.password})
         user_id = auth_res.user.id
-        profile_res = await sbase.table("userprofile").select("*").eq("id", user_id).execute()
-        
-        return {
-            "user": auth_res.user,
-            "session": auth_res.session,
-            "profile": profile_res.data[0] if profile_res.data else None
-        }
+        profile_res = await sbase.table('userprofile').select('*').eq('id', user_id).execute()
+        return {'user': auth_res.user, 'session': auth_res.session, 'profile': profile_res.data[0] if profile_res.data else None}
     except Exception as e:
-        print(f"Login failed: {e}")
-        if "email not confirmed".lower() in str(e).lower():
-            raise HTTPException(status_code=403, detail="Email not confirmed. Please check your inbox to verify your email address.")
-
-        raise HTTPException(status_code=401, detail="Invalid credentials")
-
-@app.post("/api/funcs/service.viewServices", response_model=list[ServiceRead])
-async def view_services(sbase: AsyncClient = Depends(get_supabase)):
-    response = await sbase.table("service").select("*, sub_service(*)").order("id").execute()
-    print(response.data)
-    return response.data
-
-@app.post("/api/funcs/service.bookService", response_model=BookServiceResponse)
-async def book_service(data: BookServiceRequest, sbase: AsyncClient = Depends(get_supabase)):
-    # Create Booking directly (Assignment decoupled)
-    booking_data = {
-        "user_id": str(data.user_id),
-        "service_id": data.service_id,
-        "scheduled_at": data.scheduled_at,
-        "status": "pending"
-    }
-    booking_res = await sbase.table("bookings").insert(booking_data).execute()
-    
+        print(f'Login failed: {e}')
+        if 'email not confirmed'.lower() in str(e).lower():
+            raise HTTPException(status_code=403, detail='Email not confirmed. Please check your inbox to verify your email address.')
+        raise HTTPException(status_code=401, detail='Invalid credentials')
+
+@app.post('/api/funcs/service.viewServices', response_model=list[ServiceRead])
+async def view_services():
+    return await catalog.get()
+
+@app.post('/api/funcs/service.bookService', response_model=BookServiceResponse)
+async def book_service(data: BookServiceRequest, sbase: AsyncClient=Depends(get_supabase), identity: IdentityMap=Depends(get_identity_map)):
+    booking_data = {'user_id': str(data.user_id), 'service_id': data.service_id, 'scheduled_at': data.scheduled_at, 'status': 'pending'}
+    booking_res = await sbase.table('bookings').insert(booking_data).execute()
     if not booking_res.data:
-        raise HTTPException(status_code=500, detail="Failed to create booking")
-
-    booking = booking_res.data[0]
-    booking_id = booking["id"]
-
-    # Handle Sub-services (Booking Items)
+        raise HTTPException(status_code=500, detail='Failed to create booking')
+    booking = identity.put('bookings', booking_res.data[0])
+    booking_id = booking['id']
+    publish_booking_status(booking)
     if data.sub_service_ids:
-        # Fetch prices to ensure data integrity
-        ss_res = await sbase.table("sub_service").select("id, price").in_("id", data.sub_service_ids).execute()
+        ss_res = await sbase.table('sub_service').select('id, price').in_('id', data.sub_service_ids).execute()
         valid_subs = ss_res.data
-        
         if valid_subs:
-            items_data = [
-                {
-                    "booking_id": booking_id,
-                    "sub_service_id": vs["id"],
-                    "price": vs["price"]
-                }
-                for vs in valid_subs
-            ]
-            await sbase.table("booking_item").insert(items_data).execute()
-
-    # Trigger Assignment
-    assignment = await assign_technician(booking_id, data.service_id, data.scheduled_at)
-    
-    # # Notify User (Booking Received)
-    # # Ideally fetch user email from UserProfile, but for now assuming we have it or just logging
-    # # In a real app we'd fetch the user email. Let's try to fetch it.
-    # user_res = supabase.table("userprofile").select("email").eq("id", str(data.user_id)).execute()
-    # user_email = user_res.data[0]["email"] if user_res.data and "email" in user_res.data[0] else None
-    
-    # if user_email:
-    #     send_email(user_email, "Booking Confirmation", f"Your booking (ID: {booking_id}) has been received.")
-
-    # if assignment:
-    #      # Notify User of Assignment
-    #      if user_email:
-    #          send_email(user_email, "Technician Assigned", f"A technician has been assigned to your booking (ID: {booking_id}).")
-
-    return {
-        "booking": booking
-    }
-
-    # Notify User (Booking Received)
-    # Use helper to persist and send
-    await send_notification_async(
-        sbase,
-        user_id=booking_res.data[0]["user_id"], # Ensure we have user_id string
-        title="Booking Received",
-        message=f"Your booking (ID: {booking_id}) has been received.",
-        data={"booking_id": booking_id, "type": "booking_received"}
-    )
-
-@app.post("/api/funcs/user.cancelBooking")
-async def cancel_booking(data: CancelBookingRequest, user_id: str = Depends(verify_user), sbase: AsyncClient = Depends(get_supabase)):
-    # 1. Verify booking exists and belongs to user
-    booking_res = await sbase.table("bookings").select("*").eq("id", data.booking_id).eq("user_id", user_id).execute()
-    
+            items_data = [{'booking_id': booking_id, 'sub_service_id': vs['id'], 'price': vs['price']} for vs in valid_subs]
+            await sbase.table('booking_item').insert(items_data).execute()
+    assignment = await assign_technician(booking, sbase, identity)
+    return {'booking': booking}
+
+@app.post('/api/funcs/user.cancelBooking')
+async def cancel_booking(data: CancelBookingRequest, user_id: str=Depends(verify_user), sbase: AsyncClient=Depends(get_supabase), identity: IdentityMap=Depends(get_identity_map)):
+    booking_res = await sbase.table('bookings').select('*').eq('id', data.booking_id).eq('user_id', user_id).execute()
     if not booking_res.data:
-        raise HTTPException(status_code=404, detail="Booking not found or does not belong to user")
-    
-    booking = booking_res.data[0]
-    
-    if booking["status"] == "cancelled":
-        return {"message": "Booking is already cancelled"}
-
-    # 2. Update status
-    update_res = await sbase.table("bookings").update({"status": "cancelled"}).eq("id", data.booking_id).execute()
-    
+        raise HTTPException(status_code=404, detail='Booking not found or does not belong to user')
+    booking = identity.put('bookings', booking_res.data[0])
+    if booking['status'] == 'cancelled':
+        return {'message': 'Booking is already cancelled'}
+    update_res = await sbase.table('bookings').update({'status': 'cancelled'}).eq('id', data.booking_id).execute()
     if not update_res.data:
-        raise HTTPException(status_code=500, detail="Failed to cancel booking")
-
-    # Notify User about cancellation confirmation (optional but good)
-    await send_notification_async(
-        sbase,
-        user_id=user_id,
-        title="Booking Cancelled",
-        message=f"your booking (ID: {data.booking_id}) has been cancelled successfully.",
-        data={"booking_id": data.booking_id, "type": "booking_cancelled"}
-    )
-
-    # Notify Technician if assigned
-    if booking.get("assignment_id"):
-        # Fetch technician ID from assignment
-        assign_res = await sbase.table("assignment").select("techie_id").eq("id", booking["assignment_id"]).execute()
-        if assign_res.data:
-            tech_id = assign_res.data[0]["techie_id"]
-            await send_notification_async(
-                sbase,
-                user_id=tech_id,
-                title="Booking Cancelled",
-                message=f"Booking (ID: {data.booking_id}) has been cancelled by the user.",
-                data={"booking_id": data.booking_id, "type": "booking_cancelled"}
-            )
-            # Also update assignment status to cancelled if not done automatically (Assuming logic handles it or we should too)
-            # Schema says assignment references booking. Usually we should cancel assignment too.
-            await sbase.table("assignment").update({"status": "cancelled"}).eq("id", booking["assignment_id"]).execute()
-
-    return {"message": "Booking cancelled successfully", "booking": update_res.data[0]}
-
-async def send_notification_async(sbase: AsyncClient, user_id: UUID | str, title: str, message: str, data: Optional[dict] = None, token: Optional[str] = None):
-    # 1. Persist to DB
+        raise HTTPException(status_code=500, detail='Failed to cancel booking')
+    identity.record_write('bookings', update_res.data)
+    publish_booking_status(update_res.data[0])
+    writes = [step(expire_offers(sbase, data.booking_id), name='expire_offers')]
+    if booking.get('assignment_id'):
+        writes.append(step(sbase.table('assignment').update({'status': 'cancelled'}).eq('id', booking['assignment_id']).execute(), name='cancel_assignment'))
     try:
-        notif_data = {
-            "user_id": str(user_id),
-            "title": title,
-            "content": message
-        }
-        await sbase.table("notifications").insert(notif_data).execute()
+        for result in await fan_out(*writes):
+            unwrap(result)
     except Exception as e:
-        print(f"Failed to persist notification for {user_id}: {e}")
-
-    # 2. Get Token if missing
+        raise HTTPException(status_code=500, detail=f'Failed to cancel booking: {e}')
+    steps = [step(send_notification_async(sbase, user_id=user_id, title='Booking Cancelled', message=f'your booking (ID: {data.booking_id}) has been cancelled successfully.', data={'booking_id': data.booking_id, 'type': 'booking_cancelled'}), name='notify_user')]
+    if booking.get('assignment_id'):
+        steps.append(step(notify_assigned_technician(sbase, booking['assignment_id'], data.booking_id, identity), name='notify_technician'))
+    await fan_out(*steps)
+    return {'message': 'Booking cancelled successfully', 'booking': update_res.data[0]}
+
+async def expire_offers(sbase: AsyncClient, booking_id: int):
+    res = await sbase.table('assignment_request').update({'status': 'expired'}).eq('booking_id', booking_id).eq('status', 'pending').execute()
+    for offer in res.data or []:
+        publish_offer_closed(offer['techie_id'], offer['id'], booking_id, 'cancelled')
+
+async def notify_assigned_technician(sbase: AsyncClient, assignment_id: int, booking_id: int, identity: IdentityMap):
+    assignment = await identity.load('assignment', assignment_id)
+    if assignment:
+        tech_id = assignment['techie_id']
+        await send_notification_async(sbase, user_id=tech_id, title='Booking Cancelled', message=f'Booking (ID: {booking_id}) has been cancelled by the user.', data={'booking_id': booking_id, 'type': 'booking_cancelled'})
+
+async def send_notification_async(sbase: AsyncClient, user_id: UUID | str, title: str, message: str, data: Optional[dict]=None, token: Optional[str]=None):
+    steps = [step(persist_notification(sbase, user_id, title, message), name='persist_notification')]
     if not token:
-        try:
-             # Try UserProfile first
-             res = await sbase.table("userprofile").select("push_token").eq("id", str(user_id)).execute()
-             if res.data and res.data[0].get("push_token"):
-                 token = res.data[0]["push_token"]
-             else:
-                 # Try Technician
-                 res_tech = await sbase.table("technician").select("push_token").eq("id", str(user_id)).execute()
-                 if res_tech.data and res_tech.data[0].get("push_token"):
-                     token = res_tech.data[0]["push_token"]
-        except Exception as e:
-            print(f"Failed to fetch token for {user_id}: {e}")
+        steps.append(step(fetch_push_token(sbase, user_id), name='fetch_push_token'))
+    results = await fan_out(*steps)
+    if not token and (not isinstance(results[1], Exception)):
+        token = results[1]
+    if not token:
+        push_sends_total.inc('no_token')
+        return
+    try:
+        outcome = await asyncio.to_thread(send_push_notification, token, title, message, data)
+    except Exception as e:
+        print(f'Push to {user_id} failed: {e}')
+        outcome = 'error'
+    push_sends_total.inc(outcome or 'sent')
 
-    # 3. Send Push
-    if token:
-        send_push_notification(token, title, message, data)
+async def persist_notification(sbase: AsyncClient, user_id: UUID | str, title: str, message: str):
+    try:
+        notif_data = {'user_id': str(user_id), 'title': title, 'content': message}
+        await sbase.table('notifications').insert(notif_data).execute()
+    except Exception as e:
+        print(f'Failed to persist notification for {user_id}: {e}')
 
-async def assign_technician(booking_id: int, service_id: int, scheduled_at: str):
-    sbase = await get_supabase()
-    # 1. Get Service to find provider_role_id
-    service_res = await sbase.table("service").select("provider_role_id").eq("id", service_id).execute()
-    if not service_res.data:
-        return None
-    provider_role = service_res.data[0]["provider_role_id"]
+async def fetch_push_token(sbase: AsyncClient, user_id: UUID | str) -> Optional[str]:
+    try:
+        profile = await userprofile_loader.load(user_id)
+        if profile and profile.get('push_token'):
+            return profile['push_token']
+        technician = await technician_loader.load(user_id)
+        if technician and technician.get('push_token'):
+            return technician['push_token']
+    except Exception as e:
+        print(f'Failed to fetch token for {user_id}: {e}')
+    return None
 
-    # 2. Find Technicians with matching provider_role
-    tech_res = await sbase.table("technician").select("id, push_token").eq("provider_role_id", provider_role).execute()
-    
+async def assign_technician(booking: dict, sbase: Optional[AsyncClient]=None, identity: Optional[IdentityMap]=None):
+    sbase = sbase or await get_supabase()
+    identity = identity or IdentityMap()
+    booking_id = booking['id']
+    service = await identity.load('service', booking['service_id'])
+    if not service:
+        return None
+    provider_role = service['provider_role_id']
+    tech_res = await sbase.table('technician').select('id, push_token').eq('provider_role_id', provider_role).execute()
     valid_techs = tech_res.data
     if not valid_techs:
         return None
-        
-    # 3. Check existing AssignmentRequests to filter out rejected techs
-    history_res = await sbase.table("assignment_request").select("techie_id, status").eq("booking_id", booking_id).execute()
-    rejected_tech_ids = {h["techie_id"] for h in history_res.data if h["status"] in ["rejected", "expired"]}
-    
-    eligible_techs = [t for t in valid_techs if t["id"] not in rejected_tech_ids]
-
+    history_res = await sbase.table('assignment_request').select('techie_id, status').eq('booking_id', booking_id).execute()
+    rejected_tech_ids = {h['techie_id'] for h in history_res.data if h['status'] in ['rejected', 'expired']}
+    eligible_techs = [t for t in valid_techs if t['id'] not in rejected_tech_ids]
     if not eligible_techs:
-        # No eligible tech found (all rejected or none available)
         return None
-    
-    # 4. Pick first available
     selected_tech = eligible_techs[0]
-    
-    # 5. Create AssignmentRequest (Offer)
-    # Status default is pending
-    request_data = {
-        "techie_id": selected_tech["id"],
-        "booking_id": booking_id,
-        "status": "pending"
-    }
-    
-    # We don't have service_id or scheduled_at in AssignmentRequest schema I Defined in plan?
-    # Wait, the user said "techie_id, booking_id, acceptance_status, created_at". 
-    # I should stick to that schema for AssignmentRequest.
-    # The 'Assignment' table still holds service/scheduled info, but we create that LATER.
-    
-    req_res = await sbase.table("assignment_request").insert(request_data).execute()
-    
+    request_data = {'techie_id': selected_tech['id'], 'booking_id': booking_id, 'status': 'pending'}
+    req_res = await sbase.table('assignment_request').insert(request_data).execute()
     if req_res.data:
-        # 6. Update Booking status
-        # We don't have an 'assignment_id' yet to link in the booking table because Assignment doesn't exist.
-        # But we might want to know it's "assigned/offered".
-        # Let's just set status="assigned".
-        # await sbase.table("bookings").update({"status": "assigned"}).eq("id", booking_id).execute()
+        publish_offer(selected_tech['id'], {**req_res.data[0], 'booking': {**booking, 'service': service}})
         return req_res.data[0]
-    
-    # Notify Technician
-    if selected_tech.get("push_token"):
-         await send_notification_async(
-             sbase,
-             user_id=selected_tech["id"],
-             title="New Booking Available",
-             message=f"You have a new booking request.",
-             data={"booking_id": booking_id, "type": "assignment_request"},
-             token=selected_tech["push_token"]
-         )
-    
+    if selected_tech.get('push_token'):
+        await send_notification_async(sbase, user_id=selected_tech['id'], title='New Booking Available', message=f'You have a new booking request.', data={'booking_id': booking_id, 'type': 'assignment_request'}, token=selected_tech['push_token'])
     return None
 
-
-@app.post("/api/funcs/user.viewBookedServices", response_model=list[BookingRead])
-async def view_booked_services(user_id: str = Depends(verify_user), sbase: AsyncClient = Depends(get_supabase)):
-    # Query bookings table, join service directly (since assignment might be null)
-    # Supabase join: select(*, service(*))
-    # Supabase join: select(*, service(*), booking_item(*, sub_service(*)))
-    response = await sbase.table("bookings").select("*, service:service_id(*), booking_item(*, sub_service(*))").eq("user_id", user_id).order("created_at", desc=True).execute()
+@app.post('/api/funcs/user.viewBookedServices', response_model=list[BookingRead])
+async def view_booked_services(user_id: str=Depends(verify_user), sbase: AsyncClient=Depends(get_supabase)):
+    return await fetch_user_bookings(sbase, user_id)
+
+@app.post('/api/funcs/user.viewBooking', response_model=BookingRead)
+async def view_booking(data: ViewBookingRequest, user_id: str=Depends(verify_user), sbase: AsyncClient=Depends(get_supabase)):
+    booking = await fetch_user_booking(sbase, user_id, data.booking_id)
+    if not booking:
+        raise HTTPException(status_code=404, detail='Booking not found')
+    return booking
+
+@app.websocket('/api/funcs/user.bookingUpdates')
+async def booking_updates(websocket: WebSocket):
+    sbase = await get_shared_supabase()
+    authorization = websocket.headers.get('authorization')
+    last_event_id = websocket.query_params.get('last_event_id')
+    if authorization:
+        try:
+            user_id = await verify_user(authorization, sbase)
+        except HTTPException:
+            await websocket.close(code=CLOSE_UNAUTHORIZED)
+            return
+        except (UpstreamUnavailable, DeadlineExceeded):
+            await websocket.accept()
+            await websocket.close(code=CLOSE_TOO_SLOW, reason='auth unavailable, reconnect')
+            return
+        await websocket.accept()
+    else:
+        await websocket.accept()
+        try:
+            async with asyncio.timeout(LIVE_AUTH_TIMEOUT):
+                hello = await websocket.receive_json()
+            last_event_id = hello.get('last_event_id') or last_event_id
+            user_id = await verify_user(f'Bearer {hello.get('token', '')}', sbase)
+        except (UpstreamUnavailable, DeadlineExceeded):
+            await websocket.close(code=CLOSE_TOO_SLOW, reason='auth unavailable, reconnect')
+            return
+        except Exception:
+            await websocket.close(code=CLOSE_UNAUTHORIZED)
+            return
+    await run_booking_socket(websocket, user_id, last_event_id)
+
+@app.post('/api/funcs/user.viewUser', response_model=list[UserProfile])
+async def view_user(user_id: str=Depends(verify_user), sbase: AsyncClient=Depends(get_supabase)):
+    response = await sbase.table('userprofile').select('*').eq('id', user_id).execute()
     print(response.data)
     return response.data
 
-@app.post("/api/funcs/user.viewBooking", response_model=BookingRead)
-async def view_booking(data: ViewBookingRequest, user_id: str = Depends(verify_user), sbase: AsyncClient = Depends(get_supabase)):
-    response = await sbase.table("bookings").select("*, service:service_id(*), assignment:assignment_id(*, technician:techie_id(*)), booking_item(*, sub_service(*))").eq("id", data.booking_id).eq("user_id", user_id).execute()
-    
-    if not response.data:
-         raise HTTPException(status_code=404, detail="Booking not found")
-    
-    return response.data[0]
-
-@app.post("/api/funcs/user.viewUser", response_model=list[UserProfile])
-async def view_user(user_id: str = Depends(verify_user), sbase: AsyncClient = Depends(get_supabase)):
-    response = await sbase.table("userprofile").select("*").eq("id", user_id).execute()
-    print(response.data)
+@app.post('/api/funcs/notification.viewNotifications', response_model=list[Notification])
+async def view_notifications(user_id: str=Depends(verify_user), sbase: AsyncClient=Depends(get_supabase)):
+    response = await sbase.table('notifications').select('*').eq('user_id', user_id).execute()
     return response.data
 
-@app.post("/api/funcs/notification.viewNotifications", response_model=list[Notification])
-async def view_notifications(user_id: str = Depends(verify_user), sbase: AsyncClient = Depends(get_supabase)):
-    response = await sbase.table("notifications").select("*").eq("user_id", user_id).execute()
-    return response.data
+@app.post('/api/funcs/user.sync')
+async def user_sync(data: SyncRequest, user_id: str=Depends(verify_user), sbase: AsyncClient=Depends(get_supabase)):
+    return await sync_entities(sbase, 'user', user_id, data.cursors, data.entities)
 
-@app.post("/api/funcs/utils.registerPushToken")
-async def register_push_token(data: RegisterPushTokenRequest, authorization: Optional[str] = Header(None), sbase: AsyncClient = Depends(get_supabase)):
-    # Re-using logic from verify code roughly, but generic
+@app.post('/api/funcs/utils.registerPushToken')
+async def register_push_token(data: RegisterPushTokenRequest, authorization: Optional[str]=Header(None), sbase: AsyncClient=Depends(get_supabase)):
     if not authorization:
-         raise HTTPException(status_code=401, detail="Missing Token")
-    token = authorization.replace("Bearer ", "")
+        raise HTTPException(status_code=401, detail='Missing Token')
+    token = authorization.replace('Bearer ', '')
     user_res = await sbase.auth.get_user(token)
     if not user_res.user:
-         raise HTTPException(status_code=401, detail="Invalid Token")
+        raise HTTPException(status_code=401, detail='Invalid Token')
     user_id = user_res.user.id
-
-    table = "userprofile" if data.user_type == "user" else "technician"
-    
-    # Update push_token column
+    table = 'userprofile' if data.user_type == 'user' else 'technician'
     try:
-        await sbase.table(table).update({"push_token": data.token}).eq("id", user_id).execute()
-        return {"message": "Push token updated"}
+        await sbase.table(table).update({'push_token': data.token}).eq('id', user_id).execute()
+        return {'message': 'Push token updated'}
     except Exception as e:
-        print(f"Failed to update push token: {e}")
-        raise HTTPException(status_code=500, detail="Failed to update push token")
+        print(f'Failed to update push token: {e}')
+        raise HTTPException(status_code=500, detail='Failed to update push token')
 
-@app.post("/api/funcs/utils.testNotification")
+@app.post('/api/funcs/utils.testNotification')
 async def test_notification(data: TestNotificationRequest):
-    send_push_notification(
-        token=data.token,
-        title=data.title,
-        message=data.message,
-        data=data.data
-    )
-    return {"message": "Notification sent (or attempted)"}
-
-# --- Technician Functions ---
-
-@app.post("/api/funcs/technician.register")
-async def register_technician(data: TechnicianRegisterRequest, sbase: AsyncClient = Depends(get_supabase)):
-    # 1. Sign up with Supabase Auth
+    send_push_notification(token=data.token, title=data.title, message=data.message, data=data.data)
+    return {'message': 'Notification sent (or attempted)'}
+
+@app.post('/api/funcs/utils.coalesceStats')
+async def coalesce_stats():
+    return {'singleflight': flight.stats(), 'loaders': loader_stats(), 'catalog': catalog.stats()}
+cache_counter('fixel_cache_requests_total', 'Cache lookups by cache and result.', ('cache', 'result'), lambda: {('catalog', 'hit'): catalog.stats()['hits'], ('catalog', 'miss'): catalog.stats()['misses'], ('identity_map', 'hit'): identity_stats['hits'], ('identity_map', 'miss'): identity_stats['misses']})
+
+def coalescing_stats():
+    counts = {}
+    for endpoint, s in flight.stats().items():
+        counts['singleflight', endpoint, 'collapsed'] = s['collapsed']
+        counts['singleflight', endpoint, 'executed'] = s['executions']
+    for table, s in loader_stats().items():
+        counts['loader', table, 'collapsed'] = s['collapsed']
+        counts['loader', table, 'executed'] = s['loads'] - s['collapsed']
+    return counts
+cache_counter('fixel_coalesced_requests_total', 'Reads that joined an in-flight singleflight call or loader batch (collapsed) or issued their own (executed).', ('source', 'key', 'result'), coalescing_stats)
+
+@app.get('/api/metrics', response_class=PlainTextResponse)
+async def metrics(authorization: Optional[str]=Header(None)):
+    if not metrics_enabled():
+        raise HTTPException(status_code=403, detail='Metrics are disabled')
+    if not metrics_authorized(authorization):
+        raise HTTPException(status_code=401, detail='Invalid metrics token')
+    return PlainTextResponse(registry.render(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.get('/api/warm')
+async def warm():
+    return await warmup.run()
+
+@app.post('/api/funcs/technician.register')
+async def register_technician(data: TechnicianRegisterRequest, sbase: AsyncClient=Depends(get_supabase)):
     try:
-        auth_res = await sbase.auth.sign_up({
-            "email": data.email,
-            "password": data.password,
-        })
+        auth_res = await sbase.auth.sign_up({'email': data.email, 'password': data.password})
     except Exception as e:
-        print("Error: ", e)
+        print('Error: ', e)
         raise HTTPException(status_code=400, detail=str(e))
-
     if not auth_res.user:
-        raise HTTPException(status_code=400, detail="Registration failed")
-
+        raise HTTPException(status_code=400, detail='Registration failed')
     user_id = auth_res.user.id
-
-    # 2. Create Technician
-    tech_data = {
-        "id": user_id,
-        "name": data.name,
-        "phone": data.phone,
-        "provider_role_id": data.provider_role_id
-    }
-    
-    # Use upsert=True just in case
-    tech_res = await sbase.table("technician").upsert(tech_data).execute()
-    
+    tech_data = {'id': user_id, 'name': data.name, 'phone': data.phone, 'provider_role_id': data.provider_role_id}
+    tech_res = await sbase.table('technician').upsert(tech_data).execute()
     if not tech_res.data:
-        pass # Handle error or assume success if no exception
-
-    return {
-        "user": auth_res.user,
-        "session": auth_res.session,
-        "technician": tech_res.data[0] if tech_res.data else None
-    }
-
-@app.post("/api/funcs/technician.login")
-async def login_technician(data: TechnicianLoginRequest, sbase: AsyncClient = Depends(get_supabase)):
+        pass
+    return {'user': auth_res.user, 'session': auth_res.session, 'technician': tech_res.data[0] if tech_res.data else None}
 
+@app.post('/api/funcs/technician.login')
+async def login_technician(data: TechnicianLoginRequest, sbase: AsyncClient=Depends(get_supabase)):
     try:
-        auth_res = await sbase.auth.sign_in_with_password({
-            "email": data.email,
-            "password": data.password
-        })
-
-    
-
-        # Check if actually a technician
-        tech_res = await sbase.table("technician").select("id").eq("id", auth_res.user.id).execute()
+        auth_res = await sbase.auth.sign_in_with_password({'email': data.email, 'password': data.password})
+        tech_res = await sbase.table('technician').select('id').eq('id', auth_res.user.id).execute()
         print(tech_res.data, auth_res.user.id)
         if not tech_res.data:
-             raise HTTPException(status_code=403, detail="User is not a technician")
-
-        return {
-            "user": auth_res.user,
-            "session": auth_res.session
-        }
+            raise HTTPException(status_code=403, detail='User is not a technician')
+        return {'user': auth_res.user, 'session': auth_res.session}
     except HTTPException as he:
         raise he
     except Exception as e:
         print(e)
-        if "email not confirmed" in str(e):
-             raise HTTPException(status_code=403, detail="Email not confirmed.")
-        raise HTTPException(status_code=401, detail="Invalid credentials")
+        if 'email not confirmed' in str(e):
+            raise HTTPException(status_code=403, detail='Email not confirmed.')
+        raise HTTPException(status_code=401, detail='Invalid credentials')
 
-@app.post("/api/funcs/technician.viewProfile", response_model=Optional[Technician])
-async def view_technician_profile(techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
-    response = await sbase.table("technician").select("*").eq("id", techie_id).execute()
+@app.post('/api/funcs/technician.viewProfile', response_model=Optional[Technician])
+async def view_technician_profile(techie_id: str=Depends(verify_technician), sbase: AsyncClient=Depends(get_supabase)):
+    return await fetch_technician_profile(sbase, techie_id)
+
+async def fetch_technician_profile(sbase: AsyncClient, techie_id: str) -> Optional[dict]:
+    response = await flight.run('technician.viewProfile', lambda tid: sbase.table('technician').select('*').eq('id', tid).execute(), techie_id)
     return response.data[0] if response.data else None
 
-@app.post("/api/funcs/technician.viewAssignmentRequests", response_model=list[AssignmentRequestRead])
-async def view_assignment_requests(techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
-    # Fetch pending requests
-    # We might want to join booking and service info so they can see what it is
-    # Supabase join syntax: select(*, booking:booking_id(*, service:service_id(*))) - nested might be tricky deep, but let's try shallow first or just booking.
-    # Actually booking -> service_id is in Booking table.
-    response = await sbase.table("assignment_request").select("*, booking:booking_id(*, service:service_id(*))").eq("techie_id", techie_id).eq("status", "pending").execute()
+@app.post('/api/funcs/technician.viewAssignmentRequests', response_model=list[AssignmentRequestRead])
+async def view_assignment_requests(techie_id: str=Depends(verify_technician), sbase: AsyncClient=Depends(get_supabase)):
+    return await fetch_pending_offers(sbase, techie_id)
+
+async def fetch_pending_offers(sbase: AsyncClient, techie_id: str) -> list[dict]:
+    response = await sbase.table('assignment_request').select('*, booking:booking_id(*, service:service_id(*))').eq('techie_id', techie_id).eq('status', 'pending').execute()
     return response.data
 
-@app.post("/api/funcs/technician.viewAssignedBookings", response_model=list[AssignmentRead])
-async def view_assigned_services(techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
-    # Select assignments where techie_id matches, excluding completed/cancelled
-    response = await sbase.table("assignment").select("*, service:service_id(*), booking:booking_id(*)").eq("techie_id", techie_id).neq("status", "completed").neq("status", "cancelled").execute()
+@app.post('/api/funcs/technician.offerStream', response_class=StreamingResponse)
+async def technician_offer_stream(techie_id: str=Depends(verify_technician), sbase: AsyncClient=Depends(get_supabase), last_event_id: Optional[str]=Header(None)):
+    stream = OfferStream(techie_id, lambda: fetch_pending_offers(sbase, techie_id))
+    await stream.open(last_event_id)
+    return StreamingResponse(stream.events(), media_type='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.post('/api/funcs/technician.viewAssignedBookings', response_model=list[AssignmentRead])
+async def view_assigned_services(techie_id: str=Depends(verify_technician), sbase: AsyncClient=Depends(get_supabase)):
+    return await fetch_active_assignments(sbase, techie_id)
+
+async def fetch_active_assignments(sbase: AsyncClient, techie_id: str) -> list[dict]:
+    response = await sbase.table('assignment').select('*, service:service_id(*), booking:booking_id(*)').eq('techie_id', techie_id).neq('status', 'completed').neq('status', 'cancelled').execute()
     return response.data
 
-@app.post("/api/funcs/technician.viewBookingHistory", response_model=list[AssignmentRead])
-async def view_booking_history(techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
-    # For now, maybe all assignments are history? Or filter by completed?
-    # Let's assume viewAssigned is 'active' and history is 'past'.
-    # For MVP, just return all assignments order by date desc.
-    response = await sbase.table("assignment").select("*, service:service_id(*), booking:booking_id(*)").eq("techie_id", techie_id).order("scheduled_at", desc=True).execute()
+@app.post('/api/funcs/technician.dashboard', response_model=TechnicianDashboard)
+async def technician_dashboard(techie_id: str=Depends(verify_technician), sbase: AsyncClient=Depends(get_supabase)):
+    profile, offers, assigned, counts = await fan_out(step(fetch_technician_profile(sbase, techie_id), name='dashboard_profile'), step(fetch_pending_offers(sbase, techie_id), name='dashboard_offers'), step(fetch_active_assignments(sbase, techie_id), name='dashboard_assigned'), step(fetch_technician_counts(sbase, techie_id), name='dashboard_counts'))
+    return {'profile': unwrap(profile), 'assignment_requests': unwrap(offers), 'assigned_bookings': unwrap(assigned), 'counts': unwrap(counts)}
+
+async def fetch_technician_counts(sbase: AsyncClient, techie_id: str) -> dict:
+    response = await sbase.table('technician_counters').select('pending_offers, active_assignments, completed_assignments').eq('techie_id', techie_id).execute()
+    return response.data[0] if response.data else {}
+
+@app.post('/api/funcs/technician.viewBookingHistory', response_model=list[AssignmentRead])
+async def view_booking_history(techie_id: str=Depends(verify_technician), sbase: AsyncClient=Depends(get_supabase)):
+    response = await sbase.table('assignment').select('*, service:service_id(*), booking:booking_id(*)').eq('techie_id', techie_id).order('scheduled_at', desc=True).execute()
     return response.data
 
-@app.post("/api/funcs/technician.acceptAssignment")
-async def accept_assignment(data: AssignmentResponseRequest, techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
-    # 1. Verify Request
-    req_res = await sbase.table("assignment_request").select("*").eq("id", data.request_id).eq("techie_id", techie_id).execute()
-    if not req_res.data:
-        raise HTTPException(status_code=404, detail="Assignment request not found or does not belong to you")
-    
-    request = req_res.data[0]
-    
-    if request["status"] != "pending":
-          raise HTTPException(status_code=400, detail="Assignment request is not pending")
-          
-    # 2. Get Booking to get details for Assignment
-    booking_id = request["booking_id"]
-    booking_res = await sbase.table("bookings").select("*").eq("id", booking_id).execute()
-    if not booking_res.data:
-         raise HTTPException(status_code=404, detail="Booking not found")
-    
-    booking = booking_res.data[0]
-    if booking["status"] == "confirmed":
-         return {"message": "Booking already confirmed by another technician"}
-
-    # 3. Create Assignment
-    assignment_data = {
-        "techie_id": techie_id,
-        "service_id": booking["service_id"],
-        "booking_id": booking_id,
-        "scheduled_at": booking["scheduled_at"],
-        "status": "active" # or whatever status we use for active assignment
-    }
-    
-    assign_res = await sbase.table("assignment").insert(assignment_data).execute()
-    
-    if not assign_res.data:
-         raise HTTPException(status_code=500, detail="Failed to create assignment")
-    
-    assignment = assign_res.data[0]
-
-    # 4. Update Request Status -> accepted
-    await sbase.table("assignment_request").update({"status": "accepted"}).eq("id", data.request_id).execute()
-    
-    # 5. Update Booking Status -> confirmed
-    await sbase.table("bookings").update({"status": "confirmed", "assignment_id": assignment["id"]}).eq("id", booking_id).execute()
-
-    # Notify User
+@app.post('/api/funcs/technician.sync')
+async def technician_sync(data: SyncRequest, techie_id: str=Depends(verify_technician), sbase: AsyncClient=Depends(get_supabase)):
+    return await sync_entities(sbase, 'technician', techie_id, data.cursors, data.entities)
+
+@app.post('/api/funcs/technician.acceptAssignment')
+async def accept_assignment(data: AssignmentResponseRequest, techie_id: str=Depends(verify_technician), sbase: AsyncClient=Depends(get_supabase)):
+    rpc_res = await sbase.rpc('accept_assignment_request', {'p_request_id': data.request_id, 'p_techie_id': str(techie_id)}).execute()
+    outcome = rpc_res.data or {}
+    result = outcome.get('result')
+    if result == 'not_found':
+        raise HTTPException(status_code=404, detail='Assignment request not found or does not belong to you')
+    if result == 'not_pending':
+        raise HTTPException(status_code=400, detail='Assignment request is not pending')
+    if result == 'booking_not_found':
+        raise HTTPException(status_code=404, detail='Booking not found')
+    if result in ('already_confirmed', 'booking_unavailable'):
+        publish_offer_closed(techie_id, data.request_id, None, 'expired')
+    if result == 'already_confirmed':
+        return {'message': 'Booking already confirmed by another technician'}
+    if result == 'booking_unavailable':
+        raise HTTPException(status_code=400, detail=f'Booking is no longer available ({outcome.get('status')})')
+    if result != 'accepted':
+        raise HTTPException(status_code=500, detail='Failed to create assignment')
+    assignment = outcome['assignment']
+    booking = outcome['booking']
+    publish_offer_closed(techie_id, data.request_id, booking['id'], 'accepted')
+    publish_booking_status(booking)
     try:
-        # User ID is in booking["user_id"]
-        await send_notification_async(
-            sbase,
-            user_id=booking["user_id"],
-            title="Technician Assigned",
-            message=f"A technician has been assigned to your booking.",
-            data={"booking_id": booking_id, "type": "technician_assigned"}
-        )
+        await send_notification_async(sbase, user_id=booking['user_id'], title='Technician Assigned', message=f'A technician has been assigned to your booking.', data={'booking_id': booking['id'], 'type': 'technician_assigned'})
     except Exception as e:
-        print(f"Error sending push to user: {e}")
-    
-    return {"message": "Assignment accepted", "assignment": assignment}
-
-@app.post("/api/funcs/technician.rejectAssignment")
-async def reject_assignment(data: AssignmentResponseRequest, techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
-    # 1. Verify Request
-    req_res = await sbase.table("assignment_request").select("*").eq("id", data.request_id).eq("techie_id", techie_id).execute()
-    if not req_res.data:
-        raise HTTPException(status_code=404, detail="Assignment request not found")
-        
-    request = req_res.data[0]
-    
-    # 2. Update Request Status -> rejected
-    await sbase.table("assignment_request").update({"status": "rejected"}).eq("id", data.request_id).execute()
-    
-    # 3. Trigger next assignment
-    booking_id = request["booking_id"]
-    
-    # Retrieve booking details for re-assignment
-    booking_res = await sbase.table("bookings").select("*").eq("id", booking_id).execute()
-    if booking_res.data:
-        booking = booking_res.data[0]
-        # Attempt to assign to next tech
-        new_assignment = await assign_technician(booking_id, booking["service_id"], booking["scheduled_at"])
-        
+        print(f'Error sending push to user: {e}')
+    return {'message': 'Assignment accepted', 'assignment': assignment}
+
+@app.post('/api/funcs/technician.rejectAssignment')
+async def reject_assignment(data: AssignmentResponseRequest, techie_id: str=Depends(verify_technician), sbase: AsyncClient=Depends(get_supabase), identity: IdentityMap=Depends(get_identity_map)):
+    rpc_res = await sbase.rpc('reject_assignment_request', {'p_request_id': data.request_id, 'p_techie_id': str(techie_id)}).execute()
+    outcome = rpc_res.data or {}
+    result = outcome.get('result')
+    if result == 'not_found':
+        raise HTTPException(status_code=404, detail='Assignment request not found')
+    if result == 'not_pending':
+        raise HTTPException(status_code=400, detail='Assignment request is not pending')
+    if result != 'rejected':
+        raise HTTPException(status_code=500, detail='Failed to reject assignment request')
+    booking = outcome.get('booking')
+    booking = identity.put('bookings', booking) if booking and booking.get('id') is not None else None
+    publish_offer_closed(techie_id, data.request_id, booking['id'] if booking else None, 'rejected')
+    if booking:
+        booking_id = booking['id']
+        new_assignment = await assign_technician(booking, sbase, identity)
         if not new_assignment:
-            # If no one else found, maybe set booking to 'pending' or 'unfulfilled'
-            await sbase.table("bookings").update({"status": "pending"}).eq("id", booking_id).execute()
-            return {"message": "Assignment rejected. No other technicians available."}
-            
-    return {"message": "Assignment rejected. Re-assignment process triggered."}
-
-@app.post("/api/funcs/service.updateStatus")
-async def update_status(data: UpdateStatusRequest, techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
-    # 1. Verify Assignment belongs to Technician
-    assign_res = await sbase.table("assignment").select("id").eq("id", data.assignment_id).eq("techie_id", techie_id).execute()
-    if not assign_res.data:
-        raise HTTPException(status_code=403, detail="Assignment not found or does not belong to you")
-
-    # 2. Update status in 'bookings' table via assignment_id
-    await sbase.table("bookings").update({"status": data.status}).eq("assignment_id", data.assignment_id).execute()
-
-    # 3. Update status in 'assignment' table
-    response = await sbase.table("assignment").update({"status": data.status}).eq("id", data.assignment_id).execute()
-
-    if data.status == "completed":
-        # Notify User
-        try: 
-            # Need to get user_id from booking to get token
-            booking_res = await sbase.table("bookings").select("user_id").eq("assignment_id", data.assignment_id).execute()
-            if booking_res.data:
-                user_id = booking_res.data[0]["user_id"]
-                
-                await send_notification_async(
-                    sbase,
-                    user_id=user_id,
-                    title="Booking Completed",
-                    message="Your booking has been marked as completed.",
-                    data={"booking_id": data.assignment_id, "type": "booking_completed"}
-                )
-        except Exception as e:
-             print(f"Error sending push to user: {e}")
-
-    elif data.status == "cancelled":
-         # Notify User
-        try: 
-            booking_res = await sbase.table("bookings").select("user_id").eq("assignment_id", data.assignment_id).execute()
-            if booking_res.data:
-                user_id = booking_res.data[0]["user_id"]
-                
-                await send_notification_async(
-                    sbase,
-                    user_id=user_id,
-                    title="Booking Cancelled",
-                    message="Your booking has been cancelled by the technician.",
-                    data={"booking_id": data.assignment_id, "type": "booking_cancelled"}
-                )
+            pending_res = await sbase.table('bookings').update({'status': 'pending'}).eq('id', booking_id).execute()
+            identity.record_write('bookings', pending_res.data)
+            for row in pending_res.data or []:
+                publish_booking_status(row)
+            return {'message': 'Assignment rejected. No other technicians available.'}
+    return {'message': 'Assignment rejected. Re-assignment process triggered.'}
+
+@app.post('/api/funcs/service.updateStatus')
+async def update_status(data: UpdateStatusRequest, techie_id: str=Depends(verify_technician), sbase: AsyncClient=Depends(get_supabase), identity: IdentityMap=Depends(get_identity_map)):
+    assignment = await identity.load('assignment', data.assignment_id)
+    if not assignment or str(assignment['techie_id']) != str(techie_id):
+        raise HTTPException(status_code=403, detail='Assignment not found or does not belong to you')
+    bookings_res, assign_update_res = await fan_out(step(sbase.table('bookings').update({'status': data.status}).eq('assignment_id', data.assignment_id).execute(), name='update_booking'), step(sbase.table('assignment').update({'status': data.status}).eq('id', data.assignment_id).execute(), name='update_assignment'))
+    unwrap(bookings_res)
+    response = unwrap(assign_update_res)
+    identity.record_write('bookings', bookings_res.data)
+    identity.record_write('assignment', response.data)
+    for row in bookings_res.data or []:
+        publish_booking_status(row)
+    notifications = {'completed': ('Booking Completed', 'Your booking has been marked as completed.', 'booking_completed'), 'cancelled': ('Booking Cancelled', 'Your booking has been cancelled by the technician.', 'booking_cancelled')}
+    if data.status in notifications and bookings_res.data:
+        title, message, notif_type = notifications[data.status]
+        try:
+            await send_notification_async(sbase, user_id=bookings_res.data[0]['user_id'], title=title, message=message, data={'booking_id': data.assignment_id, 'type': notif_type})
         except Exception as e:
-             print(f"Error sending push to user: {e}")
-
+            print(f'Error sending push to user: {e}')
     return response.data
 
-# --- Admin Functions (CRUD) ---
-
-# Service CRUD
-@app.post("/api/funcs/admin.service.create")
-async def admin_create_service(service: Service, sbase: AsyncClient = Depends(get_supabase)):
-    data = service.model_dump(exclude={"id", "created_at", "updated_at"})
-    response = await sbase.table("service").insert(data).execute()
+@app.post('/api/funcs/admin.service.create')
+async def admin_create_service(service: Service, sbase: AsyncClient=Depends(get_supabase)):
+    data = service.model_dump(exclude={'id', 'created_at', 'updated_at'})
+    response = await sbase.table('service').insert(data).execute()
+    catalog.invalidate()
     return response.data
 
-@app.post("/api/funcs/admin.service.update")
-async def admin_update_service(id: int, updates: Dict[str, Any], sbase: AsyncClient = Depends(get_supabase)):
-    response = await sbase.table("service").update(updates).eq("id", id).execute()
+@app.post('/api/funcs/admin.service.update')
+async def admin_update_service(id: int, updates: Dict[str, Any], sbase: AsyncClient=Depends(get_supabase)):
+    response = await sbase.table('service').update(updates).eq('id', id).execute()
+    catalog.invalidate()
     return response.data
 
-@app.post("/api/funcs/admin.service.delete")
-async def admin_delete_service(id: int, sbase: AsyncClient = Depends(get_supabase)):
-    response = await sbase.table("service").delete().eq("id", id).execute()
+@app.post('/api/funcs/admin.service.delete')
+async def admin_delete_service(id: int, sbase: AsyncClient=Depends(get_supabase)):
+    response = await sbase.table('service').delete().eq('id', id).execute()
+    catalog.invalidate()
     return response.data
 
-# Technician CRUD
-@app.post("/api/funcs/admin.technician.create")
-async def admin_create_technician(tech: Technician, sbase: AsyncClient = Depends(get_supabase)):
-    data = tech.model_dump(exclude={"id", "created_at"})
-    response = await sbase.table("technician").insert(data).execute()
+@app.post('/api/funcs/admin.technician.create')
+async def admin_create_technician(tech: Technician, sbase: AsyncClient=Depends(get_supabase)):
+    data = tech.model_dump(exclude={'id', 'created_at'})
+    response = await sbase.table('technician').insert(data).execute()
     return response.data
 
-@app.post("/api/funcs/admin.technician.delete")
-async def admin_delete_technician(id: int, sbase: AsyncClient = Depends(get_supabase)):
-    response = await sbase.table("technician").delete().eq("id", id).execute()
+@app.post('/api/funcs/admin.technician.delete')
+async def admin_delete_technician(id: int, sbase: AsyncClient=Depends(get_supabase)):
+    response = await sbase.table('technician').delete().eq('id', id).execute()
     return response.data
 
-# Assignment CRUD (Admin)
-@app.post("/api/funcs/admin.assignment.create")
-async def admin_create_assignment(assignment: Assignment, sbase: AsyncClient = Depends(get_supabase)):
-    data = assignment.model_dump(exclude={"id", "created_at"})
-    response = await sbase.table("assignment").insert(data).execute()
+@app.post('/api/funcs/admin.assignment.create')
+async def admin_create_assignment(assignment: Assignment, sbase: AsyncClient=Depends(get_supabase)):
+    data = assignment.model_dump(exclude={'id', 'created_at'})
+    response = await sbase.table('assignment').insert(data).execute()
     return response.data
 
-@app.post("/api/funcs/admin.sub_service.create")
-async def admin_create_sub_service(sub_service: SubService, sbase: AsyncClient = Depends(get_supabase)):
-    data = sub_service.model_dump(exclude={"id", "created_at"})
-    response = await sbase.table("sub_service").insert(data).execute()
+@app.post('/api/funcs/admin.sub_service.create')
+async def admin_create_sub_service(sub_service: SubService, sbase: AsyncClient=Depends(get_supabase)):
+    data = sub_service.model_dump(exclude={'id', 'created_at'})
+    response = await sbase.table('sub_service').insert(data).execute()
+    catalog.invalidate()
     return response.data
 
-def main():
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+@app.post('/api/funcs/admin.service.import', response_class=StreamingResponse, dependencies=[Depends(verify_admin)])
+async def admin_import_services(request: Request, sbase: AsyncClient=Depends(get_supabase)):
+    return import_response(request, sbase, 'service', on_complete=catalog.invalidate)
+
+@app.post('/api/funcs/admin.sub_service.import', response_class=StreamingResponse, dependencies=[Depends(verify_admin)])
+async def admin_import_sub_services(request: Request, sbase: AsyncClient=Depends(get_supabase)):
+    return import_response(request, sbase, 'sub_service', on_complete=catalog.invalidate)
+
+@app.post('/api/funcs/admin.technician.import', response_class=StreamingResponse, dependencies=[Depends(verify_admin)])
+async def admin_import_technicians(request: Request, sbase: AsyncClient=Depends(get_supabase)):
+    return import_response(request, sbase, 'technician')
+
+@app.post('/api/funcs/admin.bookings.export', response_class=StreamingResponse, dependencies=[Depends(verify_admin)])
+async def admin_export_bookings(data: ExportBookingsRequest, sbase: AsyncClient=Depends(get_supabase)):
+    return export_response(sbase, data)
+
+@app.post('/api/funcs/admin.analytics', dependencies=[Depends(verify_admin)])
+async def admin_analytics(data: AnalyticsRequest, sbase: AsyncClient=Depends(get_supabase)):
+    return await fetch_analytics(sbase, data.days)
+
+@app.post('/api/funcs/admin.booking.events', dependencies=[Depends(verify_admin)])
+async def admin_booking_events(booking_id: int, sbase: AsyncClient=Depends(get_supabase)):
+    return await fetch_booking_history(sbase, booking_id)
+batch_runner = BatchRunner(app)
+
+@app.post('/api/funcs/batch')
+async def run_batch(calls: list[BatchCall], request: Request, deadline_ms: Optional[int]=None, sbase: AsyncClient=Depends(get_supabase), identity: IdentityMap=Depends(get_identity_map)):
+    deadline = deadline_ms / 1000 if deadline_ms else None
+    return await batch_runner.run(calls, dict(request.headers), sbase, identity, deadline, request.scope.get('admission'))
+OPENAPI_SCHEMA_FILE = Path(__file__).with_name('openapi.json')
+
+def precomputed_openapi():
+    if app.openapi_schema is None and OPENAPI_SCHEMA_FILE.exists():
+        app.openapi_schema = json.loads(OPENAPI_SCHEMA_FILE.read_text(encoding='utf-8'))
+    return app.openapi_schema or FastAPI.openapi(app)
+app.openapi = precomputed_openapi
+
+@warmup.step
+async def asgi_app():
+    if app.middleware_stack is None:
+        app.middleware_stack = app.build_middleware_stack()
+    app.openapi()
 
-if __name__ == "__main__":
+def main():
+    serve()
+if __name__ == '__main__':
     main()
@@ -0,0 +1,183 @@
+import asyncio
+import inspect
+import os
+import time
+from typing import Any, Callable, Optional
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.params import Depends as DependsParam, Header as HeaderParam
+from fastapi.routing import APIRoute
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from db import get_supabase
+from identity import get_identity_map
+from utils import verify_user, verify_technician
+from concurrency import fan_out, step
+from resilience import deadline_scope, UpstreamUnavailable, DeadlineExceeded
+from metrics import registry, Counter
+
+BATCH_MAX_CALLS = int(os.environ.get("BATCH_MAX_CALLS", "10"))
+# Upper bound for a whole batch; a client may ask for less with ?deadline_ms=
+BATCH_DEADLINE = float(os.environ.get("BATCH_DEADLINE", "20"))
+FUNCS_PREFIX = "/api/funcs/"
+# Funcs that cannot run inside a batch: sessions, streams, the batch itself.
+# admin.* take query parameters and are left out as well.
+BATCH_EXCLUDED = {"batch", "user.register", "user.login", "technician.register", "technician.login", "technician.offerStream"}
+
+batch_calls_total = registry.register(Counter("fixel_batch_calls_total", "Calls made through /api/funcs/batch, by func and status.", ("func", "status")))
+
+
+class BatchTarget:
+    """How to call one /api/funcs route outside FastAPI's request handling."""
+
+    def __init__(self, route: APIRoute, body: Optional[tuple[str, type]], roles: dict[str, str], resources: dict[str, str], headers: dict[str, str]):
+        self.func = route.path[len(FUNCS_PREFIX):]
+        self.endpoint = route.endpoint
+        self.body = body
+        self.roles = roles
+        self.resources = resources
+        self.headers = headers
+        self.response = TypeAdapter(route.response_model) if route.response_model is not None else None
+
+
+# Dependencies a batch resolves once and hands to every call
+ROLE_DEPENDENCIES: dict[Callable, str] = {verify_user: "user", verify_technician: "technician"}
+RESOURCE_DEPENDENCIES: dict[Callable, str] = {get_supabase: "sbase", get_identity_map: "identity"}
+
+
+def plan_route(route: APIRoute) -> Optional[BatchTarget]:
+    """None when the route has a parameter or dependency a batch cannot supply."""
+    if route.dependencies:
+        # Route-level checks (verify_admin and the like) never run for a direct call
+        return None
+    body, roles, resources, headers = None, {}, {}, {}
+    for name, param in inspect.signature(route.endpoint).parameters.items():
+        default = param.default
+        if isinstance(default, DependsParam):
+            if default.dependency in ROLE_DEPENDENCIES:
+                roles[name] = ROLE_DEPENDENCIES[default.dependency]
+            elif default.dependency in RESOURCE_DEPENDENCIES:
+                resources[name] = RESOURCE_DEPENDENCIES[default.dependency]
+            else:
+                return None
+        elif isinstance(default, HeaderParam):
+            headers[name] = default.alias or name.replace("_", "-")
+        elif inspect.isclass(param.annotation) and issubclass(param.annotation, BaseModel) and body is None:
+            body = (name, param.annotation)
+        else:
+            return None
+    return BatchTarget(route, body, roles, resources, headers)
+
+
+def error_entry(status: int, detail: Any) -> dict:
+    return {"ok": False, "status": status, "error": detail}
+
+
+class BatchRunner:
+    """
+    Runs several /api/funcs calls for one HTTP request:
+
+    1. Each func is looked up among the app's own routes and its handler is
+       called directly, with its body model validated from `args`.
+    2. Authentication happens once per batch: verify_user / verify_technician
+       run at most once each (concurrently, so they share one auth.getUser call)
+       and every call gets the same result, or the same 401/403.
+    3. All calls share one Supabase client and one identity map, run
+       concurrently, and are bounded by one deadline; a call that does not
+       finish in time gets a 504 entry. Results come back in request order.
+
+    Admission is per call: with `admission` (the BatchAdmission the middleware
+    left in scope) each call takes a token in its func's priority class, as it
+    would on its own, and a rejected call gets a 429/503 entry.
+
+    Calls are independent: a batch is not a transaction and gives no ordering
+    between writes.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._targets: Optional[dict[str, Optional[BatchTarget]]] = None
+
+    def targets(self) -> dict[str, Optional[BatchTarget]]:
+        if self._targets is None:
+            self._targets = {}
+            for route in self.app.routes:
+                if isinstance(route, APIRoute) and route.path.startswith(FUNCS_PREFIX) and "POST" in route.methods:
+                    func = route.path[len(FUNCS_PREFIX):]
+                    if func not in BATCH_EXCLUDED and not func.startswith("admin."):
+                        self._targets[func] = plan_route(route)
+        return self._targets
+
+    async def authenticate(self, roles: set[str], authorization: Optional[str], sbase) -> dict[str, Any]:
+        """role -> user id, or the exception that role's check raised."""
+        checks = {"user": verify_user, "technician": verify_technician}
+        wanted = sorted(roles)
+        results = await asyncio.gather(*[checks[role](authorization, sbase) for role in wanted], return_exceptions=True)
+        return dict(zip(wanted, results))
+
+    async def call(self, target: BatchTarget, args: dict, identities: dict[str, Any], resources: dict[str, Any], headers: dict[str, Optional[str]]) -> dict:
+        kwargs = {}
+        for name, role in target.roles.items():
+            identity = identities[role]
+            if isinstance(identity, BaseException):
+                raise identity
+            kwargs[name] = identity
+        for name, resource in target.resources.items():
+            kwargs[name] = resources[resource]
+        for name, header in target.headers.items():
+            kwargs[name] = headers.get(header)
+        if target.body is not None:
+            name, model = target.body
+            kwargs[name] = model.model_validate(args)
+        result = await target.endpoint(**kwargs)
+        if target.response is not None:
+            result = target.response.dump_python(target.response.validate_python(result), mode="json")
+        return {"ok": True, "status": 200, "result": jsonable_encoder(result)}
+
+    async def run(self, calls: list, headers: dict[str, Optional[str]], sbase, identity, deadline: Optional[float] = None, admission=None) -> list[dict]:
+        if len(calls) > BATCH_MAX_CALLS:
+            raise HTTPException(status_code=400, detail=f"At most {BATCH_MAX_CALLS} calls per batch")
+        budget = min(deadline or BATCH_DEADLINE, BATCH_DEADLINE)
+        started = time.monotonic()
+        targets = self.targets()
+
+        # 1. Resolve every call up front; unknown funcs fail on their own
+        entries: list[Optional[dict]] = [None] * len(calls)
+        planned = []
+        for index, call in enumerate(calls):
+            target = targets.get(call.func)
+            if call.func not in targets:
+                entries[index] = error_entry(404, f"Unknown func {call.func}")
+            elif target is None:
+                entries[index] = error_entry(400, f"{call.func} cannot be called in a batch")
+            elif admission is not None and (rejection := admission.admit(call.func)) is not None:
+                entries[index] = error_entry(*rejection[:2])
+                batch_calls_total.inc(call.func, str(rejection[0]))
+            else:
+                planned.append((index, target, call.args or {}))
+
+        with deadline_scope(budget):
+            # 2. Authenticate once for every role the batch needs
+            roles = {role for _, target, _ in planned for role in target.roles.values()}
+            identities = await self.authenticate(roles, headers.get("authorization"), sbase) if roles else {}
+
+            # 3. Run the calls concurrently within what is left of the deadline
+            remaining = max(0.0, budget - (time.monotonic() - started))
+            resources = {"sbase": sbase, "identity": identity}
+            results = await fan_out(*[step(self.call(target, args, identities, resources, headers), timeout=remaining, name=f"batch:{target.func}") for _, target, args in planned])
+
+        for (index, target, _), result in zip(planned, results):
+            entries[index] = result if isinstance(result, dict) else self.error_for(result)
+            batch_calls_total.inc(target.func, str(entries[index]["status"]))
+        return entries
+
+    @staticmethod
+    def error_for(error: BaseException) -> dict:
+        if isinstance(error, HTTPException):
+            return error_entry(error.status_code, error.detail)
+        if isinstance(error, ValidationError):
+            return error_entry(422, jsonable_encoder(error.errors(include_url=False)))
+        if isinstance(error, UpstreamUnavailable):
+            return error_entry(503, "Service temporarily unavailable")
+        if isinstance(error, (DeadlineExceeded, TimeoutError)):
+            return error_entry(504, "Batch deadline exceeded")
+        return error_entry(500, "Internal error")
@@ -0,0 +1,78 @@
+"""
+Wall-time of the multi-step handlers with serial vs concurrent fan-out.
+
+Every Supabase round trip is simulated with a fixed latency, so the numbers
+show how many sequential round trips each handler pays for.
+
+    python -m benchmarks.bench_fanout [--latency-ms 40] [--runs 20]
+"""
+import argparse
+import asyncio
+import statistics
+import sys
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import main
+from concurrency import _run_isolated, Step
+from benchmarks.latency import LatencyClient, use_for_loaders
+from identity import IdentityMap
+from schema import CancelBookingRequest, UpdateStatusRequest
+
+USER_ID = "00000000-0000-0000-0000-000000000001"
+TECH_ID = "00000000-0000-0000-0000-000000000002"
+
+
+def make_client(latency: float) -> LatencyClient:
+    return LatencyClient(latency, rows={
+        "bookings": [{"id": 1, "user_id": USER_ID, "status": "confirmed", "assignment_id": 7}],
+        "assignment": [{"id": 7, "techie_id": TECH_ID, "status": "active"}],
+        "userprofile": [{"id": USER_ID, "push_token": None}],
+        "technician": [{"id": TECH_ID, "push_token": None}],
+    })
+
+
+async def serial_fan_out(*items):
+    # The pre-fan-out behaviour: await every step one after the other
+    results = []
+    for item in items:
+        results.append(await _run_isolated(item if isinstance(item, Step) else Step(item)))
+    return results
+
+
+async def time_handler(make_call, latency: float, runs: int):
+    samples, trips = [], 0
+    for _ in range(runs):
+        client = make_client(latency)
+        use_for_loaders(client)
+        started = time.perf_counter()
+        await make_call(client)
+        samples.append((time.perf_counter() - started) * 1000)
+        trips = client.round_trips
+    return statistics.median(samples), trips
+
+
+async def run(latency: float, runs: int):
+    handlers = {
+        "user.cancelBooking": lambda c: main.cancel_booking(CancelBookingRequest(user_id=USER_ID, booking_id=1), user_id=USER_ID, sbase=c, identity=IdentityMap()),
+        "service.updateStatus": lambda c: main.update_status(UpdateStatusRequest(assignment_id=7, status="completed"), techie_id=TECH_ID, sbase=c, identity=IdentityMap()),
+    }
+
+    print(f"{'handler':<24}{'mode':<12}{'median ms':>12}{'round trips':>14}")
+    for name, make_call in handlers.items():
+        with patch("main.fan_out", new=serial_fan_out):
+            before, trips_before = await time_handler(make_call, latency, runs)
+        after, trips_after = await time_handler(make_call, latency, runs)
+        print(f"{name:<24}{'serial':<12}{before:>12.1f}{trips_before:>14}")
+        print(f"{name:<24}{'fan-out':<12}{after:>12.1f}{trips_after:>14}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    parser.add_argument("--runs", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(run(args.latency_ms / 1000, args.runs))
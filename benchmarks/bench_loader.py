@@ -0,0 +1,59 @@
+"""
+Query volume of per-id push-token / role lookups with and without batching.
+
+Simulates a peak where --requests lookups for --users distinct ids arrive spread
+over --spread-ms, and counts the queries that reach the (simulated) database.
+
+    python -m benchmarks.bench_loader [--requests 2000] [--users 400] [--spread-ms 50]
+"""
+import argparse
+import asyncio
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.latency import LatencyClient
+from loader import BatchLoader, BATCH_WINDOW
+
+
+async def drive(ldr: BatchLoader, ids: list[str], spread: float):
+    async def one(i, user_id):
+        await asyncio.sleep(spread * i / len(ids))
+        return await ldr.load(user_id)
+
+    started = time.perf_counter()
+    rows = await asyncio.gather(*[one(i, u) for i, u in enumerate(ids)])
+    return rows, (time.perf_counter() - started) * 1000
+
+
+async def run(requests: int, users: int, spread: float, latency: float):
+    user_ids = [f"user-{n}" for n in range(users)]
+    rows = {"userprofile": [{"id": u, "push_token": f"token-{u}"} for u in user_ids]}
+    ids = [random.choice(user_ids) for _ in range(requests)]
+
+    print(f"{'mode':<12}{'queries':>10}{'wall ms':>10}")
+    # Before the loaders every lookup was its own `.eq("id", x)` query
+    print(f"{'eq per call':<12}{requests:>10}{'-':>10}")
+    for mode, window, max_batch in (("per-id", 0.0, 1), ("batched", BATCH_WINDOW, 200)):
+        client = LatencyClient(latency, rows=rows)
+
+        async def factory(c=client):
+            return c
+
+        ldr = BatchLoader("userprofile", window=window, max_batch=max_batch, client_factory=factory)
+        results, wall = await drive(ldr, ids, spread)
+        assert all(r["push_token"] == f"token-{u}" for r, u in zip(results, ids))
+        print(f"{mode:<12}{client.round_trips:>10}{wall:>10.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--users", type=int, default=400)
+    parser.add_argument("--spread-ms", type=float, default=50.0)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.users, args.spread_ms / 1000, args.latency_ms / 1000))
@@ -0,0 +1,151 @@
+"""
+Read cost of user.viewBookedServices / user.viewBooking built from joins versus
+read from the booking_documents read model, and what keeping it costs writes.
+
+Runs against an in-memory SQLite database (JSON1) shaped like the Supabase
+tables: --users users with --bookings each, two booking items per booking and
+an assignment with a technician on every other one. The "join" rows are what
+the embedded PostgREST select does per request; the "document" rows read the
+prebuilt JSON (supabase/migrations/*_booking_documents.sql) and add service and
+sub_service from an in-memory catalog, as read_model.py does.
+
+    python -m benchmarks.bench_read_model [--users 500] [--bookings 20] [--reads 2000]
+"""
+import argparse
+import json
+import random
+import sqlite3
+import time
+
+SCHEMA = """
+create table service (id integer primary key, name text, price integer);
+create table sub_service (id integer primary key, service_id integer, name text, price integer);
+create table technician (id integer primary key, name text, phone text);
+create table bookings (id integer primary key, user_id integer, service_id integer, assignment_id integer, status text, created_at text);
+create table booking_item (id integer primary key, booking_id integer, sub_service_id integer, price integer);
+create table assignment (id integer primary key, booking_id integer, techie_id integer, status text);
+create table booking_documents (booking_id integer primary key, user_id integer, created_at text, doc text);
+create index bookings_user_idx on bookings (user_id, created_at desc);
+create index booking_item_booking_idx on booking_item (booking_id);
+create index booking_documents_user_idx on booking_documents (user_id, created_at desc);
+"""
+
+# Same shape as user.viewBooking's embedded select
+JOINED = """
+json_object(
+    'id', b.id, 'user_id', b.user_id, 'service_id', b.service_id, 'assignment_id', b.assignment_id,
+    'status', b.status, 'created_at', b.created_at,
+    'assignment', (select json_object('id', a.id, 'status', a.status, 'techie_id', a.techie_id,
+                                      'technician', (select json_object('id', t.id, 'name', t.name, 'phone', t.phone) from technician t where t.id = a.techie_id))
+                     from assignment a where a.id = b.assignment_id),
+    'booking_item', (select json_group_array(json_object('id', bi.id, 'price', bi.price, 'sub_service_id', bi.sub_service_id,
+                                 'sub_service', json_object('id', ss.id, 'name', ss.name, 'price', ss.price)))
+                       from booking_item bi left join sub_service ss on ss.id = bi.sub_service_id
+                      where bi.booking_id = b.id),
+    'service', (select json_object('id', s.id, 'name', s.name, 'price', s.price) from service s where s.id = b.service_id)
+)
+"""
+# What booking_documents stores: the same without the catalog rows
+DOCUMENT = """
+json_object(
+    'id', b.id, 'user_id', b.user_id, 'service_id', b.service_id, 'assignment_id', b.assignment_id,
+    'status', b.status, 'created_at', b.created_at,
+    'assignment', (select json_object('id', a.id, 'status', a.status, 'techie_id', a.techie_id,
+                                      'technician', (select json_object('id', t.id, 'name', t.name, 'phone', t.phone) from technician t where t.id = a.techie_id))
+                     from assignment a where a.id = b.assignment_id),
+    'booking_item', (select json_group_array(json_object('id', bi.id, 'price', bi.price, 'sub_service_id', bi.sub_service_id))
+                       from booking_item bi where bi.booking_id = b.id)
+)
+"""
+JOIN_LIST = f"select {JOINED} from bookings b where b.user_id = ? order by b.created_at desc"
+JOIN_ONE = f"select {JOINED} from bookings b where b.id = ? and b.user_id = ?"
+DOC_LIST = "select doc from booking_documents where user_id = ? order by created_at desc"
+DOC_ONE = "select doc from booking_documents where booking_id = ? and user_id = ?"
+REFRESH = f"insert or replace into booking_documents select b.id, b.user_id, b.created_at, {DOCUMENT} from bookings b where b.id = ?"
+
+
+def build(db: sqlite3.Connection, users: int, bookings: int):
+    db.executescript(SCHEMA)
+    db.executemany("insert into service values (?, ?, ?)", [(s, f"service {s}", 400 + s) for s in range(1, 21)])
+    db.executemany("insert into sub_service values (?, ?, ?, ?)", [(s, 1 + s % 20, f"extra {s}", 50) for s in range(1, 101)])
+    db.executemany("insert into technician values (?, ?, ?)", [(t, f"tech {t}", None) for t in range(1, 201)])
+    booking_id = 0
+    for user in range(users):
+        for n in range(bookings):
+            booking_id += 1
+            assignment_id = booking_id if booking_id % 2 else None
+            db.execute("insert into bookings values (?, ?, ?, ?, ?, ?)", (booking_id, user, 1 + booking_id % 20, assignment_id, "confirmed", f"2026-01-01T00:{n:02d}:00"))
+            if assignment_id:
+                db.execute("insert into assignment values (?, ?, ?, ?)", (assignment_id, booking_id, 1 + booking_id % 200, "active"))
+            db.executemany("insert into booking_item (booking_id, sub_service_id, price) values (?, ?, 50)", [(booking_id, 1 + (booking_id + i) % 100) for i in range(2)])
+    db.execute(f"insert into booking_documents select b.id, b.user_id, b.created_at, {DOCUMENT} from bookings b")
+    return booking_id
+
+
+def load_catalog(db: sqlite3.Connection) -> tuple[dict, dict]:
+    """What CatalogCache.lookup holds: services and sub-services by id."""
+    services = {s: {"id": s, "name": name, "price": price} for s, name, price in db.execute("select id, name, price from service")}
+    sub_services = {s: {"id": s, "name": name, "price": price} for s, name, price in db.execute("select id, name, price from sub_service")}
+    return services, sub_services
+
+
+def with_catalog(rows: list, services: dict, sub_services: dict) -> list[dict]:
+    docs = [json.loads(r[0]) for r in rows]
+    for doc in docs:
+        doc["service"] = services.get(doc["service_id"])
+        for item in doc["booking_item"]:
+            item["sub_service"] = sub_services.get(item["sub_service_id"])
+    return docs
+
+
+def timed(label: str, reads: int, fn):
+    started = time.perf_counter()
+    for _ in range(reads):
+        fn()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<28}{elapsed * 1e6 / reads:>12.1f}")
+    return elapsed
+
+
+def run(users: int, bookings: int, reads: int):
+    db = sqlite3.connect(":memory:")
+    total = build(db, users, bookings)
+    rng = random.Random(7)
+    services, sub_services = load_catalog(db)
+
+    # The two paths must agree before their timings mean anything
+    user = rng.randrange(users)
+    joined = [json.loads(r[0]) for r in db.execute(JOIN_LIST, (user,))]
+    stored = with_catalog(db.execute(DOC_LIST, (user,)).fetchall(), services, sub_services)
+    assert joined == stored and len(joined) == bookings
+
+    def one_of_theirs():
+        booking_id = rng.randrange(1, total + 1)
+        return booking_id, (booking_id - 1) // bookings
+
+    print(f"{total} bookings, {users} users")
+    print(f"{'query':<28}{'us / call':>12}")
+    # Both sides decode their JSON, so the comparison includes the catalog merge
+    join_list = timed("list, join", reads, lambda: [json.loads(r[0]) for r in db.execute(JOIN_LIST, (rng.randrange(users),))])
+    doc_list = timed("list, document", reads, lambda: with_catalog(db.execute(DOC_LIST, (rng.randrange(users),)).fetchall(), services, sub_services))
+    join_one = timed("one, join", reads, lambda: [json.loads(r[0]) for r in db.execute(JOIN_ONE, tuple(one_of_theirs()))])
+    doc_one = timed("one, document", reads, lambda: with_catalog(db.execute(DOC_ONE, tuple(one_of_theirs())).fetchall(), services, sub_services))
+
+    # What the triggers add to a write: one booking_item insert plus its refresh
+    def write(refresh: bool):
+        booking_id = rng.randrange(1, total + 1)
+        db.execute("insert into booking_item (booking_id, sub_service_id, price) values (?, 1, 50)", (booking_id,))
+        if refresh:
+            db.execute(REFRESH, (booking_id,))
+    timed("write, plain", reads, lambda: write(False))
+    timed("write + refresh", reads, lambda: write(True))
+    print(f"list reads {join_list / doc_list:.1f}x, single reads {join_one / doc_one:.1f}x faster from documents")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--bookings", type=int, default=20, help="bookings per user")
+    parser.add_argument("--reads", type=int, default=2000)
+    args = parser.parse_args()
+    run(args.users, args.bookings, args.reads)
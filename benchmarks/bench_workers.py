@@ -0,0 +1,94 @@
+"""
+Throughput of the production server mode across 1..N workers.
+
+Starts `python main.py` with FIXEL_WORKERS=1..N on a free port and drives it with
+several load-generator processes. The default target (/api/openapi.json) does no
+upstream I/O, so the numbers show how request handling scales across cores.
+
+    python -m benchmarks.bench_workers [--max-workers 4] [--duration 5] [--path /api/openapi.json]
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port: int, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server on port {port} did not start")
+
+
+def _drive(url: str, duration: float, concurrency: int, out):
+    import httpx
+
+    async def run():
+        done = 0
+        deadline = time.monotonic() + duration
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(limits=limits, timeout=10) as client:
+            async def worker():
+                nonlocal done
+                while time.monotonic() < deadline:
+                    res = await client.get(url)
+                    if res.status_code == 200:
+                        done += 1
+            await asyncio.gather(*[worker() for _ in range(concurrency)])
+        return done
+
+    out.put(asyncio.run(run()))
+
+
+def measure(workers: int, path: str, duration: float, clients: int, concurrency: int) -> float:
+    port = free_port()
+    env = dict(os.environ, FIXEL_WORKERS=str(workers), FIXEL_PORT=str(port), FIXEL_HOST="127.0.0.1")
+    server = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_ready(port)
+        time.sleep(1.0)  # let every worker finish its start hooks
+        out = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=_drive, args=(f"http://127.0.0.1:{port}{path}", duration, concurrency, out)) for _ in range(clients)]
+        for p in procs:
+            p.start()
+        total = sum(out.get() for _ in procs)
+        for p in procs:
+            p.join()
+        return total / duration
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--duration", type=float, default=5.0)
+    parser.add_argument("--path", default="/api/openapi.json")
+    parser.add_argument("--clients", type=int, default=4, help="load generator processes")
+    parser.add_argument("--concurrency", type=int, default=32, help="connections per load generator")
+    args = parser.parse_args()
+
+    baseline = None
+    print(f"{'workers':>8}{'req/s':>12}{'scaling':>10}")
+    for workers in range(1, args.max_workers + 1):
+        rps = measure(workers, args.path, args.duration, args.clients, args.concurrency)
+        baseline = baseline or rps
+        print(f"{workers:>8}{rps:>12.0f}{rps / baseline:>9.2f}x")
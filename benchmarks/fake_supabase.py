@@ -0,0 +1,584 @@
+"""
+Local stand-in for the Supabase endpoints main.py talks to: PostgREST
+(/rest/v1, including embedded selects and the assignment RPCs) and GoTrue
+(/auth/v1 user, token and signup), backed by in-memory tables.
+
+Every request waits --latency-ms (plus up to --jitter-ms) before it is served,
+so load tests see a realistic round-trip cost without a real project.
+
+    python -m benchmarks.fake_supabase [--port 54321] [--latency-ms 20] [--jitter-ms 5] [--users 200] [--technicians 40]
+
+Run the app against it with SUPABASE_URL=http://127.0.0.1:54321 SUPABASE_KEY=fake.
+Seeded accounts are deterministic (see user_ids / technician_ids / token_for).
+"""
+import argparse
+import asyncio
+import base64
+import json
+import random
+import time
+import uuid
+from datetime import datetime, timezone
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+# (table, column) -> referenced table; used to resolve embedded selects
+FOREIGN_KEYS = {
+    "bookings": {"service_id": "service", "assignment_id": "assignment", "user_id": "userprofile"},
+    "assignment": {"techie_id": "technician", "service_id": "service", "booking_id": "bookings"},
+    "assignment_request": {"booking_id": "bookings", "techie_id": "technician"},
+    "booking_item": {"booking_id": "bookings", "sub_service_id": "sub_service"},
+    "sub_service": {"service_id": "service"},
+    "notifications": {"user_id": "userprofile"},
+}
+TABLES = ("userprofile", "technician", "service", "sub_service", "bookings", "booking_item", "assignment", "assignment_request", "notifications", "technician_counters", "booking_documents", "booking_events")
+# Tables whose primary key is supplied by the caller (auth user id) instead of a sequence
+UUID_TABLES = {"userprofile", "technician", "technician_counters"}
+ROLES = ("plumber", "electrician", "cleaner", "carpenter")
+PASSWORD = "password"
+SEED_NAMESPACE = uuid.UUID("6f1c2a52-9b7e-4c1e-8a4e-2d7f0b6c9e10")
+# Shape of a booking_documents.doc: user.viewBooking without the catalog rows
+BOOKING_DOCUMENT_SELECT = "*, assignment:assignment_id(*, technician:techie_id(id, created_at, name, phone, provider_role_id)), booking_item(*)"
+# Technician columns a document shows; writes to other columns leave documents alone
+TECHNICIAN_DOCUMENT_COLUMNS = ("name", "phone", "provider_role_id", "created_at")
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+def user_ids(count: int) -> list[str]:
+    return [str(uuid.uuid5(SEED_NAMESPACE, f"user-{i}")) for i in range(count)]
+
+
+def technician_ids(count: int) -> list[str]:
+    return [str(uuid.uuid5(SEED_NAMESPACE, f"technician-{i}")) for i in range(count)]
+
+
+def _b64(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def token_for(user_id: str, email: str = "", ttl: int = 24 * 3600) -> str:
+    """An (unsigned) JWT the stand-in accepts for user_id. The auth client only decodes it."""
+    header = {"alg": "HS256", "typ": "JWT"}
+    payload = {"sub": user_id, "email": email, "aud": "authenticated", "role": "authenticated", "exp": int(time.time()) + ttl}
+    return ".".join([_b64(json.dumps(header).encode()), _b64(json.dumps(payload).encode()), _b64(b"fake-signature")])
+
+
+def user_from_token(token: str):
+    try:
+        payload = token.split(".")[1]
+        return json.loads(base64.urlsafe_b64decode(payload + "=" * (-len(payload) % 4)))["sub"]
+    except Exception:
+        return None
+
+
+class Store:
+    """In-memory tables keyed by primary key, with lazily built per-column indexes."""
+
+    def __init__(self):
+        self.tables: dict[str, dict[str, dict]] = {name: {} for name in TABLES}
+        self.sequences: dict[str, int] = {name: 0 for name in TABLES}
+        self.accounts: dict[str, dict] = {}  # email -> auth user
+        self.users: dict[str, dict] = {}  # auth user id -> auth user
+        self._indexes: dict[tuple[str, str], dict[str, list[dict]]] = {}
+
+    def table(self, name: str) -> dict[str, dict]:
+        if name not in self.tables:
+            raise KeyError(name)
+        return self.tables[name]
+
+    def get(self, table: str, pk):
+        return self.table(table).get(str(pk)) if pk is not None else None
+
+    def by(self, table: str, column: str, value) -> list[dict]:
+        key = (table, column)
+        index = self._indexes.get(key)
+        if index is None:
+            index = {}
+            for row in self.table(table).values():
+                index.setdefault(str(row.get(column)), []).append(row)
+            self._indexes[key] = index
+        return index.get(str(value), [])
+
+    def _touch(self, table: str):
+        for key in [k for k in self._indexes if k[0] == table]:
+            del self._indexes[key]
+
+    # Same counts as the triggers in supabase/migrations/*_technician_counters.sql
+    def _count(self, table: str, row: dict, sign: int):
+        if table == "assignment_request":
+            deltas = {"pending_offers": row.get("status") == "pending"}
+        elif table == "assignment":
+            status = row.get("status")
+            deltas = {"active_assignments": status is not None and status not in ("completed", "cancelled"), "completed_assignments": status == "completed"}
+        else:
+            return
+        techie_id = row.get("techie_id")
+        if techie_id is None or not any(deltas.values()):
+            return
+        counters = self.tables["technician_counters"].setdefault(str(techie_id), {"id": str(techie_id), "techie_id": str(techie_id), "pending_offers": 0, "active_assignments": 0, "completed_assignments": 0})
+        for column, counted in deltas.items():
+            counters[column] = max(counters[column] + sign * counted, 0)
+        self._touch("technician_counters")
+
+    @staticmethod
+    def _shown(table: str, rows: list[dict]) -> list | None:
+        if table != "technician":
+            return None
+        return [tuple(row.get(c) for c in TECHNICIAN_DOCUMENT_COLUMNS) for row in rows]
+
+    # Same documents as the triggers in supabase/migrations/*_booking_documents.sql;
+    # `shown` holds each technician row's documented columns before an update
+    def _refresh_documents(self, table: str, rows: list[dict], shown: list | None = None):
+        if table == "technician" and shown is not None:
+            rows = [row for row, old in zip(rows, shown) if old != tuple(row.get(c) for c in TECHNICIAN_DOCUMENT_COLUMNS)]
+        if table == "bookings":
+            ids = {row["id"] for row in rows}
+        elif table in ("booking_item", "assignment"):
+            ids = {row.get("booking_id") for row in rows}
+        elif table == "technician":
+            ids = {a.get("booking_id") for row in rows for a in self.by("assignment", "techie_id", row["id"])}
+        else:
+            return
+        documents = self.tables["booking_documents"]
+        items = parse_select(BOOKING_DOCUMENT_SELECT)
+        for booking_id in ids - {None}:
+            booking = self.get("bookings", booking_id)
+            if booking is None:
+                documents.pop(str(booking_id), None)
+                continue
+            documents[str(booking_id)] = {"id": booking["id"], "booking_id": booking["id"], "user_id": booking["user_id"], "created_at": booking["created_at"], "doc": render(self, "bookings", booking, items)}
+        self._touch("booking_documents")
+
+    # Same events as the triggers in supabase/migrations/*_booking_events.sql;
+    # `before` holds each row's status before an update (None for inserts)
+    def _log_events(self, table: str, rows: list[dict], before: list | None = None):
+        if table not in ("bookings", "assignment_request", "assignment"):
+            return
+        events = []
+        for row, old in zip(rows, before or [None] * len(rows)):
+            status = row.get("status")
+            if before is not None and old == status:
+                continue
+            if table == "bookings" and before is None:
+                events.append((row["id"], "booking_created", None, {"user_id": row.get("user_id"), "service_id": row.get("service_id"), "scheduled_at": row.get("scheduled_at"), "status": status}))
+            elif table == "bookings":
+                data = {"from": old, "to": status, "service_id": row.get("service_id")}
+                if "completed" in (old, status):
+                    service = self.get("service", row.get("service_id")) or {}
+                    data["revenue"] = (service.get("price") or 0) + sum(i.get("price") or 0 for i in self.by("booking_item", "booking_id", row["id"]))
+                events.append((row["id"], "cancelled" if status == "cancelled" else "status_changed", None, {k: v for k, v in data.items() if v is not None}))
+            elif table == "assignment_request" and before is None:
+                events.append((row.get("booking_id"), "offer_sent", row.get("techie_id"), {"request_id": row["id"], "status": status}))
+            elif table == "assignment_request" and status in ("rejected", "expired"):
+                events.append((row.get("booking_id"), "offer_rejected", row.get("techie_id"), {"request_id": row["id"], "status": status}))
+            elif table == "assignment" and row.get("booking_id") is not None:
+                if before is None:
+                    events.append((row["booking_id"], "accepted", row.get("techie_id"), {"assignment_id": row["id"], "status": status}))
+                else:
+                    events.append((row["booking_id"], "status_changed", row.get("techie_id"), {"assignment_id": row["id"], "from": old, "to": status}))
+        log = self.tables["booking_events"]
+        for booking_id, kind, techie_id, data in events:
+            # No transactions here: every event is its own, so xid follows id
+            self.sequences["booking_events"] += 1
+            event_id = self.sequences["booking_events"]
+            log[str(event_id)] = {"id": event_id, "booking_id": booking_id, "type": kind, "techie_id": techie_id, "data": data, "created_at": now_iso(), "xid": str(event_id)}
+        if events:
+            self._touch("booking_events")
+
+    def insert(self, table: str, row: dict, upsert: bool = False, on_conflict: str = "id") -> dict:
+        rows = self.table(table)
+        if upsert and row.get(on_conflict) is not None:
+            existing = next((r for r in rows.values() if str(r.get(on_conflict)) == str(row[on_conflict])), None)
+            if existing is not None:
+                self._count(table, existing, -1)
+                before = [existing.get("status")]
+                shown = self._shown(table, [existing])
+                existing.update(row)
+                self._count(table, existing, 1)
+                self._touch(table)
+                self._log_events(table, [existing], before)
+                self._refresh_documents(table, [existing], shown)
+                return existing
+
+        row = dict(row)
+        if row.get("id") is None:
+            if table in UUID_TABLES:
+                row["id"] = str(uuid.uuid4())
+            else:
+                self.sequences[table] += 1
+                row["id"] = self.sequences[table]
+        elif table not in UUID_TABLES:
+            self.sequences[table] = max(self.sequences[table], int(row["id"]))
+        row.setdefault("created_at", now_iso())
+        rows[str(row["id"])] = row
+        self._count(table, row, 1)
+        self._touch(table)
+        self._log_events(table, [row])
+        self._refresh_documents(table, [row])
+        return row
+
+    def update(self, table: str, rows: list[dict], values: dict) -> list[dict]:
+        before = [row.get("status") for row in rows]
+        shown = self._shown(table, rows)
+        for row in rows:
+            self._count(table, row, -1)
+            row.update(values)
+            self._count(table, row, 1)
+        if rows:
+            self._touch(table)
+            self._log_events(table, rows, before)
+            self._refresh_documents(table, rows, shown)
+        return rows
+
+    def delete(self, table: str, rows: list[dict]) -> list[dict]:
+        for row in rows:
+            if self.table(table).pop(str(row["id"]), None) is not None:
+                self._count(table, row, -1)
+        if rows:
+            self._touch(table)
+            self._refresh_documents(table, rows)
+        return rows
+
+    def add_account(self, user_id: str, email: str, password: str = PASSWORD) -> dict:
+        user = {
+            "id": user_id, "aud": "authenticated", "role": "authenticated", "email": email,
+            "app_metadata": {"provider": "email"}, "user_metadata": {},
+            "created_at": now_iso(), "email_confirmed_at": now_iso(),
+        }
+        self.accounts[email] = {"password": password, "user": user}
+        self.users[user_id] = user
+        return user
+
+
+def seed(store: Store, users: int = 200, technicians: int = 40, services_per_role: int = 2, sub_services: int = 3) -> Store:
+    for role in ROLES:
+        for n in range(services_per_role):
+            service = store.insert("service", {"name": f"{role} service {n}", "price": 400 + 100 * n, "description": None, "provider_role_id": role, "updated_at": None})
+            for s in range(sub_services):
+                store.insert("sub_service", {"service_id": service["id"], "name": f"{service['name']} extra {s}", "price": 50 * (s + 1), "description": None})
+
+    for i, user_id in enumerate(user_ids(users)):
+        store.add_account(user_id, f"user{i}@load.test")
+        store.insert("userprofile", {"id": user_id, "name": f"User {i}", "mob_no": None, "address": None, "push_token": None})
+
+    for i, techie_id in enumerate(technician_ids(technicians)):
+        store.add_account(techie_id, f"tech{i}@load.test")
+        store.insert("technician", {"id": techie_id, "name": f"Technician {i}", "phone": None, "provider_role_id": ROLES[i % len(ROLES)], "push_token": None})
+    return store
+
+
+# --- PostgREST query handling ---
+
+def split_top_level(text: str) -> list[str]:
+    parts, depth, current = [], 0, ""
+    for ch in text:
+        if ch == "(":
+            depth += 1
+        elif ch == ")":
+            depth -= 1
+        if ch == "," and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += ch
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def parse_select(text: str) -> list[tuple]:
+    """'*, service:service_id(*), booking_item(*, sub_service(*))' -> [('*',), ('embed', 'service', 'service_id', [...]), ...]"""
+    items = []
+    for part in split_top_level(text or "*"):
+        if "(" in part:
+            head, inner = part.split("(", 1)
+            alias, _, hint = head.partition(":")
+            alias, hint = alias.split("!")[0].strip(), hint.split("!")[0].strip() or None
+            items.append(("embed", alias, hint, parse_select(inner[:-1])))
+        elif part == "*":
+            items.append(("*",))
+        else:
+            alias, _, column = part.partition(":")
+            items.append(("column", alias.strip(), (column or alias).strip()))
+    return items
+
+
+def render(store: Store, table: str, row: dict, items: list[tuple]) -> dict:
+    out = {}
+    for item in items:
+        if item[0] == "*":
+            out.update(row)
+        elif item[0] == "column":
+            out[item[1]] = row.get(item[2])
+        else:
+            _, alias, hint, children = item
+            fks = FOREIGN_KEYS.get(table, {})
+            if hint in fks:
+                # alias:fk_column(...) -> the referenced row (many-to-one)
+                target = store.get(fks[hint], row.get(hint))
+                out[alias] = render(store, fks[hint], target, children) if target else None
+            elif alias in fks.values():
+                column = next(c for c, t in fks.items() if t == alias)
+                target = store.get(alias, row.get(column))
+                out[alias] = render(store, alias, target, children) if target else None
+            else:
+                # table(...) that points back at this one -> list of children (one-to-many)
+                column = next(c for c, t in FOREIGN_KEYS.get(alias, {}).items() if t == table)
+                out[alias] = [render(store, alias, child, children) for child in store.by(alias, column, row["id"])]
+    return out
+
+
+def _text(value) -> str:
+    if value is None:
+        return "null"
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return str(value)
+
+
+def _compare(left, right: str) -> int:
+    try:
+        a, b = float(left), float(right)
+    except (TypeError, ValueError):
+        a, b = _text(left), right
+    return (a > b) - (a < b)
+
+
+def matches(row: dict, column: str, expression: str) -> bool:
+    negate = expression.startswith("not.")
+    if negate:
+        expression = expression[4:]
+    op, _, value = expression.partition(".")
+    current = row.get(column)
+    if op == "eq":
+        result = _text(current) == value
+    elif op == "neq":
+        result = _text(current) != value
+    elif op == "in":
+        wanted = {v.strip().strip('"') for v in value.strip("()").split(",")}
+        result = _text(current) in wanted
+    elif op == "is":
+        result = _text(current) == value
+    elif op in ("gt", "gte", "lt", "lte"):
+        if current is None:
+            return False
+        c = _compare(current, value)
+        result = {"gt": c > 0, "gte": c >= 0, "lt": c < 0, "lte": c <= 0}[op]
+    else:
+        raise ValueError(f"unsupported filter operator {op}")
+    return not result if negate else result
+
+
+RESERVED_PARAMS = {"select", "order", "limit", "offset", "on_conflict", "columns"}
+
+
+def filtered_rows(store: Store, table: str, params: list[tuple[str, str]]) -> list[dict]:
+    filters = [(k, v) for k, v in params if k not in RESERVED_PARAMS]
+    # Narrow with an index on the first equality filter, then scan what is left
+    eq = next(((k, v[3:]) for k, v in filters if v.startswith("eq.")), None)
+    rows = store.by(table, eq[0], eq[1]) if eq else list(store.table(table).values())
+    return [r for r in rows if all(matches(r, k, v) for k, v in filters)]
+
+
+def ordered(rows: list[dict], order: str | None) -> list[dict]:
+    for clause in reversed(split_top_level(order or "")):
+        column, *flags = clause.split(".")
+        desc = "desc" in flags
+        present = [r for r in rows if r.get(column) is not None]
+        missing = [r for r in rows if r.get(column) is None]
+        present.sort(key=lambda r: r[column], reverse=desc)
+        # PostgREST default: nulls last for asc, first for desc
+        rows = missing + present if desc and "nullslast" not in flags else present + missing
+    return rows
+
+
+def api_error(status: int, message: str, code: str = "PGRST000") -> JSONResponse:
+    return JSONResponse({"code": code, "message": message, "details": None, "hint": None}, status_code=status)
+
+
+class FakeSupabase:
+    def __init__(self, store: Store, latency: float = 0.02, jitter: float = 0.005):
+        self.store = store
+        self.latency = latency
+        self.jitter = jitter
+        self.requests = 0
+
+    async def delay(self):
+        self.requests += 1
+        wait = self.latency + random.uniform(0, self.jitter)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def respond(self, table: str, rows: list[dict], request: Request, status: int = 200) -> Response:
+        params = request.query_params
+        # `columns` on a bulk insert names the inserted columns, not the returned ones
+        items = parse_select(params.get("select") or "*")
+        body = [render(self.store, table, r, items) for r in rows]
+        if "vnd.pgrst.object" in request.headers.get("accept", ""):
+            if len(body) != 1:
+                return api_error(406, "JSON object requested, multiple (or no) rows returned", "PGRST116")
+            return JSONResponse(body[0], status_code=status)
+        return JSONResponse(body, status_code=status, headers={"Content-Range": f"0-{max(len(body) - 1, 0)}/*"})
+
+    async def rest(self, request: Request) -> Response:
+        await self.delay()
+        table = request.path_params["table"]
+        params = list(request.query_params.multi_items())
+        prefer = request.headers.get("prefer", "")
+        try:
+            if request.method in ("GET", "HEAD"):
+                rows = ordered(filtered_rows(self.store, table, params), request.query_params.get("order"))
+                offset = int(request.query_params.get("offset", 0))
+                limit = request.query_params.get("limit")
+                rows = rows[offset:offset + int(limit)] if limit else rows[offset:]
+                return self.respond(table, rows, request)
+
+            if request.method == "POST":
+                payload = await request.json()
+                upsert = "merge-duplicates" in prefer
+                on_conflict = request.query_params.get("on_conflict", "id")
+                rows = [self.store.insert(table, r, upsert=upsert, on_conflict=on_conflict) for r in (payload if isinstance(payload, list) else [payload])]
+                status = 201
+            elif request.method == "PATCH":
+                rows = self.store.update(table, filtered_rows(self.store, table, params), await request.json())
+                status = 200
+            elif request.method == "DELETE":
+                rows = self.store.delete(table, filtered_rows(self.store, table, params))
+                status = 200
+            else:
+                return api_error(405, f"{request.method} not supported")
+        except KeyError as e:
+            return api_error(404, f"relation {e} does not exist", "42P01")
+        except ValueError as e:
+            return api_error(400, str(e), "PGRST100")
+
+        if "return=representation" not in prefer:
+            return Response(status_code=204 if status == 200 else status)
+        return self.respond(table, rows, request, status=status)
+
+    async def rpc(self, request: Request) -> Response:
+        await self.delay()
+        fn = request.path_params["fn"]
+        args = await request.json()
+        if fn == "accept_assignment_request":
+            return JSONResponse(self.accept_assignment_request(int(args["p_request_id"]), str(args["p_techie_id"])))
+        if fn == "reject_assignment_request":
+            return JSONResponse(self.reject_assignment_request(int(args["p_request_id"]), str(args["p_techie_id"])))
+        if fn == "read_booking_events":
+            return JSONResponse(self.read_booking_events(args.get("p_after_xid"), args.get("p_after_id"), int(args.get("p_limit") or 5000)))
+        return api_error(404, f"function {fn} does not exist", "PGRST202")
+
+    # Same outcomes as supabase/migrations/*_assignment_cas.sql. There is no await
+    # between the check and the write, so each call is atomic on the event loop.
+    def accept_assignment_request(self, request_id: int, techie_id: str) -> dict:
+        offer = self.store.get("assignment_request", request_id)
+        if not offer or str(offer["techie_id"]) != techie_id:
+            return {"result": "not_found"}
+        if offer["status"] != "pending":
+            return {"result": "not_pending"}
+        self.store.update("assignment_request", [offer], {"status": "accepted"})
+
+        booking = self.store.get("bookings", offer["booking_id"])
+        if not booking or booking["status"] in ("confirmed", "cancelled", "completed"):
+            self.store.update("assignment_request", [offer], {"status": "expired"})
+            if not booking:
+                return {"result": "booking_not_found"}
+            if booking["status"] == "confirmed":
+                return {"result": "already_confirmed"}
+            return {"result": "booking_unavailable", "status": booking["status"]}
+
+        assignment = self.store.insert("assignment", {"techie_id": techie_id, "service_id": booking["service_id"], "booking_id": booking["id"], "scheduled_at": booking["scheduled_at"], "status": "active"})
+        self.store.update("bookings", [booking], {"status": "confirmed", "assignment_id": assignment["id"]})
+        return {"result": "accepted", "assignment": assignment, "booking": booking}
+
+    def reject_assignment_request(self, request_id: int, techie_id: str) -> dict:
+        offer = self.store.get("assignment_request", request_id)
+        if not offer or str(offer["techie_id"]) != techie_id:
+            return {"result": "not_found"}
+        if offer["status"] != "pending":
+            return {"result": "not_pending"}
+        self.store.update("assignment_request", [offer], {"status": "rejected"})
+        return {"result": "rejected", "request": offer, "booking": self.store.get("bookings", offer["booking_id"])}
+
+    # Same page shape as read_booking_events in *_booking_events.sql
+    def read_booking_events(self, after_xid, after_id, limit: int) -> dict:
+        after = (int(after_xid), int(after_id)) if after_xid is not None else None
+        events = sorted(self.store.table("booking_events").values(), key=lambda e: (int(e["xid"]), e["id"]))
+        page = [e for e in events if after is None or (int(e["xid"]), e["id"]) > after][:max(1, min(limit, 20000))]
+        return {"events": page, "horizon": str(self.store.sequences["booking_events"] + 1)}
+
+    # --- GoTrue ---
+
+    def session(self, user: dict) -> dict:
+        expires_in = 3600
+        return {
+            "access_token": token_for(user["id"], user.get("email", ""), expires_in),
+            "token_type": "bearer",
+            "expires_in": expires_in,
+            "expires_at": int(time.time()) + expires_in,
+            "refresh_token": uuid.uuid4().hex,
+            "user": user,
+        }
+
+    async def auth_user(self, request: Request) -> Response:
+        await self.delay()
+        token = request.headers.get("authorization", "").replace("Bearer ", "")
+        user = self.store.users.get(user_from_token(token) or "")
+        if not user:
+            return JSONResponse({"code": 401, "error_code": "bad_jwt", "msg": "invalid JWT"}, status_code=401)
+        return JSONResponse(user)
+
+    async def auth_token(self, request: Request) -> Response:
+        await self.delay()
+        body = await request.json()
+        account = self.store.accounts.get(body.get("email", ""))
+        if not account or account["password"] != body.get("password"):
+            return JSONResponse({"code": 400, "error_code": "invalid_credentials", "msg": "Invalid login credentials"}, status_code=400)
+        return JSONResponse(self.session(account["user"]))
+
+    async def auth_signup(self, request: Request) -> Response:
+        await self.delay()
+        body = await request.json()
+        email = body.get("email", "")
+        if email in self.store.accounts:
+            return JSONResponse({"code": 422, "error_code": "user_already_exists", "msg": "User already registered"}, status_code=422)
+        user = self.store.add_account(str(uuid.uuid4()), email, body.get("password", ""))
+        return JSONResponse(self.session(user))
+
+    def app(self) -> Starlette:
+        return Starlette(routes=[
+            Route("/rest/v1/rpc/{fn}", self.rpc, methods=["POST"]),
+            Route("/rest/v1/{table}", self.rest, methods=["GET", "HEAD", "POST", "PATCH", "DELETE"]),
+            Route("/auth/v1/user", self.auth_user, methods=["GET"]),
+            Route("/auth/v1/token", self.auth_token, methods=["POST"]),
+            Route("/auth/v1/signup", self.auth_signup, methods=["POST"]),
+        ])
+
+
+def create_app(users: int = 200, technicians: int = 40, latency: float = 0.02, jitter: float = 0.005) -> Starlette:
+    return FakeSupabase(seed(Store(), users, technicians), latency, jitter).app()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=54321)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--technicians", type=int, default=40)
+    args = parser.parse_args()
+
+    import uvicorn
+    app = create_app(args.users, args.technicians, args.latency_ms / 1000, args.jitter_ms / 1000)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning", access_log=False)
+
+
+if __name__ == "__main__":
+    main()
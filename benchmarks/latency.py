@@ -0,0 +1,57 @@
+"""In-process Supabase stand-in that charges a fixed latency per round trip."""
+import asyncio
+
+from loader import loaders
+
+
+class _Result:
+    def __init__(self, data):
+        self.data = data
+
+
+class LatencyQuery:
+    """Minimal query builder: chained filters are recorded, execute() sleeps."""
+
+    def __init__(self, client, table):
+        self.client = client
+        self.table_name = table
+        self.filters = []
+
+    def __getattr__(self, name):
+        def chain(*args, **kwargs):
+            self.filters.append((name, args))
+            return self
+        return chain
+
+    async def execute(self):
+        self.client.round_trips += 1
+        self.client.queries.append((self.table_name, self.filters))
+        await asyncio.sleep(self.client.latency)
+        rows = self.client.rows.get(self.table_name, [])
+        for name, args in self.filters:
+            if name == "eq":
+                rows = [r for r in rows if str(r.get(args[0])) == str(args[1])]
+            elif name == "in_":
+                wanted = {str(v) for v in args[1]}
+                rows = [r for r in rows if str(r.get(args[0])) in wanted]
+        return _Result(rows)
+
+
+class LatencyClient:
+    def __init__(self, latency: float, rows: dict[str, list[dict]] | None = None):
+        self.latency = latency
+        self.round_trips = 0
+        self.queries = []
+        self.rows = rows or {}
+
+    def table(self, name):
+        return LatencyQuery(self, name)
+
+
+def use_for_loaders(client: LatencyClient):
+    """Points the module-level batch loaders at the given stand-in client."""
+    async def factory():
+        return client
+
+    for ldr in loaders.values():
+        ldr.client_factory = factory
@@ -0,0 +1,248 @@
+"""
+Load test: replays user and technician sessions against the API and reports
+p50/p95/p99 latency, errors and throughput per endpoint.
+
+By default it starts benchmarks.fake_supabase and the app (python main.py, so
+FIXEL_* settings apply) on free local ports and tears both down afterwards.
+
+    python -m benchmarks.loadtest [--duration 20] [--users 40] [--technicians 8] [--latency-ms 20] [--workers 1]
+    python -m benchmarks.loadtest --target http://127.0.0.1:8000 --users 40 --technicians 8
+
+With --target the app must already be running against a fake_supabase seeded
+with at least as many users/technicians as the run uses.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import httpx
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from benchmarks.fake_supabase import technician_ids, token_for, user_ids
+
+ROOT = Path(__file__).resolve().parent.parent
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, round(q / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+class Recorder:
+    def __init__(self):
+        self.samples: dict[str, list[float]] = {}
+        self.errors: dict[str, int] = {}
+        self.statuses: dict[str, dict[int, int]] = {}
+
+    def record(self, func: str, elapsed_ms: float, status: int):
+        self.samples.setdefault(func, []).append(elapsed_ms)
+        self.statuses.setdefault(func, {}).setdefault(status, 0)
+        self.statuses[func][status] += 1
+        if status >= 400:
+            self.errors[func] = self.errors.get(func, 0) + 1
+
+    def summary(self, duration: float) -> dict:
+        rows = {}
+        everything = []
+        for func, samples in sorted(self.samples.items()):
+            ordered = sorted(samples)
+            everything.extend(ordered)
+            rows[func] = {
+                "count": len(ordered),
+                "errors": self.errors.get(func, 0),
+                "rps": len(ordered) / duration,
+                "p50": percentile(ordered, 50),
+                "p95": percentile(ordered, 95),
+                "p99": percentile(ordered, 99),
+                "max": ordered[-1],
+                "statuses": self.statuses[func],
+            }
+        everything.sort()
+        rows["TOTAL"] = {
+            "count": len(everything),
+            "errors": sum(self.errors.values()),
+            "rps": len(everything) / duration,
+            "p50": percentile(everything, 50),
+            "p95": percentile(everything, 95),
+            "p99": percentile(everything, 99),
+            "max": everything[-1] if everything else 0.0,
+        }
+        return rows
+
+
+class Session:
+    def __init__(self, client: httpx.AsyncClient, recorder: Recorder, user_id: str):
+        self.client = client
+        self.recorder = recorder
+        self.user_id = user_id
+        self.headers = {"Authorization": f"Bearer {token_for(user_id)}"}
+
+    async def call(self, func: str, payload: dict | None = None):
+        started = time.perf_counter()
+        try:
+            response = await self.client.post(f"/api/funcs/{func}", json=payload or {}, headers=self.headers)
+            status = response.status_code
+            body = response.json() if status < 400 else None
+        except (httpx.HTTPError, ValueError):
+            status, body = 599, None
+        self.recorder.record(func, (time.perf_counter() - started) * 1000, status)
+        return body
+
+
+async def user_scenario(session: Session, rng: random.Random, think: float):
+    """Open app, browse the catalog, book, look at the booking, maybe cancel."""
+    services = await session.call("service.viewServices") or []
+    await session.call("user.viewUser")
+    await session.call("notification.viewNotifications")
+    if services:
+        service = rng.choice(services)
+        subs = [s["id"] for s in service.get("sub_service", []) if rng.random() < 0.5]
+        scheduled = (datetime.now(timezone.utc) + timedelta(days=rng.randint(1, 14))).isoformat()
+        booked = await session.call("service.bookService", {"service_id": service["id"], "user_id": session.user_id, "scheduled_at": scheduled, "sub_service_ids": subs})
+        await asyncio.sleep(think)
+        await session.call("user.viewBookedServices")
+        if booked:
+            booking_id = booked["booking"]["id"]
+            await session.call("user.viewBooking", {"user_id": session.user_id, "booking_id": booking_id})
+            if rng.random() < 0.1:
+                await session.call("user.cancelBooking", {"user_id": session.user_id, "booking_id": booking_id})
+    await asyncio.sleep(think)
+
+
+async def technician_scenario(session: Session, rng: random.Random, think: float):
+    """Poll for offers, accept or reject them, then work through assigned jobs."""
+    await session.call("technician.viewProfile")
+    offers = await session.call("technician.viewAssignmentRequests") or []
+    for offer in offers[:3]:
+        func = "technician.acceptAssignment" if rng.random() < 0.8 else "technician.rejectAssignment"
+        await session.call(func, {"request_id": offer["id"]})
+    assigned = await session.call("technician.viewAssignedBookings") or []
+    for assignment in assigned[:2]:
+        await session.call("service.updateStatus", {"assignment_id": assignment["id"], "status": rng.choice(["in_progress", "completed", "completed"])})
+    if rng.random() < 0.3:
+        await session.call("technician.viewBookingHistory")
+    await asyncio.sleep(think)
+
+
+async def run_load(target: str, users: int, technicians: int, duration: float, think: float, seed: int) -> tuple[Recorder, float]:
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+    limits = httpx.Limits(max_connections=users + technicians, max_keepalive_connections=users + technicians)
+
+    async def loop(scenario, user_id: str, index: int):
+        rng = random.Random(seed + index)
+        session = Session(client, recorder, user_id)
+        # Spread the first requests out instead of starting everyone at once
+        await asyncio.sleep(rng.uniform(0, min(1.0, duration / 10)))
+        while time.perf_counter() < deadline:
+            await scenario(session, rng, think)
+
+    async with httpx.AsyncClient(base_url=target, timeout=60, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *[loop(user_scenario, uid, i) for i, uid in enumerate(user_ids(users))],
+            *[loop(technician_scenario, tid, users + i) for i, tid in enumerate(technician_ids(technicians))],
+        )
+        elapsed = time.perf_counter() - started
+    return recorder, elapsed
+
+
+def wait_until_ready(url: str, timeout: float = 30.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if httpx.get(url, timeout=1).status_code < 500:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout:.0f}s")
+
+
+def start_stack(args) -> tuple[str, list[subprocess.Popen]]:
+    fake_port, app_port = free_port(), free_port()
+    fake = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.fake_supabase", "--port", str(fake_port), "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms), "--users", str(args.users), "--technicians", str(args.technicians)],
+        cwd=ROOT,
+    )
+    env = dict(os.environ, SUPABASE_URL=f"http://127.0.0.1:{fake_port}", SUPABASE_KEY="fake", FIXEL_HOST="127.0.0.1", FIXEL_PORT=str(app_port), FIXEL_WORKERS=str(args.workers))
+    # Every simulated client shares one IP, so per-IP limits would cap the run
+    env.setdefault("ADMISSION_ENABLED", "1" if args.admission else "0")
+    env.pop("FIXEL_RELOAD", None)
+    app = subprocess.Popen([sys.executable, "main.py"], cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    procs = [app, fake]
+    try:
+        wait_until_ready(f"http://127.0.0.1:{fake_port}/auth/v1/user")
+        wait_until_ready(f"http://127.0.0.1:{app_port}/api/warm")
+    except Exception:
+        stop_stack(procs)
+        raise
+    return f"http://127.0.0.1:{app_port}", procs
+
+
+def stop_stack(procs: list[subprocess.Popen]):
+    for proc in procs:
+        proc.terminate()
+    for proc in procs:
+        try:
+            proc.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+
+def print_report(rows: dict, elapsed: float):
+    print(f"\n{'endpoint':40} {'count':>7} {'err':>5} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for func, r in rows.items():
+        print(f"{func:40} {r['count']:>7} {r['errors']:>5} {r['rps']:>8.1f} {r['p50']:>8.1f} {r['p95']:>8.1f} {r['p99']:>8.1f} {r['max']:>8.1f}")
+    print(f"\n{elapsed:.1f}s wall time")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--target", help="base URL of a running app (skips starting the stack)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds")
+    parser.add_argument("--users", type=int, default=40, help="concurrent user sessions")
+    parser.add_argument("--technicians", type=int, default=8, help="concurrent technician sessions")
+    parser.add_argument("--think-ms", type=float, default=50.0, help="pause between scenario steps")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="fake Supabase round-trip latency")
+    parser.add_argument("--jitter-ms", type=float, default=5.0)
+    parser.add_argument("--workers", default="1", help="FIXEL_WORKERS for the app")
+    parser.add_argument("--admission", action="store_true", help="keep admission control on (all clients share 127.0.0.1)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the summary to this file")
+    args = parser.parse_args()
+
+    procs = []
+    target = args.target
+    if not target:
+        target, procs = start_stack(args)
+    try:
+        recorder, elapsed = asyncio.run(run_load(target, args.users, args.technicians, args.duration, args.think_ms / 1000, args.seed))
+    finally:
+        stop_stack(procs)
+
+    rows = recorder.summary(elapsed)
+    print_report(rows, elapsed)
+    if args.json:
+        Path(args.json).write_text(json.dumps({"args": vars(args), "elapsed_s": elapsed, "endpoints": rows}, indent=2, default=str), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""
+Booking event log tool: copies the log into local segment files, replays it to
+rebuild what the database derives from bookings, and measures replay speed.
+
+    python -m benchmarks.replay_events dump --dir events/          # log -> segments, resumes where the last dump ended
+    python -m benchmarks.replay_events replay --dir events/ [--days 30]
+    python -m benchmarks.replay_events replay [--apply]            # straight from the database
+    python -m benchmarks.replay_events generate --dir events/ [--bookings 200000]
+
+`dump` and `replay` without --dir talk to SUPABASE_URL / SUPABASE_KEY, so they
+work against benchmarks.fake_supabase as well. `replay` prints the analytics
+summary (as admin.analytics returns it) and technician counts; --apply writes
+analytics, technician_counters and booking_documents back
+(replace_booking_projections, refresh_booking_documents). `generate` writes a
+synthetic log for timing replays without a database.
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import uuid
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from analytics import summarize_analytics
+from event_log import BookingEventReplay, EventSegmentWriter, apply_booking_projections, event_segments, fetch_booking_events, last_segment_position, read_event_segments
+
+
+async def dump(directory: str):
+    from db import get_supabase
+    sbase = await get_supabase()
+    after = last_segment_position(directory)
+    started = time.perf_counter()
+    with EventSegmentWriter(directory) as writer:
+        async for page in fetch_booking_events(sbase, after):
+            writer.extend(page)
+    elapsed = time.perf_counter() - started
+    size = sum(p.stat().st_size for p in event_segments(directory))
+    print(f"{writer.written} events in {elapsed:.1f}s; {len(event_segments(directory))} segments, {size / 1024:.0f} KiB in {directory}")
+
+
+async def replay(directory: str | None, days: int | None, apply: bool):
+    result = BookingEventReplay()
+    started = time.perf_counter()
+    if directory:
+        result.apply_all(read_event_segments(directory))
+    else:
+        from db import get_supabase
+        sbase = await get_supabase()
+        async for page in fetch_booking_events(sbase):
+            result.apply_all(page)
+    elapsed = time.perf_counter() - started
+    print(f"{result.events} events, {len(result.bookings)} bookings in {elapsed:.2f}s ({result.events / max(elapsed, 1e-9):,.0f} events/s)")
+    print(json.dumps({"days": days, **summarize_analytics(result.analytics_rows(days))}, indent=2))
+    busy = sum(1 for _, active, _ in result.counters.values() if active)
+    print(f"{len(result.counters)} technicians with offers or assignments, {busy} busy")
+
+    if apply:
+        from db import get_supabase
+        outcome = await apply_booking_projections(await get_supabase(), result)
+        print(f"apply: {outcome}")
+
+
+def generate(directory: str, bookings: int, technicians: int, seed: int):
+    """A log shaped like production traffic: a few offers per booking, most accepted and completed."""
+    rng = random.Random(seed)
+    techies = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(technicians)]
+    xid = event_id = request_id = assignment_id = 0
+    at = 1767225600.0  # 2026-01-01
+
+    def event(booking_id, kind, techie_id=None, **data):
+        nonlocal xid, event_id
+        xid += 1
+        event_id += 1
+        return {"id": event_id, "xid": xid, "booking_id": booking_id, "type": kind, "techie_id": techie_id, "data": data, "created_at": at}
+
+    started = time.perf_counter()
+    with EventSegmentWriter(directory) as writer:
+        for booking_id in range(1, bookings + 1):
+            at += rng.expovariate(1 / 30)
+            service_id = rng.randint(1, 20)
+            writer.append(event(booking_id, "booking_created", user_id=str(uuid.uuid4()), service_id=service_id, scheduled_at=None, status="pending"))
+            for techie_id in rng.sample(techies, rng.randint(1, 3)):
+                request_id += 1
+                writer.append(event(booking_id, "offer_sent", techie_id, request_id=request_id, status="pending"))
+                if rng.random() < 0.35:
+                    writer.append(event(booking_id, "offer_rejected", techie_id, request_id=request_id, status="rejected"))
+                    continue
+                assignment_id += 1
+                writer.append(event(booking_id, "accepted", techie_id, assignment_id=assignment_id, status="active"))
+                writer.append(event(booking_id, "status_changed", **{"from": "pending", "to": "confirmed", "service_id": service_id}))
+                final = "completed" if rng.random() < 0.85 else "cancelled"
+                writer.append(event(booking_id, "status_changed", techie_id, assignment_id=assignment_id, **{"from": "active", "to": final}))
+                writer.append(event(booking_id, "cancelled" if final == "cancelled" else "status_changed", **{"from": "confirmed", "to": final, "service_id": service_id},
+                                    **({"revenue": 500 + 50 * rng.randint(0, 4)} if final == "completed" else {})))
+                break
+    size = sum(p.stat().st_size for p in event_segments(directory))
+    print(f"{writer.written} events in {time.perf_counter() - started:.1f}s; {size / writer.written:.1f} bytes/event on disk")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    dump_args = commands.add_parser("dump")
+    dump_args.add_argument("--dir", required=True)
+    replay_args = commands.add_parser("replay")
+    replay_args.add_argument("--dir", help="segment directory (default: read the database)")
+    replay_args.add_argument("--days", type=int)
+    replay_args.add_argument("--apply", action="store_true", help="write the rebuilt projections to the database")
+    generate_args = commands.add_parser("generate")
+    generate_args.add_argument("--dir", required=True)
+    generate_args.add_argument("--bookings", type=int, default=200000)
+    generate_args.add_argument("--technicians", type=int, default=400)
+    generate_args.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    if args.command == "dump":
+        asyncio.run(dump(args.dir))
+    elif args.command == "replay":
+        asyncio.run(replay(args.dir, args.days, args.apply))
+    else:
+        generate(args.dir, args.bookings, args.technicians, args.seed)
@@ -1,4 +1,5 @@
 import sys
+import time
 from pathlib import Path
 
 # Add current directory to path to allow importing local modules
@@ -12,33 +13,46 @@ sys.path.append(str(current_dir))
 try:
     import deps
     import merge
+    import coldstart
+    import buildcache
 except ImportError:
     # Fallback if run from inside the dir
     try:
         import deps
         import merge
+        import coldstart
+        import buildcache
     except ImportError:
         print("Error: Could not import build modules. ensure you are running from the project root.")
         sys.exit(1)
 
 def main():
     print("=== Starting Build Process ===")
+    started = time.perf_counter()
+
+    # Steps whose inputs hash the same as last build are skipped; --force rebuilds everything
+    cache = buildcache.BuildCache(force="--force" in sys.argv)
     
     # Step 1: Export Dependencies
     print("\n--- Step 1: Exporting Dependencies ---")
-    if not deps.run_export():
+    if not deps.run_export(cache):
         print("Warning: Dependency export failed or was skipped.")
         # We continue even if export fails, as it might be optional or dev env issue
     
     # Step 2: Merge Files
     print("\n--- Step 2: Merging Files ---")
     try:
-        merge.run_merge()
+        merge.run_merge(cache)
     except Exception as e:
         print(f"Error during merge: {e}")
         sys.exit(1)
 
-    print("\n=== Build Complete ===")
+    # Step 3: Cold-start artifacts (precomputed OpenAPI schema, import-time report)
+    print("\n--- Step 3: Cold-Start Artifacts ---")
+    if not coldstart.run_coldstart(cache):
+        print("Warning: Cold-start artifacts incomplete (is the runtime environment installed?).")
+
+    print(f"\n=== Build Complete ({(time.perf_counter() - started) * 1000:.0f} ms) ===")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,73 @@
+import hashlib
+import json
+import sys
+from pathlib import Path
+
+# Configuration
+SOURCE_DIR = Path(__file__).resolve().parent.parent
+CACHE_DIR = SOURCE_DIR / "build" / ".cache"
+MANIFEST_FILE = CACHE_DIR / "manifest.json"
+
+# The unparsed bundle and the import-time report depend on the interpreter running the build
+PYTHON_TAG = sys.implementation.cache_tag
+
+
+def file_hash(path: Path):
+    """sha256 of a file's bytes, or None if it does not exist."""
+    try:
+        return hashlib.sha256(path.read_bytes()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+
+def hash_files(paths, extra: str = ""):
+    """One digest over several files; paths are part of it, so renames and deletions count."""
+    digest = hashlib.sha256(extra.encode("utf-8"))
+    for path in sorted(Path(p) for p in paths):
+        try:
+            name = path.relative_to(SOURCE_DIR).as_posix()
+        except ValueError:
+            name = str(path)
+        digest.update(name.encode("utf-8"))
+        digest.update((file_hash(path) or "missing").encode("utf-8"))
+    return digest.hexdigest()
+
+
+class BuildCache:
+    """
+    Remembers, per build step, the content hash of its inputs and of the outputs it
+    wrote. A step is skipped when its inputs hash the same as last time and every
+    output is still on disk unchanged.
+    """
+
+    def __init__(self, manifest_file: Path = MANIFEST_FILE, force: bool = False):
+        self.manifest_file = manifest_file
+        self.force = force
+        try:
+            self.manifest = json.loads(manifest_file.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            self.manifest = {}
+
+    def is_fresh(self, step: str, key: str, outputs) -> bool:
+        if self.force:
+            return False
+        entry = self.manifest.get(step)
+        if not entry or entry.get("key") != key:
+            return False
+        recorded = entry.get("outputs", {})
+        for output in outputs:
+            output = Path(output)
+            if recorded.get(output.name) is None or file_hash(output) != recorded[output.name]:
+                return False
+        return True
+
+    def record(self, step: str, key: str, outputs):
+        self.manifest[step] = {
+            "key": key,
+            "outputs": {Path(o).name: file_hash(Path(o)) for o in outputs},
+        }
+        self.save()
+
+    def save(self):
+        self.manifest_file.parent.mkdir(parents=True, exist_ok=True)
+        self.manifest_file.write_text(json.dumps(self.manifest, indent=2, sort_keys=True), encoding="utf-8")
@@ -0,0 +1,126 @@
+import json
+import subprocess
+import sys
+from collections import defaultdict
+from pathlib import Path
+
+from buildcache import BuildCache, hash_files, PYTHON_TAG
+
+# Configuration
+SOURCE_DIR = Path(__file__).resolve().parent.parent
+DIST_DIR = SOURCE_DIR / "api" / "dist"
+BUNDLE_FILE = DIST_DIR / "main.py"
+OPENAPI_FILE = DIST_DIR / "openapi.json"
+IMPORT_REPORT_FILE = DIST_DIR / "importtime.txt"
+
+# Rarely used subsystems that must stay function-local imports in the sources,
+# so the bundle header (which hoists every top-level import) never loads them
+# on a cold start. merge.py warns when one of these shows up at top level.
+LAZY_MODULES = {"exponent_server_sdk", "uvicorn", "smtplib"}
+
+# Runs in a child process so the bundle is imported exactly like on Vercel
+# (fresh interpreter, api/dist on sys.path) and its prints stay out of our output.
+OPENAPI_SCRIPT = """
+import json, sys
+sys.path.insert(0, sys.argv[1])
+from fastapi.openapi.utils import get_openapi
+import main
+app = main.app
+schema = get_openapi(title=app.title, version=app.version, openapi_version=app.openapi_version, description=app.description, routes=app.routes)
+with open(sys.argv[2], "w", encoding="utf-8") as f:
+    json.dump(schema, f, separators=(",", ":"))
+"""
+
+IMPORT_SCRIPT = "import sys; sys.path.insert(0, sys.argv[1]); import main"
+
+
+def write_openapi_schema(bundle_dir: Path = DIST_DIR, output_file: Path = OPENAPI_FILE):
+    """Precompute the OpenAPI schema so the deployed app never builds it at runtime."""
+    print("Precomputing OpenAPI schema...")
+    try:
+        subprocess.run([sys.executable, "-c", OPENAPI_SCRIPT, str(bundle_dir), str(output_file)], check=True, capture_output=True, text=True, cwd=bundle_dir)
+    except subprocess.CalledProcessError as e:
+        print(f"Warning: could not import the bundle to build the schema: {e.stderr.strip().splitlines()[-1:]}")
+        return False
+    paths = len(json.loads(output_file.read_text(encoding="utf-8")).get("paths", {}))
+    print(f"Wrote {output_file} ({paths} paths)")
+    return True
+
+
+def parse_importtime(stderr: str):
+    """Parse `-X importtime` output into (module, self_us, cumulative_us, depth) tuples."""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3:
+            continue
+        try:
+            self_us, cumulative_us = int(fields[0]), int(fields[1])
+        except ValueError:
+            continue
+        name = fields[2].rstrip()
+        depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+        rows.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return rows
+
+
+def format_import_report(rows, bundle_file: Path = BUNDLE_FILE, top: int = 25) -> str:
+    by_package = defaultdict(lambda: [0, 0])
+    for name, self_us, _, _ in rows:
+        package = name.split(".")[0]
+        by_package[package][0] += self_us
+        by_package[package][1] += 1
+
+    total_us = sum(self_us for _, self_us, _, _ in rows)
+    version = ".".join(map(str, sys.version_info[:3]))
+    lines = [
+        f"# Import-time report for {bundle_file.relative_to(SOURCE_DIR)} (python {version}, -X importtime)",
+        f"# Total import time: {total_us / 1000:.1f} ms across {len(rows)} modules",
+        "",
+        "## By top-level package (self time)",
+        f"{'package':<32}{'ms':>10}{'share':>8}{'modules':>9}",
+    ]
+    for package, (self_us, count) in sorted(by_package.items(), key=lambda kv: kv[1][0], reverse=True):
+        lines.append(f"{package:<32}{self_us / 1000:>10.1f}{self_us / max(total_us, 1):>8.1%}{count:>9}")
+
+    lines += ["", f"## Slowest {top} modules (self time)", f"{'module':<56}{'self ms':>10}{'cumul ms':>10}"]
+    for name, self_us, cumulative_us, _ in sorted(rows, key=lambda r: r[1], reverse=True)[:top]:
+        lines.append(f"{name:<56}{self_us / 1000:>10.1f}{cumulative_us / 1000:>10.1f}")
+
+    lazy_loaded = sorted({name.split(".")[0] for name, *_ in rows} & LAZY_MODULES)
+    lines += ["", f"## Lazy modules loaded at import: {', '.join(lazy_loaded) if lazy_loaded else 'none'}"]
+    return "\n".join(lines) + "\n"
+
+
+def write_import_report(bundle_dir: Path = DIST_DIR, output_file: Path = IMPORT_REPORT_FILE):
+    """Import the bundle under -X importtime and write a per-module/per-package breakdown."""
+    print("Measuring bundle import time...")
+    res = subprocess.run([sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT, str(bundle_dir)], capture_output=True, text=True, cwd=bundle_dir)
+    rows = parse_importtime(res.stderr)
+    if res.returncode != 0 or not rows:
+        print(f"Warning: could not import the bundle for the import-time report: {res.stderr.strip().splitlines()[-1:]}")
+        return False
+    output_file.write_text(format_import_report(rows), encoding="utf-8")
+    print(f"Wrote {output_file}")
+    return True
+
+
+def run_coldstart(cache: BuildCache | None = None):
+    cache = cache or BuildCache(force=True)
+    key = hash_files([BUNDLE_FILE, Path(__file__).resolve()], extra=PYTHON_TAG)
+    outputs = [OPENAPI_FILE, IMPORT_REPORT_FILE]
+    if cache.is_fresh("coldstart", key, outputs):
+        print("Bundle unchanged, cold-start artifacts are up to date.")
+        return True
+
+    ok = write_openapi_schema()
+    ok = write_import_report() and ok
+    if ok:
+        cache.record("coldstart", key, outputs)
+    return ok
+
+
+if __name__ == "__main__":
+    run_coldstart()
@@ -3,12 +3,21 @@ import shutil
 import sys
 from pathlib import Path
 
+from buildcache import BuildCache, hash_files
+
 # Configuration
 SOURCE_DIR = Path(__file__).resolve().parent.parent
 REQUIREMENTS_FILE = SOURCE_DIR / "requirements.txt"
+LOCK_INPUTS = [SOURCE_DIR / "uv.lock", SOURCE_DIR / "pyproject.toml"]
 
-def run_export():
+def run_export(cache: BuildCache | None = None):
     """Export dependencies from pyproject.toml to requirements.txt using uv."""
+    cache = cache or BuildCache(force=True)
+    key = hash_files(LOCK_INPUTS)
+    if cache.is_fresh("deps", key, [REQUIREMENTS_FILE]):
+        print("uv.lock unchanged, requirements.txt is up to date.")
+        return True
+
     print("Exporting dependencies...")
     
     # Check for 'uv' executable in PATH
@@ -40,6 +49,8 @@ def run_export():
 
         subprocess.run(cmd, check=True, cwd=SOURCE_DIR, capture_output=True, text=True)
         print(f"Successfully exported to {REQUIREMENTS_FILE}")
+        # uv may have refreshed the lock file, so hash the inputs again
+        cache.record("deps", hash_files(LOCK_INPUTS), [REQUIREMENTS_FILE])
         return True
 
     except subprocess.CalledProcessError as e:
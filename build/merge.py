@@ -4,52 +4,64 @@ from collections import defaultdict, deque
 from pathlib import Path
 import os
 
+from coldstart import LAZY_MODULES
+import optimize
+from buildcache import BuildCache, hash_files, PYTHON_TAG
+
 # Configuration
 SOURCE_DIR = Path(__file__).resolve().parent.parent # Root dir (parent of build/)
 OUTPUT_FILE = SOURCE_DIR / "api" / "dist" / "main.py"
-IGNORE_DIRS = {".venv", "venv", ".git", "__pycache__", "build", "dist", "tests", "FixelBackendRequestly", "bin", "lib", "include"}
+# The bundle also depends on the build code that produces it
+BUILD_SCRIPTS = [Path(__file__).resolve().parent / name for name in ("merge.py", "optimize.py", "coldstart.py")]
+IGNORE_DIRS = {".venv", "venv", ".git", "__pycache__", "build", "dist", "tests", "benchmarks", "supabase", "FixelBackendRequestly", "bin", "lib", "include"}
 IGNORE_FILES = {"__init__.py", "setup.py"}
 
 def get_python_files(directory: Path):
     """Recursively find all .py files in the directory, excluding ignored ones."""
     py_files = []
-    
-    # pathlib doesn't have a direct equivalent to os.walk's in-place dir modification
-    # so we iterate manually or use rglob and filter
-    for path in directory.rglob("*.py"):
-        # Check against ignores
-        # We need to check if any part of the path is in IGNORE_DIRS
-        # relative_to SOURCE_DIR to avoid checking parents
-        try:
-            rel_path = path.relative_to(SOURCE_DIR)
-        except ValueError:
-            continue
 
-        if any(part in IGNORE_DIRS for part in rel_path.parts):
-            continue
-        
-        if path.name in IGNORE_FILES:
-            continue
-            
-        py_files.append(rel_path)
-            
+    # os.walk lets us prune ignored directories (.venv, .git, ...) before descending,
+    # which keeps a no-op build from stat-ing thousands of site-packages files.
+    for root, dirs, files in os.walk(directory):
+        dirs[:] = sorted(d for d in dirs if d not in IGNORE_DIRS)
+        for name in sorted(files):
+            if not name.endswith(".py") or name in IGNORE_FILES:
+                continue
+            py_files.append((Path(root) / name).relative_to(SOURCE_DIR))
+
     return py_files
 
 def get_module_name(rel_path: Path):
     """Convert relative file path to module name (e.g., 'utils/helper.py' -> 'utils.helper')."""
     return str(rel_path.with_suffix("")).replace(os.sep, ".")
 
-def parse_imports(file_path: Path):
-    """Parse a Python file and return a set of imported modules."""
+class ParsedModule:
+    """Source text and AST of one module, parsed once per build and shared by every step."""
+
+    def __init__(self, source: str, tree: ast.Module | None):
+        self.source = source
+        self.tree = tree
+
+def parse_module(file_path: Path) -> ParsedModule:
+    content = file_path.read_text(encoding="utf-8")
     try:
-        content = file_path.read_text(encoding="utf-8")
         tree = ast.parse(content, filename=str(file_path))
-    except (SyntaxError, UnicodeDecodeError) as e:
+    except SyntaxError as e:
         print(f"Warning: Error parsing {file_path}: {e}, skipping dependency analysis.")
-        return set()
+        tree = None
+    return ParsedModule(content, tree)
+
+def parse_modules(files, source_dir: Path):
+    """Map module name -> ParsedModule for every file."""
+    return {get_module_name(rel_path): parse_module(source_dir / rel_path) for rel_path in files}
 
+def parse_imports(parsed: ParsedModule):
+    """Return the set of modules imported anywhere in a parsed module."""
     imports = set()
-    for node in ast.walk(tree):
+    if parsed.tree is None:
+        return imports
+
+    for node in ast.walk(parsed.tree):
         if isinstance(node, ast.Import):
             for alias in node.names:
                 imports.add(alias.name)
@@ -58,7 +70,7 @@ def parse_imports(file_path: Path):
                 imports.add(node.module)
     return imports
 
-def build_dependency_graph(files, source_dir: Path):
+def build_dependency_graph(files, parsed_modules):
     """Build a graph where keys are module names and values are sets of imported local modules."""
     graph = defaultdict(set)
     module_to_file = {}
@@ -72,8 +84,7 @@ def build_dependency_graph(files, source_dir: Path):
 
     for rel_path in files:
         module = get_module_name(rel_path)
-        full_path = source_dir / rel_path
-        imports = parse_imports(full_path)
+        imports = parse_imports(parsed_modules[module])
 
         for imp in imports:
             if imp in all_modules:
@@ -96,14 +107,15 @@ def topological_sort(graph, all_modules):
             dag[v].add(u) # v -> u
             in_degree[u] += 1
             
-    queue = deque([m for m in all_modules if in_degree[m] == 0])
+    # Sorted so the merge order (and therefore the bundle bytes) is deterministic
+    queue = deque(sorted(m for m in all_modules if in_degree[m] == 0))
     sorted_modules = []
 
     while queue:
         u = queue.popleft()
         sorted_modules.append(u)
 
-        for v in dag[u]:
+        for v in sorted(dag[u]):
             in_degree[v] -= 1
             if in_degree[v] == 0:
                 queue.append(v)
@@ -116,7 +128,7 @@ def topological_sort(graph, all_modules):
 
     return sorted_modules
 
-def collect_external_imports(sorted_modules, module_to_file, source_dir: Path):
+def collect_external_imports(sorted_modules, parsed_modules):
     """
     Scans all modules to collect top-level external imports.
     Returns a set of import strings.
@@ -125,14 +137,12 @@ def collect_external_imports(sorted_modules, module_to_file, source_dir: Path):
     processed_modules = set(sorted_modules)
 
     for module in sorted_modules:
-        rel_path = module_to_file[module]
-        full_path = source_dir / rel_path
-        
         try:
-            content = full_path.read_text(encoding="utf-8")
+            tree = parsed_modules[module].tree
+            if tree is None:
+                continue
+
             # We only care about top-level imports
-            tree = ast.parse(content)
-            
             for node in tree.body:
                 if isinstance(node, (ast.Import, ast.ImportFrom)):
                     # Check if it's a local import
@@ -147,6 +157,12 @@ def collect_external_imports(sorted_modules, module_to_file, source_dir: Path):
                             is_local = True
                     
                     if not is_local:
+                        roots = [a.name.split('.')[0] for a in node.names] if isinstance(node, ast.Import) else [(node.module or "").split('.')[0]]
+                        lazy = LAZY_MODULES.intersection(roots)
+                        if lazy:
+                            # Hoisting would load it on every cold start
+                            print(f"Warning: {module} imports {', '.join(sorted(lazy))} at top level; move it into the function that uses it.")
+
                         # Reconstruct the import string
                         # This is a bit simplistic, might lose comments or formatting, but AST unparse is available in 3.9+
                         # For older python, might need manual extraction or assume single line.
@@ -181,12 +197,19 @@ def collect_external_imports(sorted_modules, module_to_file, source_dir: Path):
 
     return sorted(list(external_imports))
 
-def merge_files(sorted_modules, module_to_file, source_dir: Path, output_file: Path):
+def bundle_header(source_dir: Path):
+    return (
+        "# AUTO-GENERATED FILE. DO NOT EDIT MANUALLY.\n"
+        f"# Source: {source_dir}\n"
+        "# This file is generated by merging multiple modules.\n\n"
+    )
+
+def merge_files(sorted_modules, module_to_file, parsed_modules, source_dir: Path, output_file: Path):
     """Merge files in order, stripping local imports."""
     processed_modules = set(sorted_modules)
     
     # 1. Collect all external imports
-    external_imports = collect_external_imports(sorted_modules, module_to_file, source_dir)
+    external_imports = collect_external_imports(sorted_modules, parsed_modules)
     
     # User Request: load dotenv must be done before os import happens
     # We prioritize dotenv imports to ensure they are at the top.
@@ -212,9 +235,7 @@ def merge_files(sorted_modules, module_to_file, source_dir: Path, output_file: P
     output_file.parent.mkdir(parents=True, exist_ok=True)
 
     with output_file.open("w", encoding="utf-8") as out:
-        out.write("# AUTO-GENERATED FILE. DO NOT EDIT MANUALLY.\n")
-        out.write(f"# Source: {source_dir}\n")
-        out.write("# This file is generated by merging multiple modules.\n\n")
+        out.write(bundle_header(source_dir))
         
         # 2. Write External Imports
         out.write("# --- EXTERNAL IMPORTS ---\n")
@@ -241,11 +262,10 @@ def merge_files(sorted_modules, module_to_file, source_dir: Path, output_file: P
         # 3. Write Modules
         for module in sorted_modules:
             rel_path = module_to_file[module]
-            full_path = source_dir / rel_path
             
             out.write(f"\n# --- MODULE: {module} ({rel_path}) ---\n")
             
-            lines = full_path.read_text(encoding="utf-8").splitlines(keepends=True)
+            lines = parsed_modules[module].source.splitlines(keepends=True)
             
             for line in lines:
                 stripped = line.strip()
@@ -274,14 +294,26 @@ def merge_files(sorted_modules, module_to_file, source_dir: Path, output_file: P
 
 
 
-def run_merge():
+def run_merge(cache: BuildCache | None = None):
+    """Merge (and optimize) the bundle. Returns False when the cache says it is already up to date."""
+    cache = cache or BuildCache(force=True)
+
     print(f"Scanning {SOURCE_DIR}...")
     files = get_python_files(SOURCE_DIR)
     
     print(f"Found files: {[str(f) for f in files]}")
 
+    key = hash_files([SOURCE_DIR / f for f in files] + BUILD_SCRIPTS, extra=PYTHON_TAG)
+    outputs = [OUTPUT_FILE]
+    if cache.is_fresh("merge", key, outputs):
+        print("Sources unchanged, bundle is up to date.")
+        return False
+
+    print("Parsing modules...")
+    parsed_modules = parse_modules(files, SOURCE_DIR)
+
     print("Analyzing dependencies...")
-    graph, module_to_file = build_dependency_graph(files, SOURCE_DIR)
+    graph, module_to_file = build_dependency_graph(files, parsed_modules)
     all_modules = list(module_to_file.keys())
     
     print("Sorting files...")
@@ -289,8 +321,14 @@ def run_merge():
     print(f"Merge order: {sorted_modules}")
 
     print(f"Merging into {OUTPUT_FILE}...")
-    merge_files(sorted_modules, module_to_file, SOURCE_DIR, OUTPUT_FILE)
+    merge_files(sorted_modules, module_to_file, parsed_modules, SOURCE_DIR, OUTPUT_FILE)
+
+    # AST pass: drop shadowed definitions, unreachable code and comments
+    print("Optimizing bundle...")
+    optimize.optimize_file(OUTPUT_FILE, header=bundle_header(SOURCE_DIR))
+    cache.record("merge", key, outputs)
     print("Merge complete.")
+    return True
 
 if __name__ == "__main__":
     run_merge()
\ No newline at end of file
@@ -0,0 +1,144 @@
+import ast
+from pathlib import Path
+
+# Statements after one of these can never run
+TERMINATORS = (ast.Return, ast.Raise, ast.Continue, ast.Break)
+DEF_NODES = (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)
+
+
+def _module_level_loads(node: ast.AST):
+    """Names read while the statement itself executes (function bodies run later, so they are skipped)."""
+    names = set()
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, ast.Name) and isinstance(current.ctx, ast.Load):
+            names.add(current.id)
+        if isinstance(current, (ast.FunctionDef, ast.AsyncFunctionDef)):
+            # Decorators, defaults and annotations are evaluated at definition time
+            stack.extend(current.decorator_list)
+            stack.extend(current.args.defaults)
+            stack.extend(d for d in current.args.kw_defaults if d is not None)
+            stack.extend(a.annotation for a in current.args.args + current.args.kwonlyargs if a.annotation is not None)
+            if current.returns is not None:
+                stack.append(current.returns)
+            continue
+        if isinstance(current, ast.Lambda):
+            stack.extend(current.args.defaults)
+            continue
+        stack.extend(ast.iter_child_nodes(current))
+    return names
+
+
+def remove_shadowed_definitions(tree: ast.Module):
+    """
+    Drop top-level functions/classes that a later top-level definition replaces.
+
+    Only undecorated definitions are removed (a decorator such as @app.post has
+    side effects even if the name is rebound), and only when nothing at module
+    level reads the name between the two definitions.
+    """
+    removed = []
+    body = tree.body
+    keep = [True] * len(body)
+
+    for i, node in enumerate(body):
+        if not isinstance(node, DEF_NODES) or node.decorator_list:
+            continue
+        for j in range(i + 1, len(body)):
+            later = body[j]
+            if isinstance(later, DEF_NODES) and later.name == node.name:
+                between = set()
+                for stmt in body[i + 1:j]:
+                    between |= _module_level_loads(stmt)
+                if node.name not in between:
+                    keep[i] = False
+                    removed.append(f"{node.name} (line {node.lineno})")
+                break
+
+    tree.body = [node for node, k in zip(body, keep) if k]
+    return removed
+
+
+def _is_generator(node: ast.AST) -> bool:
+    """Whether the function's own body (not a nested def or lambda) yields."""
+    stack = list(node.body)
+    while stack:
+        current = stack.pop()
+        if isinstance(current, (ast.Yield, ast.YieldFrom)):
+            return True
+        if isinstance(current, (*DEF_NODES, ast.Lambda)):
+            continue
+        stack.extend(ast.iter_child_nodes(current))
+    return False
+
+
+class _UnreachableStripper(ast.NodeTransformer):
+    """
+    Drops statements after a return/raise/continue/break. Functions that yield
+    are left alone: an unreachable `yield` still makes the function a
+    generator, so removing it would change what calling it returns.
+    """
+
+    def __init__(self):
+        self.removed = 0
+        self._keep = [False]
+
+    def _scope(self, node, keep: bool):
+        self._keep.append(keep)
+        try:
+            return self.generic_visit(node)
+        finally:
+            self._keep.pop()
+
+    def visit_FunctionDef(self, node):
+        return self._scope(node, _is_generator(node))
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def visit_ClassDef(self, node):
+        return self._scope(node, False)
+
+    def _truncate(self, stmts):
+        for index, stmt in enumerate(stmts):
+            if isinstance(stmt, TERMINATORS):
+                self.removed += len(stmts) - index - 1
+                return stmts[:index + 1]
+        return stmts
+
+    def generic_visit(self, node):
+        super().generic_visit(node)
+        if self._keep[-1]:
+            return node
+        for field in ("body", "orelse", "finalbody"):
+            stmts = getattr(node, field, None)
+            if isinstance(stmts, list) and stmts and isinstance(stmts[0], ast.stmt):
+                setattr(node, field, self._truncate(stmts))
+        return node
+
+
+def remove_unreachable(tree: ast.Module):
+    stripper = _UnreachableStripper()
+    stripper.visit(tree)
+    return stripper.removed
+
+
+def optimize_source(source: str, filename: str = "<bundle>"):
+    """Returns (optimized_source, report). Comments are dropped by the AST round trip."""
+    tree = ast.parse(source, filename=filename)
+    shadowed = remove_shadowed_definitions(tree)
+    unreachable = remove_unreachable(tree)
+    ast.fix_missing_locations(tree)
+    return ast.unparse(tree) + "\n", {"shadowed": shadowed, "unreachable": unreachable}
+
+
+def optimize_file(path: Path, header: str = ""):
+    source = path.read_text(encoding="utf-8")
+    optimized, report = optimize_source(source, filename=str(path))
+    path.write_text(header + optimized, encoding="utf-8")
+
+    before, after = len(source.encode("utf-8")), path.stat().st_size
+    print(f"Removed shadowed definitions: {report['shadowed'] or 'none'}")
+    print(f"Removed unreachable statements: {report['unreachable']}")
+    print(f"Bundle size: {before} -> {after} bytes ({(after - before) / before:+.1%})")
+    return report
@@ -0,0 +1,242 @@
+import csv
+import json
+import os
+from typing import AsyncIterator, Callable, Optional
+from pydantic import BaseModel, ValidationError
+from fastapi import HTTPException, Request
+from fastapi.responses import StreamingResponse
+from starlette.requests import ClientDisconnect
+from fastapi.encoders import jsonable_encoder
+from postgrest.exceptions import APIError
+from schema import ServiceImport, SubServiceImport, TechnicianImport
+from metrics import registry, Counter
+
+# Rows per upsert call
+IMPORT_CHUNK_ROWS = int(os.environ.get("IMPORT_CHUNK_ROWS", "500"))
+# Longer lines are reported as invalid without being buffered
+IMPORT_MAX_LINE_BYTES = int(os.environ.get("IMPORT_MAX_LINE_BYTES", str(64 * 1024)))
+IMPORT_TABLES: dict[str, type[BaseModel]] = {"service": ServiceImport, "sub_service": SubServiceImport, "technician": TechnicianImport}
+# Imports run for as long as the upload does; DeadlineMiddleware leaves them alone
+IMPORT_PATHS = frozenset(f"/api/funcs/admin.{table}.import" for table in IMPORT_TABLES)
+CSV_TYPES = {"text/csv", "application/csv"}
+NDJSON_TYPES = {"application/x-ndjson", "application/ndjson", "application/jsonl", "application/x-jsonlines"}
+
+import_rows_total = registry.register(Counter("fixel_import_rows_total", "Rows processed by admin.*.import, by table and status (ok, invalid, failed).", ("table", "status")))
+
+
+def import_format(content_type: Optional[str]) -> str:
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    if media_type in CSV_TYPES:
+        return "csv"
+    if media_type in NDJSON_TYPES:
+        return "ndjson"
+    raise HTTPException(status_code=415, detail="Send NDJSON (application/x-ndjson) or CSV (text/csv)")
+
+
+async def split_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[Optional[bytes]]:
+    """Complete lines from a byte stream; None stands for a line over IMPORT_MAX_LINE_BYTES."""
+    buffer = bytearray()
+    oversized = False
+    async for chunk in chunks:
+        buffer += chunk
+        start = 0
+        while (end := buffer.find(b"\n", start)) >= 0:
+            yield None if oversized else bytes(buffer[start:end]).rstrip(b"\r")
+            oversized = False
+            start = end + 1
+        del buffer[:start]
+        if len(buffer) > IMPORT_MAX_LINE_BYTES:
+            oversized = True
+            buffer.clear()
+    if oversized or buffer:
+        yield None if oversized else bytes(buffer).rstrip(b"\r")
+
+
+async def read_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[tuple[int, Optional[dict], Optional[str]]]:
+    """
+    (line, record, error) for every non-blank record, line being where it starts.
+    CSV needs a header row; a quoted CSV field may span lines. Empty CSV fields
+    are left out, so the model's defaults apply.
+    """
+    header: Optional[list[str]] = None
+    pending: list[str] = []
+    line_no = 0
+    async for raw in split_lines(chunks):
+        line_no += 1
+        if raw is None:
+            pending = []
+            yield line_no, None, f"Line longer than {IMPORT_MAX_LINE_BYTES} bytes"
+            continue
+        try:
+            text = raw.decode("utf-8-sig" if line_no == 1 else "utf-8")
+        except UnicodeDecodeError:
+            pending = []
+            yield line_no, None, "Not valid UTF-8"
+            continue
+
+        if fmt == "ndjson":
+            if not text.strip():
+                continue
+            try:
+                record = json.loads(text)
+            except ValueError as e:
+                yield line_no, None, f"Invalid JSON: {e}"
+                continue
+            if not isinstance(record, dict):
+                yield line_no, None, "Each line must be a JSON object"
+                continue
+            yield line_no, record, None
+            continue
+
+        # CSV: an odd number of quotes means a quoted field continues on the next line
+        pending.append(text)
+        if sum(part.count('"') for part in pending) % 2:
+            if sum(len(part) for part in pending) > IMPORT_MAX_LINE_BYTES:
+                pending = []
+                yield line_no, None, f"Record longer than {IMPORT_MAX_LINE_BYTES} bytes"
+            continue
+        first_line = line_no - len(pending) + 1
+        record_text = "\n".join(pending)
+        pending = []
+        if not record_text.strip():
+            continue
+        try:
+            values = next(csv.reader([record_text]))
+        except csv.Error as e:
+            yield first_line, None, f"Invalid CSV: {e}"
+            continue
+        if header is None:
+            header = [name.strip() for name in values]
+            continue
+        if len(values) != len(header):
+            yield first_line, None, f"Expected {len(header)} fields, got {len(values)}"
+            continue
+        yield first_line, {name: value for name, value in zip(header, values) if value != ""}, None
+    if pending:
+        yield line_no - len(pending) + 1, None, "Unterminated quoted field"
+
+
+class BulkImport:
+    """
+    Streams an NDJSON or CSV upload into one table:
+
+    1. Records are parsed and validated one at a time as the body arrives.
+       Invalid rows are reported straight away and never reach the database.
+    2. Valid rows are written IMPORT_CHUNK_ROWS at a time: upserted by id, or
+       inserted when they have none. When the database rejects a chunk, it is
+       split in halves until the rows at fault are isolated, so one bad row does
+       not fail its neighbours.
+    3. The report is NDJSON, one entry per row ({"line", "status", ...}) in
+       the order rows are settled, then {"summary": {...}}.
+
+    At most one chunk of each kind is held in memory, whatever the size of the
+    upload.
+    """
+
+    def __init__(self, sbase, table: str, on_complete: Optional[Callable[[], None]] = None):
+        self.sbase = sbase
+        self.table = table
+        self.on_complete = on_complete
+        self.model = IMPORT_TABLES[table]
+        self.counts = {"ok": 0, "invalid": 0, "failed": 0}
+
+    def entry(self, line: int, status: str, **fields) -> str:
+        self.counts[status] += 1
+        import_rows_total.inc(self.table, status)
+        return json.dumps({"line": line, "status": status, **fields}) + "\n"
+
+    async def run(self, chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[str]:
+        # Rows with and without an id go in separate calls (upsert vs insert)
+        keyed: list[tuple[int, dict]] = []
+        new: list[tuple[int, dict]] = []
+        keyed_ids: set = set()
+
+        async for line, record, error in read_records(chunks, fmt):
+            if error is not None:
+                yield self.entry(line, "invalid", errors=[error])
+                continue
+            try:
+                row = self.model.model_validate(record)
+            except ValidationError as e:
+                yield self.entry(line, "invalid", errors=jsonable_encoder(e.errors(include_url=False, include_context=False)))
+                continue
+            data = row.model_dump(mode="json", exclude={"created_at", "updated_at"})
+            if data.get("id") is None:
+                data.pop("id", None)
+                new.append((line, data))
+            else:
+                # Postgres refuses to upsert one id twice in a statement
+                if data["id"] in keyed_ids:
+                    async for report in self.flush(keyed, upsert=True):
+                        yield report
+                    keyed, keyed_ids = [], set()
+                keyed.append((line, data))
+                keyed_ids.add(data["id"])
+
+            if len(keyed) >= IMPORT_CHUNK_ROWS:
+                async for report in self.flush(keyed, upsert=True):
+                    yield report
+                keyed, keyed_ids = [], set()
+            if len(new) >= IMPORT_CHUNK_ROWS:
+                async for report in self.flush(new, upsert=False):
+                    yield report
+                new = []
+
+        async for report in self.flush(keyed, upsert=True):
+            yield report
+        async for report in self.flush(new, upsert=False):
+            yield report
+        if self.counts["ok"] and self.on_complete:
+            self.on_complete()
+        yield json.dumps({"summary": {"table": self.table, **self.counts}}) + "\n"
+
+    async def flush(self, rows: list[tuple[int, dict]], upsert: bool) -> AsyncIterator[str]:
+        if not rows:
+            return
+        try:
+            query = self.sbase.table(self.table)
+            payload = [data for _, data in rows]
+            res = await (query.upsert(payload, on_conflict="id") if upsert else query.insert(payload)).execute()
+        except APIError as e:
+            # The data was refused: narrow it down
+            if len(rows) > 1:
+                middle = len(rows) // 2
+                async for report in self.flush(rows[:middle], upsert):
+                    yield report
+                async for report in self.flush(rows[middle:], upsert):
+                    yield report
+                return
+            yield self.entry(rows[0][0], "failed", error=e.message or str(e))
+            return
+        except Exception as e:
+            # Upstream trouble (timeouts, open breaker): splitting would not help
+            print(f"Import into {self.table} failed for {len(rows)} rows: {e}")
+            for line, _ in rows:
+                yield self.entry(line, "failed", error="Write failed, retry these rows")
+            return
+
+        written = res.data or []
+        for index, (line, data) in enumerate(rows):
+            row_id = written[index].get("id") if index < len(written) else data.get("id")
+            yield self.entry(line, "ok", id=row_id)
+
+
+class ImportResponse(StreamingResponse):
+    """
+    A StreamingResponse that leaves the request body alone. The stock one reads
+    the body in the background to notice disconnects (ASGI < 2.4, uvicorn), which
+    would swallow the upload the report is written from; here the upload reader
+    sees the disconnect instead (ClientDisconnect from request.stream()).
+    """
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await self.stream_response(send)
+        except OSError:
+            raise ClientDisconnect()
+
+
+def import_response(request: Request, sbase, table: str, on_complete: Optional[Callable[[], None]] = None) -> StreamingResponse:
+    fmt = import_format(request.headers.get("content-type"))
+    importer = BulkImport(sbase, table, on_complete)
+    return ImportResponse(importer.run(request.stream(), fmt), media_type="application/x-ndjson")
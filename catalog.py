@@ -0,0 +1,68 @@
+import os
+import time
+from typing import Any, Awaitable, Callable, Optional
+from db import get_shared_supabase
+from singleflight import flight
+
+# The catalog only changes through the admin endpoints, which invalidate it on this
+# instance. Other instances pick the change up once their copy is CATALOG_TTL old.
+CATALOG_TTL = float(os.environ.get("CATALOG_TTL", "60"))
+# A booking read that finds an id missing from the catalog reloads it only if the
+# copy is at least this old; a deleted service would otherwise reload it per read
+CATALOG_MISS_RELOAD = float(os.environ.get("CATALOG_MISS_RELOAD", "5"))
+
+
+class CatalogCache:
+    """
+    Per-worker copy of the service catalog (services with their sub-services).
+
+    Reads within the TTL are served from memory; a refresh goes through the
+    singleflight so a burst of app opens after expiry still sends one query.
+    """
+
+    def __init__(self, ttl: float = CATALOG_TTL, client_factory: Callable[[], Awaitable[Any]] = get_shared_supabase):
+        self.ttl = ttl
+        self.client_factory = client_factory
+        self._rows: Optional[list[dict]] = None
+        self._loaded_at = 0.0
+        self._stats = {"hits": 0, "misses": 0}
+        self._index: Optional[tuple[list[dict], dict[str, dict], dict[str, dict]]] = None
+
+    def fresh(self) -> bool:
+        return self._rows is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def get(self) -> list[dict]:
+        if self.fresh():
+            self._stats["hits"] += 1
+            return self._rows
+        self._stats["misses"] += 1
+        return await flight.run("service.viewServices", self._fetch)
+
+    async def _fetch(self) -> list[dict]:
+        sbase = await self.client_factory()
+        response = await sbase.table("service").select("*, sub_service(*)").order("id").execute()
+        self._rows = response.data or []
+        self._loaded_at = time.monotonic()
+        return self._rows
+
+    async def lookup(self) -> tuple[dict[str, dict], dict[str, dict]]:
+        """Services (without their sub-services) and sub-services, each keyed by str(id)."""
+        rows = await self.get()
+        if self._index is None or self._index[0] is not rows:
+            services = {str(s["id"]): {k: v for k, v in s.items() if k != "sub_service"} for s in rows}
+            sub_services = {str(ss["id"]): ss for s in rows for ss in s.get("sub_service") or []}
+            self._index = (rows, services, sub_services)
+        return self._index[1], self._index[2]
+
+    def age(self) -> float:
+        """Seconds since the current copy was loaded (infinite without one)."""
+        return time.monotonic() - self._loaded_at if self._rows is not None else float("inf")
+
+    def invalidate(self):
+        self._rows = None
+
+    def stats(self) -> dict[str, int]:
+        return dict(self._stats)
+
+
+catalog = CatalogCache()
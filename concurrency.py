@@ -0,0 +1,60 @@
+import asyncio
+import time
+from typing import Any, Awaitable, Optional
+
+# Upper bound for a single fanned-out call. Vercel kills the whole function at 60s,
+# so one slow notification or query must not be allowed to eat the request budget.
+DEFAULT_CALL_TIMEOUT = 10.0
+
+
+class Step:
+    """An awaitable plus the per-call options used by fan_out."""
+
+    def __init__(self, awaitable: Awaitable, timeout: Optional[float] = DEFAULT_CALL_TIMEOUT, name: Optional[str] = None):
+        self.awaitable = awaitable
+        self.timeout = timeout
+        self.name = name
+
+
+def step(awaitable: Awaitable, timeout: Optional[float] = DEFAULT_CALL_TIMEOUT, name: Optional[str] = None) -> Step:
+    return Step(awaitable, timeout=timeout, name=name)
+
+
+async def _run_isolated(item: Step):
+    started = time.perf_counter()
+    try:
+        async with asyncio.timeout(item.timeout):
+            return await item.awaitable
+    except TimeoutError as e:
+        elapsed = time.perf_counter() - started
+        print(f"Fan-out step {item.name or '?'} timed out after {elapsed:.2f}s")
+        return e
+    except Exception as e:
+        print(f"Fan-out step {item.name or '?'} failed: {e}")
+        return e
+
+
+async def fan_out(*items: Awaitable | Step) -> list[Any]:
+    """
+    Runs independent awaitables concurrently inside a TaskGroup.
+
+    Each call gets its own timeout and its failures are isolated: the result list
+    (in argument order) holds either the value or the exception instance, and one
+    failing step never cancels its siblings. Cancelling the caller still cancels
+    every child, which plain asyncio.gather does not guarantee.
+    """
+    steps = [item if isinstance(item, Step) else Step(item) for item in items]
+    if not steps:
+        return []
+
+    async with asyncio.TaskGroup() as tg:
+        tasks = [tg.create_task(_run_isolated(s)) for s in steps]
+
+    return [t.result() for t in tasks]
+
+
+def unwrap(result: Any) -> Any:
+    """Re-raises an exception captured by fan_out, otherwise returns the value."""
+    if isinstance(result, BaseException):
+        raise result
+    return result
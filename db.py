@@ -1,6 +1,11 @@
 import os
-from supabase import create_client, Client, create_async_client, AsyncClient
+from importlib.util import find_spec
+import httpx
+from supabase import create_async_client, AsyncClient, AsyncClientOptions
 from dotenv import load_dotenv
+from lifecycle import on_worker_start
+from metrics import MeteredTransport
+from resilience import ResilientTransport, register_breaker_metrics
 
 load_dotenv()
 
@@ -12,5 +17,32 @@ if not url or not key:
     print("Warning: SUPABASE_URL or SUPABASE_KEY not set in environment.")
     print(f"DEBUG: URL={url}, KEY={key}")
 
+# Every client (per-request and shared) sends through one pooled httpx client, so
+# requests reuse connections and every upstream call is timed (see metrics.py).
+# Headers and URLs are passed per call by the supabase libraries, not set here.
+# Breakers, retries and the request deadline wrap the metered transport, so each
+# attempt is timed on its own (see resilience.py).
+upstream_transport = ResilientTransport(MeteredTransport(httpx.AsyncHTTPTransport(http2=find_spec("h2") is not None)))
+register_breaker_metrics(upstream_transport)
+http_client = httpx.AsyncClient(
+    transport=upstream_transport,
+    timeout=120,
+    follow_redirects=True,
+)
+
+def client_options() -> AsyncClientOptions:
+    return AsyncClientOptions(httpx_client=http_client)
+
 async def get_supabase():
-    return await create_async_client(url or "", key or "")
+    return await create_async_client(url or "", key or "", options=client_options())
+
+_shared_client: AsyncClient | None = None
+
+@on_worker_start
+async def get_shared_supabase():
+    # One long-lived client for server-side reads (batch loaders, caches).
+    # Never sign in with it: auth calls store the session on the client.
+    global _shared_client
+    if _shared_client is None:
+        _shared_client = await create_async_client(url or "", key or "", options=client_options())
+    return _shared_client
@@ -0,0 +1,366 @@
+import asyncio
+import json
+import os
+import struct
+import uuid
+import zlib
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+# Written by the triggers in supabase/migrations/*_booking_events.sql
+BOOKING_EVENT_TYPES = ("booking_created", "offer_sent", "offer_rejected", "accepted", "status_changed", "cancelled")
+# Events per read_booking_events call (the SQL function caps it at 20000)
+EVENT_PAGE_ROWS = int(os.environ.get("EVENT_PAGE_ROWS", "5000"))
+# Events per compressed block in a segment file
+SEGMENT_BLOCK_EVENTS = int(os.environ.get("SEGMENT_BLOCK_EVENTS", "4096"))
+# A segment file is closed and the next one started past this size
+SEGMENT_MAX_BYTES = int(os.environ.get("SEGMENT_MAX_BYTES", str(64 * 1024 * 1024)))
+SEGMENT_MAGIC = b"FXEV1\n"
+
+# Block header: compressed length, crc32 of the compressed bytes, event count.
+# The block holds the fixed-size records, then the events' data as one JSON array.
+SEGMENT_BLOCK = struct.Struct("<III")
+# Record: xid, id, booking_id, type, created_at (epoch seconds), techie_id (zeros = none)
+SEGMENT_RECORD = struct.Struct("<QqqBd16s")
+NO_TECHIE = bytes(16)
+ASSIGNMENT_DONE = ("completed", "cancelled")
+
+
+def event_time(value) -> float:
+    """created_at as epoch seconds (the log returns ISO strings, segments store floats)."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+def event_position(event: dict) -> tuple[int, int]:
+    """(xid, id): the order events are read and replayed in."""
+    return int(event.get("xid") or 0), int(event["id"])
+
+
+class EventSegmentWriter:
+    """
+    Appends events to numbered segment files (00000001.seg, ...) in a directory.
+
+    Events are buffered and written SEGMENT_BLOCK_EVENTS at a time as one
+    zlib-compressed block, so a segment costs a few bytes per event and one
+    write per block. A writer never touches existing segments: it starts after
+    the highest number there, and rolls over past SEGMENT_MAX_BYTES.
+    """
+
+    def __init__(self, directory, block_events: int = SEGMENT_BLOCK_EVENTS, max_bytes: int = SEGMENT_MAX_BYTES):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.block_events = block_events
+        self.max_bytes = max_bytes
+        self.pending: list[bytes] = []
+        self.pending_data: list[dict] = []
+        self.file = None
+        self.number = max((int(p.stem) for p in self.directory.glob("*.seg") if p.stem.isdigit()), default=0)
+        self.written = 0
+
+    def append(self, event: dict):
+        techie = event.get("techie_id")
+        self.pending.append(SEGMENT_RECORD.pack(
+            int(event.get("xid") or 0), int(event["id"]), int(event["booking_id"]), BOOKING_EVENT_TYPES.index(event["type"]),
+            event_time(event["created_at"]), uuid.UUID(str(techie)).bytes if techie else NO_TECHIE,
+        ))
+        self.pending_data.append(event.get("data") or {})
+        if len(self.pending) >= self.block_events:
+            self.flush()
+
+    def extend(self, events: Iterable[dict]):
+        for event in events:
+            self.append(event)
+
+    def flush(self):
+        if not self.pending:
+            return
+        if self.file is None or self.file.tell() >= self.max_bytes:
+            self._next_segment()
+        block = zlib.compress(b"".join(self.pending) + json.dumps(self.pending_data, separators=(",", ":")).encode(), 6)
+        self.file.write(SEGMENT_BLOCK.pack(len(block), zlib.crc32(block), len(self.pending)) + block)
+        self.file.flush()
+        self.written += len(self.pending)
+        self.pending, self.pending_data = [], []
+
+    def _next_segment(self):
+        if self.file is not None:
+            self.file.close()
+        self.number += 1
+        self.file = open(self.directory / f"{self.number:08d}.seg", "xb")
+        self.file.write(SEGMENT_MAGIC)
+
+    def close(self):
+        self.flush()
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def read_event_segment(path) -> Iterator[dict]:
+    """Events of one segment file. A torn last block (the writer died mid-write) ends it."""
+    techies = {NO_TECHIE: None}
+    with open(path, "rb") as f:
+        if f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not an event segment")
+        while header := f.read(SEGMENT_BLOCK.size):
+            if len(header) < SEGMENT_BLOCK.size:
+                print(f"Event segment {path}: ignoring a torn block header")
+                return
+            size, crc, count = SEGMENT_BLOCK.unpack(header)
+            block = f.read(size)
+            if len(block) < size or zlib.crc32(block) != crc:
+                print(f"Event segment {path}: ignoring a torn or corrupt block")
+                return
+            raw = zlib.decompress(block)
+            split = count * SEGMENT_RECORD.size
+            for (xid, event_id, booking_id, kind, at, techie), data in zip(SEGMENT_RECORD.iter_unpack(raw[:split]), json.loads(raw[split:])):
+                if techie not in techies:
+                    techies[techie] = str(uuid.UUID(bytes=techie))
+                yield {"id": event_id, "booking_id": booking_id, "type": BOOKING_EVENT_TYPES[kind], "techie_id": techies[techie], "data": data, "created_at": at, "xid": xid}
+
+
+def event_segments(directory) -> list[Path]:
+    return sorted(p for p in Path(directory).glob("*.seg") if p.stem.isdigit())
+
+
+def read_event_segments(directory) -> Iterator[dict]:
+    """Every event in a segment directory, in the order it was written."""
+    for path in event_segments(directory):
+        yield from read_event_segment(path)
+
+
+def last_segment_position(directory) -> Optional[tuple[int, int]]:
+    """(xid, id) of the last event written to a directory, to resume reading the log after."""
+    for path in reversed(event_segments(directory)):
+        last = None
+        for last in read_event_segment(path):
+            pass
+        if last is not None:
+            return event_position(last)
+    return None
+
+
+async def fetch_booking_history(sbase, booking_id: int) -> list[dict]:
+    """One booking's events, oldest first (booking_events_booking_idx)."""
+    res = await sbase.table("booking_events").select("id, type, techie_id, data, created_at").eq("booking_id", booking_id).order("id").execute()
+    return res.data or []
+
+
+async def fetch_booking_events(sbase, after: Optional[tuple[int, int]] = None, page_rows: Optional[int] = None) -> AsyncIterator[list[dict]]:
+    """
+    Pages of the log after `after` (an (xid, id) position), oldest first, up to
+    the database's current horizon. The next page is fetched while the caller
+    handles the current one.
+    """
+    limit = page_rows or EVENT_PAGE_ROWS
+
+    async def fetch(position):
+        params = {"p_after_xid": str(position[0]) if position else None, "p_after_id": position[1] if position else None, "p_limit": limit}
+        res = await sbase.rpc("read_booking_events", params).execute()
+        return (res.data or {}).get("events") or []
+
+    task = asyncio.create_task(fetch(after))
+    try:
+        while True:
+            page = await task
+            if len(page) < limit:
+                if page:
+                    yield page
+                return
+            task = asyncio.create_task(fetch(event_position(page[-1])))
+            yield page
+    finally:
+        task.cancel()
+
+
+class BookingEventReplay:
+    """
+    Rebuilds what the database derives from booking writes by folding the log:
+
+    - analytics_totals / analytics_daily, the same metrics as *_analytics.sql
+      except the technician count, which is not a booking event
+    - technician_counters (pending offers, active and completed assignments)
+    - the ids of the bookings seen, whose booking_documents get rebuilt
+
+    Only plain dicts and tuples are touched per event, so a replay costs a
+    few microseconds per event.
+    """
+
+    def __init__(self):
+        # booking id -> [service key, created_at, status, assigned]
+        self.bookings: dict[int, list] = {}
+        # request id -> (booking id, techie id), and the reverse for accepts
+        self.offers: dict[int, tuple[int, str]] = {}
+        self.offer_by_pair: dict[tuple[int, str], int] = {}
+        # assignment id -> (techie id, status)
+        self.assignments: dict[int, tuple[str, Optional[str]]] = {}
+        # techie id -> [pending_offers, active_assignments, completed_assignments]
+        self.counters: dict[str, list[int]] = {}
+        self.totals: dict[tuple[str, str], list[float]] = {}
+        self.daily: dict[tuple[str, str, str], list[float]] = {}
+        self._days: dict[int, str] = {}
+        self.position: Optional[tuple[int, int]] = None
+        self.events = 0
+
+    def add(self, metric: str, key: str, at: float, count: int, total: float = 0):
+        values = self.totals.setdefault((metric, key), [0, 0])
+        values[0] += count
+        values[1] += total
+        day = int(at // 86400)
+        if day not in self._days:
+            self._days[day] = datetime.fromtimestamp(day * 86400, timezone.utc).date().isoformat()
+        values = self.daily.setdefault((self._days[day], metric, key), [0, 0])
+        values[0] += count
+        values[1] += total
+
+    def bump(self, techie_id: Optional[str], pending: int = 0, active: int = 0, completed: int = 0):
+        if techie_id is None:
+            return
+        counts = self.counters.setdefault(techie_id, [0, 0, 0])
+        # Never below zero, like bump_technician_counters
+        counts[0] = max(counts[0] + pending, 0)
+        counts[1] = max(counts[1] + active, 0)
+        counts[2] = max(counts[2] + completed, 0)
+
+    def bump_assignment(self, techie_id: Optional[str], status: Optional[str], sign: int):
+        # A null status is neither active nor completed, as in count_assignment
+        if status is not None:
+            self.bump(techie_id, 0, sign * (status not in ASSIGNMENT_DONE), sign * (status == "completed"))
+
+    def apply(self, event: dict):
+        kind = event["type"]
+        data = event.get("data") or {}
+        booking_id = event["booking_id"]
+        techie_id = event.get("techie_id")
+        at = event_time(event["created_at"])
+        booking = self.bookings.get(booking_id)
+        self.position = event_position(event)
+        self.events += 1
+
+        if kind == "booking_created":
+            service = str(data.get("service_id") or "")
+            self.bookings[booking_id] = [service, at, data.get("status"), False]
+            self.add("bookings_created", service, at, 1)
+
+        elif kind == "offer_sent":
+            status = data.get("status") or "pending"
+            self.add("offers_sent", "", at, 1)
+            if status == "pending":
+                self.offers[data["request_id"]] = (booking_id, techie_id)
+                self.offer_by_pair[(booking_id, techie_id)] = data["request_id"]
+                self.bump(techie_id, 1)
+            else:
+                self.add(f"offers_{status}", "", at, 1)
+
+        elif kind == "offer_rejected":
+            if self._close_offer(data.get("request_id")):
+                self.bump(techie_id, -1)
+            self.add(f"offers_{data.get('status') or 'rejected'}", "", at, 1)
+
+        elif kind == "accepted":
+            # Only an accepted offer counts as one (admin.assignment.create has none)
+            if self._close_offer(self.offer_by_pair.get((booking_id, techie_id))):
+                self.bump(techie_id, -1)
+                self.add("offers_accepted", "", at, 1)
+            status = data.get("status")
+            self.assignments[data["assignment_id"]] = (techie_id, status)
+            self.bump_assignment(techie_id, status, 1)
+            if booking is not None and not booking[3]:
+                booking[3] = True
+                self.add("time_to_assign", booking[0], at, 1, at - booking[1])
+
+        elif "assignment_id" in data:
+            # status_changed of the booking's assignment
+            techie_id, status = self.assignments.get(data["assignment_id"], (techie_id, data.get("from")))
+            self.bump_assignment(techie_id, status, -1)
+            self.bump_assignment(techie_id, data.get("to"), 1)
+            self.assignments[data["assignment_id"]] = (techie_id, data.get("to"))
+
+        else:
+            # status_changed / cancelled of the booking, as analytics_bookings counts them
+            service = booking[0] if booking is not None else str(data.get("service_id") or "")
+            old, new = (booking[2] if booking is not None else data.get("from")), data.get("to")
+            revenue = float(data.get("revenue") or 0)
+            if old == "completed":
+                self.add("bookings_completed", service, at, -1, -revenue)
+            elif old == "cancelled":
+                self.add("bookings_cancelled", service, at, -1)
+            if new == "completed":
+                self.add("bookings_completed", service, at, 1, revenue)
+            elif new == "cancelled":
+                self.add("bookings_cancelled", service, at, 1)
+            if booking is not None:
+                booking[2] = new
+
+    def _close_offer(self, request_id: Optional[int]) -> bool:
+        pair = self.offers.pop(request_id, None)
+        if pair is None:
+            return False
+        if self.offer_by_pair.get(pair) == request_id:
+            del self.offer_by_pair[pair]
+        return True
+
+    def apply_all(self, events: Iterable[dict]) -> "BookingEventReplay":
+        for event in events:
+            self.apply(event)
+        return self
+
+    def technician_counters(self) -> list[dict]:
+        return [
+            {"techie_id": techie_id, "pending_offers": p, "active_assignments": a, "completed_assignments": c}
+            for techie_id, (p, a, c) in self.counters.items()
+        ]
+
+    def analytics_totals(self) -> list[dict]:
+        """analytics_totals rows, technicians_busy included."""
+        rows = [{"metric": m, "key": k, "count": c, "total": t} for (m, k), (c, t) in self.totals.items() if c or t]
+        busy = sum(1 for _, active, _ in self.counters.values() if active > 0)
+        return rows + [{"metric": "technicians_busy", "key": "", "count": busy, "total": 0}]
+
+    def analytics_daily(self) -> list[dict]:
+        return [{"day": d, "metric": m, "key": k, "count": c, "total": t} for (d, m, k), (c, t) in self.daily.items() if c or t]
+
+    def analytics_rows(self, days: Optional[int] = None, today: Optional[str] = None) -> list[dict]:
+        """What analytics_snapshot(days) would return after these events (see analytics.summarize_analytics)."""
+        totals = self.analytics_totals()
+        if days is None:
+            return totals
+        today = today or datetime.now(timezone.utc).date().isoformat()
+        first = datetime.fromordinal(datetime.fromisoformat(today).toordinal() - days + 1).date().isoformat()
+        window: dict[tuple[str, str], list[float]] = {}
+        for (day, metric, key), (count, total) in self.daily.items():
+            if day >= first:
+                values = window.setdefault((metric, key), [0, 0])
+                values[0] += count
+                values[1] += total
+        rows = [{"metric": m, "key": k, "count": c, "total": t} for (m, k), (c, t) in window.items() if c or t]
+        return rows + [row for row in totals if row["metric"] == "technicians_busy"]
+
+
+async def apply_booking_projections(sbase, replay: BookingEventReplay, refresh_rows: int = 1000) -> dict:
+    """
+    Writes a replay back: analytics and technician_counters in one
+    transaction (replace_booking_projections), then the booking documents of
+    every booking in the log, refresh_rows at a time.
+    """
+    xid, event_id = replay.position or (None, None)
+    res = await sbase.rpc("replace_booking_projections", {
+        "p_xid": str(xid) if xid is not None else None, "p_id": event_id,
+        "p_totals": replay.analytics_totals(), "p_daily": replay.analytics_daily(), "p_counters": replay.technician_counters(),
+    }).execute()
+    outcome = res.data or {}
+    if outcome.get("result") != "replaced":
+        return outcome
+    ids = sorted(replay.bookings)
+    for start in range(0, len(ids), refresh_rows):
+        await sbase.rpc("refresh_booking_documents", {"p_booking_ids": ids[start:start + refresh_rows]}).execute()
+    return {"result": "replaced", "events": replay.events, "bookings": len(ids), "technicians": len(replay.counters)}
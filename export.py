@@ -0,0 +1,133 @@
+import asyncio
+import csv
+import io
+import json
+import os
+import time
+from typing import AsyncIterator, Optional
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from schema import ExportBookingsRequest
+from metrics import registry, Counter
+
+# Bookings per export_bookings call (the SQL function caps it at 5000)
+EXPORT_PAGE_ROWS = int(os.environ.get("EXPORT_PAGE_ROWS", "1000"))
+# Stop starting new pages after this long, so the stream ends cleanly before
+# Vercel's maxDuration (60s) and the client resumes from the last row; 0 = no limit
+EXPORT_MAX_SECONDS = float(os.environ.get("EXPORT_MAX_SECONDS", "50"))
+# Exports run for as long as they stream; DeadlineMiddleware leaves them alone
+EXPORT_PATHS = frozenset({"/api/funcs/admin.bookings.export"})
+CSV_COLUMNS = [
+    "id", "created_at", "scheduled_at", "status", "user_id", "service_id", "service_name",
+    "assignment_id", "assignment_status", "techie_id", "technician_name",
+    "item_count", "items_total", "sub_service_ids",
+]
+
+export_rows_total = registry.register(Counter("fixel_export_rows_total", "Bookings streamed by admin.bookings.export, by format.", ("format",)))
+
+
+def csv_row(doc: dict) -> list:
+    service = doc.get("service") or {}
+    assignment = doc.get("assignment") or {}
+    technician = assignment.get("technician") or {}
+    items = doc.get("booking_item") or []
+    return [
+        doc.get("id"), doc.get("created_at"), doc.get("scheduled_at"), doc.get("status"), doc.get("user_id"),
+        doc.get("service_id"), service.get("name"),
+        doc.get("assignment_id"), assignment.get("status"), assignment.get("techie_id"), technician.get("name"),
+        len(items), sum(item.get("price") or 0 for item in items), " ".join(str(item.get("sub_service_id")) for item in items),
+    ]
+
+
+class BookingExport:
+    """
+    Streams every booking matching the filters, one export_bookings page at a time:
+
+    1. Pages are keyset-paged on (created_at, id) by the database, and the next
+       page is fetched while the current one is being sent, so at most two pages
+       are in memory however many rows match.
+    2. NDJSON rows are user.viewBooking documents; CSV rows flatten them
+       (CSV_COLUMNS). Rows come out in (created_at, id) order.
+    3. After EXPORT_MAX_SECONDS no new page is started. NDJSON ends with
+       {"summary": {"rows", "complete", "next"}}, `next` holding the after_*
+       values to resume with; CSV ends after the last full page, and a client
+       resumes from its last row's created_at and id until a page is empty.
+    """
+
+    def __init__(self, sbase, request: ExportBookingsRequest):
+        if request.to_date <= request.from_date:
+            raise HTTPException(status_code=400, detail="to_date must be after from_date")
+        if (request.after_created_at is None) != (request.after_id is None):
+            raise HTTPException(status_code=400, detail="after_created_at and after_id go together")
+        self.sbase = sbase
+        self.request = request
+        self.rows = 0
+
+    async def fetch(self, after: Optional[tuple[str, int]]) -> list[dict]:
+        params = {
+            "p_from": self.request.from_date.isoformat(),
+            "p_to": self.request.to_date.isoformat(),
+            "p_statuses": self.request.statuses,
+            "p_after_created": after[0] if after else None,
+            "p_after_id": after[1] if after else None,
+            "p_limit": EXPORT_PAGE_ROWS,
+        }
+        res = await self.sbase.rpc("export_bookings", params).execute()
+        return res.data or []
+
+    async def pages(self, stop_at: Optional[float]) -> AsyncIterator[list[dict]]:
+        request = self.request
+        after = (request.after_created_at.isoformat(), request.after_id) if request.after_created_at else None
+        task = asyncio.create_task(self.fetch(after))
+        try:
+            while True:
+                page = await task
+                if len(page) < EXPORT_PAGE_ROWS or (stop_at and time.monotonic() >= stop_at):
+                    yield page
+                    return
+                after = (page[-1]["created_at"], page[-1]["id"])
+                # 1. Ask for the next page, 2. send this one meanwhile
+                task = asyncio.create_task(self.fetch(after))
+                yield page
+        finally:
+            task.cancel()
+
+    async def run(self) -> AsyncIterator[str]:
+        fmt = self.request.format
+        stop_at = time.monotonic() + EXPORT_MAX_SECONDS if EXPORT_MAX_SECONDS > 0 else None
+        last: Optional[dict] = None
+        complete = False
+        if fmt == "csv":
+            yield self.csv_lines([CSV_COLUMNS])
+        try:
+            async for page in self.pages(stop_at):
+                if page:
+                    last = page[-1]
+                    self.rows += len(page)
+                    export_rows_total.inc(fmt, amount=len(page))
+                    yield self.csv_lines([csv_row(doc) for doc in page]) if fmt == "csv" else "".join(json.dumps(doc) + "\n" for doc in page)
+                complete = len(page) < EXPORT_PAGE_ROWS
+        except Exception as e:
+            # Headers are gone already; end the stream and let the client resume
+            print(f"Bookings export stopped after {self.rows} rows: {e}")
+        if fmt == "ndjson":
+            # Resume after the last row sent, or where this request started
+            resume = None
+            if not complete and last:
+                resume = {"after_created_at": last["created_at"], "after_id": last["id"]}
+            elif not complete and self.request.after_created_at:
+                resume = {"after_created_at": self.request.after_created_at.isoformat(), "after_id": self.request.after_id}
+            yield json.dumps({"summary": {"rows": self.rows, "complete": complete, "next": resume}}) + "\n"
+
+    @staticmethod
+    def csv_lines(rows: list[list]) -> str:
+        out = io.StringIO()
+        csv.writer(out).writerows(rows)
+        return out.getvalue()
+
+
+def export_response(sbase, request: ExportBookingsRequest) -> StreamingResponse:
+    export = BookingExport(sbase, request)
+    media_type = "text/csv" if request.format == "csv" else "application/x-ndjson"
+    filename = f"bookings-{request.from_date:%Y%m%d}-{request.to_date:%Y%m%d}.{request.format}"
+    return StreamingResponse(export.run(), media_type=media_type, headers={"Content-Disposition": f'attachment; filename="{filename}"'})
@@ -0,0 +1,68 @@
+from typing import Any, Optional
+from loader import loaders
+
+# Totals across all requests handled by this worker (exported by the metrics endpoint)
+identity_stats = {"hits": 0, "misses": 0}
+
+
+class IdentityMap:
+    """
+    Request-scoped cache of rows keyed by (table, primary key).
+
+    Handlers and helpers pass the same map around during one request, so a row
+    that was already read (or returned by a write) is not fetched again. Misses go
+    through the shared batch loaders. Writes must be recorded with record_write,
+    which replaces the cached rows with the returned representation, or drops the
+    table when the write did not return rows.
+    """
+
+    def __init__(self):
+        self._rows: dict[tuple[str, str], dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, table: str, pk: Any) -> Optional[dict]:
+        return self._rows.get((table, str(pk)))
+
+    def put(self, table: str, row: Optional[dict], pk: str = "id") -> Optional[dict]:
+        if row is not None and pk in row:
+            self._rows[(table, str(row[pk]))] = row
+        return row
+
+    def put_many(self, table: str, rows: Optional[list[dict]], pk: str = "id") -> list[dict]:
+        for row in rows or []:
+            self.put(table, row, pk)
+        return rows or []
+
+    def invalidate(self, table: str, pk: Any = None):
+        if pk is not None:
+            self._rows.pop((table, str(pk)), None)
+            return
+        for key in [k for k in self._rows if k[0] == table]:
+            del self._rows[key]
+
+    def record_write(self, table: str, rows: Optional[list[dict]], pk: str = "id"):
+        if rows:
+            self.put_many(table, rows, pk)
+        else:
+            self.invalidate(table)
+
+    async def load(self, table: str, pk: Any) -> Optional[dict]:
+        key = (table, str(pk))
+        if key in self._rows:
+            self.hits += 1
+            identity_stats["hits"] += 1
+            return self._rows[key]
+
+        self.misses += 1
+        identity_stats["misses"] += 1
+        row = await loaders[table].load(pk)
+        if row is not None:
+            self._rows[key] = row
+        return row
+
+
+async def get_identity_map() -> IdentityMap:
+    # FastAPI caches dependencies per request, so every Depends(get_identity_map)
+    # in one request (handler and its dependencies) shares the same map.
+    return IdentityMap()
@@ -0,0 +1,43 @@
+import inspect
+import os
+import time
+from typing import Any, Callable
+
+# Hooks run once per worker process: on `uvicorn --workers N` every worker imports
+# the app on its own and runs these from the FastAPI lifespan before serving.
+_start_hooks: list[Callable[[], Any]] = []
+_stop_hooks: list[Callable[[], Any]] = []
+
+
+def on_worker_start(fn: Callable[[], Any]) -> Callable[[], Any]:
+    _start_hooks.append(fn)
+    return fn
+
+
+def on_worker_stop(fn: Callable[[], Any]) -> Callable[[], Any]:
+    _stop_hooks.append(fn)
+    return fn
+
+
+async def _run_hooks(hooks: list[Callable[[], Any]], phase: str) -> dict[str, float]:
+    timings = {}
+    for hook in hooks:
+        started = time.perf_counter()
+        try:
+            result = hook()
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            # A failing warm-up must not keep the worker from serving
+            print(f"Worker {os.getpid()} {phase} hook {hook.__name__} failed: {e}")
+        timings[hook.__name__] = (time.perf_counter() - started) * 1000
+    return timings
+
+
+async def run_worker_start_hooks() -> dict[str, float]:
+    """Runs the start hooks in registration order and returns their timings in ms."""
+    return await _run_hooks(_start_hooks, "start")
+
+
+async def run_worker_stop_hooks() -> dict[str, float]:
+    return await _run_hooks(list(reversed(_stop_hooks)), "stop")
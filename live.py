@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+from typing import Optional
+from pubsub import event_hub, Event
+from metrics import registry, Counter, callback_gauge
+
+# A frame that takes longer than this to hand to the socket means the client stopped reading
+LIVE_SEND_TIMEOUT = float(os.environ.get("LIVE_SEND_TIMEOUT", "10"))
+# Bookings with an unsent change before a slow client is disconnected
+LIVE_MAX_PENDING = int(os.environ.get("LIVE_MAX_PENDING", "256"))
+# How long a socket without an Authorization header has to send its auth message
+LIVE_AUTH_TIMEOUT = 10.0
+
+# Close codes: 1008 policy violation (auth), 1013 try again later (too slow / overloaded)
+CLOSE_UNAUTHORIZED = 1008
+CLOSE_TOO_SLOW = 1013
+
+live_frames_total = registry.register(Counter("fixel_live_frames_total", "Booking update frames, by outcome (sent, slow_consumer, send_failed).", ("outcome",)))
+callback_gauge("fixel_live_sockets", "Open booking update WebSockets on this worker.", (), lambda: {(): event_hub.subscriber_count("user:")})
+
+
+def user_topic(user_id) -> str:
+    return f"user:{user_id}"
+
+
+def publish_booking_status(booking: Optional[dict]):
+    """Pushes a booking row's status to its owner's sockets. Call after every booking write."""
+    if not booking or not booking.get("user_id"):
+        return
+    event_hub.publish(user_topic(booking["user_id"]), "booking", {
+        "id": booking["id"],
+        "status": booking.get("status"),
+        "assignment_id": booking.get("assignment_id"),
+    })
+
+
+class BookingSocket:
+    """
+    One user's WebSocket as an EventHub subscriber.
+
+    An idle socket costs this object and the connection's own receive task:
+    there is no queue and no timer. offer() only records the latest change per
+    booking (a newer status replaces one that was not sent yet) and, if no send
+    is running, starts one task that sends everything pending as one frame.
+    A client that stops reading is disconnected with 1013 once a send times
+    out or LIVE_MAX_PENDING bookings are waiting; it reconnects and resumes.
+    """
+
+    __slots__ = ("topic", "websocket", "pending", "flushing", "closed")
+
+    def __init__(self, user_id: str, websocket):
+        self.topic = user_topic(user_id)
+        self.websocket = websocket
+        self.pending: dict[int, Event] = {}
+        self.flushing = False
+        self.closed = False
+
+    def offer(self, event: Event) -> bool:
+        if self.closed:
+            return False
+        self.pending[event.data["id"]] = event
+        if len(self.pending) > LIVE_MAX_PENDING:
+            self.drop("slow_consumer")
+            return False
+        if not self.flushing:
+            self.flushing = True
+            asyncio.get_running_loop().create_task(self.flush())
+        return True
+
+    async def flush(self):
+        try:
+            while self.pending and not self.closed:
+                batch, self.pending = self.pending, {}
+                events = sorted(batch.values(), key=lambda e: e.seq)
+                frame = json.dumps({"type": "bookings", "id": events[-1].id, "changes": [e.data for e in events]}, default=str, separators=(",", ":"))
+                try:
+                    async with asyncio.timeout(LIVE_SEND_TIMEOUT):
+                        await self.websocket.send_text(frame)
+                except TimeoutError:
+                    self.drop("slow_consumer")
+                    return
+                except Exception:
+                    # Already gone; the receive loop notices and detaches
+                    live_frames_total.inc("send_failed")
+                    self.closed = True
+                    return
+                live_frames_total.inc("sent")
+        finally:
+            self.flushing = False
+
+    def drop(self, reason: str):
+        if self.closed:
+            return
+        self.closed = True
+        self.pending = {}
+        live_frames_total.inc(reason)
+        asyncio.get_running_loop().create_task(self._close())
+
+    async def _close(self):
+        try:
+            await self.websocket.close(code=CLOSE_TOO_SLOW, reason="too slow, reconnect")
+        except Exception:
+            pass
+
+    async def send_json(self, message: dict):
+        await self.websocket.send_text(json.dumps(message, default=str, separators=(",", ":")))
+
+
+async def run_booking_socket(websocket, user_id: str, last_event_id: Optional[str]):
+    """Subscribes an accepted, authenticated socket and holds it until the client leaves."""
+    socket = BookingSocket(user_id, websocket)
+    # 1. Subscribe before catching up, so nothing published in between is lost
+    event_hub.attach(socket)
+    try:
+        # 2. Catch up from the client's last frame id, or tell it to reload its bookings
+        if last_event_id:
+            replay = event_hub.since(socket.topic, last_event_id)
+            if replay is None:
+                await socket.send_json({"type": "resync"})
+            for event in replay or ():
+                socket.offer(event)
+
+        # 3. Nothing is expected from the client; wait for it to go away
+        while not socket.closed:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+    finally:
+        socket.closed = True
+        event_hub.detach(socket)
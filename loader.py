@@ -0,0 +1,110 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Iterable, Optional
+from db import get_shared_supabase
+
+# How long a loader waits for more ids before sending the batch. Small enough to be
+# invisible next to a Supabase round trip, large enough to catch a burst of requests.
+BATCH_WINDOW = 0.002
+MAX_BATCH_SIZE = 200
+
+
+class BatchLoader:
+    """
+    DataLoader-style per-table row loader.
+
+    Ids requested within BATCH_WINDOW (across all concurrent requests) are fetched
+    with one `.in_(key, [...])` query and the rows fanned back out to each caller.
+    An id that is already part of an in-flight batch joins that batch instead of
+    being queued again. Rows are never kept after their batch resolves.
+    """
+
+    def __init__(self, table: str, key: str = "id", columns: str = "*", window: float = BATCH_WINDOW, max_batch: int = MAX_BATCH_SIZE, client_factory: Callable[[], Awaitable[Any]] = get_shared_supabase, name: Optional[str] = None):
+        self.table = table
+        self.name = name or table
+        self.key = key
+        self.columns = columns
+        self.window = window
+        self.max_batch = max_batch
+        self.client_factory = client_factory
+        self._pending: dict[str, asyncio.Future] = {}
+        self._inflight: dict[str, asyncio.Future] = {}
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The loop only keeps weak references to tasks; a batch must not be
+        # collected while its callers wait on it
+        self._tasks: set[asyncio.Task] = set()
+        self._stats = {"loads": 0, "queries": 0, "ids_fetched": 0, "collapsed": 0}
+
+    async def load(self, id: Any) -> Optional[dict]:
+        """Returns the row whose key column equals id, or None."""
+        key = str(id)
+        self._stats["loads"] += 1
+
+        fut = self._pending.get(key) or self._inflight.get(key)
+        if fut is not None:
+            self._stats["collapsed"] += 1
+        else:
+            loop = asyncio.get_running_loop()
+            fut = loop.create_future()
+            self._pending[key] = fut
+            if len(self._pending) >= self.max_batch:
+                self._dispatch()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._dispatch)
+
+        return await asyncio.shield(fut)
+
+    async def load_many(self, ids: Iterable[Any]) -> list[Optional[dict]]:
+        return list(await asyncio.gather(*[self.load(i) for i in ids]))
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        self._inflight.update(batch)
+        task = asyncio.ensure_future(self._fetch(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _fetch(self, batch: dict[str, asyncio.Future]):
+        self._stats["queries"] += 1
+        self._stats["ids_fetched"] += len(batch)
+        try:
+            sbase = await self.client_factory()
+            res = await sbase.table(self.table).select(self.columns).in_(self.key, list(batch)).execute()
+            rows = {str(row[self.key]): row for row in res.data or []}
+            for key, fut in batch.items():
+                if not fut.done():
+                    fut.set_result(rows.get(key))
+        except Exception as e:
+            print(f"Batch load from {self.table} failed: {e}")
+            for fut in batch.values():
+                if not fut.done():
+                    fut.set_exception(e)
+        finally:
+            for key, fut in batch.items():
+                if self._inflight.get(key) is fut:
+                    del self._inflight[key]
+
+    def stats(self) -> dict[str, int]:
+        return dict(self._stats)
+
+
+userprofile_loader = BatchLoader("userprofile")
+technician_loader = BatchLoader("technician")
+assignment_loader = BatchLoader("assignment")
+bookings_loader = BatchLoader("bookings")
+service_loader = BatchLoader("service")
+
+loaders = {ldr.table: ldr for ldr in (userprofile_loader, technician_loader, assignment_loader, bookings_loader, service_loader)}
+
+# Existence checks for verify_user / verify_technician: only the id comes back,
+# so a role check does not pull push tokens and profile columns on every request
+userprofile_exists_loader = BatchLoader("userprofile", columns="id", name="userprofile.exists")
+technician_exists_loader = BatchLoader("technician", columns="id", name="technician.exists")
+
+
+def loader_stats() -> dict[str, dict[str, int]]:
+    return {ldr.name: ldr.stats() for ldr in (*loaders.values(), userprofile_exists_loader, technician_exists_loader)}
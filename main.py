@@ -1,17 +1,65 @@
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import FastAPI, HTTPException
+import asyncio
+import json
 import os
-import smtplib
-from email.message import EmailMessage
-from pydantic import BaseModel
+from pathlib import Path
 from typing import List, Optional, Any, Dict
-from models import Service, Assignment, Technician, UserProfile, Booking, Notification, AssignmentRequest, SubService, BookingItem, ServiceRead, BookingRead, AssignmentRead, BookingItemRead, SubServiceRead, AssignmentRequestRead, BookServiceResponse
-from schema import BookServiceRequest, UserRequest, TechnicianRequest, UpdateStatusRequest, LoginRequest, RegisterRequest, ViewBookingRequest, CancelBookingRequest, TechnicianRegisterRequest, TechnicianLoginRequest, AssignmentResponseRequest, RegisterPushTokenRequest, TestNotificationRequest
-from db import get_supabase, AsyncClient
+from models import Service, Assignment, Technician, UserProfile, Booking, Notification, AssignmentRequest, SubService, BookingItem, ServiceRead, BookingRead, AssignmentRead, BookingItemRead, SubServiceRead, AssignmentRequestRead, BookServiceResponse, TechnicianDashboard
+from schema import BookServiceRequest, UserRequest, TechnicianRequest, UpdateStatusRequest, LoginRequest, RegisterRequest, ViewBookingRequest, CancelBookingRequest, TechnicianRegisterRequest, TechnicianLoginRequest, AssignmentResponseRequest, RegisterPushTokenRequest, TestNotificationRequest, SyncRequest, BatchCall, ExportBookingsRequest, AnalyticsRequest
+from db import get_supabase, get_shared_supabase, AsyncClient
 from uuid import UUID
-from utils import send_email, verify_user, verify_technician, send_push_notification
-from fastapi import Depends, HTTPException, Header
-
-app = FastAPI(title="Fixel Backend", docs_url="/api/docs", redoc_url="/api/redoc", openapi_url="/api/openapi.json")
+from utils import send_email, verify_user, verify_technician, verify_admin, send_push_notification
+from concurrency import fan_out, step, unwrap
+from singleflight import flight
+from loader import userprofile_loader, technician_loader, loader_stats
+from identity import IdentityMap, get_identity_map
+from catalog import catalog
+from warmup import warmup
+from metrics import registry, cache_counter, push_sends_total, MetricsMiddleware, metrics_enabled, metrics_authorized
+from identity import identity_stats
+from profiler import ProfilerMiddleware
+from admission import AdmissionMiddleware, STREAM_PATHS
+from resilience import DeadlineMiddleware, UpstreamUnavailable, DeadlineExceeded
+from offers import OfferStream, publish_offer, publish_offer_closed
+from sync import sync_entities
+from batch import BatchRunner
+from bulk_import import import_response, IMPORT_PATHS
+from export import export_response, EXPORT_PATHS
+from analytics import fetch_analytics
+from event_log import fetch_booking_history
+from read_model import fetch_user_bookings, fetch_user_booking
+from live import run_booking_socket, publish_booking_status, CLOSE_TOO_SLOW, CLOSE_UNAUTHORIZED, LIVE_AUTH_TIMEOUT
+from lifecycle import run_worker_start_hooks, run_worker_stop_hooks
+from server import serve
+from fastapi import Depends, HTTPException, Header, WebSocket, Request
+from contextlib import asynccontextmanager
+from fastapi.responses import PlainTextResponse, JSONResponse, StreamingResponse
+import math
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Runs in every worker process (see lifecycle.py / server.py)
+    await run_worker_start_hooks()
+    yield
+    await run_worker_stop_hooks()
+
+app = FastAPI(title="Fixel Backend", docs_url="/api/docs", redoc_url="/api/redoc", openapi_url="/api/openapi.json", lifespan=lifespan)
+# The last middleware added runs first: metrics see every request, including
+# the ones admission control rejects. The deadline starts only once a request is admitted.
+app.add_middleware(DeadlineMiddleware, exempt_paths=STREAM_PATHS | IMPORT_PATHS | EXPORT_PATHS)
+app.add_middleware(AdmissionMiddleware)
+# Off unless PROFILE_SAMPLE_RATE or PROFILE_SECRET is set (see profiler.py)
+app.add_middleware(ProfilerMiddleware)
+app.add_middleware(MetricsMiddleware)
+
+@app.exception_handler(UpstreamUnavailable)
+async def upstream_unavailable_handler(request, exc: UpstreamUnavailable):
+    # Circuit open: fail fast and tell the client when the next probe is due
+    return JSONResponse(status_code=503, content={"detail": "Service temporarily unavailable"}, headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))})
+
+@app.exception_handler(DeadlineExceeded)
+async def deadline_exceeded_handler(request, exc: DeadlineExceeded):
+    return JSONResponse(status_code=504, content={"detail": "Upstream timed out"})
 
 # --- User Functions ---
 
@@ -84,13 +132,12 @@ async def login_user(data: LoginRequest, sbase: AsyncClient = Depends(get_supaba
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
 @app.post("/api/funcs/service.viewServices", response_model=list[ServiceRead])
-async def view_services(sbase: AsyncClient = Depends(get_supabase)):
-    response = await sbase.table("service").select("*, sub_service(*)").order("id").execute()
-    print(response.data)
-    return response.data
+async def view_services():
+    # Served from the per-worker catalog cache; refreshes are coalesced (see catalog.py)
+    return await catalog.get()
 
 @app.post("/api/funcs/service.bookService", response_model=BookServiceResponse)
-async def book_service(data: BookServiceRequest, sbase: AsyncClient = Depends(get_supabase)):
+async def book_service(data: BookServiceRequest, sbase: AsyncClient = Depends(get_supabase), identity: IdentityMap = Depends(get_identity_map)):
     # Create Booking directly (Assignment decoupled)
     booking_data = {
         "user_id": str(data.user_id),
@@ -103,8 +150,9 @@ async def book_service(data: BookServiceRequest, sbase: AsyncClient = Depends(ge
     if not booking_res.data:
         raise HTTPException(status_code=500, detail="Failed to create booking")
 
-    booking = booking_res.data[0]
+    booking = identity.put("bookings", booking_res.data[0])
     booking_id = booking["id"]
+    publish_booking_status(booking)
 
     # Handle Sub-services (Booking Items)
     if data.sub_service_ids:
@@ -124,7 +172,7 @@ async def book_service(data: BookServiceRequest, sbase: AsyncClient = Depends(ge
             await sbase.table("booking_item").insert(items_data).execute()
 
     # Trigger Assignment
-    assignment = await assign_technician(booking_id, data.service_id, data.scheduled_at)
+    assignment = await assign_technician(booking, sbase, identity)
     
     # # Notify User (Booking Received)
     # # Ideally fetch user email from UserProfile, but for now assuming we have it or just logging
@@ -155,14 +203,14 @@ async def book_service(data: BookServiceRequest, sbase: AsyncClient = Depends(ge
     )
 
 @app.post("/api/funcs/user.cancelBooking")
-async def cancel_booking(data: CancelBookingRequest, user_id: str = Depends(verify_user), sbase: AsyncClient = Depends(get_supabase)):
+async def cancel_booking(data: CancelBookingRequest, user_id: str = Depends(verify_user), sbase: AsyncClient = Depends(get_supabase), identity: IdentityMap = Depends(get_identity_map)):
     # 1. Verify booking exists and belongs to user
     booking_res = await sbase.table("bookings").select("*").eq("id", data.booking_id).eq("user_id", user_id).execute()
     
     if not booking_res.data:
         raise HTTPException(status_code=404, detail="Booking not found or does not belong to user")
     
-    booking = booking_res.data[0]
+    booking = identity.put("bookings", booking_res.data[0])
     
     if booking["status"] == "cancelled":
         return {"message": "Booking is already cancelled"}
@@ -172,37 +220,80 @@ async def cancel_booking(data: CancelBookingRequest, user_id: str = Depends(veri
     
     if not update_res.data:
         raise HTTPException(status_code=500, detail="Failed to cancel booking")
+    identity.record_write("bookings", update_res.data)
+    publish_booking_status(update_res.data[0])
 
-    # Notify User about cancellation confirmation (optional but good)
-    await send_notification_async(
-        sbase,
-        user_id=user_id,
-        title="Booking Cancelled",
-        message=f"your booking (ID: {data.booking_id}) has been cancelled successfully.",
-        data={"booking_id": data.booking_id, "type": "booking_cancelled"}
-    )
+    # Withdraw offers still waiting on a technician's answer and cancel the
+    # assignment. These are part of the cancellation: if either write fails the
+    # request fails, so the client retries instead of leaving a technician on it.
+    writes = [step(expire_offers(sbase, data.booking_id), name="expire_offers")]
+    if booking.get("assignment_id"):
+        # Schema says assignment references booking. Usually we should cancel assignment too.
+        writes.append(step(sbase.table("assignment").update({"status": "cancelled"}).eq("id", booking["assignment_id"]).execute(), name="cancel_assignment"))
+    try:
+        for result in await fan_out(*writes):
+            unwrap(result)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to cancel booking: {e}")
 
-    # Notify Technician if assigned
+    # Notify User about cancellation confirmation (optional but good) and the
+    # assigned technician; a failed notification does not fail the request.
+    steps = [
+        step(send_notification_async(
+            sbase,
+            user_id=user_id,
+            title="Booking Cancelled",
+            message=f"your booking (ID: {data.booking_id}) has been cancelled successfully.",
+            data={"booking_id": data.booking_id, "type": "booking_cancelled"}
+        ), name="notify_user")
+    ]
     if booking.get("assignment_id"):
-        # Fetch technician ID from assignment
-        assign_res = await sbase.table("assignment").select("techie_id").eq("id", booking["assignment_id"]).execute()
-        if assign_res.data:
-            tech_id = assign_res.data[0]["techie_id"]
-            await send_notification_async(
-                sbase,
-                user_id=tech_id,
-                title="Booking Cancelled",
-                message=f"Booking (ID: {data.booking_id}) has been cancelled by the user.",
-                data={"booking_id": data.booking_id, "type": "booking_cancelled"}
-            )
-            # Also update assignment status to cancelled if not done automatically (Assuming logic handles it or we should too)
-            # Schema says assignment references booking. Usually we should cancel assignment too.
-            await sbase.table("assignment").update({"status": "cancelled"}).eq("id", booking["assignment_id"]).execute()
+        steps.append(step(notify_assigned_technician(sbase, booking["assignment_id"], data.booking_id, identity), name="notify_technician"))
+
+    await fan_out(*steps)
 
     return {"message": "Booking cancelled successfully", "booking": update_res.data[0]}
 
+async def expire_offers(sbase: AsyncClient, booking_id: int):
+    res = await sbase.table("assignment_request").update({"status": "expired"}).eq("booking_id", booking_id).eq("status", "pending").execute()
+    for offer in res.data or []:
+        publish_offer_closed(offer["techie_id"], offer["id"], booking_id, "cancelled")
+
+async def notify_assigned_technician(sbase: AsyncClient, assignment_id: int, booking_id: int, identity: IdentityMap):
+    # Fetch technician ID from assignment
+    assignment = await identity.load("assignment", assignment_id)
+    if assignment:
+        tech_id = assignment["techie_id"]
+        await send_notification_async(
+            sbase,
+            user_id=tech_id,
+            title="Booking Cancelled",
+            message=f"Booking (ID: {booking_id}) has been cancelled by the user.",
+            data={"booking_id": booking_id, "type": "booking_cancelled"}
+        )
+
 async def send_notification_async(sbase: AsyncClient, user_id: UUID | str, title: str, message: str, data: Optional[dict] = None, token: Optional[str] = None):
-    # 1. Persist to DB
+    # 1. Persist to DB and 2. get the token if missing, concurrently
+    steps = [step(persist_notification(sbase, user_id, title, message), name="persist_notification")]
+    if not token:
+        steps.append(step(fetch_push_token(sbase, user_id), name="fetch_push_token"))
+
+    results = await fan_out(*steps)
+    if not token and not isinstance(results[1], Exception):
+        token = results[1]
+
+    # 3. Send Push (the Expo SDK is blocking, keep it off the event loop)
+    if not token:
+        push_sends_total.inc("no_token")
+        return
+    try:
+        outcome = await asyncio.to_thread(send_push_notification, token, title, message, data)
+    except Exception as e:
+        print(f"Push to {user_id} failed: {e}")
+        outcome = "error"
+    push_sends_total.inc(outcome or "sent")
+
+async def persist_notification(sbase: AsyncClient, user_id: UUID | str, title: str, message: str):
     try:
         notif_data = {
             "user_id": str(user_id),
@@ -213,32 +304,34 @@ async def send_notification_async(sbase: AsyncClient, user_id: UUID | str, title
     except Exception as e:
         print(f"Failed to persist notification for {user_id}: {e}")
 
-    # 2. Get Token if missing
-    if not token:
-        try:
-             # Try UserProfile first
-             res = await sbase.table("userprofile").select("push_token").eq("id", str(user_id)).execute()
-             if res.data and res.data[0].get("push_token"):
-                 token = res.data[0]["push_token"]
-             else:
-                 # Try Technician
-                 res_tech = await sbase.table("technician").select("push_token").eq("id", str(user_id)).execute()
-                 if res_tech.data and res_tech.data[0].get("push_token"):
-                     token = res_tech.data[0]["push_token"]
-        except Exception as e:
-            print(f"Failed to fetch token for {user_id}: {e}")
+async def fetch_push_token(sbase: AsyncClient, user_id: UUID | str) -> Optional[str]:
+    # Lookups go through the batch loaders, so a burst of notifications costs one
+    # `in_` query per table instead of one query per recipient.
+    try:
+         # Try UserProfile first
+         profile = await userprofile_loader.load(user_id)
+         if profile and profile.get("push_token"):
+             return profile["push_token"]
+         # Try Technician
+         technician = await technician_loader.load(user_id)
+         if technician and technician.get("push_token"):
+             return technician["push_token"]
+    except Exception as e:
+        print(f"Failed to fetch token for {user_id}: {e}")
+    return None
 
-    # 3. Send Push
-    if token:
-        send_push_notification(token, title, message, data)
+async def assign_technician(booking: dict, sbase: Optional[AsyncClient] = None, identity: Optional[IdentityMap] = None):
+    # Takes the already-loaded booking row; the service row comes from the
+    # request's identity map when a caller has read it before.
+    sbase = sbase or await get_supabase()
+    identity = identity or IdentityMap()
+    booking_id = booking["id"]
 
-async def assign_technician(booking_id: int, service_id: int, scheduled_at: str):
-    sbase = await get_supabase()
     # 1. Get Service to find provider_role_id
-    service_res = await sbase.table("service").select("provider_role_id").eq("id", service_id).execute()
-    if not service_res.data:
+    service = await identity.load("service", booking["service_id"])
+    if not service:
         return None
-    provider_role = service_res.data[0]["provider_role_id"]
+    provider_role = service["provider_role_id"]
 
     # 2. Find Technicians with matching provider_role
     tech_res = await sbase.table("technician").select("id, push_token").eq("provider_role_id", provider_role).execute()
@@ -276,6 +369,8 @@ async def assign_technician(booking_id: int, service_id: int, scheduled_at: str)
     req_res = await sbase.table("assignment_request").insert(request_data).execute()
     
     if req_res.data:
+        # Push the offer to the technician's open stream (technician.offerStream)
+        publish_offer(selected_tech["id"], {**req_res.data[0], "booking": {**booking, "service": service}})
         # 6. Update Booking status
         # We don't have an 'assignment_id' yet to link in the booking table because Assignment doesn't exist.
         # But we might want to know it's "assigned/offered".
@@ -299,21 +394,57 @@ async def assign_technician(booking_id: int, service_id: int, scheduled_at: str)
 
 @app.post("/api/funcs/user.viewBookedServices", response_model=list[BookingRead])
 async def view_booked_services(user_id: str = Depends(verify_user), sbase: AsyncClient = Depends(get_supabase)):
-    # Query bookings table, join service directly (since assignment might be null)
-    # Supabase join: select(*, service(*))
-    # Supabase join: select(*, service(*), booking_item(*, sub_service(*)))
-    response = await sbase.table("bookings").select("*, service:service_id(*), booking_item(*, sub_service(*))").eq("user_id", user_id).order("created_at", desc=True).execute()
-    print(response.data)
-    return response.data
+    # Reads the denormalized booking documents (read_model.py); each one also
+    # carries the assignment, which the join-based list left out.
+    return await fetch_user_bookings(sbase, user_id)
 
 @app.post("/api/funcs/user.viewBooking", response_model=BookingRead)
 async def view_booking(data: ViewBookingRequest, user_id: str = Depends(verify_user), sbase: AsyncClient = Depends(get_supabase)):
-    response = await sbase.table("bookings").select("*, service:service_id(*), assignment:assignment_id(*, technician:techie_id(*)), booking_item(*, sub_service(*))").eq("id", data.booking_id).eq("user_id", user_id).execute()
-    
-    if not response.data:
+    booking = await fetch_user_booking(sbase, user_id, data.booking_id)
+    if not booking:
          raise HTTPException(status_code=404, detail="Booking not found")
-    
-    return response.data[0]
+    return booking
+
+@app.websocket("/api/funcs/user.bookingUpdates")
+async def booking_updates(websocket: WebSocket):
+    # Pushes {"type": "bookings", "id", "changes": [{id, status, assignment_id}]} frames
+    # whenever one of the user's bookings is written (see live.py). Clients that
+    # cannot set headers send {"token": ..., "last_event_id": ...} first instead.
+    # 1. Authenticate (same checks as every user.* function). The shared client is
+    # used so an idle socket does not keep a whole supabase client alive.
+    sbase = await get_shared_supabase()
+    authorization = websocket.headers.get("authorization")
+    last_event_id = websocket.query_params.get("last_event_id")
+    # Auth that could not be checked (Supabase down, out of time) closes with
+    # 1013 "try again later" instead of telling the client its token is bad.
+    if authorization:
+        try:
+            user_id = await verify_user(authorization, sbase)
+        except HTTPException:
+            await websocket.close(code=CLOSE_UNAUTHORIZED)
+            return
+        except (UpstreamUnavailable, DeadlineExceeded):
+            # A close code only reaches the client once the socket is accepted
+            await websocket.accept()
+            await websocket.close(code=CLOSE_TOO_SLOW, reason="auth unavailable, reconnect")
+            return
+        await websocket.accept()
+    else:
+        await websocket.accept()
+        try:
+            async with asyncio.timeout(LIVE_AUTH_TIMEOUT):
+                hello = await websocket.receive_json()
+            last_event_id = hello.get("last_event_id") or last_event_id
+            user_id = await verify_user(f"Bearer {hello.get('token', '')}", sbase)
+        except (UpstreamUnavailable, DeadlineExceeded):
+            await websocket.close(code=CLOSE_TOO_SLOW, reason="auth unavailable, reconnect")
+            return
+        except Exception:
+            await websocket.close(code=CLOSE_UNAUTHORIZED)
+            return
+
+    # 2. Subscribe and hold the socket until the client leaves
+    await run_booking_socket(websocket, user_id, last_event_id)
 
 @app.post("/api/funcs/user.viewUser", response_model=list[UserProfile])
 async def view_user(user_id: str = Depends(verify_user), sbase: AsyncClient = Depends(get_supabase)):
@@ -326,6 +457,13 @@ async def view_notifications(user_id: str = Depends(verify_user), sbase: AsyncCl
     response = await sbase.table("notifications").select("*").eq("user_id", user_id).execute()
     return response.data
 
+@app.post("/api/funcs/user.sync")
+async def user_sync(data: SyncRequest, user_id: str = Depends(verify_user), sbase: AsyncClient = Depends(get_supabase)):
+    # Delta sync for user.viewBookedServices and notification.viewNotifications:
+    # per entity {changed, removed, full, cursor}; send the cursors back next time
+    # (supabase/migrations/*_delta_sync.sql).
+    return await sync_entities(sbase, "user", user_id, data.cursors, data.entities)
+
 @app.post("/api/funcs/utils.registerPushToken")
 async def register_push_token(data: RegisterPushTokenRequest, authorization: Optional[str] = Header(None), sbase: AsyncClient = Depends(get_supabase)):
     # Re-using logic from verify code roughly, but generic
@@ -357,6 +495,46 @@ async def test_notification(data: TestNotificationRequest):
     )
     return {"message": "Notification sent (or attempted)"}
 
+@app.post("/api/funcs/utils.coalesceStats")
+async def coalesce_stats():
+    # singleflight: calls = reads requested, executions = queries actually sent, collapsed = calls that joined an in-flight query
+    # loaders: loads = ids requested, queries = batched `in_` queries sent
+    return {"singleflight": flight.stats(), "loaders": loader_stats(), "catalog": catalog.stats()}
+
+# Cache hit rates, read from the stats each cache already keeps when scraped
+cache_counter("fixel_cache_requests_total", "Cache lookups by cache and result.", ("cache", "result"), lambda: {
+    ("catalog", "hit"): catalog.stats()["hits"],
+    ("catalog", "miss"): catalog.stats()["misses"],
+    ("identity_map", "hit"): identity_stats["hits"],
+    ("identity_map", "miss"): identity_stats["misses"],
+})
+def coalescing_stats():
+    counts = {}
+    for endpoint, s in flight.stats().items():
+        counts[("singleflight", endpoint, "collapsed")] = s["collapsed"]
+        counts[("singleflight", endpoint, "executed")] = s["executions"]
+    for table, s in loader_stats().items():
+        counts[("loader", table, "collapsed")] = s["collapsed"]
+        counts[("loader", table, "executed")] = s["loads"] - s["collapsed"]
+    return counts
+
+cache_counter("fixel_coalesced_requests_total", "Reads that joined an in-flight singleflight call or loader batch (collapsed) or issued their own (executed).", ("source", "key", "result"), coalescing_stats)
+
+@app.get("/api/metrics", response_class=PlainTextResponse)
+async def metrics(authorization: Optional[str] = Header(None)):
+    # Prometheus scrape endpoint. Values are per worker process.
+    if not metrics_enabled():
+        raise HTTPException(status_code=403, detail="Metrics are disabled")
+    if not metrics_authorized(authorization):
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/api/warm")
+async def warm():
+    # Cheap enough for a scheduler to hit every few minutes; only the first call on
+    # an instance does any work (if the lifespan hook has not already done it).
+    return await warmup.run()
+
 # --- Technician Functions ---
 
 @app.post("/api/funcs/technician.register")
@@ -427,7 +605,10 @@ async def login_technician(data: TechnicianLoginRequest, sbase: AsyncClient = De
 
 @app.post("/api/funcs/technician.viewProfile", response_model=Optional[Technician])
 async def view_technician_profile(techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
-    response = await sbase.table("technician").select("*").eq("id", techie_id).execute()
+    return await fetch_technician_profile(sbase, techie_id)
+
+async def fetch_technician_profile(sbase: AsyncClient, techie_id: str) -> Optional[dict]:
+    response = await flight.run("technician.viewProfile", lambda tid: sbase.table("technician").select("*").eq("id", tid).execute(), techie_id)
     return response.data[0] if response.data else None
 
 @app.post("/api/funcs/technician.viewAssignmentRequests", response_model=list[AssignmentRequestRead])
@@ -436,15 +617,48 @@ async def view_assignment_requests(techie_id: str = Depends(verify_technician),
     # We might want to join booking and service info so they can see what it is
     # Supabase join syntax: select(*, booking:booking_id(*, service:service_id(*))) - nested might be tricky deep, but let's try shallow first or just booking.
     # Actually booking -> service_id is in Booking table.
+    return await fetch_pending_offers(sbase, techie_id)
+
+async def fetch_pending_offers(sbase: AsyncClient, techie_id: str) -> list[dict]:
     response = await sbase.table("assignment_request").select("*, booking:booking_id(*, service:service_id(*))").eq("techie_id", techie_id).eq("status", "pending").execute()
     return response.data
 
+@app.post("/api/funcs/technician.offerStream", response_class=StreamingResponse)
+async def technician_offer_stream(techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase), last_event_id: Optional[str] = Header(None)):
+    # Server-Sent Events replacing technician.viewAssignmentRequests polling:
+    # `snapshot` (all pending offers), then `offer` / `offer_closed` as they happen.
+    # Reconnect with the Last-Event-ID header to resume (see offers.py).
+    stream = OfferStream(techie_id, lambda: fetch_pending_offers(sbase, techie_id))
+    await stream.open(last_event_id)
+    return StreamingResponse(stream.events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
 @app.post("/api/funcs/technician.viewAssignedBookings", response_model=list[AssignmentRead])
 async def view_assigned_services(techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
+    return await fetch_active_assignments(sbase, techie_id)
+
+async def fetch_active_assignments(sbase: AsyncClient, techie_id: str) -> list[dict]:
     # Select assignments where techie_id matches, excluding completed/cancelled
     response = await sbase.table("assignment").select("*, service:service_id(*), booking:booking_id(*)").eq("techie_id", techie_id).neq("status", "completed").neq("status", "cancelled").execute()
     return response.data
 
+@app.post("/api/funcs/technician.dashboard", response_model=TechnicianDashboard)
+async def technician_dashboard(techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
+    # The home screen in one call: viewProfile, viewAssignmentRequests and
+    # viewAssignedBookings after a single auth check, fetched concurrently, plus
+    # the counters the database keeps (supabase/migrations/*_technician_counters.sql).
+    profile, offers, assigned, counts = await fan_out(
+        step(fetch_technician_profile(sbase, techie_id), name="dashboard_profile"),
+        step(fetch_pending_offers(sbase, techie_id), name="dashboard_offers"),
+        step(fetch_active_assignments(sbase, techie_id), name="dashboard_assigned"),
+        step(fetch_technician_counts(sbase, techie_id), name="dashboard_counts"),
+    )
+    return {"profile": unwrap(profile), "assignment_requests": unwrap(offers), "assigned_bookings": unwrap(assigned), "counts": unwrap(counts)}
+
+async def fetch_technician_counts(sbase: AsyncClient, techie_id: str) -> dict:
+    # No row yet means the technician never had an offer or an assignment
+    response = await sbase.table("technician_counters").select("pending_offers, active_assignments, completed_assignments").eq("techie_id", techie_id).execute()
+    return response.data[0] if response.data else {}
+
 @app.post("/api/funcs/technician.viewBookingHistory", response_model=list[AssignmentRead])
 async def view_booking_history(techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
     # For now, maybe all assignments are history? Or filter by completed?
@@ -453,49 +667,40 @@ async def view_booking_history(techie_id: str = Depends(verify_technician), sbas
     response = await sbase.table("assignment").select("*, service:service_id(*), booking:booking_id(*)").eq("techie_id", techie_id).order("scheduled_at", desc=True).execute()
     return response.data
 
+@app.post("/api/funcs/technician.sync")
+async def technician_sync(data: SyncRequest, techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
+    # Delta sync for technician.viewBookingHistory and the technician's notifications
+    return await sync_entities(sbase, "technician", techie_id, data.cursors, data.entities)
+
 @app.post("/api/funcs/technician.acceptAssignment")
 async def accept_assignment(data: AssignmentResponseRequest, techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
-    # 1. Verify Request
-    req_res = await sbase.table("assignment_request").select("*").eq("id", data.request_id).eq("techie_id", techie_id).execute()
-    if not req_res.data:
+    # Claim the offer and the booking in one transaction (supabase/migrations/*_assignment_cas.sql).
+    # The RPC guards every update with a status check, so when several technicians
+    # accept at the same moment exactly one of them gets "accepted" back.
+    rpc_res = await sbase.rpc("accept_assignment_request", {"p_request_id": data.request_id, "p_techie_id": str(techie_id)}).execute()
+    outcome = rpc_res.data or {}
+    result = outcome.get("result")
+
+    if result == "not_found":
         raise HTTPException(status_code=404, detail="Assignment request not found or does not belong to you")
-    
-    request = req_res.data[0]
-    
-    if request["status"] != "pending":
-          raise HTTPException(status_code=400, detail="Assignment request is not pending")
-          
-    # 2. Get Booking to get details for Assignment
-    booking_id = request["booking_id"]
-    booking_res = await sbase.table("bookings").select("*").eq("id", booking_id).execute()
-    if not booking_res.data:
-         raise HTTPException(status_code=404, detail="Booking not found")
-    
-    booking = booking_res.data[0]
-    if booking["status"] == "confirmed":
-         return {"message": "Booking already confirmed by another technician"}
-
-    # 3. Create Assignment
-    assignment_data = {
-        "techie_id": techie_id,
-        "service_id": booking["service_id"],
-        "booking_id": booking_id,
-        "scheduled_at": booking["scheduled_at"],
-        "status": "active" # or whatever status we use for active assignment
-    }
-    
-    assign_res = await sbase.table("assignment").insert(assignment_data).execute()
-    
-    if not assign_res.data:
-         raise HTTPException(status_code=500, detail="Failed to create assignment")
-    
-    assignment = assign_res.data[0]
-
-    # 4. Update Request Status -> accepted
-    await sbase.table("assignment_request").update({"status": "accepted"}).eq("id", data.request_id).execute()
-    
-    # 5. Update Booking Status -> confirmed
-    await sbase.table("bookings").update({"status": "confirmed", "assignment_id": assignment["id"]}).eq("id", booking_id).execute()
+    if result == "not_pending":
+        raise HTTPException(status_code=400, detail="Assignment request is not pending")
+    if result == "booking_not_found":
+        raise HTTPException(status_code=404, detail="Booking not found")
+    if result in ("already_confirmed", "booking_unavailable"):
+        # The RPC expired the offer
+        publish_offer_closed(techie_id, data.request_id, None, "expired")
+    if result == "already_confirmed":
+        return {"message": "Booking already confirmed by another technician"}
+    if result == "booking_unavailable":
+        raise HTTPException(status_code=400, detail=f"Booking is no longer available ({outcome.get('status')})")
+    if result != "accepted":
+        raise HTTPException(status_code=500, detail="Failed to create assignment")
+
+    assignment = outcome["assignment"]
+    booking = outcome["booking"]
+    publish_offer_closed(techie_id, data.request_id, booking["id"], "accepted")
+    publish_booking_status(booking)
 
     # Notify User
     try:
@@ -505,7 +710,7 @@ async def accept_assignment(data: AssignmentResponseRequest, techie_id: str = De
             user_id=booking["user_id"],
             title="Technician Assigned",
             message=f"A technician has been assigned to your booking.",
-            data={"booking_id": booking_id, "type": "technician_assigned"}
+            data={"booking_id": booking["id"], "type": "technician_assigned"}
         )
     except Exception as e:
         print(f"Error sending push to user: {e}")
@@ -513,79 +718,73 @@ async def accept_assignment(data: AssignmentResponseRequest, techie_id: str = De
     return {"message": "Assignment accepted", "assignment": assignment}
 
 @app.post("/api/funcs/technician.rejectAssignment")
-async def reject_assignment(data: AssignmentResponseRequest, techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
-    # 1. Verify Request
-    req_res = await sbase.table("assignment_request").select("*").eq("id", data.request_id).eq("techie_id", techie_id).execute()
-    if not req_res.data:
+async def reject_assignment(data: AssignmentResponseRequest, techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase), identity: IdentityMap = Depends(get_identity_map)):
+    # 1. Reject the offer (only if still pending) and get the booking back in the same call
+    rpc_res = await sbase.rpc("reject_assignment_request", {"p_request_id": data.request_id, "p_techie_id": str(techie_id)}).execute()
+    outcome = rpc_res.data or {}
+    result = outcome.get("result")
+
+    if result == "not_found":
         raise HTTPException(status_code=404, detail="Assignment request not found")
-        
-    request = req_res.data[0]
-    
-    # 2. Update Request Status -> rejected
-    await sbase.table("assignment_request").update({"status": "rejected"}).eq("id", data.request_id).execute()
-    
-    # 3. Trigger next assignment
-    booking_id = request["booking_id"]
-    
-    # Retrieve booking details for re-assignment
-    booking_res = await sbase.table("bookings").select("*").eq("id", booking_id).execute()
-    if booking_res.data:
-        booking = booking_res.data[0]
-        # Attempt to assign to next tech
-        new_assignment = await assign_technician(booking_id, booking["service_id"], booking["scheduled_at"])
+    if result == "not_pending":
+        raise HTTPException(status_code=400, detail="Assignment request is not pending")
+    if result != "rejected":
+        raise HTTPException(status_code=500, detail="Failed to reject assignment request")
+
+    # 2. Trigger next assignment
+    booking = outcome.get("booking")
+    booking = identity.put("bookings", booking) if booking and booking.get("id") is not None else None
+    publish_offer_closed(techie_id, data.request_id, booking["id"] if booking else None, "rejected")
+    if booking:
+        booking_id = booking["id"]
+        # Attempt to assign to next tech (reuses the booking the RPC returned)
+        new_assignment = await assign_technician(booking, sbase, identity)
         
         if not new_assignment:
             # If no one else found, maybe set booking to 'pending' or 'unfulfilled'
-            await sbase.table("bookings").update({"status": "pending"}).eq("id", booking_id).execute()
+            pending_res = await sbase.table("bookings").update({"status": "pending"}).eq("id", booking_id).execute()
+            identity.record_write("bookings", pending_res.data)
+            for row in pending_res.data or []:
+                publish_booking_status(row)
             return {"message": "Assignment rejected. No other technicians available."}
             
     return {"message": "Assignment rejected. Re-assignment process triggered."}
 
 @app.post("/api/funcs/service.updateStatus")
-async def update_status(data: UpdateStatusRequest, techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase)):
+async def update_status(data: UpdateStatusRequest, techie_id: str = Depends(verify_technician), sbase: AsyncClient = Depends(get_supabase), identity: IdentityMap = Depends(get_identity_map)):
     # 1. Verify Assignment belongs to Technician
-    assign_res = await sbase.table("assignment").select("id").eq("id", data.assignment_id).eq("techie_id", techie_id).execute()
-    if not assign_res.data:
+    assignment = await identity.load("assignment", data.assignment_id)
+    if not assignment or str(assignment["techie_id"]) != str(techie_id):
         raise HTTPException(status_code=403, detail="Assignment not found or does not belong to you")
 
-    # 2. Update status in 'bookings' table via assignment_id
-    await sbase.table("bookings").update({"status": data.status}).eq("assignment_id", data.assignment_id).execute()
-
-    # 3. Update status in 'assignment' table
-    response = await sbase.table("assignment").update({"status": data.status}).eq("id", data.assignment_id).execute()
-
-    if data.status == "completed":
+    # 2. Update status in 'bookings' (via assignment_id) and 'assignment' together.
+    # The bookings update returns the row, so we get user_id without re-selecting it.
+    bookings_res, assign_update_res = await fan_out(
+        step(sbase.table("bookings").update({"status": data.status}).eq("assignment_id", data.assignment_id).execute(), name="update_booking"),
+        step(sbase.table("assignment").update({"status": data.status}).eq("id", data.assignment_id).execute(), name="update_assignment"),
+    )
+    unwrap(bookings_res)
+    response = unwrap(assign_update_res)
+    identity.record_write("bookings", bookings_res.data)
+    identity.record_write("assignment", response.data)
+    for row in bookings_res.data or []:
+        publish_booking_status(row)
+
+    notifications = {
+        "completed": ("Booking Completed", "Your booking has been marked as completed.", "booking_completed"),
+        "cancelled": ("Booking Cancelled", "Your booking has been cancelled by the technician.", "booking_cancelled"),
+    }
+    if data.status in notifications and bookings_res.data:
         # Notify User
-        try: 
-            # Need to get user_id from booking to get token
-            booking_res = await sbase.table("bookings").select("user_id").eq("assignment_id", data.assignment_id).execute()
-            if booking_res.data:
-                user_id = booking_res.data[0]["user_id"]
-                
-                await send_notification_async(
-                    sbase,
-                    user_id=user_id,
-                    title="Booking Completed",
-                    message="Your booking has been marked as completed.",
-                    data={"booking_id": data.assignment_id, "type": "booking_completed"}
-                )
-        except Exception as e:
-             print(f"Error sending push to user: {e}")
-
-    elif data.status == "cancelled":
-         # Notify User
-        try: 
-            booking_res = await sbase.table("bookings").select("user_id").eq("assignment_id", data.assignment_id).execute()
-            if booking_res.data:
-                user_id = booking_res.data[0]["user_id"]
-                
-                await send_notification_async(
-                    sbase,
-                    user_id=user_id,
-                    title="Booking Cancelled",
-                    message="Your booking has been cancelled by the technician.",
-                    data={"booking_id": data.assignment_id, "type": "booking_cancelled"}
-                )
+        title, message, notif_type = notifications[data.status]
+        try:
+            await send_notification_async(
+                sbase,
+                user_id=bookings_res.data[0]["user_id"],
+                title=title,
+                message=message,
+                data={"booking_id": data.assignment_id, "type": notif_type}
+            )
         except Exception as e:
              print(f"Error sending push to user: {e}")
 
@@ -598,16 +797,19 @@ async def update_status(data: UpdateStatusRequest, techie_id: str = Depends(veri
 async def admin_create_service(service: Service, sbase: AsyncClient = Depends(get_supabase)):
     data = service.model_dump(exclude={"id", "created_at", "updated_at"})
     response = await sbase.table("service").insert(data).execute()
+    catalog.invalidate()
     return response.data
 
 @app.post("/api/funcs/admin.service.update")
 async def admin_update_service(id: int, updates: Dict[str, Any], sbase: AsyncClient = Depends(get_supabase)):
     response = await sbase.table("service").update(updates).eq("id", id).execute()
+    catalog.invalidate()
     return response.data
 
 @app.post("/api/funcs/admin.service.delete")
 async def admin_delete_service(id: int, sbase: AsyncClient = Depends(get_supabase)):
     response = await sbase.table("service").delete().eq("id", id).execute()
+    catalog.invalidate()
     return response.data
 
 # Technician CRUD
@@ -633,11 +835,69 @@ async def admin_create_assignment(assignment: Assignment, sbase: AsyncClient = D
 async def admin_create_sub_service(sub_service: SubService, sbase: AsyncClient = Depends(get_supabase)):
     data = sub_service.model_dump(exclude={"id", "created_at"})
     response = await sbase.table("sub_service").insert(data).execute()
+    catalog.invalidate()
     return response.data
 
+# Bulk imports: NDJSON or CSV body in, NDJSON per-row report out (bulk_import.py)
+@app.post("/api/funcs/admin.service.import", response_class=StreamingResponse, dependencies=[Depends(verify_admin)])
+async def admin_import_services(request: Request, sbase: AsyncClient = Depends(get_supabase)):
+    return import_response(request, sbase, "service", on_complete=catalog.invalidate)
+
+@app.post("/api/funcs/admin.sub_service.import", response_class=StreamingResponse, dependencies=[Depends(verify_admin)])
+async def admin_import_sub_services(request: Request, sbase: AsyncClient = Depends(get_supabase)):
+    return import_response(request, sbase, "sub_service", on_complete=catalog.invalidate)
+
+@app.post("/api/funcs/admin.technician.import", response_class=StreamingResponse, dependencies=[Depends(verify_admin)])
+async def admin_import_technicians(request: Request, sbase: AsyncClient = Depends(get_supabase)):
+    return import_response(request, sbase, "technician")
+
+@app.post("/api/funcs/admin.bookings.export", response_class=StreamingResponse, dependencies=[Depends(verify_admin)])
+async def admin_export_bookings(data: ExportBookingsRequest, sbase: AsyncClient = Depends(get_supabase)):
+    # Every booking in the date range as NDJSON or CSV, streamed page by page (export.py)
+    return export_response(sbase, data)
+
+@app.post("/api/funcs/admin.analytics", dependencies=[Depends(verify_admin)])
+async def admin_analytics(data: AnalyticsRequest, sbase: AsyncClient = Depends(get_supabase)):
+    # Counters the database updates on every booking/offer transition
+    # (supabase/migrations/*_analytics.sql); reading them scans no bookings.
+    return await fetch_analytics(sbase, data.days)
+
+@app.post("/api/funcs/admin.booking.events", dependencies=[Depends(verify_admin)])
+async def admin_booking_events(booking_id: int, sbase: AsyncClient = Depends(get_supabase)):
+    # Everything that happened to the booking, from the append-only log the
+    # database writes (supabase/migrations/*_booking_events.sql)
+    return await fetch_booking_history(sbase, booking_id)
+
+# Batch: several funcs in one request, authenticated once (batch.py)
+batch_runner = BatchRunner(app)
+
+@app.post("/api/funcs/batch")
+async def run_batch(calls: list[BatchCall], request: Request, deadline_ms: Optional[int] = None, sbase: AsyncClient = Depends(get_supabase), identity: IdentityMap = Depends(get_identity_map)):
+    # One entry per call, in order: {"ok", "status", "result"} or {"ok", "status", "error"}
+    deadline = deadline_ms / 1000 if deadline_ms else None
+    return await batch_runner.run(calls, dict(request.headers), sbase, identity, deadline, request.scope.get("admission"))
+
+# The build writes the schema next to the bundle (build/coldstart.py), so a cold
+# instance serves /api/docs without walking every route and model first.
+OPENAPI_SCHEMA_FILE = Path(__file__).with_name("openapi.json")
+
+def precomputed_openapi():
+    if app.openapi_schema is None and OPENAPI_SCHEMA_FILE.exists():
+        app.openapi_schema = json.loads(OPENAPI_SCHEMA_FILE.read_text(encoding="utf-8"))
+    return app.openapi_schema or FastAPI.openapi(app)
+
+app.openapi = precomputed_openapi
+
+@warmup.step
+async def asgi_app():
+    # Starlette builds the middleware stack on the first request; do it now instead
+    if app.middleware_stack is None:
+        app.middleware_stack = app.build_middleware_stack()
+    app.openapi()
+
 def main():
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # Worker count, event loop and HTTP parser come from the environment (see server.py)
+    serve()
 
 if __name__ == "__main__":
     main()
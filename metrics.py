@@ -0,0 +1,232 @@
+import hmac
+import os
+import time
+from bisect import bisect_left
+from typing import Callable, Iterable, Optional
+import httpx
+
+# Seconds. Vercel's maxDuration is 60s, so anything past that is a timeout anyway.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(labelnames: tuple, labels: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, labels)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """
+    Monotonic counter keyed by a tuple of label values.
+
+    Metrics are only ever updated from the worker's event loop thread (blocking
+    work in asyncio.to_thread reports back after the await), so plain dict
+    updates are safe and no lock is taken on the hot path. Each worker process
+    keeps and serves its own values.
+    """
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.values: dict[tuple, float] = {}
+
+    def inc(self, *labels, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def render(self) -> list[str]:
+        return [f"{self.name}{_label_text(self.labelnames, labels)} {_number(value)}" for labels, value in sorted(self.values.items())]
+
+
+class CallbackCounter(Counter):
+    """Counter whose values are read at scrape time from stats another module already keeps."""
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str], collect: Callable[[], dict[tuple, float]]):
+        super().__init__(name, help, labelnames)
+        self.collect = collect
+
+    def render(self) -> list[str]:
+        try:
+            self.values = dict(self.collect())
+        except Exception as e:
+            print(f"Metrics collector {self.name} failed: {e}")
+        return super().render()
+
+
+class CallbackGauge(CallbackCounter):
+    """Current values (not totals) read at scrape time."""
+
+    kind = "gauge"
+
+
+class Histogram:
+    """Fixed-bucket histogram; each series is [count per bucket..., +Inf count, sum]."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self.series: dict[tuple, list] = {}
+
+    def observe(self, value: float, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = []
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), series):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else _number(bound)
+                bucket_labels = _label_text(self.labelnames, labels, 'le="' + le + '"')
+                lines.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_label_text(self.labelnames, labels)} {_number(series[-1])}")
+            lines.append(f"{self.name}_count{_label_text(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: list = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+request_duration = registry.register(Histogram("fixel_http_request_duration_seconds", "Time spent serving a request, by route template.", ("method", "route")))
+responses_total = registry.register(Counter("fixel_http_responses_total", "Responses sent, by route template and status code.", ("method", "route", "status")))
+upstream_duration = registry.register(Histogram("fixel_upstream_request_duration_seconds", "Supabase HTTP calls, by API, table (or rpc/auth endpoint) and operation.", ("api", "table", "op")))
+upstream_total = registry.register(Counter("fixel_upstream_requests_total", "Supabase HTTP calls, by API, table, operation and status code.", ("api", "table", "op", "status")))
+push_sends_total = registry.register(Counter("fixel_push_sends_total", "Push notification attempts, by outcome.", ("outcome",)))
+
+# Called as observer(api, table, op, status, started, seconds) after every upstream
+# call, from the task that made it (the profiler uses this for its timeline).
+upstream_observers: list[Callable[[str, str, str, str, float, float], None]] = []
+
+
+def cache_counter(name: str, help: str, labelnames: Iterable[str], collect: Callable[[], dict[tuple, float]]) -> CallbackCounter:
+    return registry.register(CallbackCounter(name, help, labelnames, collect))
+
+
+def callback_gauge(name: str, help: str, labelnames: Iterable[str], collect: Callable[[], dict[tuple, float]]) -> CallbackGauge:
+    return registry.register(CallbackGauge(name, help, labelnames, collect))
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware (no BaseHTTPMiddleware task/stream overhead) recording
+    latency and status per route template, so /api/funcs/* paths do not explode
+    label cardinality. Requests that match no route are grouped as "unmatched".
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        started = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            method = scope.get("method", "")
+            request_duration.observe(time.perf_counter() - started, method, path)
+            responses_total.inc(method, path, str(status[0]))
+
+
+def classify_upstream(request: httpx.Request) -> tuple[str, str, str]:
+    """Maps a Supabase URL to (api, table, op), e.g. /rest/v1/bookings PATCH -> (rest, bookings, update)."""
+    parts = [p for p in request.url.path.split("/") if p]
+    method = request.method
+    if len(parts) >= 3 and parts[0] == "rest":
+        if parts[2] == "rpc" and len(parts) >= 4:
+            return "rest", parts[3], "rpc"
+        if method in ("GET", "HEAD"):
+            op = "select"
+        elif method == "POST":
+            op = "upsert" if "merge-duplicates" in request.headers.get("prefer", "") else "insert"
+        elif method == "PATCH":
+            op = "update"
+        else:
+            op = method.lower()
+        return "rest", parts[2], op
+    if len(parts) >= 3 and parts[0] == "auth":
+        return "auth", parts[2], method.lower()
+    return (parts[0] if parts else "other"), "", method.lower()
+
+
+class MeteredTransport(httpx.AsyncBaseTransport):
+    """httpx transport wrapper that times every Supabase call (up to response headers)."""
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.transport = transport or httpx.AsyncHTTPTransport()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        api, table, op = classify_upstream(request)
+        started = time.perf_counter()
+        status = "error"
+        try:
+            response = await self.transport.handle_async_request(request)
+            status = str(response.status_code)
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            upstream_duration.observe(elapsed, api, table, op)
+            upstream_total.inc(api, table, op, status)
+            for observer in upstream_observers:
+                observer(api, table, op, status, started, elapsed)
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def metrics_enabled() -> bool:
+    # Without METRICS_TOKEN the scrape endpoint is off, as the admin functions are without ADMIN_TOKEN
+    return bool(os.environ.get("METRICS_TOKEN"))
+
+
+def metrics_authorized(authorization: Optional[str]) -> bool:
+    # The scrape endpoint needs `Authorization: Bearer <METRICS_TOKEN>`
+    token = os.environ.get("METRICS_TOKEN")
+    return bool(token) and authorization is not None and hmac.compare_digest(authorization.encode(), f"Bearer {token}".encode())
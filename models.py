@@ -100,5 +100,17 @@ class AssignmentRequestRead(AssignmentRequest):
 class BookServiceResponse(BaseModel):
     booking: Booking
 
+class TechnicianCounts(BaseModel):
+    # Kept by the database (technician_counters), not counted per request
+    pending_offers: int = 0
+    active_assignments: int = 0
+    completed_assignments: int = 0
+
+class TechnicianDashboard(BaseModel):
+    profile: Optional[Technician] = None
+    assignment_requests: list[AssignmentRequestRead] = []
+    assigned_bookings: list[AssignmentRead] = []
+    counts: TechnicianCounts = TechnicianCounts()
+
 
 
@@ -0,0 +1,141 @@
+import asyncio
+import os
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Optional
+from pubsub import event_hub, format_sse, Subscription
+from metrics import registry, Counter, callback_gauge
+
+# Comment line sent when nothing else was, so proxies and phones keep the connection
+OFFER_STREAM_HEARTBEAT = float(os.environ.get("OFFER_STREAM_HEARTBEAT", "15"))
+# Streams end after this long and the client reconnects with Last-Event-ID.
+# Keep it under the platform's request limit (Vercel maxDuration is 60s).
+OFFER_STREAM_MAX_SECONDS = float(os.environ.get("OFFER_STREAM_MAX_SECONDS", "55"))
+# Re-read the pending offers this often, to pick up offers published on another
+# worker or instance; 0 turns it off (single worker)
+OFFER_STREAM_RESYNC = float(os.environ.get("OFFER_STREAM_RESYNC", "30"))
+# Reconnect delay sent to EventSource clients, ms
+OFFER_STREAM_RETRY_MS = 2000
+
+offer_events_total = registry.register(Counter("fixel_offer_events_total", "Technician offer events published, by type and reason.", ("type", "reason")))
+callback_gauge("fixel_offer_streams", "Open technician offer streams on this worker.", (), lambda: {(): event_hub.subscriber_count("technician:")})
+
+
+def offer_topic(techie_id) -> str:
+    return f"technician:{techie_id}"
+
+
+def publish_offer(techie_id, offer: dict):
+    """offer is shaped like a technician.viewAssignmentRequests item (booking and service embedded)."""
+    offer_events_total.inc("offer", "")
+    event_hub.publish(offer_topic(techie_id), "offer", offer)
+
+
+def publish_offer_closed(techie_id, request_id: int, booking_id: Optional[int], reason: str):
+    """reason: accepted, rejected, expired or cancelled. The client drops the offer."""
+    offer_events_total.inc("offer_closed", reason)
+    event_hub.publish(offer_topic(techie_id), "offer_closed", {"id": request_id, "booking_id": booking_id, "reason": reason})
+
+
+class OfferStream:
+    """
+    One technician's SSE stream:
+
+    1. Subscribe first, so nothing published while catching up is lost.
+    2. Catch up: replay the events after Last-Event-ID if this worker still has
+       them all, otherwise send a `snapshot` event with every pending offer.
+    3. Forward live `offer` / `offer_closed` events, with a heartbeat comment
+       whenever the line has been quiet for `heartbeat` seconds.
+    4. Every `resync` seconds re-read the pending offers and send a new snapshot
+       if they differ from what the client has been told.
+
+    The stream ends after `max_seconds`, or as soon as the client falls so far
+    behind that its queue overflows; either way it reconnects and resumes.
+    Clients treat `snapshot` as "replace all" and `offer` as an upsert by id, so
+    an offer that arrives both ways is harmless.
+    """
+
+    def __init__(self, techie_id: str, snapshot: Callable[[], Awaitable[list[dict]]], heartbeat: float = OFFER_STREAM_HEARTBEAT, max_seconds: float = OFFER_STREAM_MAX_SECONDS, resync: float = OFFER_STREAM_RESYNC):
+        self.techie_id = str(techie_id)
+        self.snapshot = snapshot
+        self.heartbeat = heartbeat
+        self.max_seconds = max_seconds
+        self.resync = resync
+        self.known: Optional[set] = None
+        self.subscription: Optional[Subscription] = None
+        self._backlog: list[str] = []
+
+    async def open(self, last_event_id: Optional[str]):
+        """Runs before the response starts, so a failing snapshot is still a normal HTTP error."""
+        self.subscription = event_hub.subscribe(offer_topic(self.techie_id))
+        try:
+            replay = event_hub.since(self.subscription.topic, last_event_id)
+            if replay is None:
+                self._backlog.append(await self._snapshot_event())
+            else:
+                self._backlog.extend(e.sse() for e in replay)
+        except BaseException:
+            self.close()
+            raise
+
+    def close(self):
+        if self.subscription is not None:
+            event_hub.unsubscribe(self.subscription)
+            self.subscription = None
+
+    def _track(self, type: str, data: Any):
+        if self.known is None:
+            return
+        if type == "offer":
+            self.known.add(data.get("id"))
+        elif type == "offer_closed":
+            self.known.discard(data.get("id"))
+
+    async def _snapshot_event(self) -> str:
+        cursor = event_hub.cursor()
+        offers = await self.snapshot()
+        self.known = {o.get("id") for o in offers}
+        return format_sse("snapshot", offers, cursor)
+
+    async def _resync(self) -> Optional[str]:
+        try:
+            cursor = event_hub.cursor()
+            offers = await self.snapshot()
+        except Exception as e:
+            print(f"Offer stream resync for {self.techie_id} failed: {e}")
+            return None
+        ids = {o.get("id") for o in offers}
+        if ids == self.known:
+            return None
+        self.known = ids
+        return format_sse("snapshot", offers, cursor)
+
+    async def events(self) -> AsyncIterator[str]:
+        subscription = self.subscription
+        try:
+            yield f"retry: {OFFER_STREAM_RETRY_MS}\n\n"
+            for chunk in self._backlog:
+                yield chunk
+            self._backlog = []
+
+            now = time.monotonic()
+            ends_at = now + self.max_seconds
+            resync_at = now + self.resync if self.resync > 0 else float("inf")
+            while not subscription.overflowed:
+                now = time.monotonic()
+                if now >= ends_at:
+                    return
+                if now >= resync_at:
+                    resync_at = now + self.resync
+                    chunk = await self._resync()
+                    if chunk:
+                        yield chunk
+                    continue
+                try:
+                    event = await asyncio.wait_for(subscription.queue.get(), timeout=min(self.heartbeat, ends_at - now, resync_at - now))
+                except TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                self._track(event.type, event.data)
+                yield event.sse()
+        finally:
+            self.close()
@@ -0,0 +1,238 @@
+import asyncio
+import contextvars
+import hashlib
+import hmac
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from metrics import upstream_observers
+
+# Off unless PROFILE_SAMPLE_RATE > 0 or PROFILE_SECRET is set.
+#   PROFILE_SAMPLE_RATE     fraction of requests to profile (0)
+#   PROFILE_SECRET          enables the signed X-Fixel-Profile header (see sign_profile_header)
+#   PROFILE_DIR             where profiles are written (<tmp>/fixel-profiles)
+#   PROFILE_INTERVAL_MS     stack sampling interval (5)
+#   PROFILE_MAX_CONCURRENT  profiled requests in flight per worker; others run unprofiled (1)
+#   PROFILE_MAX_SECONDS     stop sampling a request after this long (30)
+PROFILE_HEADER = "x-fixel-profile"
+MAX_HEADER_TTL = 24 * 3600
+
+_active_profile: contextvars.ContextVar[Optional["Profile"]] = contextvars.ContextVar("active_profile", default=None)
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.environ.get(name, default))
+    except ValueError:
+        print(f"Warning: ignoring invalid {name}={os.environ.get(name)!r}")
+        return default
+
+
+def sign_profile_header(secret: str, ttl: int = 300, now: Optional[float] = None) -> str:
+    """Value for the X-Fixel-Profile header: '<expiry>.<hmac-sha256(secret, expiry)>'."""
+    expiry = str(int((now or time.time()) + ttl))
+    return f"{expiry}.{hmac.new(secret.encode(), expiry.encode(), hashlib.sha256).hexdigest()}"
+
+
+def verify_profile_header(value: Optional[str], secret: Optional[str], now: Optional[float] = None) -> bool:
+    if not value or not secret:
+        return False
+    expiry, _, signature = value.partition(".")
+    if not expiry.isdigit():
+        return False
+    remaining = int(expiry) - (now or time.time())
+    if remaining <= 0 or remaining > MAX_HEADER_TTL:
+        return False
+    expected = hmac.new(secret.encode(), expiry.encode(), hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({Path(code.co_filename).name}:{frame.f_lineno})"
+
+
+class Profile:
+    """Samples and upstream calls collected for one request."""
+
+    def __init__(self, method: str, path: str, max_seconds: float):
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.deadline = self.started + max_seconds
+        self.stacks: dict[str, int] = {}
+        self.samples = 0
+        self.upstream: list[dict] = []
+        self.status: Optional[int] = None
+        self.route: Optional[str] = None
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{random.randrange(16 ** 6):06x}"
+
+    def add_sample(self, stack: str):
+        self.samples += 1
+        self.stacks[stack] = self.stacks.get(stack, 0) + 1
+
+    def add_upstream(self, api: str, table: str, op: str, status: str, started: float, seconds: float):
+        self.upstream.append({
+            "start_ms": round((started - self.started) * 1000, 2),
+            "duration_ms": round(seconds * 1000, 2),
+            "api": api, "table": table, "op": op, "status": status,
+        })
+
+    def collapsed(self) -> str:
+        # One "root;...;leaf count" line per distinct stack, as read by flamegraph.pl,
+        # speedscope and inferno
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def timeline(self) -> dict:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "route": self.route,
+            "status": self.status,
+            "started_at": self.wall_started,
+            "duration_ms": round((time.perf_counter() - self.started) * 1000, 2),
+            "samples": self.samples,
+            "upstream": sorted(self.upstream, key=lambda u: u["start_ms"]),
+        }
+
+
+class Sampler:
+    """
+    One background thread that, while any profile is active, periodically grabs
+    the event loop thread's stack and charges it to the profile whose task is
+    running. Samples taken while another request's task runs, or while the loop
+    waits for I/O, are recorded as "(other requests)" / "(idle)" so the output
+    adds up to wall time.
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.profiles: set[Profile] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._thread: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+
+    def add(self, profile: Profile):
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self.profiles.add(profile)
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="fixel-profiler", daemon=True)
+            self._thread.start()
+        self._wake.set()
+
+    def remove(self, profile: Profile):
+        self.profiles.discard(profile)
+
+    def _run(self):
+        while True:
+            if not self.profiles:
+                self._wake.clear()
+                if not self._wake.wait(timeout=5.0):
+                    if not self.profiles:
+                        # Nothing to do for a while: let the thread go, add() restarts it
+                        self._thread = None
+                        return
+            time.sleep(self.interval)
+            self.sample()
+
+    def sample(self):
+        frame = sys._current_frames().get(self._loop_thread)
+        if frame is None:
+            return
+        task = asyncio.current_task(self._loop)
+        owner = task.get_context().get(_active_profile) if task is not None else None
+        if owner is not None:
+            labels = []
+            while frame is not None:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            stack = ";".join(reversed(labels))
+        else:
+            stack = "(idle)" if task is None else "(other requests)"
+
+        now = time.perf_counter()
+        for profile in list(self.profiles):
+            if now > profile.deadline:
+                continue
+            profile.add_sample(stack if profile is owner else ("(other requests)" if owner is not None else stack))
+
+
+def _record_upstream(api: str, table: str, op: str, status: str, started: float, seconds: float):
+    profile = _active_profile.get()
+    if profile is not None:
+        profile.add_upstream(api, table, op, status, started, seconds)
+
+
+upstream_observers.append(_record_upstream)
+
+
+class ProfilerMiddleware:
+    """
+    Opt-in per-request profiling. A request is profiled when it carries a valid
+    signed X-Fixel-Profile header, or is picked by PROFILE_SAMPLE_RATE, and fewer
+    than PROFILE_MAX_CONCURRENT profiles are running. Each profile writes
+    <id>.collapsed (stack samples) and <id>.json (upstream call timeline) to
+    PROFILE_DIR; the response carries the id in X-Fixel-Profile-Id.
+    """
+
+    def __init__(self, app, sample_rate: Optional[float] = None, secret: Optional[str] = None, output_dir: Optional[str] = None, interval_ms: Optional[float] = None, max_concurrent: Optional[int] = None, max_seconds: Optional[float] = None):
+        self.app = app
+        self.sample_rate = sample_rate if sample_rate is not None else _env_float("PROFILE_SAMPLE_RATE", 0.0)
+        self.secret = secret if secret is not None else os.environ.get("PROFILE_SECRET") or None
+        self.output_dir = Path(output_dir or os.environ.get("PROFILE_DIR") or Path(tempfile.gettempdir()) / "fixel-profiles")
+        self.max_concurrent = max_concurrent if max_concurrent is not None else int(_env_float("PROFILE_MAX_CONCURRENT", 1))
+        self.max_seconds = max_seconds if max_seconds is not None else _env_float("PROFILE_MAX_SECONDS", 30.0)
+        self.sampler = Sampler((interval_ms if interval_ms is not None else _env_float("PROFILE_INTERVAL_MS", 5.0)) / 1000)
+        self.enabled = self.sample_rate > 0 or bool(self.secret)
+
+    def wants_profile(self, scope) -> bool:
+        if len(self.sampler.profiles) >= self.max_concurrent:
+            return False
+        if self.secret:
+            for name, value in scope.get("headers", []):
+                if name == PROFILE_HEADER.encode():
+                    return verify_profile_header(value.decode("latin-1"), self.secret)
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    async def __call__(self, scope, receive, send):
+        if not self.enabled or scope["type"] != "http" or not self.wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        profile = Profile(scope.get("method", ""), scope.get("path", ""), self.max_seconds)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-fixel-profile-id", profile.id.encode())]
+            await send(message)
+
+        token = _active_profile.set(profile)
+        self.sampler.add(profile)
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            self.sampler.remove(profile)
+            _active_profile.reset(token)
+            profile.route = getattr(scope.get("route"), "path", None)
+            await asyncio.to_thread(self.write, profile)
+
+    def write(self, profile: Profile):
+        try:
+            self.output_dir.mkdir(parents=True, exist_ok=True)
+            name = f"{profile.id}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', profile.path.strip('/'))[:80]}"
+            (self.output_dir / f"{name}.collapsed").write_text(profile.collapsed(), encoding="utf-8")
+            (self.output_dir / f"{name}.json").write_text(json.dumps(profile.timeline(), indent=2), encoding="utf-8")
+        except OSError as e:
+            print(f"Failed to write profile {profile.id}: {e}")
@@ -0,0 +1,148 @@
+import asyncio
+import itertools
+import json
+import os
+import time
+from collections import deque
+from typing import Any, Optional
+
+# Events kept per topic so a reconnecting client can resume from its Last-Event-ID
+PUBSUB_REPLAY_EVENTS = int(os.environ.get("PUBSUB_REPLAY_EVENTS", "100"))
+# Topics with a replay buffer; the least recently published-to are dropped first
+PUBSUB_MAX_TOPICS = int(os.environ.get("PUBSUB_MAX_TOPICS", "10000"))
+# Undelivered events per subscriber before it is cut off (it resumes on reconnect)
+PUBSUB_QUEUE_SIZE = int(os.environ.get("PUBSUB_QUEUE_SIZE", "64"))
+
+
+class Event:
+    __slots__ = ("id", "seq", "type", "data")
+
+    def __init__(self, id: str, seq: int, type: str, data: Any):
+        self.id = id
+        self.seq = seq
+        self.type = type
+        self.data = data
+
+    def sse(self) -> str:
+        return format_sse(self.type, self.data, self.id)
+
+
+def format_sse(type: str, data: Any, id: Optional[str] = None) -> str:
+    lines = [f"id: {id}"] if id else []
+    lines.append(f"event: {type}")
+    lines.append(f"data: {json.dumps(data, default=str, separators=(',', ':'))}")
+    return "\n".join(lines) + "\n\n"
+
+
+class Subscription:
+    """One listener's bounded queue. `overflowed` is set instead of blocking the publisher."""
+
+    def __init__(self, topic: str, size: int):
+        self.topic = topic
+        self.queue: asyncio.Queue[Event] = asyncio.Queue(maxsize=size)
+        self.overflowed = False
+
+    def offer(self, event: Event) -> bool:
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            self.overflowed = True
+            return False
+
+
+class EventHub:
+    """
+    In-process pub/sub keyed by topic (e.g. "technician:<uuid>").
+
+    publish() never waits: every subscriber buffers a bounded amount, and a
+    subscriber that falls behind is flagged and should be disconnected, so one
+    slow phone cannot hold up the request that published. Each topic also keeps its last
+    `replay` events; event ids are "<epoch>-<seq>", where the epoch changes with
+    every process, so since() can tell whether it can fill the gap after a
+    client's Last-Event-ID or the client has to start from a fresh snapshot.
+
+    Only subscribers on the same worker process see an event.
+    """
+
+    def __init__(self, replay: int = PUBSUB_REPLAY_EVENTS, max_topics: int = PUBSUB_MAX_TOPICS, queue_size: int = PUBSUB_QUEUE_SIZE):
+        self.replay = replay
+        self.max_topics = max_topics
+        self.queue_size = queue_size
+        self.epoch = f"{os.getpid():x}{time.time_ns() // 1000:x}"
+        self._seq = itertools.count(1)
+        self.last_seq = 0
+        # topic -> (events, seq before which events may be missing)
+        self._history: dict[str, tuple[deque, int]] = {}
+        self._subscribers: dict[str, set] = {}
+        self._evictions = 0
+        self.stats = {"published": 0, "delivered": 0, "overflowed": 0}
+
+    def cursor(self) -> str:
+        """An id meaning "everything up to now", for snapshots."""
+        return f"{self.epoch}-{self.last_seq}"
+
+    def publish(self, topic: str, type: str, data: Any) -> Event:
+        self.last_seq = seq = next(self._seq)
+        event = Event(f"{self.epoch}-{seq}", seq, type, data)
+        self.stats["published"] += 1
+
+        entry = self._history.pop(topic, None)
+        if entry is None:
+            # A topic dropped earlier may have had events nobody can replay now
+            entry = (deque(maxlen=self.replay), seq if self._evictions else 0)
+            if len(self._history) >= self.max_topics:
+                del self._history[next(iter(self._history))]
+                self._evictions += 1
+        events, floor = entry
+        if len(events) == events.maxlen:
+            floor = events[0].seq
+        events.append(event)
+        # Re-inserting keeps the dict in least-recently-published order
+        self._history[topic] = (events, floor)
+
+        for subscriber in self._subscribers.get(topic, ()):
+            if subscriber.offer(event):
+                self.stats["delivered"] += 1
+            else:
+                self.stats["overflowed"] += 1
+        return event
+
+    def since(self, topic: str, last_event_id: Optional[str]) -> Optional[list[Event]]:
+        """Events after last_event_id, or None when they cannot all be replayed."""
+        epoch, _, seq = (last_event_id or "").rpartition("-")
+        if epoch != self.epoch or not seq.isdigit():
+            return None
+        last = int(seq)
+        entry = self._history.get(topic)
+        if entry is None:
+            # Nothing published yet, unless the topic's buffer was dropped
+            return None if self._evictions else []
+        events, floor = entry
+        if last < floor:
+            return None
+        return [e for e in events if e.seq > last]
+
+    def subscribe(self, topic: str) -> Subscription:
+        return self.attach(Subscription(topic, self.queue_size))
+
+    def unsubscribe(self, subscription: Subscription):
+        self.detach(subscription)
+
+    def attach(self, subscriber):
+        """Any object with a `topic` and an `offer(event) -> bool` that does not block."""
+        self._subscribers.setdefault(subscriber.topic, set()).add(subscriber)
+        return subscriber
+
+    def detach(self, subscriber):
+        listeners = self._subscribers.get(subscriber.topic)
+        if listeners is not None:
+            listeners.discard(subscriber)
+            if not listeners:
+                del self._subscribers[subscriber.topic]
+
+    def subscriber_count(self, prefix: str = "") -> int:
+        return sum(len(s) for topic, s in self._subscribers.items() if topic.startswith(prefix))
+
+
+event_hub = EventHub()
@@ -0,0 +1,51 @@
+import os
+from typing import Optional
+from catalog import catalog, CATALOG_MISS_RELOAD
+
+# Serve user.viewBooking / user.viewBookedServices from booking_documents
+# (supabase/migrations/*_booking_documents.sql); BOOKING_DOCUMENTS=0 goes back
+# to the embedded joins, e.g. against a database without the migration.
+# Documents keep only service_id / sub_service_id; the rows come from the
+# catalog cache (catalog.py) at read time, so a catalog edit rewrites no documents.
+BOOKING_DOCUMENTS = os.environ.get("BOOKING_DOCUMENTS", "1") != "0"
+# Both reads return the whole document, assignment included, on either path
+BOOKING_SELECT = "*, service:service_id(*), assignment:assignment_id(*, technician:techie_id(id, created_at, name, phone, provider_role_id)), booking_item(*, sub_service(*))"
+
+
+async def fetch_user_bookings(sbase, user_id: str, documents: Optional[bool] = None) -> list[dict]:
+    """The user's bookings, newest first."""
+    if documents if documents is not None else BOOKING_DOCUMENTS:
+        # One index range scan on (user_id, created_at desc)
+        response = await sbase.table("booking_documents").select("doc").eq("user_id", user_id).order("created_at", desc=True).execute()
+        return await with_catalog([row["doc"] for row in response.data])
+    response = await sbase.table("bookings").select(BOOKING_SELECT).eq("user_id", user_id).order("created_at", desc=True).execute()
+    return response.data
+
+
+async def fetch_user_booking(sbase, user_id: str, booking_id: int, documents: Optional[bool] = None) -> Optional[dict]:
+    """One booking of the user's, or None."""
+    if documents if documents is not None else BOOKING_DOCUMENTS:
+        # Primary key lookup; user_id keeps other users' bookings out
+        response = await sbase.table("booking_documents").select("doc").eq("booking_id", booking_id).eq("user_id", user_id).execute()
+        return (await with_catalog([response.data[0]["doc"]]))[0] if response.data else None
+    response = await sbase.table("bookings").select(BOOKING_SELECT).eq("id", booking_id).eq("user_id", user_id).execute()
+    return response.data[0] if response.data else None
+
+
+async def with_catalog(docs: list[dict]) -> list[dict]:
+    """Fills in `service` and each item's `sub_service` from the catalog, as the embedded select returns them."""
+    services, sub_services = await catalog.lookup()
+    wanted = {str(d["service_id"]) for d in docs if d.get("service_id") is not None}
+    wanted_subs = {str(i["sub_service_id"]) for d in docs for i in d.get("booking_item") or [] if i.get("sub_service_id") is not None}
+    missing = not wanted <= services.keys() or not wanted_subs <= sub_services.keys()
+    if missing and catalog.age() >= CATALOG_MISS_RELOAD:
+        # Possibly added since this worker's copy was loaded. Ids still missing
+        # (deleted rows) come back null, as from the embedded join.
+        catalog.invalidate()
+        services, sub_services = await catalog.lookup()
+
+    for doc in docs:
+        doc["service"] = services.get(str(doc.get("service_id")))
+        for item in doc.get("booking_item") or []:
+            item["sub_service"] = sub_services.get(str(item.get("sub_service_id")))
+    return docs
@@ -0,0 +1,267 @@
+import asyncio
+import contextvars
+import os
+import random
+import time
+from contextlib import contextmanager
+from typing import Optional
+import httpx
+from metrics import registry, Counter, callback_gauge, classify_upstream
+
+# Vercel kills the function at maxDuration (60s); stop starting upstream work well before that
+REQUEST_BUDGET = float(os.environ.get("REQUEST_BUDGET", "50"))
+# No single Supabase call may take longer than this, whatever budget is left
+UPSTREAM_CALL_TIMEOUT = float(os.environ.get("UPSTREAM_CALL_TIMEOUT", "10"))
+UPSTREAM_MAX_RETRIES = int(os.environ.get("UPSTREAM_MAX_RETRIES", "2"))
+# Retries may add at most this fraction on top of first attempts (per worker)
+RETRY_BUDGET_RATIO = float(os.environ.get("RETRY_BUDGET_RATIO", "0.1"))
+BREAKER_FAILURES = int(os.environ.get("BREAKER_FAILURES", "5"))
+BREAKER_COOLDOWN = float(os.environ.get("BREAKER_COOLDOWN", "5"))
+
+RETRYABLE_METHODS = {"GET", "HEAD"}
+RETRYABLE_STATUSES = {502, 503, 504}
+BACKOFF_BASE = 0.05
+BACKOFF_CAP = 1.0
+
+_deadline: contextvars.ContextVar[Optional[float]] = contextvars.ContextVar("request_deadline", default=None)
+
+retries_total = registry.register(Counter("fixel_upstream_retries_total", "Retried Supabase calls, by API and table.", ("api", "table")))
+retries_denied_total = registry.register(Counter("fixel_upstream_retries_denied_total", "Retries skipped because the retry budget was empty.", ("api", "table")))
+circuit_rejections_total = registry.register(Counter("fixel_circuit_rejections_total", "Supabase calls failed fast by an open circuit.", ("api", "table")))
+circuit_transitions_total = registry.register(Counter("fixel_circuit_transitions_total", "Circuit state changes.", ("api", "table", "state")))
+deadline_exceeded_total = registry.register(Counter("fixel_deadline_exceeded_total", "Supabase calls cut off by the request deadline.", ("api", "table")))
+
+
+class UpstreamUnavailable(Exception):
+    """Raised instead of calling Supabase while the circuit for that table is open."""
+
+    def __init__(self, key: tuple[str, str], retry_after: float):
+        super().__init__(f"{key[0]}/{key[1]} is unavailable (circuit open)")
+        self.key = key
+        self.retry_after = retry_after
+
+
+class DeadlineExceeded(Exception):
+    """The request's time budget ran out before (or while) calling Supabase."""
+
+
+def remaining_budget() -> Optional[float]:
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+@contextmanager
+def deadline_scope(seconds: float):
+    """Narrows the current deadline (never extends it) for the calls made inside."""
+    deadline = time.monotonic() + seconds
+    current = _deadline.get()
+    token = _deadline.set(deadline if current is None else min(current, deadline))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+class CircuitBreaker:
+    """
+    closed -> open after `failures` consecutive failures; open -> half_open after
+    `cooldown`, letting a single probe through; the probe's result closes or
+    re-opens it. Only transport errors, timeouts and 5xx count as failures.
+    """
+
+    STATES = {"closed": 0, "half_open": 1, "open": 2}
+
+    def __init__(self, key: tuple[str, str], failures: int = BREAKER_FAILURES, cooldown: float = BREAKER_COOLDOWN):
+        self.key = key
+        self.threshold = failures
+        self.cooldown = cooldown
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+
+    def _move(self, state: str):
+        if state != self.state:
+            self.state = state
+            circuit_transitions_total.inc(*self.key, state)
+
+    def allow(self, now: Optional[float] = None) -> bool:
+        now = time.monotonic() if now is None else now
+        if self.state == "open" and now - self.opened_at >= self.cooldown:
+            self._move("half_open")
+        if self.state == "closed":
+            return True
+        if self.state == "half_open" and not self.probing:
+            self.probing = True
+            return True
+        return False
+
+    def retry_after(self, now: Optional[float] = None) -> float:
+        now = time.monotonic() if now is None else now
+        return max(0.0, self.cooldown - (now - self.opened_at))
+
+    def record_success(self):
+        self.failures = 0
+        self.probing = False
+        self._move("closed")
+
+    def record_failure(self, now: Optional[float] = None):
+        self.failures += 1
+        self.probing = False
+        if self.state == "half_open" or self.failures >= self.threshold:
+            self.opened_at = time.monotonic() if now is None else now
+            self._move("open")
+
+
+class RetryBudget:
+    """Every first attempt deposits `ratio` tokens and every retry spends one, capped at `cap`."""
+
+    def __init__(self, ratio: float = RETRY_BUDGET_RATIO, cap: float = 10.0):
+        self.ratio = ratio
+        self.cap = cap
+        self.tokens = cap
+
+    def deposit(self):
+        self.tokens = min(self.cap, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+def _shrink_timeouts(request: httpx.Request, seconds: float):
+    # httpx passes per-request timeouts to the connection pool through this extension,
+    # so the deadline also bounds reading the response body.
+    timeouts = dict(request.extensions.get("timeout") or {})
+    for phase in ("connect", "read", "write", "pool"):
+        current = timeouts.get(phase)
+        timeouts[phase] = seconds if current is None else min(current, seconds)
+    request.extensions["timeout"] = timeouts
+
+
+class ResilientTransport(httpx.AsyncBaseTransport):
+    """
+    Wraps the Supabase transport with, per call:
+
+    1. a circuit breaker per (api, table) that fails fast while the table is down,
+    2. a timeout of min(UPSTREAM_CALL_TIMEOUT, what is left of the request budget),
+    3. bounded retries with full-jitter backoff for idempotent reads (GET/HEAD)
+       on transport errors and 502/503/504, limited by a worker-wide retry budget.
+    """
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, call_timeout: float = UPSTREAM_CALL_TIMEOUT, max_retries: int = UPSTREAM_MAX_RETRIES, budget: Optional[RetryBudget] = None):
+        self.transport = transport
+        self.call_timeout = call_timeout
+        self.max_retries = max_retries
+        self.budget = budget or RetryBudget()
+        self.breakers: dict[tuple[str, str], CircuitBreaker] = {}
+
+    def breaker(self, key: tuple[str, str]) -> CircuitBreaker:
+        breaker = self.breakers.get(key)
+        if breaker is None:
+            breaker = self.breakers[key] = CircuitBreaker(key)
+        return breaker
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        api, table, _ = classify_upstream(request)
+        key = (api, table)
+        breaker = self.breaker(key)
+        retryable = request.method in RETRYABLE_METHODS
+        self.budget.deposit()
+        attempt = 0
+
+        while True:
+            if not breaker.allow():
+                circuit_rejections_total.inc(api, table)
+                raise UpstreamUnavailable(key, breaker.retry_after())
+
+            remaining = remaining_budget()
+            timeout = self.call_timeout if remaining is None else min(self.call_timeout, remaining)
+            if timeout <= 0:
+                breaker.probing = False
+                deadline_exceeded_total.inc(api, table)
+                raise DeadlineExceeded(f"request budget exhausted before calling {api}/{table}")
+            _shrink_timeouts(request, timeout)
+
+            failure: Optional[Exception] = None
+            response = None
+            try:
+                async with asyncio.timeout(timeout):
+                    response = await self.transport.handle_async_request(request)
+            except TimeoutError:
+                failure = httpx.ReadTimeout(f"{api}/{table} timed out after {timeout:.2f}s", request=request)
+            except httpx.TransportError as e:
+                failure = e
+            except BaseException:
+                # Cancelled (client gone, fan_out timeout, batch deadline) or an
+                # unexpected error: a probe that never finished counts as failed,
+                # so the circuit re-opens instead of staying half open for good
+                if breaker.state == "half_open" and breaker.probing:
+                    breaker.record_failure()
+                raise
+
+            if response is not None and response.status_code not in RETRYABLE_STATUSES:
+                # 2xx-4xx: Supabase answered, the table is healthy (a 4xx is the caller's problem)
+                breaker.record_success()
+                return response
+
+            cut_by_deadline = isinstance(failure, httpx.TimeoutException) and timeout < self.call_timeout
+            if cut_by_deadline:
+                # Our budget ran out, which says nothing about the table's health
+                breaker.probing = False
+                deadline_exceeded_total.inc(api, table)
+                raise DeadlineExceeded(f"request budget exhausted while calling {api}/{table}") from failure
+            breaker.record_failure()
+
+            left = remaining_budget()
+            out_of_time = left is not None and left <= BACKOFF_BASE
+            if not retryable or attempt >= self.max_retries or out_of_time:
+                if failure is not None:
+                    raise failure
+                return response
+            if not self.budget.withdraw():
+                retries_denied_total.inc(api, table)
+                if failure is not None:
+                    raise failure
+                return response
+
+            if response is not None:
+                await response.aclose()
+            attempt += 1
+            retries_total.inc(api, table)
+            delay = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+            left = remaining_budget()
+            await asyncio.sleep(delay if left is None else max(0.0, min(delay, left - BACKOFF_BASE)))
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+class DeadlineMiddleware:
+    """
+    Starts every request's budget; upstream calls made on its behalf inherit it.
+    exempt_paths (long-lived streams) only get the per-call timeout.
+    """
+
+    def __init__(self, app, budget: float = REQUEST_BUDGET, exempt_paths: frozenset = frozenset()):
+        self.app = app
+        self.budget = budget
+        self.exempt_paths = exempt_paths
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") in self.exempt_paths:
+            await self.app(scope, receive, send)
+            return
+        with deadline_scope(self.budget):
+            await self.app(scope, receive, send)
+
+
+def breaker_states(transport: ResilientTransport) -> dict[tuple, float]:
+    return {key: CircuitBreaker.STATES[b.state] for key, b in transport.breakers.items()}
+
+
+def register_breaker_metrics(transport: ResilientTransport):
+    callback_gauge("fixel_circuit_state", "Circuit breaker state per API and table (0 closed, 1 half-open, 2 open).", ("api", "table"), lambda: breaker_states(transport))
+    callback_gauge("fixel_retry_budget_tokens", "Retries currently available in the worker's retry budget.", (), lambda: {(): transport.budget.tokens})
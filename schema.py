@@ -1,5 +1,8 @@
+from datetime import datetime
+from typing import Literal, Optional
 from pydantic import BaseModel
 from uuid import UUID
+from models import Service, SubService, Technician
 
 class BookServiceRequest(BaseModel):
     service_id: int
@@ -59,3 +62,43 @@ class TestNotificationRequest(BaseModel):
     title: str = "Test Notification"
     message: str = "This is a test notification"
     data: dict | None = None
+
+class SyncRequest(BaseModel):
+    # entity -> cursor from the previous sync; a missing or null cursor means a full download
+    cursors: dict[str, str | None] = {}
+    # Defaults to every entity the caller can sync
+    entities: list[str] | None = None
+
+class BatchCall(BaseModel):
+    # Name after /api/funcs/, e.g. "user.viewBookedServices"
+    func: str
+    # The func's usual JSON body
+    args: dict | None = None
+
+# Rows of admin.*.import (bulk_import.py): the admin create models, but the
+# database fills in created_at, and a row without an id is inserted as new.
+class ServiceImport(Service):
+    id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+class SubServiceImport(SubService):
+    id: Optional[int] = None
+    created_at: Optional[datetime] = None
+
+class TechnicianImport(Technician):
+    # Technician ids are auth user ids, so every row needs one
+    created_at: Optional[datetime] = None
+
+class ExportBookingsRequest(BaseModel):
+    # Bookings created in [from_date, to_date)
+    from_date: datetime
+    to_date: datetime
+    statuses: list[str] | None = None
+    format: Literal["ndjson", "csv"] = "ndjson"
+    # created_at and id of the last row received, to resume an export
+    after_created_at: datetime | None = None
+    after_id: int | None = None
+
+class AnalyticsRequest(BaseModel):
+    # Rolling window in days; all-time figures when omitted
+    days: int | None = None
@@ -0,0 +1,116 @@
+import os
+from importlib.util import find_spec
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    try:
+        return int(value) if value else default
+    except ValueError:
+        print(f"Warning: ignoring invalid {name}={value!r}")
+        return default
+
+
+def _env_flag(name: str) -> bool:
+    return os.environ.get(name, "").lower() in ("1", "true", "yes", "on")
+
+
+def resolve_workers(value: str | None) -> int:
+    # "auto" = one worker per core; anything invalid falls back to a single worker
+    if not value:
+        return 1
+    if value == "auto":
+        return os.cpu_count() or 1
+    try:
+        return max(1, int(value))
+    except ValueError:
+        print(f"Warning: ignoring invalid FIXEL_WORKERS={value!r}")
+        return 1
+
+
+def resolve_loop(value: str | None) -> str:
+    # uvloop has no Windows build, so "auto" quietly falls back to asyncio there
+    if value in (None, "", "auto"):
+        return "uvloop" if find_spec("uvloop") else "asyncio"
+    return value
+
+
+def resolve_http(value: str | None) -> str:
+    if value in (None, "", "auto"):
+        return "httptools" if find_spec("httptools") else "h11"
+    return value
+
+
+def server_config() -> dict:
+    """
+    uvicorn settings for `python main.py`, read from the environment:
+
+    FIXEL_HOST / FIXEL_PORT          bind address (0.0.0.0:8000)
+    FIXEL_WORKERS                    worker processes, a number or "auto" (1)
+    FIXEL_LOOP                       auto | uvloop | asyncio (auto)
+    FIXEL_HTTP                       auto | httptools | h11 (auto)
+    FIXEL_RELOAD                     restart on code changes, dev only, forces 1 worker
+    FIXEL_GRACEFUL_TIMEOUT           seconds to drain requests on shutdown (30)
+    FIXEL_KEEPALIVE                  keep-alive timeout in seconds (5)
+    FIXEL_BACKLOG                    listen backlog (2048)
+    FIXEL_MAX_REQUESTS               recycle a worker after this many requests (off)
+    FIXEL_WS_PING                    WebSocket ping interval in seconds, also the pong timeout (20)
+
+    WebSockets (user.bookingUpdates) are mostly idle, so per-connection memory
+    is what limits how many a worker holds: permessage-deflate (a zlib context
+    per socket) is off and incoming messages are capped at 64 KiB.
+    """
+    reload = _env_flag("FIXEL_RELOAD")
+    config = {
+        "host": os.environ.get("FIXEL_HOST", "0.0.0.0"),
+        "port": _env_int("FIXEL_PORT", 8000),
+        "workers": 1 if reload else resolve_workers(os.environ.get("FIXEL_WORKERS")),
+        "loop": resolve_loop(os.environ.get("FIXEL_LOOP")),
+        "http": resolve_http(os.environ.get("FIXEL_HTTP")),
+        "reload": reload,
+        "timeout_graceful_shutdown": _env_int("FIXEL_GRACEFUL_TIMEOUT", 30),
+        "timeout_keep_alive": _env_int("FIXEL_KEEPALIVE", 5),
+        "backlog": _env_int("FIXEL_BACKLOG", 2048),
+        "ws": os.environ.get("FIXEL_WS") or "auto",
+        "ws_ping_interval": _env_int("FIXEL_WS_PING", 20),
+        "ws_ping_timeout": _env_int("FIXEL_WS_PING", 20),
+        "ws_per_message_deflate": False,
+        "ws_max_size": 64 * 1024,
+    }
+    max_requests = _env_int("FIXEL_MAX_REQUESTS", 0)
+    if max_requests:
+        config["limit_max_requests"] = max_requests
+    return config
+
+
+def raise_open_files_limit():
+    # Every WebSocket holds a file descriptor; the default soft limit (often 1024)
+    # would cap a worker long before memory does.
+    try:
+        import resource
+    except ImportError:  # Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    target = 65536 if hard == resource.RLIM_INFINITY else hard
+    if soft != resource.RLIM_INFINITY and soft < target:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError) as e:
+            print(f"Warning: could not raise the open files limit: {e}")
+
+
+def serve():
+    """
+    Production entry point.
+
+    With FIXEL_WORKERS > 1 uvicorn binds the socket once in the supervisor and
+    starts the workers up front (pre-fork); each worker imports main:app and runs
+    the lifecycle start hooks. Sending SIGHUP to the supervisor restarts the
+    workers one by one (graceful reload), SIGTERM drains and stops them.
+    """
+    import uvicorn
+
+    raise_open_files_limit()
+    config = server_config()
+    print(f"Starting Fixel Backend: {config['workers']} worker(s), loop={config['loop']}, http={config['http']}")
+    uvicorn.run("main:app", **config)
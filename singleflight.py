@@ -0,0 +1,58 @@
+import asyncio
+import os
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent reads into one in-flight call.
+
+    Each endpoint registers a key function; callers that arrive while a call with
+    the same key is still running await the same task instead of issuing their own
+    query. Nothing is cached once the call finishes, so results are never stale.
+    """
+
+    def __init__(self, disabled: Optional[set[str]] = None):
+        self._keys: dict[str, Callable[..., Hashable]] = {}
+        self._inflight: dict[tuple, asyncio.Task] = {}
+        self._disabled = disabled or set()
+        self._stats: dict[str, dict[str, int]] = {}
+
+    def register(self, endpoint: str, key_fn: Callable[..., Hashable]):
+        """key_fn receives the same positional args as the read and returns its cache key."""
+        self._keys[endpoint] = key_fn
+        self._stats.setdefault(endpoint, {"calls": 0, "executions": 0, "collapsed": 0})
+
+    async def run(self, endpoint: str, fn: Callable[..., Awaitable[Any]], *args) -> Any:
+        key_fn = self._keys.get(endpoint)
+        if key_fn is None or endpoint in self._disabled:
+            return await fn(*args)
+
+        stats = self._stats[endpoint]
+        stats["calls"] += 1
+        key = (endpoint, key_fn(*args))
+
+        task = self._inflight.get(key)
+        if task is not None:
+            stats["collapsed"] += 1
+        else:
+            stats["executions"] += 1
+            task = asyncio.ensure_future(fn(*args))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _t, k=key: self._inflight.pop(k, None))
+
+        # Shield so one caller going away (client disconnect) does not cancel the
+        # shared call for everyone else waiting on it.
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict[str, dict[str, int]]:
+        return {endpoint: dict(s) for endpoint, s in self._stats.items()}
+
+
+# Endpoints can be switched back to direct reads with e.g.
+# SINGLEFLIGHT_DISABLED=service.viewServices,technician.viewProfile
+flight = SingleFlight(disabled={e.strip() for e in os.environ.get("SINGLEFLIGHT_DISABLED", "").split(",") if e.strip()})
+
+flight.register("service.viewServices", lambda: "all")
+flight.register("technician.viewProfile", lambda techie_id: str(techie_id))
+flight.register("auth.getUser", lambda token: token)
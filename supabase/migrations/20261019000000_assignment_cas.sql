@@ -0,0 +1,104 @@
+-- Atomic accept / reject for assignment requests.
+--
+-- Both functions run as a single transaction and guard every state change
+-- with a compare-and-set WHERE clause, so concurrent calls for the same offer
+-- or booking cannot both succeed. Callers get a jsonb object whose "result"
+-- field names the outcome.
+
+create or replace function accept_assignment_request(p_request_id bigint, p_techie_id uuid)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_request assignment_request%rowtype;
+    v_booking bookings%rowtype;
+    v_assignment assignment%rowtype;
+    v_status text;
+begin
+    -- 1. Claim the offer (only a pending offer owned by this technician)
+    update assignment_request
+       set status = 'accepted'
+     where id = p_request_id
+       and techie_id = p_techie_id
+       and status = 'pending'
+    returning * into v_request;
+
+    if not found then
+        if exists (select 1 from assignment_request where id = p_request_id and techie_id = p_techie_id) then
+            return jsonb_build_object('result', 'not_pending');
+        end if;
+        return jsonb_build_object('result', 'not_found');
+    end if;
+
+    -- 2. Claim the booking. Concurrent transactions block on the row lock and
+    --    re-check the guard, so exactly one of them flips it to confirmed.
+    update bookings
+       set status = 'confirmed'
+     where id = v_request.booking_id
+       and status not in ('confirmed', 'cancelled', 'completed')
+    returning * into v_booking;
+
+    if not found then
+        -- Lost the race (or the booking went away): release the offer again
+        update assignment_request set status = 'expired' where id = p_request_id;
+
+        select status into v_status from bookings where id = v_request.booking_id;
+        if v_status is null then
+            return jsonb_build_object('result', 'booking_not_found');
+        elsif v_status = 'confirmed' then
+            return jsonb_build_object('result', 'already_confirmed');
+        end if;
+        return jsonb_build_object('result', 'booking_unavailable', 'status', v_status);
+    end if;
+
+    -- 3. Create the assignment and link it to the booking
+    insert into assignment (techie_id, service_id, booking_id, scheduled_at, status)
+    values (p_techie_id, v_booking.service_id, v_booking.id, v_booking.scheduled_at, 'active')
+    returning * into v_assignment;
+
+    update bookings
+       set assignment_id = v_assignment.id
+     where id = v_booking.id
+    returning * into v_booking;
+
+    return jsonb_build_object(
+        'result', 'accepted',
+        'assignment', to_jsonb(v_assignment),
+        'booking', to_jsonb(v_booking)
+    );
+end;
+$$;
+
+create or replace function reject_assignment_request(p_request_id bigint, p_techie_id uuid)
+returns jsonb
+language plpgsql
+as $$
+declare
+    v_request assignment_request%rowtype;
+    v_booking bookings%rowtype;
+begin
+    update assignment_request
+       set status = 'rejected'
+     where id = p_request_id
+       and techie_id = p_techie_id
+       and status = 'pending'
+    returning * into v_request;
+
+    if not found then
+        if exists (select 1 from assignment_request where id = p_request_id and techie_id = p_techie_id) then
+            return jsonb_build_object('result', 'not_pending');
+        end if;
+        return jsonb_build_object('result', 'not_found');
+    end if;
+
+    -- Hand the booking back so the caller can re-assign without another round trip.
+    -- A missing booking is null: to_jsonb of an unfilled row is an object of nulls.
+    select * into v_booking from bookings where id = v_request.booking_id;
+
+    return jsonb_build_object(
+        'result', 'rejected',
+        'request', to_jsonb(v_request),
+        'booking', case when found then to_jsonb(v_booking) end
+    );
+end;
+$$;
@@ -0,0 +1,177 @@
+-- Delta sync for bookings, notifications and technician booking history.
+--
+-- Every row carries the id of the transaction that last wrote it (change_xid).
+-- A client's high-water mark is the oldest transaction that was still running
+-- when it last synced (pg_snapshot_xmin), so a sync returns every row written
+-- by a transaction at or after that point. Transactions that had not committed
+-- yet are picked up next time; nothing is skipped because commits land out of
+-- order, which a plain timestamp or sequence number cannot guarantee. A few
+-- rows may be sent twice; clients upsert by id.
+--
+-- Deleted rows leave a tombstone behind, and rows that reach a cancelled state
+-- are reported as tombstones too (the client marks them cancelled instead of
+-- downloading them again).
+
+alter table bookings
+    add column if not exists updated_at timestamptz not null default now(),
+    add column if not exists change_xid xid8 not null default pg_current_xact_id();
+alter table assignment
+    add column if not exists updated_at timestamptz not null default now(),
+    add column if not exists change_xid xid8 not null default pg_current_xact_id();
+alter table notifications
+    add column if not exists updated_at timestamptz not null default now(),
+    add column if not exists change_xid xid8 not null default pg_current_xact_id();
+
+create or replace function touch_sync_columns()
+returns trigger
+language plpgsql
+as $$
+begin
+    new.updated_at := now();
+    new.change_xid := pg_current_xact_id();
+    return new;
+end;
+$$;
+
+drop trigger if exists bookings_touch_sync on bookings;
+create trigger bookings_touch_sync before update on bookings
+    for each row execute function touch_sync_columns();
+drop trigger if exists assignment_touch_sync on assignment;
+create trigger assignment_touch_sync before update on assignment
+    for each row execute function touch_sync_columns();
+drop trigger if exists notifications_touch_sync on notifications;
+create trigger notifications_touch_sync before update on notifications
+    for each row execute function touch_sync_columns();
+
+-- Booking items are inserted after their booking, in a separate call; touching
+-- the booking makes a client that synced in between fetch it again.
+create or replace function touch_parent_booking()
+returns trigger
+language plpgsql
+as $$
+begin
+    update bookings set updated_at = now() where id = new.booking_id;
+    return new;
+end;
+$$;
+
+drop trigger if exists booking_item_touch_booking on booking_item;
+create trigger booking_item_touch_booking after insert on booking_item
+    for each row execute function touch_parent_booking();
+
+create index if not exists bookings_user_change_idx on bookings (user_id, change_xid);
+create index if not exists assignment_techie_change_idx on assignment (techie_id, change_xid);
+create index if not exists notifications_user_change_idx on notifications (user_id, change_xid);
+
+create table if not exists sync_tombstone (
+    id bigint generated always as identity primary key,
+    entity text not null,
+    row_id bigint not null,
+    owner_id uuid not null,
+    deleted_at timestamptz not null default now(),
+    change_xid xid8 not null default pg_current_xact_id()
+);
+create index if not exists sync_tombstone_owner_idx on sync_tombstone (owner_id, entity, change_xid);
+
+create or replace function record_sync_tombstone()
+returns trigger
+language plpgsql
+as $$
+begin
+    -- TG_ARGV[0]: entity name, TG_ARGV[1]: owner column
+    insert into sync_tombstone (entity, row_id, owner_id)
+    values (TG_ARGV[0], old.id, (to_jsonb(old) ->> TG_ARGV[1])::uuid);
+    return old;
+end;
+$$;
+
+drop trigger if exists bookings_tombstone on bookings;
+create trigger bookings_tombstone after delete on bookings
+    for each row execute function record_sync_tombstone('bookings', 'user_id');
+drop trigger if exists assignment_tombstone on assignment;
+create trigger assignment_tombstone after delete on assignment
+    for each row execute function record_sync_tombstone('booking_history', 'techie_id');
+drop trigger if exists notifications_tombstone on notifications;
+create trigger notifications_tombstone after delete on notifications
+    for each row execute function record_sync_tombstone('notifications', 'user_id');
+
+-- Returns {"changed": [...], "removed": [{"id", "reason"}], "cursor": "<xid>"} for
+-- one entity of one owner. p_since null means a full download (no tombstones).
+-- Rows in "changed" have the same shape as the matching list endpoint.
+create or replace function sync_changes(p_entity text, p_owner uuid, p_since xid8 default null)
+returns jsonb
+language plpgsql
+stable
+as $$
+declare
+    v_cursor xid8 := pg_snapshot_xmin(pg_current_snapshot());
+    v_changed jsonb;
+    v_removed jsonb;
+begin
+    if p_entity = 'bookings' then
+        -- Same shape as user.viewBookedServices
+        select coalesce(jsonb_agg((to_jsonb(b) - 'change_xid') || jsonb_build_object(
+                   'service', (select to_jsonb(s) from service s where s.id = b.service_id),
+                   'booking_item', (select coalesce(jsonb_agg(to_jsonb(bi) || jsonb_build_object('sub_service', to_jsonb(ss))), '[]'::jsonb)
+                                      from booking_item bi left join sub_service ss on ss.id = bi.sub_service_id
+                                     where bi.booking_id = b.id)
+               ) order by b.created_at desc), '[]'::jsonb)
+          into v_changed
+          from bookings b
+         where b.user_id = p_owner
+           and (p_since is null or (b.change_xid >= p_since and b.status <> 'cancelled'));
+
+        select coalesce(jsonb_agg(jsonb_build_object('id', b.id, 'reason', 'cancelled')), '[]'::jsonb)
+          into v_removed
+          from bookings b
+         where p_since is not null and b.user_id = p_owner and b.change_xid >= p_since and b.status = 'cancelled';
+
+    elsif p_entity = 'booking_history' then
+        -- Same shape as technician.viewBookingHistory
+        select coalesce(jsonb_agg((to_jsonb(a) - 'change_xid') || jsonb_build_object(
+                   'service', (select to_jsonb(s) from service s where s.id = a.service_id),
+                   'booking', (select to_jsonb(b) - 'change_xid' from bookings b where b.id = a.booking_id)
+               ) order by a.scheduled_at desc), '[]'::jsonb)
+          into v_changed
+          from assignment a
+         where a.techie_id = p_owner
+           and (p_since is null or (a.change_xid >= p_since and a.status <> 'cancelled'));
+
+        select coalesce(jsonb_agg(jsonb_build_object('id', a.id, 'reason', 'cancelled')), '[]'::jsonb)
+          into v_removed
+          from assignment a
+         where p_since is not null and a.techie_id = p_owner and a.change_xid >= p_since and a.status = 'cancelled';
+
+    elsif p_entity = 'notifications' then
+        select coalesce(jsonb_agg(to_jsonb(n) - 'change_xid' order by n.id), '[]'::jsonb)
+          into v_changed
+          from notifications n
+         where n.user_id = p_owner
+           and (p_since is null or n.change_xid >= p_since);
+        v_removed := '[]'::jsonb;
+
+    else
+        raise exception 'unknown sync entity %', p_entity using errcode = '22023';
+    end if;
+
+    if p_since is not null then
+        select v_removed || coalesce(jsonb_agg(jsonb_build_object('id', t.row_id, 'reason', 'deleted')), '[]'::jsonb)
+          into v_removed
+          from sync_tombstone t
+         where t.owner_id = p_owner and t.entity = p_entity and t.change_xid >= p_since;
+    end if;
+
+    return jsonb_build_object('changed', v_changed, 'removed', v_removed, 'cursor', v_cursor::text);
+end;
+$$;
+
+-- Tombstones only need to outlive the longest gap between two syncs of a client;
+-- older ones can be dropped (a client with an older cursor gets a full download,
+-- see SYNC_MAX_CURSOR_AGE in sync.py).
+create or replace function prune_sync_tombstones(p_older_than interval default interval '30 days')
+returns bigint
+language sql
+as $$
+    with gone as (delete from sync_tombstone where deleted_at < now() - p_older_than returning 1)
+    select count(*) from gone;
+$$;
@@ -0,0 +1,104 @@
+-- Per-technician counters for technician.dashboard.
+--
+-- Triggers on assignment_request and assignment adjust one row per technician
+-- in the same transaction as every insert, status change and delete, so the
+-- dashboard reads its counts instead of counting the technician's lists.
+--   pending_offers        assignment_request rows with status 'pending'
+--   active_assignments    assignment rows not completed or cancelled
+--                         (what technician.viewAssignedBookings returns)
+--   completed_assignments assignment rows with status 'completed'
+
+create table if not exists technician_counters (
+    techie_id uuid primary key references technician(id) on delete cascade,
+    pending_offers integer not null default 0,
+    active_assignments integer not null default 0,
+    completed_assignments integer not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+create or replace function bump_technician_counters(p_techie_id uuid, p_pending integer, p_active integer, p_completed integer)
+returns void
+language plpgsql
+as $$
+begin
+    if p_techie_id is null or (p_pending = 0 and p_active = 0 and p_completed = 0) then
+        return;
+    end if;
+    insert into technician_counters as c (techie_id, pending_offers, active_assignments, completed_assignments)
+    values (p_techie_id, greatest(p_pending, 0), greatest(p_active, 0), greatest(p_completed, 0))
+    on conflict (techie_id) do update
+       set pending_offers = greatest(c.pending_offers + p_pending, 0),
+           active_assignments = greatest(c.active_assignments + p_active, 0),
+           completed_assignments = greatest(c.completed_assignments + p_completed, 0),
+           updated_at = now();
+end;
+$$;
+
+create or replace function count_assignment_request()
+returns trigger
+language plpgsql
+as $$
+begin
+    -- 1. Take the old row out, 2. put the new one in
+    if tg_op in ('UPDATE', 'DELETE') and old.status = 'pending' then
+        perform bump_technician_counters(old.techie_id, -1, 0, 0);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') and new.status = 'pending' then
+        perform bump_technician_counters(new.techie_id, 1, 0, 0);
+    end if;
+    return null;
+end;
+$$;
+
+create or replace function count_assignment()
+returns trigger
+language plpgsql
+as $$
+begin
+    -- A null status is neither active nor completed, as in the list endpoints
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform bump_technician_counters(old.techie_id, 0,
+            case when old.status not in ('completed', 'cancelled') then -1 else 0 end,
+            case when old.status = 'completed' then -1 else 0 end);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform bump_technician_counters(new.techie_id, 0,
+            case when new.status not in ('completed', 'cancelled') then 1 else 0 end,
+            case when new.status = 'completed' then 1 else 0 end);
+    end if;
+    return null;
+end;
+$$;
+
+-- Updates that leave status and owner alone (most of them) skip the counters
+drop trigger if exists assignment_request_count on assignment_request;
+create trigger assignment_request_count after insert or delete on assignment_request
+    for each row execute function count_assignment_request();
+drop trigger if exists assignment_request_count_update on assignment_request;
+create trigger assignment_request_count_update after update of status, techie_id on assignment_request
+    for each row when (old.status is distinct from new.status or old.techie_id is distinct from new.techie_id)
+    execute function count_assignment_request();
+
+drop trigger if exists assignment_count on assignment;
+create trigger assignment_count after insert or delete on assignment
+    for each row execute function count_assignment();
+drop trigger if exists assignment_count_update on assignment;
+create trigger assignment_count_update after update of status, techie_id on assignment
+    for each row when (old.status is distinct from new.status or old.techie_id is distinct from new.techie_id)
+    execute function count_assignment();
+
+-- Backfill. The lock holds writers off until the migration commits, so no
+-- change lands between the count and the triggers taking over.
+lock table assignment_request, assignment in share mode;
+
+insert into technician_counters (techie_id, pending_offers, active_assignments, completed_assignments)
+select t.id,
+       (select count(*) from assignment_request r where r.techie_id = t.id and r.status = 'pending'),
+       (select count(*) from assignment a where a.techie_id = t.id and a.status not in ('completed', 'cancelled')),
+       (select count(*) from assignment a where a.techie_id = t.id and a.status = 'completed')
+  from technician t
+on conflict (techie_id) do update
+   set pending_offers = excluded.pending_offers,
+       active_assignments = excluded.active_assignments,
+       completed_assignments = excluded.completed_assignments,
+       updated_at = now();
@@ -0,0 +1,47 @@
+-- Keyset-paged bookings export for admin.bookings.export (export.py).
+--
+-- Each call returns one page of bookings created in [p_from, p_to), ordered by
+-- (created_at, id) and starting after the (p_after_created, p_after_id) of the
+-- previous page's last row. The row comparison walks the index below, so a page
+-- costs the same at the start and at the end of a multi-million row export
+-- (OFFSET paging rescans everything before the page).
+
+create index if not exists bookings_created_id_idx on bookings (created_at, id);
+
+-- Rows have the shape of user.viewBooking: booking columns plus service,
+-- assignment (with technician) and booking_item (with sub_service).
+create or replace function export_bookings(
+    p_from timestamptz,
+    p_to timestamptz,
+    p_statuses text[] default null,
+    p_after_created timestamptz default null,
+    p_after_id bigint default null,
+    p_limit integer default 1000
+)
+returns jsonb
+language sql
+stable
+as $$
+    select coalesce(jsonb_agg(page.doc order by page.created_at, page.id), '[]'::jsonb)
+      from (
+        select b.created_at, b.id,
+               (to_jsonb(b) - 'change_xid') || jsonb_build_object(
+                   'service', (select to_jsonb(s) from service s where s.id = b.service_id),
+                   -- Listed technician columns: push_token stays out
+                   'assignment', (select (to_jsonb(a) - 'change_xid') || jsonb_build_object(
+                                     'technician', (select jsonb_build_object('id', t.id, 'created_at', t.created_at, 'name', t.name, 'phone', t.phone, 'provider_role_id', t.provider_role_id)
+                                                      from technician t where t.id = a.techie_id))
+                                    from assignment a where a.id = b.assignment_id),
+                   'booking_item', (select coalesce(jsonb_agg(to_jsonb(bi) || jsonb_build_object('sub_service', to_jsonb(ss)) order by bi.id), '[]'::jsonb)
+                                      from booking_item bi left join sub_service ss on ss.id = bi.sub_service_id
+                                     where bi.booking_id = b.id)
+               ) as doc
+          from bookings b
+         where b.created_at >= p_from
+           and b.created_at < p_to
+           and (p_statuses is null or b.status = any(p_statuses))
+           and (p_after_created is null or (b.created_at, b.id) > (p_after_created, p_after_id))
+         order by b.created_at, b.id
+         limit least(greatest(p_limit, 1), 5000)
+      ) page;
+$$;
@@ -0,0 +1,219 @@
+-- Operational analytics kept up to date on every state transition.
+--
+-- Triggers on the tables written by service.bookService, technician.acceptAssignment,
+-- technician.rejectAssignment and service.updateStatus (directly or through the
+-- assignment RPCs) add to counters in the same transaction as the change:
+--
+--   metric             key         count                     total
+--   bookings_created   service_id  bookings                  -
+--   offers_sent        -           offers made               -
+--   offers_<status>    -           offers answered           - (accepted, rejected, expired)
+--   time_to_assign     service_id  bookings assigned         seconds from booking to assignment
+--   bookings_completed service_id  bookings completed        revenue (service price + booking items)
+--   bookings_cancelled service_id  bookings cancelled        -
+--   technicians        -           technicians               -
+--   technicians_busy   -           with an active assignment -
+--
+-- analytics_totals holds all-time values and analytics_daily the same per UTC
+-- day, for rolling windows. Each counter is spread over 8 rows (shards)
+-- picked by backend pid, so concurrent bookings do not queue on one row lock;
+-- readers add the shards up (analytics_snapshot). Reading never touches the
+-- source tables.
+
+create table if not exists analytics_totals (
+    metric text not null,
+    key text not null default '',
+    shard smallint not null default 0,
+    count bigint not null default 0,
+    total numeric not null default 0,
+    updated_at timestamptz not null default now(),
+    primary key (metric, key, shard)
+);
+
+create table if not exists analytics_daily (
+    day date not null,
+    metric text not null,
+    key text not null default '',
+    shard smallint not null default 0,
+    count bigint not null default 0,
+    total numeric not null default 0,
+    primary key (day, metric, key, shard)
+);
+
+create or replace function analytics_add(p_metric text, p_key text, p_count bigint, p_total numeric default 0)
+returns void
+language plpgsql
+as $$
+declare
+    v_shard smallint := pg_backend_pid() % 8;
+    v_key text := coalesce(p_key, '');
+begin
+    if p_count = 0 and p_total = 0 then
+        return;
+    end if;
+    insert into analytics_totals as t (metric, key, shard, count, total)
+    values (p_metric, v_key, v_shard, p_count, p_total)
+    on conflict (metric, key, shard) do update
+       set count = t.count + excluded.count, total = t.total + excluded.total, updated_at = now();
+    insert into analytics_daily as d (day, metric, key, shard, count, total)
+    values ((now() at time zone 'utc')::date, p_metric, v_key, v_shard, p_count, p_total)
+    on conflict (day, metric, key, shard) do update
+       set count = d.count + excluded.count, total = d.total + excluded.total;
+end;
+$$;
+
+-- bookings: created, assigned (time to assign), completed (revenue), cancelled
+create or replace function analytics_bookings()
+returns trigger
+language plpgsql
+as $$
+declare
+    v_revenue numeric;
+begin
+    if tg_op = 'INSERT' then
+        perform analytics_add('bookings_created', new.service_id::text, 1);
+        return null;
+    end if;
+
+    if old.assignment_id is null and new.assignment_id is not null then
+        perform analytics_add('time_to_assign', new.service_id::text, 1, extract(epoch from now() - new.created_at));
+    end if;
+
+    if old.status is distinct from new.status then
+        -- Leaving a terminal status takes it back out, so counts stay exact
+        if old.status in ('completed', 'cancelled') or new.status in ('completed', 'cancelled') then
+            select coalesce((select price from service where id = new.service_id), 0)
+                 + coalesce((select sum(price) from booking_item where booking_id = new.id), 0)
+              into v_revenue;
+        end if;
+        if old.status = 'completed' then
+            perform analytics_add('bookings_completed', old.service_id::text, -1, -v_revenue);
+        elsif old.status = 'cancelled' then
+            perform analytics_add('bookings_cancelled', old.service_id::text, -1);
+        end if;
+        if new.status = 'completed' then
+            perform analytics_add('bookings_completed', new.service_id::text, 1, v_revenue);
+        elsif new.status = 'cancelled' then
+            perform analytics_add('bookings_cancelled', new.service_id::text, 1);
+        end if;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists bookings_analytics on bookings;
+create trigger bookings_analytics after insert on bookings
+    for each row execute function analytics_bookings();
+drop trigger if exists bookings_analytics_update on bookings;
+create trigger bookings_analytics_update after update of status, assignment_id on bookings
+    for each row when (old.status is distinct from new.status or old.assignment_id is distinct from new.assignment_id)
+    execute function analytics_bookings();
+
+-- assignment_request: offers sent and how they were answered
+create or replace function analytics_offers()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_op = 'INSERT' then
+        perform analytics_add('offers_sent', null, 1);
+        if new.status <> 'pending' then
+            perform analytics_add('offers_' || new.status, null, 1);
+        end if;
+        return null;
+    end if;
+    -- An accept that loses the race goes accepted -> expired in one transaction
+    if old.status <> 'pending' then
+        perform analytics_add('offers_' || old.status, null, -1);
+    end if;
+    if new.status <> 'pending' then
+        perform analytics_add('offers_' || new.status, null, 1);
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists assignment_request_analytics on assignment_request;
+create trigger assignment_request_analytics after insert on assignment_request
+    for each row execute function analytics_offers();
+drop trigger if exists assignment_request_analytics_update on assignment_request;
+create trigger assignment_request_analytics_update after update of status on assignment_request
+    for each row when (old.status is distinct from new.status)
+    execute function analytics_offers();
+
+-- Utilization: technicians, and those with an active assignment (technician_counters)
+create or replace function analytics_technicians()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_table_name = 'technician' then
+        perform analytics_add('technicians', null, case when tg_op = 'INSERT' then 1 else -1 end);
+        return null;
+    end if;
+    perform analytics_add('technicians_busy', null,
+        (case when tg_op <> 'DELETE' and new.active_assignments > 0 then 1 else 0 end)
+      - (case when tg_op <> 'INSERT' and old.active_assignments > 0 then 1 else 0 end));
+    return null;
+end;
+$$;
+
+drop trigger if exists technician_analytics on technician;
+create trigger technician_analytics after insert or delete on technician
+    for each row execute function analytics_technicians();
+drop trigger if exists technician_counters_analytics on technician_counters;
+create trigger technician_counters_analytics after insert or update of active_assignments or delete on technician_counters
+    for each row execute function analytics_technicians();
+
+-- All-time values (p_days null) or the last p_days UTC days, shards added up;
+-- the technician counts are current values either way:
+-- [{"metric", "key", "count", "total"}]. The row count depends on the number
+-- of metrics and services (and days), not on the size of the source tables.
+create or replace function analytics_snapshot(p_days integer default null)
+returns jsonb
+language sql
+stable
+as $$
+    select coalesce(jsonb_agg(jsonb_build_object('metric', metric, 'key', key, 'count', count, 'total', total)), '[]'::jsonb)
+      from (
+        select metric, key, sum(count) as count, sum(total) as total
+          from analytics_totals
+         where p_days is null or metric in ('technicians', 'technicians_busy')
+         group by metric, key
+        union all
+        select metric, key, sum(count), sum(total)
+          from analytics_daily
+         where p_days is not null
+           and day > (now() at time zone 'utc')::date - p_days
+           and metric not in ('technicians', 'technicians_busy')
+         group by metric, key
+      ) m;
+$$;
+
+-- Backfill the all-time values. Daily values start with this migration.
+lock table bookings, assignment_request, technician, technician_counters in share mode;
+
+delete from analytics_totals;
+insert into analytics_totals (metric, key, count, total)
+select 'bookings_created', service_id::text, count(*), 0 from bookings group by service_id
+union all
+select 'bookings_cancelled', service_id::text, count(*), 0 from bookings where status = 'cancelled' group by service_id
+union all
+select 'bookings_completed', b.service_id::text, count(*),
+       sum(coalesce(s.price, 0) + coalesce((select sum(bi.price) from booking_item bi where bi.booking_id = b.id), 0))
+  from bookings b left join service s on s.id = b.service_id
+ where b.status = 'completed'
+ group by b.service_id
+union all
+-- The assignment row is created when the offer is accepted
+select 'time_to_assign', b.service_id::text, count(*), sum(extract(epoch from a.created_at - b.created_at))
+  from bookings b join assignment a on a.id = b.assignment_id
+ group by b.service_id
+union all
+select 'offers_sent', '', count(*), 0 from assignment_request
+union all
+select 'offers_' || status, '', count(*), 0 from assignment_request where status <> 'pending' group by status
+union all
+select 'technicians', '', count(*), 0 from technician
+union all
+select 'technicians_busy', '', count(*), 0 from technician_counters where active_assignments > 0;
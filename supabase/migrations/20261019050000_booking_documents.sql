@@ -0,0 +1,238 @@
+-- Denormalized booking read model for user.viewBooking and user.viewBookedServices.
+--
+-- booking_documents holds one row per booking with the user.viewBooking
+-- document (booking, assignment with technician, booking_item), so both reads
+-- are a single indexed lookup instead of a four-way embedded join.
+-- Statement-level triggers rebuild the documents a write touches in the same
+-- transaction, so a read always sees its own writes:
+--
+--   bookings            insert, update (delete cascades)
+--   booking_item        insert, update, delete
+--   assignment          insert, update (through the booking, see below)
+--   technician          update of a column the document shows (name, phone,
+--                       provider_role_id, created_at); push token writes skip it
+--
+-- A multi-row write rebuilds each affected booking once. Catalog rows are not
+-- copied in: documents keep service_id / sub_service_id and readers add the
+-- current service and sub_service (read_model.py from the catalog cache,
+-- export_bookings through with_catalog), so a price edit rewrites nothing.
+
+create table if not exists booking_documents (
+    booking_id bigint primary key references bookings(id) on delete cascade,
+    user_id uuid not null,
+    created_at timestamptz not null,
+    doc jsonb not null,
+    refreshed_at timestamptz not null default now()
+);
+create index if not exists booking_documents_user_idx on booking_documents (user_id, created_at desc);
+
+create or replace function build_booking_document(p_booking_id bigint)
+returns jsonb
+language sql
+stable
+as $$
+    select (to_jsonb(b) - 'change_xid') || jsonb_build_object(
+               -- Listed technician columns: push_token stays out
+               'assignment', (select (to_jsonb(a) - 'change_xid') || jsonb_build_object(
+                                 'technician', (select jsonb_build_object('id', t.id, 'created_at', t.created_at, 'name', t.name, 'phone', t.phone, 'provider_role_id', t.provider_role_id)
+                                                  from technician t where t.id = a.techie_id))
+                                from assignment a where a.id = b.assignment_id),
+               'booking_item', (select coalesce(jsonb_agg(to_jsonb(bi) order by bi.id), '[]'::jsonb)
+                                  from booking_item bi
+                                 where bi.booking_id = b.id)
+           )
+      from bookings b
+     where b.id = p_booking_id;
+$$;
+
+create or replace function refresh_booking_documents(p_booking_ids bigint[])
+returns void
+language sql
+as $$
+    insert into booking_documents (booking_id, user_id, created_at, doc)
+    select b.id, b.user_id, b.created_at, build_booking_document(b.id)
+      from bookings b
+     where b.id = any(p_booking_ids)
+    on conflict (booking_id) do update
+       set user_id = excluded.user_id,
+           created_at = excluded.created_at,
+           doc = excluded.doc,
+           refreshed_at = now();
+$$;
+
+-- Each trigger below names its transition table `changed` (and the technician
+-- one its old rows `old_rows`)
+create or replace function booking_documents_refresh()
+returns trigger
+language plpgsql
+as $$
+declare
+    v_ids bigint[];
+begin
+    if tg_table_name = 'bookings' then
+        select array_agg(id) into v_ids from changed;
+    elsif tg_table_name = 'booking_item' then
+        select array_agg(distinct booking_id) into v_ids from changed;
+    elsif tg_table_name = 'assignment' then
+        -- The document embeds the assignment, so its booking changed too: touching
+        -- it moves change_xid for delta sync (touch_sync_columns), and the
+        -- bookings trigger rebuilds the document
+        update bookings set updated_at = now() where id in (select booking_id from changed);
+        return null;
+    elsif tg_table_name = 'technician' then
+        -- Transition-table triggers cannot take a column list, so compare here:
+        -- registerPushToken and technician.login rewrite the row on every app open
+        select array_agg(b.id) into v_ids
+          from bookings b join assignment a on a.id = b.assignment_id
+         where a.techie_id in (
+                   select n.id
+                     from changed n join old_rows o on o.id = n.id
+                    where (n.name, n.phone, n.provider_role_id, n.created_at)
+                          is distinct from (o.name, o.phone, o.provider_role_id, o.created_at));
+    end if;
+    if v_ids is not null then
+        perform refresh_booking_documents(v_ids);
+    end if;
+    return null;
+end;
+$$;
+
+-- Transition tables need one trigger per event
+drop trigger if exists bookings_documents_insert on bookings;
+create trigger bookings_documents_insert after insert on bookings
+    referencing new table as changed for each statement execute function booking_documents_refresh();
+drop trigger if exists bookings_documents_update on bookings;
+create trigger bookings_documents_update after update on bookings
+    referencing new table as changed for each statement execute function booking_documents_refresh();
+
+drop trigger if exists booking_item_documents_insert on booking_item;
+create trigger booking_item_documents_insert after insert on booking_item
+    referencing new table as changed for each statement execute function booking_documents_refresh();
+drop trigger if exists booking_item_documents_update on booking_item;
+create trigger booking_item_documents_update after update on booking_item
+    referencing new table as changed for each statement execute function booking_documents_refresh();
+drop trigger if exists booking_item_documents_delete on booking_item;
+create trigger booking_item_documents_delete after delete on booking_item
+    referencing old table as changed for each statement execute function booking_documents_refresh();
+
+drop trigger if exists assignment_documents_insert on assignment;
+create trigger assignment_documents_insert after insert on assignment
+    referencing new table as changed for each statement execute function booking_documents_refresh();
+drop trigger if exists assignment_documents_update on assignment;
+create trigger assignment_documents_update after update on assignment
+    referencing new table as changed for each statement execute function booking_documents_refresh();
+
+drop trigger if exists technician_documents_update on technician;
+create trigger technician_documents_update after update on technician
+    referencing old table as old_rows new table as changed for each statement execute function booking_documents_refresh();
+-- A stored document with its current service and sub_service rows, the
+-- shape the embedded select returns
+create or replace function with_catalog(p_doc jsonb)
+returns jsonb
+language sql
+stable
+as $$
+    select p_doc || jsonb_build_object(
+               'service', (select to_jsonb(s) from service s where s.id = (p_doc->>'service_id')::bigint),
+               'booking_item', (select coalesce(jsonb_agg(i.item || jsonb_build_object('sub_service', (select to_jsonb(ss) from sub_service ss where ss.id = (i.item->>'sub_service_id')::bigint))
+                                                order by i.n), '[]'::jsonb)
+                                  from jsonb_array_elements(p_doc->'booking_item') with ordinality as i(item, n)));
+$$;
+
+-- The export reads the same documents (see *_bookings_export.sql)
+create or replace function export_bookings(
+    p_from timestamptz,
+    p_to timestamptz,
+    p_statuses text[] default null,
+    p_after_created timestamptz default null,
+    p_after_id bigint default null,
+    p_limit integer default 1000
+)
+returns jsonb
+language sql
+stable
+as $$
+    select coalesce(jsonb_agg(with_catalog(page.doc) order by page.created_at, page.id), '[]'::jsonb)
+      from (
+        select b.created_at, b.id, d.doc
+          from bookings b
+          join booking_documents d on d.booking_id = b.id
+         where b.created_at >= p_from
+           and b.created_at < p_to
+           and (p_statuses is null or b.status = any(p_statuses))
+           and (p_after_created is null or (b.created_at, b.id) > (p_after_created, p_after_id))
+         order by b.created_at, b.id
+         limit least(greatest(p_limit, 1), 5000)
+      ) page;
+$$;
+
+-- Delta sync of bookings (*_delta_sync.sql) sends the stored documents too, so
+-- a synced booking has the same shape as user.viewBookedServices, assignment
+-- included. The other entities are unchanged.
+create or replace function sync_changes(p_entity text, p_owner uuid, p_since xid8 default null)
+returns jsonb
+language plpgsql
+stable
+as $$
+declare
+    v_cursor xid8 := pg_snapshot_xmin(pg_current_snapshot());
+    v_changed jsonb;
+    v_removed jsonb;
+begin
+    if p_entity = 'bookings' then
+        -- Same shape as user.viewBookedServices: the booking document with the
+        -- current catalog rows
+        select coalesce(jsonb_agg(with_catalog(d.doc) order by b.created_at desc), '[]'::jsonb)
+          into v_changed
+          from bookings b
+          join booking_documents d on d.booking_id = b.id
+         where b.user_id = p_owner
+           and (p_since is null or (b.change_xid >= p_since and b.status <> 'cancelled'));
+
+        select coalesce(jsonb_agg(jsonb_build_object('id', b.id, 'reason', 'cancelled')), '[]'::jsonb)
+          into v_removed
+          from bookings b
+         where p_since is not null and b.user_id = p_owner and b.change_xid >= p_since and b.status = 'cancelled';
+
+    elsif p_entity = 'booking_history' then
+        -- Same shape as technician.viewBookingHistory
+        select coalesce(jsonb_agg((to_jsonb(a) - 'change_xid') || jsonb_build_object(
+                   'service', (select to_jsonb(s) from service s where s.id = a.service_id),
+                   'booking', (select to_jsonb(b) - 'change_xid' from bookings b where b.id = a.booking_id)
+               ) order by a.scheduled_at desc), '[]'::jsonb)
+          into v_changed
+          from assignment a
+         where a.techie_id = p_owner
+           and (p_since is null or (a.change_xid >= p_since and a.status <> 'cancelled'));
+
+        select coalesce(jsonb_agg(jsonb_build_object('id', a.id, 'reason', 'cancelled')), '[]'::jsonb)
+          into v_removed
+          from assignment a
+         where p_since is not null and a.techie_id = p_owner and a.change_xid >= p_since and a.status = 'cancelled';
+
+    elsif p_entity = 'notifications' then
+        select coalesce(jsonb_agg(to_jsonb(n) - 'change_xid' order by n.id), '[]'::jsonb)
+          into v_changed
+          from notifications n
+         where n.user_id = p_owner
+           and (p_since is null or n.change_xid >= p_since);
+        v_removed := '[]'::jsonb;
+
+    else
+        raise exception 'unknown sync entity %', p_entity using errcode = '22023';
+    end if;
+
+    if p_since is not null then
+        select v_removed || coalesce(jsonb_agg(jsonb_build_object('id', t.row_id, 'reason', 'deleted')), '[]'::jsonb)
+          into v_removed
+          from sync_tombstone t
+         where t.owner_id = p_owner and t.entity = p_entity and t.change_xid >= p_since;
+    end if;
+
+    return jsonb_build_object('changed', v_changed, 'removed', v_removed, 'cursor', v_cursor::text);
+end;
+$$;
+
+-- Backfill while holding off writers, so no change slips between the two
+lock table bookings, booking_item, assignment in share mode;
+select refresh_booking_documents(array(select id from bookings));
@@ -0,0 +1,235 @@
+-- Append-only log of booking state changes.
+--
+-- Triggers append the events in the same transaction as the write, so every
+-- path that changes a booking (handlers, the assignment RPCs, admin edits) is
+-- logged without the handlers knowing:
+--
+--   type            written on                               techie_id  data
+--   booking_created bookings insert                          -          user_id, service_id, scheduled_at, status
+--   offer_sent      assignment_request insert                offer's    request_id, status
+--   offer_rejected  assignment_request -> rejected/expired   offer's    request_id, status
+--   accepted        assignment insert                        assigned   assignment_id, status
+--   status_changed  bookings / assignment status update      -          from, to, service_id, revenue (when completed
+--                                                                       is one side) / assignment_id, from, to
+--   cancelled       bookings status -> cancelled             -          same as status_changed
+--
+-- The triggers are statement-level: all events of one statement are appended
+-- with a single insert. Updates, deletes and truncates of the log are refused.
+--
+-- Readers page in (xid, id) order and only up to the oldest running
+-- transaction (read_booking_events), the same high-water mark as delta sync,
+-- so events committed out of order are never skipped.
+
+create table if not exists booking_events (
+    id bigint generated always as identity primary key,
+    booking_id bigint not null,
+    type text not null check (type in ('booking_created', 'offer_sent', 'offer_rejected', 'accepted', 'status_changed', 'cancelled')),
+    techie_id uuid,
+    data jsonb not null default '{}'::jsonb,
+    created_at timestamptz not null default now(),
+    xid xid8 not null default pg_current_xact_id()
+);
+create index if not exists booking_events_xid_idx on booking_events (xid, id);
+create index if not exists booking_events_booking_idx on booking_events (booking_id, id);
+
+create or replace function booking_events_append_only()
+returns trigger
+language plpgsql
+as $$
+begin
+    raise exception 'booking_events is append-only' using errcode = '42501';
+end;
+$$;
+
+drop trigger if exists booking_events_append_only on booking_events;
+create trigger booking_events_append_only before update or delete on booking_events
+    for each statement execute function booking_events_append_only();
+drop trigger if exists booking_events_no_truncate on booking_events;
+create trigger booking_events_no_truncate before truncate on booking_events
+    for each statement execute function booking_events_append_only();
+
+-- Each trigger below names its transition tables new_rows / old_rows
+create or replace function log_booking_events()
+returns trigger
+language plpgsql
+as $$
+begin
+    if tg_table_name = 'bookings' and tg_op = 'INSERT' then
+        insert into booking_events (booking_id, type, data)
+        select n.id, 'booking_created', jsonb_build_object('user_id', n.user_id, 'service_id', n.service_id, 'scheduled_at', n.scheduled_at, 'status', n.status)
+          from new_rows n
+         order by n.id;
+
+    elsif tg_table_name = 'bookings' then
+        -- Revenue as in analytics_bookings (*_analytics.sql), so a replay can add it up
+        insert into booking_events (booking_id, type, data)
+        select n.id,
+               case when n.status = 'cancelled' then 'cancelled' else 'status_changed' end,
+               jsonb_strip_nulls(jsonb_build_object(
+                   'from', o.status, 'to', n.status, 'service_id', n.service_id,
+                   'revenue', case when 'completed' in (o.status, n.status) then
+                                       coalesce((select price from service where id = n.service_id), 0)
+                                     + coalesce((select sum(price) from booking_item where booking_id = n.id), 0)
+                              end))
+          from new_rows n join old_rows o on o.id = n.id
+         where o.status is distinct from n.status
+         order by n.id;
+
+    elsif tg_table_name = 'assignment_request' and tg_op = 'INSERT' then
+        insert into booking_events (booking_id, type, techie_id, data)
+        select n.booking_id, 'offer_sent', n.techie_id, jsonb_build_object('request_id', n.id, 'status', n.status)
+          from new_rows n
+         order by n.id;
+
+    elsif tg_table_name = 'assignment_request' then
+        -- pending -> accepted is logged as the assignment it creates; an accept
+        -- that loses the race goes on to expired and is logged as that
+        insert into booking_events (booking_id, type, techie_id, data)
+        select n.booking_id, 'offer_rejected', n.techie_id, jsonb_build_object('request_id', n.id, 'status', n.status)
+          from new_rows n join old_rows o on o.id = n.id
+         where n.status in ('rejected', 'expired') and o.status is distinct from n.status
+         order by n.id;
+
+    elsif tg_table_name = 'assignment' and tg_op = 'INSERT' then
+        insert into booking_events (booking_id, type, techie_id, data)
+        select n.booking_id, 'accepted', n.techie_id, jsonb_build_object('assignment_id', n.id, 'status', n.status)
+          from new_rows n
+         where n.booking_id is not null
+         order by n.id;
+
+    elsif tg_table_name = 'assignment' then
+        insert into booking_events (booking_id, type, techie_id, data)
+        select n.booking_id, 'status_changed', n.techie_id, jsonb_build_object('assignment_id', n.id, 'from', o.status, 'to', n.status)
+          from new_rows n join old_rows o on o.id = n.id
+         where n.booking_id is not null and o.status is distinct from n.status
+         order by n.id;
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists bookings_events_insert on bookings;
+create trigger bookings_events_insert after insert on bookings
+    referencing new table as new_rows for each statement execute function log_booking_events();
+drop trigger if exists bookings_events_update on bookings;
+create trigger bookings_events_update after update on bookings
+    referencing old table as old_rows new table as new_rows for each statement execute function log_booking_events();
+
+drop trigger if exists assignment_request_events_insert on assignment_request;
+create trigger assignment_request_events_insert after insert on assignment_request
+    referencing new table as new_rows for each statement execute function log_booking_events();
+drop trigger if exists assignment_request_events_update on assignment_request;
+create trigger assignment_request_events_update after update on assignment_request
+    referencing old table as old_rows new table as new_rows for each statement execute function log_booking_events();
+
+drop trigger if exists assignment_events_insert on assignment;
+create trigger assignment_events_insert after insert on assignment
+    referencing new table as new_rows for each statement execute function log_booking_events();
+drop trigger if exists assignment_events_update on assignment;
+create trigger assignment_events_update after update on assignment
+    referencing old table as old_rows new table as new_rows for each statement execute function log_booking_events();
+
+-- One page of the log after (p_after_xid, p_after_id), oldest first:
+-- {"events": [{"id", "booking_id", "type", "techie_id", "data", "created_at", "xid"}], "horizon": "<xid>"}.
+-- Only transactions older than every running one are returned, so a reader
+-- that resumes after the last event it got misses nothing.
+create or replace function read_booking_events(p_after_xid xid8 default null, p_after_id bigint default null, p_limit integer default 5000)
+returns jsonb
+language sql
+stable
+as $$
+    with horizon as (select pg_snapshot_xmin(pg_current_snapshot()) as xmin)
+    select jsonb_build_object(
+               'events', coalesce((
+                   select jsonb_agg(jsonb_build_object('id', e.id, 'booking_id', e.booking_id, 'type', e.type, 'techie_id', e.techie_id,
+                                                       'data', e.data, 'created_at', e.created_at, 'xid', e.xid::text)
+                                    order by e.xid, e.id)
+                     from (select * from booking_events
+                            where xid < (select xmin from horizon)
+                              and (p_after_xid is null or (xid, id) > (p_after_xid, p_after_id))
+                            order by xid, id
+                            limit least(greatest(p_limit, 1), 20000)) e
+               ), '[]'::jsonb),
+               'horizon', (select xmin from horizon)::text);
+$$;
+
+-- Replaces what the triggers maintain (analytics_totals / analytics_daily
+-- except the technician count, technician_counters) with values replayed from
+-- the log up to (p_xid, p_id). Writers are held off while it runs; if the log
+-- moved past the replayed position nothing is changed and the replay has to
+-- read the rest first.
+--   p_totals   [{"metric", "key", "count", "total"}]
+--   p_daily    [{"day", "metric", "key", "count", "total"}]
+--   p_counters [{"techie_id", "pending_offers", "active_assignments", "completed_assignments"}]
+create or replace function replace_booking_projections(p_xid xid8, p_id bigint, p_totals jsonb, p_daily jsonb, p_counters jsonb)
+returns jsonb
+language plpgsql
+as $$
+begin
+    lock table bookings, booking_item, assignment_request, assignment in share mode;
+    if exists (select 1 from booking_events where p_xid is null or (xid, id) > (p_xid, p_id)) then
+        return jsonb_build_object('result', 'behind');
+    end if;
+
+    -- Counters first: their analytics trigger writes technicians_busy, which is
+    -- replaced below. Counters of technicians deleted since are dropped.
+    delete from technician_counters;
+    insert into technician_counters (techie_id, pending_offers, active_assignments, completed_assignments)
+    select (r->>'techie_id')::uuid, (r->>'pending_offers')::integer, (r->>'active_assignments')::integer, (r->>'completed_assignments')::integer
+      from jsonb_array_elements(p_counters) r
+     where exists (select 1 from technician t where t.id = (r->>'techie_id')::uuid);
+
+    delete from analytics_totals where metric <> 'technicians';
+    insert into analytics_totals (metric, key, count, total)
+    select r->>'metric', coalesce(r->>'key', ''), (r->>'count')::bigint, (r->>'total')::numeric
+      from jsonb_array_elements(p_totals) r;
+
+    delete from analytics_daily where metric <> 'technicians';
+    insert into analytics_daily (day, metric, key, count, total)
+    select (r->>'day')::date, r->>'metric', coalesce(r->>'key', ''), (r->>'count')::bigint, (r->>'total')::numeric
+      from jsonb_array_elements(p_daily) r;
+
+    return jsonb_build_object('result', 'replaced');
+end;
+$$;
+
+-- Backfill: bookings that exist already get a history synthesized from their
+-- current rows (created, offers and how they were answered, assignment,
+-- current status), dated like the rows themselves
+lock table bookings, booking_item, assignment_request, assignment in share mode;
+
+insert into booking_events (booking_id, type, techie_id, data, created_at)
+select booking_id, type, techie_id, data, created_at
+  from (
+    select b.id as booking_id, 'booking_created' as type, null::uuid as techie_id,
+           jsonb_build_object('user_id', b.user_id, 'service_id', b.service_id, 'scheduled_at', b.scheduled_at, 'status', 'pending') as data,
+           b.created_at, 0 as step, b.id as row_id
+      from bookings b
+    union all
+    select r.booking_id, 'offer_sent', r.techie_id, jsonb_build_object('request_id', r.id, 'status', 'pending'), r.created_at, 1, r.id
+      from assignment_request r
+    union all
+    select r.booking_id, 'offer_rejected', r.techie_id, jsonb_build_object('request_id', r.id, 'status', r.status), r.created_at, 2, r.id
+      from assignment_request r
+     where r.status in ('rejected', 'expired')
+    union all
+    select a.booking_id, 'accepted', a.techie_id, jsonb_build_object('assignment_id', a.id, 'status', 'active'), a.created_at, 3, a.id
+      from assignment a
+     where a.booking_id is not null
+    union all
+    select a.booking_id, 'status_changed', a.techie_id, jsonb_build_object('assignment_id', a.id, 'from', 'active', 'to', a.status), a.created_at, 4, a.id
+      from assignment a
+     where a.booking_id is not null and a.status is distinct from 'active'
+    union all
+    select b.id, case when b.status = 'cancelled' then 'cancelled' else 'status_changed' end, null,
+           jsonb_strip_nulls(jsonb_build_object(
+               'from', 'pending', 'to', b.status, 'service_id', b.service_id,
+               'revenue', case when b.status = 'completed' then
+                                   coalesce((select price from service where id = b.service_id), 0)
+                                 + coalesce((select sum(price) from booking_item where booking_id = b.id), 0)
+                          end)),
+           coalesce(b.updated_at, b.created_at), 5, b.id
+      from bookings b
+     where b.status is distinct from 'pending'
+  ) history
+ order by booking_id, step, row_id;
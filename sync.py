@@ -0,0 +1,62 @@
+import os
+import time
+from typing import Optional
+from fastapi import HTTPException
+from concurrency import fan_out, step, unwrap
+
+# Entities each role can sync; rows have the shape of the matching list endpoint
+# (user.viewBookedServices, notification.viewNotifications, technician.viewBookingHistory).
+SYNC_ENTITIES = {
+    "user": ("bookings", "notifications"),
+    "technician": ("booking_history", "notifications"),
+}
+# Tombstones are pruned after 30 days (prune_sync_tombstones); an older cursor
+# could have missed a deletion, so it gets a full download instead.
+SYNC_MAX_CURSOR_AGE = float(os.environ.get("SYNC_MAX_CURSOR_AGE", str(29 * 24 * 3600)))
+
+
+def encode_cursor(xid: str, now: Optional[float] = None) -> str:
+    return f"{xid}.{int(now or time.time())}"
+
+
+def decode_cursor(cursor: Optional[str], now: Optional[float] = None) -> Optional[str]:
+    """The transaction id to sync from, or None for a full download."""
+    if not cursor:
+        return None
+    xid, _, issued = cursor.partition(".")
+    if not xid.isdigit() or not issued.isdigit():
+        raise HTTPException(status_code=400, detail=f"Invalid sync cursor {cursor!r}")
+    if (now or time.time()) - int(issued) > SYNC_MAX_CURSOR_AGE:
+        return None
+    return xid
+
+
+async def sync_entity(sbase, entity: str, owner_id: str, cursor: Optional[str]) -> dict:
+    since = decode_cursor(cursor)
+    res = await sbase.rpc("sync_changes", {"p_entity": entity, "p_owner": str(owner_id), "p_since": since}).execute()
+    result = res.data or {}
+    return {
+        "changed": result.get("changed") or [],
+        "removed": result.get("removed") or [],
+        # A full download replaces the client's copy; a delta is merged into it
+        "full": since is None,
+        "cursor": encode_cursor(result["cursor"]) if result.get("cursor") else cursor,
+    }
+
+
+async def sync_entities(sbase, role: str, owner_id: str, cursors: dict[str, Optional[str]], entities: Optional[list[str]] = None) -> dict:
+    """
+    Syncs the requested entities (all of the role's by default) concurrently.
+    Each result carries its own cursor for the client to send next time.
+    """
+    allowed = SYNC_ENTITIES[role]
+    wanted = entities or list(allowed)
+    unknown = [e for e in [*wanted, *cursors] if e not in allowed]
+    if unknown:
+        raise HTTPException(status_code=400, detail=f"Cannot sync {', '.join(sorted(set(unknown)))} as {role}")
+
+    # Decode first so a bad cursor is a 400 before anything is queried
+    for entity in wanted:
+        decode_cursor(cursors.get(entity))
+    results = await fan_out(*[step(sync_entity(sbase, entity, owner_id, cursors.get(entity)), name=f"sync_{entity}") for entity in wanted])
+    return {entity: unwrap(result) for entity, result in zip(wanted, results)}
@@ -0,0 +1,110 @@
+import asyncio
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+from admission import AdmissionMiddleware, TokenBuckets, parse_rates, priority_class
+
+
+def test_bucket_refills_at_rate_and_reports_wait():
+    buckets = TokenBuckets()
+    assert [buckets.take(b"k", rate=2, burst=3, now=0) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take(b"k", rate=2, burst=3, now=0) == 0.5
+    assert buckets.take(b"k", rate=2, burst=3, now=0.5) == 0
+    # Never refills past the burst
+    assert buckets.take(b"k", rate=2, burst=3, now=100) == 0
+    assert [buckets.take(b"k", rate=2, burst=3, now=100) for _ in range(2)] == [0, 0]
+    assert buckets.take(b"k", rate=2, burst=3, now=100) > 0
+
+
+def test_bucket_memory_is_bounded_lru():
+    buckets = TokenBuckets(max_entries=100)
+    for n in range(1000):
+        buckets.take(n.to_bytes(8, "big"), rate=1, burst=1, now=0)
+    assert len(buckets) == 100
+    # The most recent keys survived and are still empty
+    assert buckets.take((999).to_bytes(8, "big"), rate=1, burst=1, now=0) > 0
+
+
+def test_priority_classes_and_rate_parsing():
+    assert priority_class("/api/funcs/technician.viewAssignmentRequests") == "low"
+    assert priority_class("/api/funcs/technician.acceptAssignment") == "critical"
+    assert priority_class("/api/funcs/user.viewBooking") == "normal"
+    assert priority_class("/api/metrics") is None
+    assert parse_rates("low=1:4,critical=5")["low"] == (1.0, 4.0)
+    assert parse_rates("low=1:4,critical=5")["critical"] == (5.0, 5.0)
+
+
+def make_client(**options):
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, enabled=True, **options)
+
+    @app.post("/api/funcs/{func}")
+    async def func(func: str):
+        return {"func": func}
+
+    return app, TestClient(app)
+
+
+def test_polling_is_limited_without_starving_writes():
+    _, client = make_client(rates={"low": (0.001, 3), "normal": (10, 10), "critical": (0.001, 2)})
+    headers = {"Authorization": "Bearer tech-1"}
+    polls = [client.post("/api/funcs/technician.viewAssignmentRequests", headers=headers) for _ in range(5)]
+    assert [r.status_code for r in polls] == [200, 200, 200, 429, 429]
+    assert int(polls[-1].headers["retry-after"]) >= 1
+
+    # Separate bucket per class, and per client
+    assert client.post("/api/funcs/technician.acceptAssignment", headers=headers).status_code == 200
+    assert client.post("/api/funcs/technician.viewAssignmentRequests", headers={"Authorization": "Bearer tech-2"}).status_code == 200
+
+
+def test_sheds_low_priority_first_when_busy():
+    app, client = make_client(max_inflight=10)
+    admission = app.build_middleware_stack()
+    while not isinstance(admission, AdmissionMiddleware):
+        admission = admission.app
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    async def call(path):
+        sent.clear()
+        await admission({"type": "http", "method": "POST", "path": path, "headers": [], "client": ("1.2.3.4", 1)}, None, send)
+        return sent[0]["status"]
+
+    admission.inflight = 6
+    assert asyncio.run(call("/api/funcs/technician.viewAssignmentRequests")) == 503
+    assert dict(sent[0]["headers"])[b"retry-after"] == b"1"
+    admission.inflight = 9
+    assert asyncio.run(call("/api/funcs/user.viewUser")) == 503
+    admission.app = lambda scope, receive, send: send({"type": "http.response.start", "status": 200, "headers": []})
+    assert asyncio.run(call("/api/funcs/service.bookService")) == 200
+
+
+def test_spoofed_forwarded_for_does_not_get_a_fresh_bucket():
+    # A client rotating its own X-Forwarded-For entry; the proxy appends the real address
+    _, client = make_client(ip_rate=(0.001, 2), trust_forwarded=True)
+    codes = [client.post("/api/funcs/user.viewUser", headers={"X-Forwarded-For": f"10.0.0.{n}, 203.0.113.7", "Authorization": f"Bearer t{n}"}).status_code for n in range(4)]
+    assert codes == [200, 200, 429, 429]
+
+    # Without a trusted proxy the header is ignored entirely
+    _, client = make_client(ip_rate=(0.001, 2), trust_forwarded=False)
+    codes = [client.post("/api/funcs/user.viewUser", headers={"X-Forwarded-For": f"10.0.0.{n}", "Authorization": f"Bearer t{n}"}).status_code for n in range(4)]
+    assert codes == [200, 200, 429, 429]
+
+
+def test_batch_calls_are_charged_by_the_runner_not_the_envelope():
+    app = FastAPI()
+    app.add_middleware(AdmissionMiddleware, enabled=True, rates={"normal": (0.001, 1)})
+    seen = []
+
+    @app.post("/api/funcs/batch")
+    async def batch(request: Request):
+        admission = request.scope["admission"]
+        seen.append([admission.admit("user.viewUser") for _ in range(3)])
+        return {}
+
+    client = TestClient(app)
+    assert [client.post("/api/funcs/batch").status_code for _ in range(2)] == [200, 200]
+    # One token for the first call; the envelopes took none
+    assert [[r and r[0] for r in calls] for calls in seen] == [[None, 429, 429], [429, 429, 429]]
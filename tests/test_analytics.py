@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from analytics import summarize_analytics, fetch_analytics
+
+
+def test_snapshot_rows_become_rates_and_per_service_figures():
+    rows = [
+        {"metric": "technicians", "key": "", "count": 40, "total": 0},
+        {"metric": "technicians_busy", "key": "", "count": 10, "total": 0},
+        {"metric": "offers_sent", "key": "", "count": 12, "total": 0},
+        {"metric": "offers_accepted", "key": "", "count": 6, "total": 0},
+        {"metric": "offers_rejected", "key": "", "count": 3, "total": 0},
+        {"metric": "offers_expired", "key": "", "count": 1, "total": 0},
+        {"metric": "bookings_created", "key": "2", "count": 5, "total": 0},
+        {"metric": "bookings_created", "key": "10", "count": 3, "total": 0},
+        {"metric": "bookings_completed", "key": "2", "count": 2, "total": "900.00"},
+        {"metric": "time_to_assign", "key": "2", "count": 4, "total": 480},
+        {"metric": "time_to_assign", "key": "10", "count": 2, "total": 360},
+    ]
+    summary = summarize_analytics(rows)
+    assert summary["technicians"] == {"total": 40, "busy": 10, "utilization": 0.25}
+    assert summary["offers"]["acceptance_rate"] == 0.6
+    assert summary["time_to_assign"] == {"assigned": 6, "avg_seconds": 140.0}
+    assert summary["revenue"] == 900.0
+    assert [s["service_id"] for s in summary["services"]] == [2, 10]
+    assert summary["services"][0] == {"service_id": 2, "bookings": 5, "completed": 2, "cancelled": 0, "revenue": 900.0, "avg_time_to_assign_seconds": 120.0}
+    # Nothing answered or assigned yet: no rate instead of a division by zero
+    empty = summarize_analytics([])
+    assert empty["offers"]["acceptance_rate"] is None and empty["technicians"]["utilization"] is None
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.calls = []
+
+    def rpc(self, name, params):
+        self.calls.append((name, params))
+
+        class Call:
+            async def execute(self):
+                return type("Res", (), {"data": []})()
+        return Call()
+
+
+def test_window_is_bounded():
+    sbase = FakeSupabase()
+    assert asyncio.run(fetch_analytics(sbase, 7))["days"] == 7
+    assert sbase.calls == [("analytics_snapshot", {"p_days": 7})]
+    with pytest.raises(HTTPException):
+        asyncio.run(fetch_analytics(sbase, 365))
@@ -0,0 +1,108 @@
+import asyncio
+from typing import Optional
+import pytest
+from fastapi import Depends, FastAPI, HTTPException, Header
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from db import get_supabase
+from schema import BatchCall
+from admission import AdmissionMiddleware, BatchAdmission
+from batch import BatchRunner, plan_route
+import batch
+
+
+class EchoRequest(BaseModel):
+    value: int
+
+
+def make_runner(monkeypatch):
+    auth_calls = []
+
+    async def fake_verify_user(authorization: Optional[str] = Header(None), sbase=None):
+        auth_calls.append(authorization)
+        if authorization != "Bearer good":
+            raise HTTPException(status_code=401, detail="Invalid Token")
+        return "u1"
+
+    # plan_route recognises roles by the dependency function itself
+    monkeypatch.setitem(batch.ROLE_DEPENDENCIES, fake_verify_user, "user")
+    monkeypatch.setattr(batch, "verify_user", fake_verify_user)
+    app = FastAPI()
+
+    @app.post("/api/funcs/test.echo")
+    async def echo(data: EchoRequest, user_id: str = Depends(fake_verify_user), sbase=Depends(get_supabase)):
+        return {"user": user_id, "value": data.value}
+
+    @app.post("/api/funcs/test.slow")
+    async def slow(user_id: str = Depends(fake_verify_user)):
+        await asyncio.sleep(5)
+
+    @app.post("/api/funcs/test.query")
+    async def query(id: int):
+        return id
+
+    return BatchRunner(app), auth_calls
+
+
+def test_results_come_back_in_order_with_per_call_errors(monkeypatch):
+    runner, auth_calls = make_runner(monkeypatch)
+    calls = [
+        BatchCall(func="test.echo", args={"value": 1}),
+        BatchCall(func="test.missing"),
+        BatchCall(func="test.echo", args={"value": "nope"}),
+        BatchCall(func="test.query"),
+        BatchCall(func="test.echo", args={"value": 2}),
+    ]
+    entries = asyncio.run(runner.run(calls, {"authorization": "Bearer good"}, sbase=object(), identity=None))
+    assert entries[0] == {"ok": True, "status": 200, "result": {"user": "u1", "value": 1}}
+    assert entries[1]["status"] == 404
+    assert entries[2]["status"] == 422 and not entries[2]["ok"]
+    assert entries[3]["status"] == 400
+    assert entries[4]["result"]["value"] == 2
+    # Three calls needed a user; the token was checked once
+    assert auth_calls == ["Bearer good"]
+
+
+def test_failed_auth_fails_every_call_that_needs_it(monkeypatch):
+    runner, auth_calls = make_runner(monkeypatch)
+    calls = [BatchCall(func="test.echo", args={"value": 1}), BatchCall(func="test.echo", args={"value": 2})]
+    entries = asyncio.run(runner.run(calls, {}, sbase=object(), identity=None))
+    assert [e["status"] for e in entries] == [401, 401]
+    assert len(auth_calls) == 1
+
+
+def test_deadline_cuts_slow_calls_only(monkeypatch):
+    runner, _ = make_runner(monkeypatch)
+    calls = [BatchCall(func="test.slow"), BatchCall(func="test.echo", args={"value": 3})]
+    entries = asyncio.run(runner.run(calls, {"authorization": "Bearer good"}, sbase=object(), identity=None, deadline=0.1))
+    assert entries[0] == {"ok": False, "status": 504, "error": "Batch deadline exceeded"}
+    assert entries[1]["ok"]
+
+    monkeypatch.setattr(batch, "BATCH_MAX_CALLS", 1)
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(runner.run(calls, {}, sbase=object(), identity=None))
+    assert e.value.status_code == 400
+
+
+def test_calls_are_admitted_one_by_one_in_their_class(monkeypatch):
+    runner, _ = make_runner(monkeypatch)
+    middleware = AdmissionMiddleware(None, enabled=True, rates={"low": (0.001, 1), "normal": (0.001, 2), "critical": (0.001, 1)})
+    admission = BatchAdmission(middleware, ("token", "Bearer good"), "1.2.3.4")
+    calls = [BatchCall(func="test.echo", args={"value": n}) for n in range(4)] + [BatchCall(func="test.missing")]
+    entries = asyncio.run(runner.run(calls, {"authorization": "Bearer good"}, sbase=object(), identity=None, admission=admission))
+    # Two tokens in the normal bucket; unknown funcs take none
+    assert [e["status"] for e in entries] == [200, 200, 429, 429, 404]
+    assert middleware.inflight == 2
+    admission.release()
+    assert middleware.inflight == 0
+
+
+def test_routes_with_route_level_dependencies_cannot_be_batched():
+    async def verify_admin():
+        pass
+
+    async def stats(sbase=Depends(get_supabase)):
+        return {}
+
+    assert plan_route(APIRoute("/api/funcs/test.stats", stats)) is not None
+    assert plan_route(APIRoute("/api/funcs/admin.stats", stats, dependencies=[Depends(verify_admin)])) is None
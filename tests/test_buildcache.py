@@ -0,0 +1,49 @@
+import os
+import sys
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "build"))
+from buildcache import BuildCache, hash_files
+
+
+def test_hash_files_is_stable_and_covers_names_and_contents(tmp_path):
+    a, b = tmp_path / "a.py", tmp_path / "b.py"
+    a.write_text("x = 1\n")
+    b.write_text("y = 2\n")
+    key = hash_files([a, b], extra="cpython-313")
+    # Order-independent, and sensitive to contents, the extra tag and missing files
+    assert hash_files([b, a], extra="cpython-313") == key
+    assert hash_files([a, b], extra="cpython-314") != key
+    b.write_text("y = 3\n")
+    assert hash_files([a, b], extra="cpython-313") != key
+    b.unlink()
+    missing = hash_files([a, b], extra="cpython-313")
+    assert missing not in (key, hash_files([a], extra="cpython-313"))
+
+
+def test_build_cache_is_fresh_until_inputs_or_outputs_change(tmp_path):
+    manifest = tmp_path / ".cache" / "manifest.json"
+    output = tmp_path / "main.py"
+    output.write_text("bundle\n")
+    cache = BuildCache(manifest)
+    assert not cache.is_fresh("merge", "k1", [output])
+    cache.record("merge", "k1", [output])
+
+    # A new instance reads the recorded manifest back
+    cache = BuildCache(manifest)
+    assert cache.is_fresh("merge", "k1", [output])
+    assert not cache.is_fresh("merge", "k2", [output])
+    assert not cache.is_fresh("coldstart", "k1", [output])
+    assert not cache.is_fresh("merge", "k1", [output, tmp_path / "openapi.json"])
+    assert not BuildCache(manifest, force=True).is_fresh("merge", "k1", [output])
+
+    output.write_text("edited\n")
+    assert not cache.is_fresh("merge", "k1", [output])
+    output.unlink()
+    assert not cache.is_fresh("merge", "k1", [output])
+
+
+def test_build_cache_ignores_a_corrupt_manifest(tmp_path):
+    manifest = tmp_path / "manifest.json"
+    manifest.write_text("{not json")
+    assert BuildCache(Path(manifest)).manifest == {}
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import pytest
+from fastapi import HTTPException
+from postgrest.exceptions import APIError
+from bulk_import import BulkImport, import_format, read_records
+import bulk_import
+
+
+class FakeQuery:
+    def __init__(self, db, op, rows):
+        self.db, self.op, self.rows = db, op, rows
+
+    async def execute(self):
+        self.db.calls.append((self.op, len(self.rows)))
+        if any(row.get("name") == "bad" for row in self.rows):
+            raise APIError({"message": "violates check constraint", "code": "23514"})
+        written = []
+        for row in self.rows:
+            row = dict(row)
+            if row.get("id") is None:
+                self.db.next_id += 1
+                row["id"] = self.db.next_id
+            written.append(row)
+        return type("Res", (), {"data": written})()
+
+
+class FakeTable:
+    def __init__(self, db):
+        self.db = db
+
+    def upsert(self, rows, on_conflict):
+        return FakeQuery(self.db, "upsert", rows)
+
+    def insert(self, rows):
+        return FakeQuery(self.db, "insert", rows)
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.calls = []
+        self.next_id = 100
+
+    def table(self, name):
+        return FakeTable(self)
+
+
+async def body(*parts: bytes):
+    for part in parts:
+        yield part
+
+
+def run_import(sbase, table, fmt, *parts):
+    async def run():
+        return [json.loads(line) async for line in BulkImport(sbase, table).run(body(*parts), fmt)]
+    return asyncio.run(run())
+
+
+def test_ndjson_rows_are_validated_chunked_and_reported(monkeypatch):
+    monkeypatch.setattr(bulk_import, "IMPORT_CHUNK_ROWS", 2)
+    sbase = FakeSupabase()
+    lines = [
+        {"id": 1, "name": "Plumbing", "price": 300},
+        {"name": "Wiring", "price": 200},
+        {"id": 2, "name": "Cleaning"},
+        {"id": 3, "name": "bad", "price": 1},
+        {"id": 1, "name": "Plumbing v2", "price": 350},
+        {"id": 1, "name": "Plumbing v3", "price": 400},
+    ]
+    raw = "\n".join(json.dumps(line) for line in lines).encode() + b"\nnot json\n"
+    # Split mid-line to exercise the line buffer
+    report = run_import(sbase, "service", "ndjson", raw[:17], raw[17:60], raw[60:])
+
+    by_line = {entry["line"]: entry for entry in report if "line" in entry}
+    assert by_line[1] == {"line": 1, "status": "ok", "id": 1}
+    assert by_line[2]["status"] == "ok" and by_line[2]["id"] == 101
+    assert by_line[3]["status"] == "invalid" and by_line[3]["errors"][0]["loc"] == ["price"]
+    assert by_line[4]["status"] == "failed" and "check constraint" in by_line[4]["error"]
+    assert by_line[5]["status"] == "ok" and by_line[6]["status"] == "ok"
+    assert by_line[7]["status"] == "invalid"
+    assert report[-1] == {"summary": {"table": "service", "ok": 4, "invalid": 2, "failed": 1}}
+    # The rejected chunk was split to isolate line 4; id 1 twice never shares a call
+    assert sbase.calls == [("upsert", 2), ("upsert", 1), ("upsert", 1), ("upsert", 1), ("upsert", 1), ("insert", 1)]
+
+
+def test_csv_header_quoted_newlines_and_empty_fields():
+    sbase = FakeSupabase()
+    raw = (
+        b'\xef\xbb\xbfid,service_id,name,price,description\r\n'
+        b'1,10,Tap fix,100,\r\n'
+        b'2,10,"Pipe, long",250,"two\nlines"\r\n'
+        b'3,10,Short row\r\n'
+    )
+    report = run_import(sbase, "sub_service", "csv", raw)
+    assert [(e["line"], e["status"]) for e in report[:-1]] == [(5, "invalid"), (2, "ok"), (3, "ok")]
+    assert report[-1]["summary"]["ok"] == 2
+
+
+def test_oversized_lines_are_skipped_without_buffering(monkeypatch):
+    monkeypatch.setattr(bulk_import, "IMPORT_MAX_LINE_BYTES", 32)
+
+    async def run():
+        raw = [b'{"name": "' + b"x" * 40, b"x" * 40 + b'"}\n{"a": 1}\n']
+        return [record async for record in read_records(body(*raw), "ndjson")]
+
+    records = asyncio.run(run())
+    assert records[0][0] == 1 and records[0][2].startswith("Line longer")
+    assert records[1] == (2, {"a": 1}, None)
+    assert import_format("text/csv; charset=utf-8") == "csv"
+    with pytest.raises(HTTPException) as e:
+        import_format("application/json")
+    assert e.value.status_code == 415
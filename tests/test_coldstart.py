@@ -0,0 +1,49 @@
+import ast
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "build"))
+from coldstart import LAZY_MODULES, SOURCE_DIR, format_import_report, parse_importtime
+
+IMPORTTIME = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |        450 | encodings
+import time:        80 |         80 |     smtplib
+import time:      1500 |       1580 |   fastapi
+import time: not a row
+import time:        12 |       1592 | main
+Traceback (most recent call last):
+"""
+
+
+def test_parse_importtime_reads_rows_and_nesting():
+    rows = parse_importtime(IMPORTTIME)
+    assert rows == [
+        ("_io", 120, 120, 1),
+        ("encodings", 300, 450, 0),
+        ("smtplib", 80, 80, 2),
+        ("fastapi", 1500, 1580, 1),
+        ("main", 12, 1592, 0),
+    ]
+
+
+def test_import_report_flags_lazy_modules_loaded_at_import():
+    report = format_import_report(parse_importtime(IMPORTTIME))
+    assert "Total import time: 2.0 ms across 5 modules" in report
+    assert report.rstrip().endswith("## Lazy modules loaded at import: smtplib")
+    clean = format_import_report([row for row in parse_importtime(IMPORTTIME) if row[0] != "smtplib"])
+    assert clean.rstrip().endswith("## Lazy modules loaded at import: none")
+
+
+def test_sources_only_import_lazy_modules_inside_functions():
+    for path in SOURCE_DIR.glob("*.py"):
+        tree = ast.parse(path.read_text(encoding="utf-8"))
+        for node in tree.body:
+            if isinstance(node, ast.Import):
+                roots = {alias.name.split(".")[0] for alias in node.names}
+            elif isinstance(node, ast.ImportFrom):
+                roots = {(node.module or "").split(".")[0]}
+            else:
+                continue
+            assert not roots & LAZY_MODULES, f"{path.name} imports {roots & LAZY_MODULES} at top level"
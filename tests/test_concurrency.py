@@ -0,0 +1,39 @@
+import asyncio
+import time
+import pytest
+from concurrency import fan_out, step, unwrap
+
+
+async def _value(v, delay=0.0):
+    await asyncio.sleep(delay)
+    return v
+
+
+async def _boom():
+    raise ValueError("boom")
+
+
+def test_fan_out_runs_concurrently_and_keeps_order():
+    async def run():
+        started = time.perf_counter()
+        results = await fan_out(_value("a", 0.05), _value("b", 0.05), _value("c", 0.01))
+        return results, time.perf_counter() - started
+
+    results, elapsed = asyncio.run(run())
+    assert results == ["a", "b", "c"]
+    assert elapsed < 0.1
+
+
+def test_fan_out_isolates_errors():
+    results = asyncio.run(fan_out(_boom(), _value("ok")))
+    assert isinstance(results[0], ValueError)
+    assert results[1] == "ok"
+    with pytest.raises(ValueError):
+        unwrap(results[0])
+    assert unwrap(results[1]) == "ok"
+
+
+def test_fan_out_per_call_timeout():
+    results = asyncio.run(fan_out(step(_value("slow", 1.0), timeout=0.01), step(_value("fast"), timeout=1.0)))
+    assert isinstance(results[0], TimeoutError)
+    assert results[1] == "fast"
@@ -0,0 +1,76 @@
+from analytics import summarize_analytics
+from event_log import BookingEventReplay, EventSegmentWriter, event_segments, fetch_booking_events, last_segment_position, read_event_segments
+from tests.test_fake_supabase import run_with_client
+from benchmarks.fake_supabase import technician_ids, user_ids
+
+
+def test_replaying_the_log_rebuilds_counters_and_analytics(tmp_path):
+    user_id, (first, second, third) = user_ids(1)[0], technician_ids(3)
+
+    async def check(sbase, fake):
+        service = (await sbase.table("service").select("*").execute()).data[0]
+
+        async def book():
+            booking = (await sbase.table("bookings").insert({"user_id": user_id, "service_id": service["id"], "scheduled_at": "2026-01-01T10:00:00Z", "status": "pending"}).execute()).data[0]
+            await sbase.table("booking_item").insert({"booking_id": booking["id"], "sub_service_id": None, "price": 50}).execute()
+            return booking
+
+        async def offer(booking, techie_id):
+            return (await sbase.table("assignment_request").insert({"booking_id": booking["id"], "techie_id": techie_id, "status": "pending"}).execute()).data[0]
+
+        done, cancelled, waiting = await book(), await book(), await book()
+        rejected = await offer(done, first)
+        await sbase.rpc("reject_assignment_request", {"p_request_id": rejected["id"], "p_techie_id": first}).execute()
+        winner, loser = await offer(done, second), await offer(done, third)
+        accepted = (await sbase.rpc("accept_assignment_request", {"p_request_id": winner["id"], "p_techie_id": second}).execute()).data
+        await sbase.rpc("accept_assignment_request", {"p_request_id": loser["id"], "p_techie_id": third}).execute()
+        await sbase.table("bookings").update({"status": "completed"}).eq("assignment_id", accepted["assignment"]["id"]).execute()
+        await sbase.table("assignment").update({"status": "completed"}).eq("id", accepted["assignment"]["id"]).execute()
+        await offer(cancelled, first)
+        await sbase.table("bookings").update({"status": "cancelled"}).eq("id", cancelled["id"]).execute()
+        await offer(waiting, third)
+
+        # Pages of 4, into segments of one small block each
+        with EventSegmentWriter(tmp_path, block_events=3, max_bytes=1) as writer:
+            async for page in fetch_booking_events(sbase, page_rows=4):
+                writer.extend(page)
+        events = list(read_event_segments(tmp_path))
+        assert [e["type"] for e in events].count("booking_created") == 3
+        assert len(event_segments(tmp_path)) == (len(events) + 2) // 3
+        assert last_segment_position(tmp_path) == (events[-1]["xid"], events[-1]["id"])
+        assert [e["id"] for e in events] == sorted(int(e["id"]) for e in fake.store.table("booking_events").values())
+
+        replay = BookingEventReplay().apply_all(events)
+        maintained = {row["techie_id"]: [row["pending_offers"], row["active_assignments"], row["completed_assignments"]] for row in fake.store.table("technician_counters").values()}
+        assert {t: c for t, c in replay.counters.items() if any(c)} == {t: c for t, c in maintained.items() if any(c)} != {}
+
+        summary = summarize_analytics(replay.analytics_rows())
+        assert summary["offers"] == {"sent": 5, "accepted": 1, "rejected": 1, "expired": 1, "acceptance_rate": 0.3333}
+        [by_service] = summary["services"]
+        assert (by_service["bookings"], by_service["completed"], by_service["cancelled"]) == (3, 1, 1)
+        assert by_service["revenue"] == service["price"] + 50
+        assert summary["time_to_assign"]["assigned"] == 1
+        assert replay.analytics_rows(days=1) and replay.analytics_daily()
+
+    run_with_client(check)
+
+
+def test_a_torn_block_ends_the_segment(tmp_path):
+    events = [
+        {"id": i, "xid": i, "booking_id": 1, "type": "offer_sent", "techie_id": technician_ids(1)[0], "data": {"request_id": i, "status": "pending"}, "created_at": "2026-01-01T00:00:00+00:00"}
+        for i in range(1, 11)
+    ]
+    with EventSegmentWriter(tmp_path, block_events=4) as writer:
+        writer.extend(events)
+    [segment] = event_segments(tmp_path)
+    segment.write_bytes(segment.read_bytes()[:-5])
+
+    read = list(read_event_segments(tmp_path))
+    assert [e["id"] for e in read] == list(range(1, 9))
+    assert read[0]["techie_id"] == events[0]["techie_id"] and read[0]["data"] == events[0]["data"]
+
+    # A new writer starts the next segment instead of appending to a damaged one
+    with EventSegmentWriter(tmp_path) as writer:
+        writer.extend(events[8:])
+    assert [e["id"] for e in read_event_segments(tmp_path)] == list(range(1, 11))
+    assert last_segment_position(tmp_path) == (10, 10)
@@ -0,0 +1,107 @@
+import asyncio
+import csv
+import io
+import json
+from datetime import datetime, timedelta, timezone
+import pytest
+from fastapi import HTTPException
+from schema import ExportBookingsRequest
+from export import BookingExport, CSV_COLUMNS
+import export
+
+START = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+
+class FakeRpc:
+    def __init__(self, data):
+        self.data = data
+
+    async def execute(self):
+        await asyncio.sleep(0)
+        return self
+
+
+class FakeSupabase:
+    """export_bookings over an in-memory list, with the same keyset semantics."""
+
+    def __init__(self, count):
+        self.calls = []
+        self.bookings = [
+            {
+                "id": i, "created_at": (START + timedelta(minutes=i // 2)).isoformat(), "status": "cancelled" if i % 5 == 0 else "completed",
+                "user_id": "u1", "service_id": 1, "service": {"id": 1, "name": "Plumbing"}, "assignment_id": None, "assignment": None,
+                "booking_item": [{"sub_service_id": 7, "price": 100}, {"sub_service_id": 8, "price": 50}],
+            }
+            for i in range(1, count + 1)
+        ]
+
+    def rpc(self, name, params):
+        self.calls.append(params)
+        after = (params["p_after_created"], params["p_after_id"]) if params["p_after_created"] else None
+        rows = [
+            b for b in self.bookings
+            if params["p_from"] <= b["created_at"] < params["p_to"]
+            and (params["p_statuses"] is None or b["status"] in params["p_statuses"])
+            and (after is None or (b["created_at"], b["id"]) > after)
+        ]
+        return FakeRpc(rows[:params["p_limit"]])
+
+
+def collect(sbase, **fields) -> str:
+    request = ExportBookingsRequest(from_date=START, to_date=START + timedelta(days=1), **fields)
+
+    async def run():
+        return "".join([chunk async for chunk in BookingExport(sbase, request).run()])
+    return asyncio.run(run())
+
+
+def test_ndjson_export_pages_through_every_matching_booking(monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_PAGE_ROWS", 4)
+    sbase = FakeSupabase(10)
+    lines = [json.loads(line) for line in collect(sbase, statuses=["completed"]).splitlines()]
+    assert [row["id"] for row in lines[:-1]] == [1, 2, 3, 4, 6, 7, 8, 9]
+    assert lines[-1] == {"summary": {"rows": 8, "complete": True, "next": None}}
+    # Two full pages and an empty one, each starting after the previous last row
+    assert [call["p_after_id"] for call in sbase.calls] == [None, 4, 9]
+
+
+def test_time_limit_ends_the_stream_with_a_resume_cursor(monkeypatch):
+    monkeypatch.setattr(export, "EXPORT_PAGE_ROWS", 3)
+    monkeypatch.setattr(export, "EXPORT_MAX_SECONDS", 1e-9)
+    sbase = FakeSupabase(10)
+    lines = [json.loads(line) for line in collect(sbase).splitlines()]
+    summary = lines[-1]["summary"]
+    assert [row["id"] for row in lines[:-1]] == [1, 2, 3]
+    assert summary["complete"] is False and summary["next"] == {"after_created_at": lines[2]["created_at"], "after_id": 3}
+
+    monkeypatch.setattr(export, "EXPORT_MAX_SECONDS", 0)
+    rest = [json.loads(line) for line in collect(sbase, **summary["next"]).splitlines()]
+    assert [row["id"] for row in rest[:-1]] == list(range(4, 11))
+
+
+def test_csv_export_flattens_rows_and_filters_are_checked(monkeypatch):
+    rows = list(csv.reader(io.StringIO(collect(FakeSupabase(3), format="csv"))))
+    assert rows[0] == CSV_COLUMNS
+    assert rows[1][CSV_COLUMNS.index("service_name")] == "Plumbing"
+    assert rows[1][CSV_COLUMNS.index("items_total")] == "150"
+    assert rows[1][CSV_COLUMNS.index("sub_service_ids")] == "7 8"
+    assert len(rows) == 4
+
+    with pytest.raises(HTTPException):
+        BookingExport(FakeSupabase(0), ExportBookingsRequest(from_date=START, to_date=START))
+    with pytest.raises(HTTPException):
+        BookingExport(FakeSupabase(0), ExportBookingsRequest(from_date=START, to_date=START + timedelta(days=1), after_id=3))
+
+
+def test_bulk_admin_functions_need_the_admin_token(monkeypatch):
+    from fastapi.testclient import TestClient
+    from main import app
+    client = TestClient(app)
+    body = {"from_date": START.isoformat(), "to_date": (START + timedelta(days=1)).isoformat()}
+
+    monkeypatch.delenv("ADMIN_TOKEN", raising=False)
+    assert client.post("/api/funcs/admin.bookings.export", json=body).status_code == 403
+    monkeypatch.setenv("ADMIN_TOKEN", "secret")
+    assert client.post("/api/funcs/admin.bookings.export", json=body, headers={"Authorization": "Bearer guess"}).status_code == 401
+    assert client.post("/api/funcs/admin.analytics", json={}).status_code == 401
+    assert client.post("/api/funcs/admin.booking.events?booking_id=1").status_code == 401
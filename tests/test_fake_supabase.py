@@ -0,0 +1,199 @@
+import asyncio
+import httpx
+from supabase import create_async_client, AsyncClientOptions
+from benchmarks.fake_supabase import FakeSupabase, Store, seed, technician_ids, token_for, user_ids
+
+
+def run_with_client(check):
+    fake = FakeSupabase(seed(Store(), users=3, technicians=4), latency=0, jitter=0)
+
+    async def run():
+        http = httpx.AsyncClient(transport=httpx.ASGITransport(app=fake.app()))
+        sbase = await create_async_client("http://fake.local", "fake", options=AsyncClientOptions(httpx_client=http))
+        try:
+            return await check(sbase, fake)
+        finally:
+            await http.aclose()
+
+    return asyncio.run(run())
+
+
+def test_real_client_round_trips_through_the_stand_in():
+    user_id, techie_id = user_ids(1)[0], technician_ids(1)[0]
+
+    async def check(sbase, fake):
+        services = (await sbase.table("service").select("*, sub_service(*)").order("id", desc=True).execute()).data
+        assert services[0]["id"] > services[-1]["id"]
+        assert len(services[0]["sub_service"]) == 3
+
+        booking = (await sbase.table("bookings").insert({"user_id": user_id, "service_id": services[-1]["id"], "scheduled_at": "2026-01-01T10:00:00Z", "status": "pending"}).execute()).data[0]
+        await sbase.table("booking_item").insert([{"booking_id": booking["id"], "sub_service_id": s["id"], "price": s["price"]} for s in services[-1]["sub_service"]]).execute()
+        offer = (await sbase.table("assignment_request").insert({"booking_id": booking["id"], "techie_id": techie_id, "status": "pending"}).execute()).data[0]
+
+        accepted = (await sbase.rpc("accept_assignment_request", {"p_request_id": offer["id"], "p_techie_id": techie_id}).execute()).data
+        assert accepted["result"] == "accepted"
+        again = (await sbase.rpc("accept_assignment_request", {"p_request_id": offer["id"], "p_techie_id": techie_id}).execute()).data
+        assert again["result"] == "not_pending"
+
+        view = (await sbase.table("bookings").select("*, service:service_id(*), assignment:assignment_id(*, technician:techie_id(*)), booking_item(*, sub_service(*))").eq("id", booking["id"]).eq("user_id", user_id).execute()).data[0]
+        assert view["status"] == "confirmed"
+        assert view["assignment"]["technician"]["id"] == techie_id
+        assert [i["sub_service"]["id"] for i in view["booking_item"]] == [s["id"] for s in services[-1]["sub_service"]]
+
+        open_jobs = (await sbase.table("assignment").select("id").eq("techie_id", techie_id).neq("status", "completed").neq("status", "cancelled").execute()).data
+        assert open_jobs == [{"id": accepted["assignment"]["id"]}]
+
+        profiles = (await sbase.table("userprofile").select("id, push_token").in_("id", user_ids(3)).execute()).data
+        assert len(profiles) == 3
+        await sbase.table("userprofile").upsert({"id": user_id, "name": "Renamed"}).execute()
+        assert fake.store.get("userprofile", user_id)["name"] == "Renamed"
+
+        user = await sbase.auth.get_user(token_for(user_id))
+        assert user.user.id == user_id
+        session = await sbase.auth.sign_in_with_password({"email": "tech0@load.test", "password": "password"})
+        assert session.user.id == techie_id
+
+    run_with_client(check)
+
+
+def test_technician_dashboard_reads_maintained_counts():
+    from main import technician_dashboard
+    user_id, techie_id = user_ids(1)[0], technician_ids(1)[0]
+
+    async def check(sbase, fake):
+        service = (await sbase.table("service").select("*").execute()).data[0]
+        bookings = [(await sbase.table("bookings").insert({"user_id": user_id, "service_id": service["id"], "scheduled_at": "2026-01-01T10:00:00Z", "status": "pending"}).execute()).data[0] for _ in range(3)]
+        offers = [(await sbase.table("assignment_request").insert({"booking_id": b["id"], "techie_id": techie_id, "status": "pending"}).execute()).data[0] for b in bookings]
+        accepted = (await sbase.rpc("accept_assignment_request", {"p_request_id": offers[0]["id"], "p_techie_id": techie_id}).execute()).data
+        await sbase.table("assignment").update({"status": "completed"}).eq("id", accepted["assignment"]["id"]).execute()
+        await sbase.rpc("accept_assignment_request", {"p_request_id": offers[1]["id"], "p_techie_id": techie_id}).execute()
+
+        dashboard = await technician_dashboard(techie_id=techie_id, sbase=sbase)
+        assert dashboard["profile"]["id"] == techie_id
+        assert [o["id"] for o in dashboard["assignment_requests"]] == [offers[2]["id"]]
+        assert [a["booking_id"] for a in dashboard["assigned_bookings"]] == [bookings[1]["id"]]
+        assert dashboard["counts"] == {"pending_offers": 1, "active_assignments": 1, "completed_assignments": 1}
+
+    run_with_client(check)
+
+
+def test_booking_documents_follow_writes():
+    from unittest.mock import AsyncMock, patch
+    from catalog import catalog
+    from main import view_booked_services, view_booking
+    from read_model import fetch_user_bookings
+    from schema import ViewBookingRequest
+    user_id, techie_id = user_ids(1)[0], technician_ids(1)[0]
+
+    async def check(sbase, fake):
+        catalog.invalidate()
+        with patch.object(catalog, "client_factory", AsyncMock(return_value=sbase)):
+            await follow_writes(sbase, fake)
+
+    async def follow_writes(sbase, fake):
+        service = (await sbase.table("service").select("*, sub_service(*)").execute()).data[0]
+        booking = (await sbase.table("bookings").insert({"user_id": user_id, "service_id": service["id"], "scheduled_at": "2026-01-01T10:00:00Z", "status": "pending"}).execute()).data[0]
+        await sbase.table("booking_item").insert({"booking_id": booking["id"], "sub_service_id": service["sub_service"][0]["id"], "price": 50}).execute()
+        offer = (await sbase.table("assignment_request").insert({"booking_id": booking["id"], "techie_id": techie_id, "status": "pending"}).execute()).data[0]
+        await sbase.rpc("accept_assignment_request", {"p_request_id": offer["id"], "p_techie_id": techie_id}).execute()
+        await sbase.table("technician").update({"push_token": "ExponentPushToken[x]"}).eq("id", techie_id).execute()
+        untouched = fake.store.get("booking_documents", booking["id"])
+        await sbase.table("technician").update({"push_token": "ExponentPushToken[y]"}).eq("id", techie_id).execute()
+        # A push token write is not shown in documents, so it rebuilds none
+        assert fake.store.get("booking_documents", booking["id"]) is untouched
+        await sbase.table("technician").update({"name": "Renamed"}).eq("id", techie_id).execute()
+        assert fake.store.get("booking_documents", booking["id"]) is not untouched
+
+        [listed] = await view_booked_services(user_id=user_id, sbase=sbase)
+        view = await view_booking(ViewBookingRequest(user_id=user_id, booking_id=booking["id"]), user_id=user_id, sbase=sbase)
+        assert listed == view
+        # The join fallback returns the same document, assignment included
+        assert await fetch_user_bookings(sbase, user_id, documents=False) == [listed]
+        assert view["status"] == "confirmed" and view["service"]["id"] == service["id"]
+        assert view["assignment"]["technician"]["name"] == "Renamed"
+        assert [i["sub_service"]["id"] for i in view["booking_item"]] == [service["sub_service"][0]["id"]]
+        assert "service" not in fake.store.get("booking_documents", booking["id"])["doc"]
+
+        # Catalog edits rewrite no documents; reads merge the refreshed catalog
+        document = fake.store.get("booking_documents", booking["id"])
+        await sbase.table("service").update({"price": 999}).eq("id", service["id"]).execute()
+        assert fake.store.get("booking_documents", booking["id"]) is document
+        catalog.invalidate()
+        [listed] = await view_booked_services(user_id=user_id, sbase=sbase)
+        assert listed["service"]["price"] == 999 and "sub_service" not in listed["service"]
+
+        await sbase.table("bookings").delete().eq("id", booking["id"]).execute()
+        assert fake.store.table("booking_documents") == {}
+
+    run_with_client(check)
+
+
+def test_cancel_booking_fails_when_the_assignment_is_not_cancelled():
+    import pytest
+    from fastapi import HTTPException
+    from identity import IdentityMap
+    from main import cancel_booking
+    from schema import CancelBookingRequest
+    user_id, (first, second) = user_ids(1)[0], technician_ids(2)
+
+    class FailingAssignmentWrites:
+        """Passes everything through except writes to the assignment table."""
+
+        def __init__(self, sbase):
+            self.sbase = sbase
+
+        def table(self, name):
+            return self if name == "assignment" else self.sbase.table(name)
+
+        def update(self, values):
+            return self
+
+        def eq(self, column, value):
+            return self
+
+        async def execute(self):
+            raise RuntimeError("assignment write refused")
+
+    async def check(sbase, fake):
+        service = (await sbase.table("service").select("*").execute()).data[0]
+
+        async def assigned_booking():
+            booking = (await sbase.table("bookings").insert({"user_id": user_id, "service_id": service["id"], "scheduled_at": "2026-01-01T10:00:00Z", "status": "pending"}).execute()).data[0]
+            offer = (await sbase.table("assignment_request").insert({"booking_id": booking["id"], "techie_id": first, "status": "pending"}).execute()).data[0]
+            waiting = (await sbase.table("assignment_request").insert({"booking_id": booking["id"], "techie_id": second, "status": "pending"}).execute()).data[0]
+            accepted = (await sbase.rpc("accept_assignment_request", {"p_request_id": offer["id"], "p_techie_id": first}).execute()).data
+            identity = IdentityMap()
+            identity.put("assignment", accepted["assignment"])
+            return booking, waiting, accepted["assignment"], identity
+
+        booking, waiting, assignment, identity = await assigned_booking()
+        await cancel_booking(CancelBookingRequest(user_id=user_id, booking_id=booking["id"]), user_id=user_id, sbase=sbase, identity=identity)
+        assert fake.store.get("assignment", assignment["id"])["status"] == "cancelled"
+        assert fake.store.get("assignment_request", waiting["id"])["status"] == "expired"
+
+        booking, waiting, assignment, identity = await assigned_booking()
+        with pytest.raises(HTTPException) as failed:
+            await cancel_booking(CancelBookingRequest(user_id=user_id, booking_id=booking["id"]), user_id=user_id, sbase=FailingAssignmentWrites(sbase), identity=identity)
+        assert failed.value.status_code == 500
+        assert fake.store.get("assignment", assignment["id"])["status"] == "active"
+
+    run_with_client(check)
+
+
+def test_rejecting_an_offer_whose_booking_is_gone():
+    from identity import IdentityMap
+    from main import reject_assignment
+    from schema import AssignmentResponseRequest
+    user_id, techie_id = user_ids(1)[0], technician_ids(1)[0]
+
+    async def check(sbase, fake):
+        service = (await sbase.table("service").select("*").execute()).data[0]
+        booking = (await sbase.table("bookings").insert({"user_id": user_id, "service_id": service["id"], "scheduled_at": "2026-01-01T10:00:00Z", "status": "pending"}).execute()).data[0]
+        offer = (await sbase.table("assignment_request").insert({"booking_id": booking["id"], "techie_id": techie_id, "status": "pending"}).execute()).data[0]
+        await sbase.table("bookings").delete().eq("id", booking["id"]).execute()
+
+        result = await reject_assignment(AssignmentResponseRequest(request_id=offer["id"]), techie_id=techie_id, sbase=sbase, identity=IdentityMap())
+        assert result == {"message": "Assignment rejected. Re-assignment process triggered."}
+        assert fake.store.get("assignment_request", offer["id"])["status"] == "rejected"
+
+    run_with_client(check)
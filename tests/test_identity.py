@@ -0,0 +1,59 @@
+import asyncio
+from identity import IdentityMap
+from loader import loaders
+
+
+class FakeAssignments:
+    def __init__(self):
+        self.queries = 0
+
+    def table(self, name):
+        return self
+
+    def select(self, columns):
+        return self
+
+    def in_(self, column, values):
+        self._ids = list(values)
+        return self
+
+    async def execute(self):
+        self.queries += 1
+        res = type("Res", (), {})()
+        res.data = [{"id": int(i), "techie_id": "tech-1", "status": "active"} for i in self._ids]
+        return res
+
+
+def test_rows_are_loaded_once_per_request(monkeypatch):
+    db = FakeAssignments()
+
+    async def factory():
+        return db
+
+    monkeypatch.setattr(loaders["assignment"], "client_factory", factory)
+    identity = IdentityMap()
+
+    async def run():
+        first = await identity.load("assignment", 7)
+        second = await identity.load("assignment", "7")
+        return first, second
+
+    first, second = asyncio.run(run())
+    assert first is second
+    assert db.queries == 1
+    assert (identity.hits, identity.misses) == (1, 1)
+
+
+def test_writes_refresh_or_invalidate_cached_rows():
+    identity = IdentityMap()
+    identity.put("bookings", {"id": 1, "status": "pending"})
+    identity.put("bookings", {"id": 2, "status": "pending"})
+
+    identity.record_write("bookings", [{"id": 1, "status": "confirmed"}])
+    assert identity.get("bookings", 1)["status"] == "confirmed"
+    assert identity.get("bookings", 2)["status"] == "pending"
+
+    # A write that returned nothing could have touched any row
+    identity.record_write("bookings", [])
+    assert identity.get("bookings", 1) is None
+    assert identity.get("bookings", 2) is None
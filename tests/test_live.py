@@ -0,0 +1,112 @@
+import asyncio
+from fastapi import FastAPI, WebSocket
+from fastapi.testclient import TestClient
+from pubsub import EventHub
+from live import BookingSocket, run_booking_socket, publish_booking_status, user_topic, CLOSE_TOO_SLOW
+import live
+
+
+def make_client(monkeypatch) -> TestClient:
+    monkeypatch.setattr(live, "event_hub", EventHub())
+    app = FastAPI()
+
+    @app.websocket("/ws")
+    async def ws(websocket: WebSocket):
+        await websocket.accept()
+        await run_booking_socket(websocket, "u1", websocket.query_params.get("last_event_id"))
+
+    @app.post("/publish")
+    async def publish(booking: dict):
+        publish_booking_status(booking)
+
+    return TestClient(app)
+
+
+def test_socket_receives_its_users_booking_changes(monkeypatch):
+    client = make_client(monkeypatch)
+    with client.websocket_connect("/ws") as ws:
+        client.post("/publish", json={"id": 1, "user_id": "u2", "status": "confirmed"})
+        client.post("/publish", json={"id": 1, "user_id": "u1", "status": "confirmed", "assignment_id": 5})
+        frame = ws.receive_json()
+    assert frame["type"] == "bookings"
+    assert frame["changes"] == [{"id": 1, "status": "confirmed", "assignment_id": 5}]
+
+
+def test_reconnect_resumes_or_asks_for_resync(monkeypatch):
+    client = make_client(monkeypatch)
+    with client.websocket_connect("/ws") as ws:
+        client.post("/publish", json={"id": 1, "user_id": "u1", "status": "confirmed"})
+        last = ws.receive_json()["id"]
+    client.post("/publish", json={"id": 2, "user_id": "u1", "status": "cancelled"})
+
+    with client.websocket_connect(f"/ws?last_event_id={last}") as ws:
+        assert ws.receive_json()["changes"] == [{"id": 2, "status": "cancelled", "assignment_id": None}]
+    with client.websocket_connect("/ws?last_event_id=old-epoch-3") as ws:
+        assert ws.receive_json() == {"type": "resync"}
+
+
+class StuckWebSocket:
+    def __init__(self):
+        self.sent = []
+        self.closed_with = None
+
+    async def send_text(self, text):
+        self.sent.append(text)
+        await asyncio.sleep(3600)
+
+    async def close(self, code, reason=""):
+        self.closed_with = code
+
+
+def test_slow_consumer_is_coalesced_then_dropped(monkeypatch):
+    hub = EventHub()
+    monkeypatch.setattr(live, "event_hub", hub)
+    monkeypatch.setattr(live, "LIVE_MAX_PENDING", 3)
+
+    async def run():
+        websocket = StuckWebSocket()
+        socket = hub.attach(BookingSocket("u1", websocket))
+        publish_booking_status({"id": 1, "user_id": "u1", "status": "pending"})
+        await asyncio.sleep(0)
+        # The first frame is stuck; further changes to one booking collapse into one entry
+        for status in ("confirmed", "in_progress", "completed"):
+            publish_booking_status({"id": 2, "user_id": "u1", "status": status})
+        assert len(socket.pending) == 1 and socket.pending[2].data["status"] == "completed"
+
+        for booking_id in range(3, 7):
+            publish_booking_status({"id": booking_id, "user_id": "u1", "status": "pending"})
+        await asyncio.sleep(0)
+        assert socket.closed and websocket.closed_with == CLOSE_TOO_SLOW
+        # Publishing never waited on the stuck socket
+        assert hub.stats["overflowed"] >= 1
+        assert user_topic("u1") == socket.topic
+
+    asyncio.run(run())
+
+
+def test_auth_outage_closes_with_try_again_later(monkeypatch):
+    import pytest
+    from fastapi import HTTPException
+    from starlette.websockets import WebSocketDisconnect
+    from unittest.mock import AsyncMock
+    from resilience import UpstreamUnavailable, DeadlineExceeded
+    from live import CLOSE_UNAUTHORIZED
+    import main
+
+    monkeypatch.setattr(main, "get_shared_supabase", AsyncMock())
+    client = TestClient(main.app)
+
+    def close_code(error, **connect):
+        monkeypatch.setattr(main, "verify_user", AsyncMock(side_effect=error))
+        with pytest.raises(WebSocketDisconnect) as closed:
+            with client.websocket_connect("/api/funcs/user.bookingUpdates", **connect) as ws:
+                if "headers" not in connect:
+                    ws.send_json({"token": "t"})
+                ws.receive_json()
+        return closed.value.code
+
+    outage = UpstreamUnavailable(("auth", "GET"), retry_after=1.0)
+    assert close_code(outage, headers={"Authorization": "Bearer t"}) == CLOSE_TOO_SLOW
+    assert close_code(DeadlineExceeded(), headers={"Authorization": "Bearer t"}) == CLOSE_TOO_SLOW
+    assert close_code(outage) == CLOSE_TOO_SLOW
+    assert close_code(HTTPException(status_code=401)) == CLOSE_UNAUTHORIZED
@@ -0,0 +1,88 @@
+import asyncio
+import pytest
+from loader import BatchLoader
+
+
+class FakeTable:
+    def __init__(self, rows, fail=False):
+        self.rows = rows
+        self.fail = fail
+        self.queries = []
+
+    def table(self, name):
+        return self
+
+    def select(self, columns):
+        self.columns = columns
+        return self
+
+    def in_(self, column, values):
+        self.queries.append(list(values))
+        self._wanted = set(values)
+        return self
+
+    async def execute(self):
+        await asyncio.sleep(0.001)
+        if self.fail:
+            raise RuntimeError("upstream down")
+        res = type("Res", (), {})()
+        res.data = [r for r in self.rows if r["id"] in self._wanted]
+        return res
+
+
+def make_loader(db, **kwargs):
+    async def factory():
+        return db
+    return BatchLoader("userprofile", client_factory=factory, **kwargs)
+
+
+def test_concurrent_loads_become_one_in_query():
+    db = FakeTable([{"id": str(n), "push_token": f"tok-{n}"} for n in range(10)])
+    ldr = make_loader(db)
+
+    async def run():
+        return await asyncio.gather(*[ldr.load(n % 10) for n in range(100)], ldr.load("missing"))
+
+    results = asyncio.run(run())
+    assert len(db.queries) == 1
+    assert sorted(db.queries[0]) == sorted([str(n) for n in range(10)] + ["missing"])
+    assert results[3] == {"id": "3", "push_token": "tok-3"}
+    assert results[-1] is None
+    assert ldr.stats()["collapsed"] == 90
+
+
+def test_max_batch_splits_queries():
+    db = FakeTable([{"id": str(n)} for n in range(25)])
+    ldr = make_loader(db, max_batch=10)
+    asyncio.run(ldr.load_many(range(25)))
+    assert [len(q) for q in db.queries] == [10, 10, 5]
+
+
+def test_batch_failure_reaches_every_caller():
+    ldr = make_loader(FakeTable([], fail=True))
+
+    async def run():
+        return await asyncio.gather(ldr.load(1), ldr.load(2), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    with pytest.raises(RuntimeError):
+        asyncio.run(ldr.load(1))
+
+
+def test_in_flight_batches_are_held_until_they_finish():
+    db = FakeTable([{"id": "1"}])
+    ldr = make_loader(db, columns="id")
+
+    async def run():
+        pending = asyncio.ensure_future(ldr.load(1))
+        await asyncio.sleep(0)
+        ldr._dispatch()
+        held = len(ldr._tasks)
+        row = await pending
+        await asyncio.sleep(0)
+        return held, row
+
+    held, row = asyncio.run(run())
+    assert held == 1 and not ldr._tasks
+    assert row == {"id": "1"} and db.columns == "id"
@@ -0,0 +1,80 @@
+import asyncio
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from metrics import Counter, Histogram, Registry, MetricsMiddleware, MeteredTransport, classify_upstream, request_duration, responses_total, upstream_total
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = Registry()
+    hist = registry.register(Histogram("latency_seconds", "Latency.", ("route",), buckets=(0.1, 1.0)))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        hist.observe(value, "/a")
+
+    text = registry.render()
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 2' in text
+    assert 'latency_seconds_bucket{route="/a",le="1"} 3' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{route="/a"} 4' in text
+    assert 'latency_seconds_sum{route="/a"} 3.65' in text
+
+
+def test_counter_escapes_label_values():
+    counter = Counter("things_total", "Things.", ("name",))
+    counter.inc('a"b')
+    counter.inc('a"b', amount=2)
+    assert counter.render() == ['things_total{name="a\\"b"} 3']
+
+
+def test_classify_upstream_maps_postgrest_and_auth_calls():
+    base = "https://x.supabase.co"
+    assert classify_upstream(httpx.Request("GET", f"{base}/rest/v1/bookings?id=eq.1")) == ("rest", "bookings", "select")
+    assert classify_upstream(httpx.Request("PATCH", f"{base}/rest/v1/assignment")) == ("rest", "assignment", "update")
+    assert classify_upstream(httpx.Request("POST", f"{base}/rest/v1/userprofile", headers={"Prefer": "resolution=merge-duplicates"})) == ("rest", "userprofile", "upsert")
+    assert classify_upstream(httpx.Request("POST", f"{base}/rest/v1/rpc/accept_assignment_request")) == ("rest", "accept_assignment_request", "rpc")
+    assert classify_upstream(httpx.Request("GET", f"{base}/auth/v1/user")) == ("auth", "user", "get")
+
+
+def test_metered_transport_counts_upstream_calls():
+    before = upstream_total.values.get(("rest", "metrics_test", "insert", "201"), 0)
+    transport = MeteredTransport(httpx.MockTransport(lambda request: httpx.Response(201, json=[])))
+
+    async def run():
+        async with httpx.AsyncClient(transport=transport) as client:
+            await client.post("https://x.supabase.co/rest/v1/metrics_test", json={})
+
+    asyncio.run(run())
+    assert upstream_total.values[("rest", "metrics_test", "insert", "201")] == before + 1
+
+
+def test_middleware_labels_by_route_template():
+    app = FastAPI()
+    app.add_middleware(MetricsMiddleware)
+
+    @app.post("/api/metrics_test/{item}")
+    async def item(item: int):
+        return {"item": item}
+
+    client = TestClient(app)
+    client.post("/api/metrics_test/1")
+    client.post("/api/metrics_test/2")
+    client.post("/api/metrics_test/nope")
+    client.get("/api/metrics_test_missing")
+
+    assert responses_total.values[("POST", "/api/metrics_test/{item}", "200")] == 2
+    assert responses_total.values[("POST", "/api/metrics_test/{item}", "422")] == 1
+    assert ("GET", "unmatched", "404") in responses_total.values
+    assert request_duration.series[("POST", "/api/metrics_test/{item}")][-2:] != [0, 0.0]
+
+
+def test_metrics_endpoint_serves_prometheus_text(client, monkeypatch):
+    # Closed until METRICS_TOKEN is set, then only with that token
+    assert client.get("/api/metrics").status_code == 403
+    monkeypatch.setenv("METRICS_TOKEN", "scrape")
+    assert client.get("/api/metrics", headers={"Authorization": "Bearer nope"}).status_code == 401
+    response = client.get("/api/metrics", headers={"Authorization": "Bearer scrape"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE fixel_http_request_duration_seconds histogram" in response.text
+    assert 'fixel_cache_requests_total{cache="catalog",result="hit"}' in response.text
@@ -0,0 +1,105 @@
+import asyncio
+import json
+from pubsub import EventHub
+from offers import OfferStream, publish_offer, publish_offer_closed
+import offers
+
+
+def parse(chunks: list[str]) -> list[tuple]:
+    events = []
+    for chunk in chunks:
+        fields = dict(line.split(": ", 1) for line in chunk.strip().splitlines() if not line.startswith(":") and ": " in line)
+        if "event" in fields:
+            events.append((fields["event"], json.loads(fields["data"]), fields.get("id")))
+    return events
+
+
+def test_hub_replays_after_last_event_id_and_detects_gaps():
+    hub = EventHub(replay=3)
+    first = hub.publish("t", "offer", {"id": 1})
+    second = hub.publish("t", "offer", {"id": 2})
+    assert [e.data["id"] for e in hub.since("t", first.id)] == [2]
+    assert hub.since("t", second.id) == []
+    # Unknown epoch (another worker, or a restart): the client needs a snapshot
+    assert hub.since("t", "other-1") is None
+    assert hub.since("t", None) is None
+    for n in range(3, 6):
+        hub.publish("t", "offer", {"id": n})
+    # Event 2 fell out of the buffer, so resuming from 1 can no longer be served
+    assert hub.since("t", first.id) is None
+    assert [e.data["id"] for e in hub.since("t", hub._history["t"][0][0].id)] == [4, 5]
+
+
+def test_slow_subscriber_is_flagged_not_waited_on():
+    hub = EventHub(queue_size=2)
+    subscription = hub.subscribe("t")
+    for n in range(5):
+        hub.publish("t", "offer", {"id": n})
+    assert subscription.overflowed
+    assert subscription.queue.qsize() == 2
+    hub.unsubscribe(subscription)
+    assert hub.subscriber_count() == 0
+
+
+def test_stream_sends_snapshot_then_live_events_and_resumes(monkeypatch):
+    hub = EventHub()
+    monkeypatch.setattr(offers, "event_hub", hub)
+    pending = [{"id": 7, "booking_id": 70}]
+    snapshots = []
+
+    async def snapshot():
+        snapshots.append(1)
+        return list(pending)
+
+    async def collect(stream: OfferStream, last_event_id=None, publish=()):
+        await stream.open(last_event_id)
+        chunks = []
+        events = stream.events()
+        chunks.append(await events.__anext__())  # retry: directive
+        for action in publish:
+            action()
+        async for chunk in events:
+            chunks.append(chunk)
+        return parse(chunks)
+
+    async def run():
+        stream = OfferStream("tech-1", snapshot, heartbeat=0.01, max_seconds=0.05, resync=0)
+        received = await collect(stream, publish=[
+            lambda: publish_offer("tech-1", {"id": 8, "booking_id": 80}),
+            lambda: publish_offer_closed("tech-1", 7, 70, "cancelled"),
+            lambda: publish_offer("tech-2", {"id": 9, "booking_id": 90}),
+        ])
+        assert received[0][:2] == ("snapshot", pending)
+        assert [(t, d["id"]) for t, d, _ in received[1:]] == [("offer", 8), ("offer_closed", 7)]
+        assert hub.subscriber_count() == 0
+
+        # Reconnect from the first live event: only what came after it, no snapshot
+        publish_offer("tech-1", {"id": 10, "booking_id": 100})
+        resumed = await collect(OfferStream("tech-1", snapshot, heartbeat=0.01, max_seconds=0.02, resync=0), last_event_id=received[1][2])
+        assert [(t, d["id"]) for t, d, _ in resumed] == [("offer_closed", 7), ("offer", 10)]
+        assert len(snapshots) == 1
+
+    asyncio.run(run())
+
+
+def test_resync_only_sends_a_snapshot_when_offers_changed(monkeypatch):
+    hub = EventHub()
+    monkeypatch.setattr(offers, "event_hub", hub)
+    pending = [{"id": 1}]
+
+    async def snapshot():
+        return list(pending)
+
+    async def run():
+        stream = OfferStream("tech-1", snapshot, heartbeat=1, max_seconds=0.2, resync=0.05)
+        await stream.open(None)
+        chunks = []
+        async for chunk in stream.events():
+            chunks.append(chunk)
+            if len(parse(chunks)) == 1 and len(pending) == 1:
+                # An offer created on another worker shows up on the next resync
+                pending.append({"id": 2})
+        snapshots = [d for t, d, _ in parse(chunks) if t == "snapshot"]
+        assert [[o["id"] for o in s] for s in snapshots] == [[1], [1, 2]]
+
+    asyncio.run(run())
@@ -0,0 +1,95 @@
+import os
+import sys
+from textwrap import dedent
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "build"))
+from optimize import optimize_source
+
+
+def run(source: str) -> dict:
+    namespace = {}
+    exec(source, namespace)
+    return namespace
+
+
+def test_shadowed_definitions_are_removed_unless_decorated_or_read():
+    source = dedent('''
+        registered = []
+
+        def register(f):
+            registered.append(f.__name__)
+            return f
+
+        def send():
+            return "old"
+
+        @register
+        def hook():
+            return "old"
+
+        def helper():
+            return "old"
+
+        first = helper()
+
+        def send():
+            return "new"
+
+        def hook():
+            return "new"
+
+        def helper():
+            return "new"
+    ''')
+    optimized, report = optimize_source(source)
+    assert [entry.split(" ")[0] for entry in report["shadowed"]] == ["send"]
+    assert optimized.count("def send") == 1
+    # The decorator ran for the first hook, and helper was called before it was replaced
+    namespace = run(optimized)
+    assert namespace["registered"] == ["hook"]
+    assert namespace["first"] == "old"
+    assert namespace["send"]() == "new"
+
+
+def test_statements_after_return_raise_continue_break_are_stripped():
+    source = dedent('''
+        def pick(items):
+            for item in items:
+                if item < 0:
+                    continue
+                    print("skipped")
+                if item > 10:
+                    break
+                    print("stopped")
+            else:
+                raise ValueError("none")
+                print("unreachable")
+            return item
+            print("after return")
+    ''')
+    optimized, report = optimize_source(source)
+    assert report["unreachable"] == 4
+    assert "print" not in optimized
+    assert run(optimized)["pick"]([-1, 3, 12]) == 12
+
+
+def test_generators_keep_their_unreachable_yield():
+    source = dedent('''
+        def stream():
+            return
+            yield 1
+
+        def outer():
+            def inner():
+                return 1
+                print("unreachable")
+            return inner
+            yield inner
+    ''')
+    optimized, report = optimize_source(source)
+    namespace = run(optimized)
+    # Still generators, so calling them returns an iterator rather than None
+    assert list(namespace["stream"]()) == []
+    assert next(namespace["outer"](), "done") == "done"
+    # A plain function nested in a generator is still stripped
+    assert report["unreachable"] == 1 and "print" not in optimized
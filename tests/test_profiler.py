@@ -0,0 +1,60 @@
+import json
+import time
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from metrics import MeteredTransport
+from profiler import ProfilerMiddleware, sign_profile_header, verify_profile_header
+
+
+def busy_wait(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def make_app(tmp_path, **options):
+    app = FastAPI()
+    app.add_middleware(ProfilerMiddleware, output_dir=str(tmp_path), interval_ms=1, **options)
+    upstream = httpx.AsyncClient(transport=MeteredTransport(httpx.MockTransport(lambda request: httpx.Response(200, json=[]))))
+
+    @app.post("/api/funcs/slow.thing")
+    async def slow_thing():
+        await upstream.get("https://x.supabase.co/rest/v1/bookings?id=eq.1")
+        busy_wait(0.05)
+        return {"ok": True}
+
+    return TestClient(app)
+
+
+def test_sampled_request_writes_collapsed_stacks_and_timeline(tmp_path):
+    client = make_app(tmp_path, sample_rate=1.0)
+    response = client.post("/api/funcs/slow.thing")
+    profile_id = response.headers["x-fixel-profile-id"]
+
+    collapsed = next(tmp_path.glob(f"{profile_id}*.collapsed")).read_text()
+    timeline = json.loads(next(tmp_path.glob(f"{profile_id}*.json")).read_text())
+
+    assert "busy_wait" in collapsed
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed.splitlines())
+    assert timeline["route"] == "/api/funcs/slow.thing"
+    assert timeline["status"] == 200
+    assert [(u["table"], u["op"], u["status"]) for u in timeline["upstream"]] == [("bookings", "select", "200")]
+
+
+def test_profiling_is_off_by_default_and_needs_a_valid_signature(tmp_path, monkeypatch):
+    monkeypatch.delenv("PROFILE_SAMPLE_RATE", raising=False)
+    monkeypatch.delenv("PROFILE_SECRET", raising=False)
+    client = make_app(tmp_path)
+    assert "x-fixel-profile-id" not in client.post("/api/funcs/slow.thing").headers
+
+    client = make_app(tmp_path, secret="s3cret")
+    assert "x-fixel-profile-id" not in client.post("/api/funcs/slow.thing", headers={"X-Fixel-Profile": sign_profile_header("wrong")}).headers
+    assert "x-fixel-profile-id" in client.post("/api/funcs/slow.thing", headers={"X-Fixel-Profile": sign_profile_header("s3cret")}).headers
+
+
+def test_profile_header_expires():
+    value = sign_profile_header("s3cret", ttl=60, now=1000)
+    assert verify_profile_header(value, "s3cret", now=1030)
+    assert not verify_profile_header(value, "s3cret", now=1061)
+    assert not verify_profile_header(sign_profile_header("s3cret", ttl=7 * 24 * 3600, now=1000), "s3cret", now=1000)
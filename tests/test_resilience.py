@@ -0,0 +1,128 @@
+import asyncio
+import httpx
+import pytest
+from resilience import ResilientTransport, RetryBudget, CircuitBreaker, UpstreamUnavailable, DeadlineExceeded, deadline_scope, remaining_budget
+
+URL = "https://project.supabase.co/rest/v1/booking?select=*"
+
+
+class Flaky:
+    """Answers with the queued statuses in order, then 200."""
+
+    def __init__(self, *statuses, delay: float = 0.0):
+        self.statuses = list(statuses)
+        self.delay = delay
+        self.calls = 0
+
+    async def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.calls += 1
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        status = self.statuses.pop(0) if self.statuses else 200
+        if status == 0:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(status, json=[])
+
+
+def client_for(upstream: Flaky, **options) -> tuple[httpx.AsyncClient, ResilientTransport]:
+    transport = ResilientTransport(httpx.MockTransport(upstream), **options)
+    return httpx.AsyncClient(transport=transport), transport
+
+
+def test_reads_are_retried_writes_are_not():
+    async def run():
+        upstream = Flaky(503, 0)
+        client, _ = client_for(upstream)
+        assert (await client.get(URL)).status_code == 200
+        assert upstream.calls == 3
+
+        upstream = Flaky(503)
+        client, _ = client_for(upstream)
+        assert (await client.post(URL, json={})).status_code == 503
+        assert upstream.calls == 1
+
+    asyncio.run(run())
+
+
+def test_retry_budget_limits_retries():
+    async def run():
+        upstream = Flaky(503, 503, 503)
+        client, _ = client_for(upstream, budget=RetryBudget(ratio=0.1, cap=1.0))
+        # One retry in the budget; the second one is denied
+        assert (await client.get(URL)).status_code == 503
+        assert upstream.calls == 2
+
+    asyncio.run(run())
+
+
+def test_breaker_opens_fails_fast_and_recovers_with_one_probe():
+    breaker = CircuitBreaker(("rest", "booking"), failures=3, cooldown=5)
+    for _ in range(3):
+        assert breaker.allow(now=0)
+        breaker.record_failure(now=0)
+    assert breaker.state == "open"
+    assert not breaker.allow(now=1)
+    assert breaker.retry_after(now=1) == 4
+    # After the cooldown exactly one probe goes through
+    assert breaker.allow(now=6)
+    assert not breaker.allow(now=6)
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow(now=6)
+
+
+def test_open_circuit_raises_without_calling_upstream():
+    async def run():
+        upstream = Flaky(*[0] * 20)
+        client, transport = client_for(upstream, max_retries=0)
+        for _ in range(5):
+            with pytest.raises(httpx.ConnectError):
+                await client.get(URL)
+        with pytest.raises(UpstreamUnavailable):
+            await client.get(URL)
+        assert upstream.calls == 5
+        assert transport.breakers[("rest", "booking")].state == "open"
+        # Other tables keep their own breaker
+        upstream.statuses.clear()
+        assert (await client.get("https://project.supabase.co/rest/v1/service")).status_code == 200
+
+    asyncio.run(run())
+
+
+def test_deadline_bounds_calls_and_never_extends():
+    async def run():
+        upstream = Flaky(delay=1.0)
+        client, transport = client_for(upstream)
+        with deadline_scope(0.05):
+            with deadline_scope(30):
+                assert remaining_budget() <= 0.05
+            with pytest.raises(DeadlineExceeded):
+                await client.get(URL)
+        assert remaining_budget() is None
+        # Running out of budget is not the table's fault
+        assert transport.breakers[("rest", "booking")].failures == 0
+
+    asyncio.run(run())
+
+
+def test_cancelled_probe_reopens_the_circuit():
+    async def run():
+        upstream = Flaky(delay=1.0)
+        client, transport = client_for(upstream, max_retries=0)
+        breaker = transport.breakers.setdefault(("rest", "booking"), CircuitBreaker(("rest", "booking"), failures=1, cooldown=0))
+        breaker.record_failure()
+        assert breaker.state == "open"
+
+        probe = asyncio.create_task(client.get(URL))
+        await asyncio.sleep(0.01)
+        assert breaker.probing
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+        assert breaker.state == "open" and not breaker.probing
+
+        # The next call after the cooldown is a new probe, not a rejection
+        upstream.delay = 0
+        assert (await client.get(URL)).status_code == 200
+        assert breaker.state == "closed"
+
+    asyncio.run(run())
@@ -0,0 +1,53 @@
+import asyncio
+from server import server_config, resolve_workers, resolve_loop
+from lifecycle import on_worker_start, run_worker_start_hooks
+
+
+def test_server_config_from_environment(monkeypatch):
+    monkeypatch.setenv("FIXEL_WORKERS", "4")
+    monkeypatch.setenv("FIXEL_PORT", "9000")
+    monkeypatch.setenv("FIXEL_LOOP", "asyncio")
+    monkeypatch.setenv("FIXEL_HTTP", "h11")
+    monkeypatch.delenv("FIXEL_RELOAD", raising=False)
+
+    config = server_config()
+    assert config["workers"] == 4
+    assert config["port"] == 9000
+    assert config["loop"] == "asyncio"
+    assert config["http"] == "h11"
+    assert config["reload"] is False
+    # Idle WebSockets must stay cheap
+    assert config["ws_per_message_deflate"] is False
+
+
+def test_reload_forces_single_worker(monkeypatch):
+    monkeypatch.setenv("FIXEL_WORKERS", "8")
+    monkeypatch.setenv("FIXEL_RELOAD", "true")
+    assert server_config()["workers"] == 1
+
+
+def test_worker_and_loop_resolution(monkeypatch):
+    assert resolve_workers(None) == 1
+    assert resolve_workers("bogus") == 1
+    assert resolve_workers("0") == 1
+    assert resolve_workers("auto") >= 1
+
+    monkeypatch.setattr("server.find_spec", lambda name: None)
+    assert resolve_loop("auto") == "asyncio"
+
+
+def test_failing_start_hook_does_not_stop_the_others(monkeypatch):
+    monkeypatch.setattr("lifecycle._start_hooks", [])
+    calls = []
+
+    @on_worker_start
+    def broken():
+        raise RuntimeError("no network")
+
+    @on_worker_start
+    async def warm():
+        calls.append("warm")
+
+    timings = asyncio.run(run_worker_start_hooks())
+    assert calls == ["warm"]
+    assert set(timings) == {"broken", "warm"}
@@ -0,0 +1,61 @@
+import asyncio
+import pytest
+from singleflight import SingleFlight
+
+
+def test_identical_concurrent_reads_share_one_call():
+    sf = SingleFlight()
+    sf.register("technician.viewProfile", lambda techie_id: techie_id)
+    calls = []
+
+    async def fetch(techie_id):
+        calls.append(techie_id)
+        await asyncio.sleep(0.01)
+        return {"id": techie_id}
+
+    async def run():
+        return await asyncio.gather(*[sf.run("technician.viewProfile", fetch, "t1") for _ in range(50)], sf.run("technician.viewProfile", fetch, "t2"))
+
+    results = asyncio.run(run())
+    assert calls == ["t1", "t2"]
+    assert results[0] == {"id": "t1"} and results[-1] == {"id": "t2"}
+    assert sf.stats()["technician.viewProfile"] == {"calls": 51, "executions": 2, "collapsed": 49}
+
+
+def test_errors_reach_every_waiter_and_are_not_cached():
+    sf = SingleFlight()
+    sf.register("service.viewServices", lambda: "all")
+    attempts = []
+
+    async def fetch():
+        attempts.append(1)
+        await asyncio.sleep(0.01)
+        raise RuntimeError("upstream down")
+
+    async def run():
+        return await asyncio.gather(*[sf.run("service.viewServices", fetch) for _ in range(5)], return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert all(isinstance(r, RuntimeError) for r in results)
+    assert len(attempts) == 1
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(sf.run("service.viewServices", fetch))
+    assert len(attempts) == 2
+
+
+def test_disabled_endpoint_is_not_coalesced():
+    sf = SingleFlight(disabled={"service.viewServices"})
+    sf.register("service.viewServices", lambda: "all")
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0)
+        return []
+
+    async def run():
+        await asyncio.gather(*[sf.run("service.viewServices", fetch) for _ in range(3)])
+
+    asyncio.run(run())
+    assert len(calls) == 3
@@ -0,0 +1,53 @@
+import asyncio
+import pytest
+from fastapi import HTTPException
+from sync import sync_entities, encode_cursor, decode_cursor
+
+
+class FakeRpc:
+    def __init__(self, data):
+        self.data = data
+
+    async def execute(self):
+        return self
+
+
+class FakeSupabase:
+    def __init__(self):
+        self.calls = []
+
+    def rpc(self, name, params):
+        self.calls.append((name, params))
+        if params["p_since"] is None:
+            return FakeRpc({"changed": [{"id": 1}, {"id": 2}], "removed": [], "cursor": "900"})
+        return FakeRpc({"changed": [], "removed": [{"id": 2, "reason": "cancelled"}], "cursor": "950"})
+
+
+def test_first_sync_is_full_and_later_ones_are_deltas():
+    sbase = FakeSupabase()
+    first = asyncio.run(sync_entities(sbase, "user", "u1", {}))
+    assert set(first) == {"bookings", "notifications"}
+    assert first["bookings"]["full"] is True
+    assert [r["id"] for r in first["bookings"]["changed"]] == [1, 2]
+
+    cursors = {entity: result["cursor"] for entity, result in first.items()}
+    second = asyncio.run(sync_entities(sbase, "user", "u1", cursors, ["bookings"]))
+    assert list(second) == ["bookings"]
+    assert second["bookings"] == {"changed": [], "removed": [{"id": 2, "reason": "cancelled"}], "full": False, "cursor": second["bookings"]["cursor"]}
+    assert sbase.calls[-1] == ("sync_changes", {"p_entity": "bookings", "p_owner": "u1", "p_since": "900"})
+
+
+def test_bad_or_foreign_entities_and_cursors_are_rejected_before_querying():
+    sbase = FakeSupabase()
+    with pytest.raises(HTTPException) as e:
+        asyncio.run(sync_entities(sbase, "user", "u1", {}, ["booking_history"]))
+    assert e.value.status_code == 400
+    with pytest.raises(HTTPException):
+        asyncio.run(sync_entities(sbase, "technician", "t1", {"booking_history": "not-a-cursor"}))
+    assert sbase.calls == []
+
+
+def test_expired_cursor_falls_back_to_a_full_download():
+    assert decode_cursor(encode_cursor("42", now=1000), now=1060) == "42"
+    assert decode_cursor(encode_cursor("42", now=1000), now=1000 + 60 * 24 * 3600) is None
+    assert decode_cursor(None) is None
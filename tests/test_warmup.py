@@ -0,0 +1,99 @@
+import asyncio
+import time
+from unittest.mock import AsyncMock, MagicMock
+from catalog import CatalogCache
+from warmup import WarmUp
+
+
+def fake_client(rows):
+    sbase = MagicMock()
+    sbase.table.return_value.select.return_value.order.return_value.execute = AsyncMock(return_value=MagicMock(data=rows))
+    return sbase
+
+
+def test_catalog_cache_serves_from_memory_until_invalidated():
+    sbase = fake_client([{"id": 1, "sub_service": []}])
+    cache = CatalogCache(ttl=60, client_factory=AsyncMock(return_value=sbase))
+
+    async def run():
+        first = await asyncio.gather(*[cache.get() for _ in range(20)])
+        again = await cache.get()
+        cache.invalidate()
+        await cache.get()
+        return first, again
+
+    first, again = asyncio.run(run())
+    assert all(rows == [{"id": 1, "sub_service": []}] for rows in first)
+    assert again == first[0]
+    # One query for the burst, one after invalidation
+    assert sbase.table.return_value.select.return_value.order.return_value.execute.await_count == 2
+    assert cache.stats()["hits"] == 1
+
+
+def test_catalog_cache_expires_after_ttl():
+    sbase = fake_client([])
+    cache = CatalogCache(ttl=60, client_factory=AsyncMock(return_value=sbase))
+    asyncio.run(cache.get())
+    cache._loaded_at = time.monotonic() - 61
+    assert not cache.fresh()
+    asyncio.run(cache.get())
+    assert sbase.table.return_value.select.return_value.order.return_value.execute.await_count == 2
+
+
+def test_missing_catalog_ids_reload_at_most_once_per_interval():
+    from unittest.mock import patch
+    import read_model
+    sbase = fake_client([{"id": 1, "sub_service": [{"id": 10}]}])
+    execute = sbase.table.return_value.select.return_value.order.return_value.execute
+    cache = CatalogCache(ttl=60, client_factory=AsyncMock(return_value=sbase))
+    deleted = {"service_id": 2, "booking_item": [{"sub_service_id": 20}]}
+
+    async def read():
+        return await read_model.with_catalog([dict(deleted, booking_item=[dict(i) for i in deleted["booking_item"]])])
+
+    with patch.object(read_model, "catalog", cache):
+        [doc] = asyncio.run(read())
+        # Loaded once; a fresh copy is not reloaded for ids that stay missing
+        assert execute.await_count == 1
+        for _ in range(5):
+            [doc] = asyncio.run(read())
+        assert execute.await_count == 1
+        assert doc["service"] is None and doc["booking_item"][0]["sub_service"] is None
+        cache._loaded_at = time.monotonic() - read_model.CATALOG_MISS_RELOAD
+        asyncio.run(read())
+        assert execute.await_count == 2
+
+
+def test_warm_up_runs_steps_once_and_reports_failures():
+    warm = WarmUp()
+    calls = []
+
+    @warm.step
+    async def client():
+        calls.append("client")
+
+    @warm.step
+    async def broken():
+        await asyncio.sleep(0)
+        calls.append("broken")
+        if calls.count("broken") == 1:
+            raise RuntimeError("no network")
+
+    async def run():
+        return await asyncio.gather(warm.run(), warm.run(), warm.run())
+
+    reports = asyncio.run(run())
+    assert calls == ["client", "broken"]
+    assert reports[0]["ready"] is False and reports[0]["warmed_at"] is None
+    assert reports[0]["errors"] == {"broken": "no network"}
+    assert set(reports[0]["timings_ms"]) == {"client", "broken"}
+
+    # The next run retries only the failed step
+    report = asyncio.run(warm.run())
+    assert calls == ["client", "broken", "broken"]
+    assert report["ready"] is True and report["errors"] == {} and report["warmed_at"] is not None
+    asyncio.run(warm.run())
+    assert len(calls) == 3
+
+    asyncio.run(warm.run(force=True))
+    assert calls == ["client", "broken", "broken", "client", "broken"]
@@ -1,8 +1,11 @@
+import hmac
 import os
-from email.message import EmailMessage
 from fastapi import Header, HTTPException, Depends
 from db import get_supabase, AsyncClient
 from typing import Optional
+from singleflight import flight
+from loader import userprofile_exists_loader, technician_exists_loader
+from resilience import UpstreamUnavailable, DeadlineExceeded
 
 def send_email(to_email: str, subject: str, content: str):
     # Email logic mocked for now as per request
@@ -76,6 +79,17 @@ def send_push_notification(token: str, title: str, message: str, data: Optional[
     else:
         print(f"Push Notification sent to {token}: {title} - {message}")
 
+def verify_admin(authorization: Optional[str] = Header(None)):
+    """
+    Guards the bulk admin functions (import, export, analytics, event history)
+    with `Authorization: Bearer <ADMIN_TOKEN>`. Without ADMIN_TOKEN they are off.
+    """
+    token = os.environ.get("ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=403, detail="Admin functions are disabled")
+    if not authorization or not hmac.compare_digest(authorization, f"Bearer {token}"):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
 async def verify_user(
     authorization: Optional[str] = Header(None), 
     sbase: AsyncClient = Depends(get_supabase)
@@ -91,19 +105,24 @@ async def verify_user(
     
     try:
         # 1. Verify Token with Supabase Auth
-        user_res = await sbase.auth.get_user(token)
+        # Identical concurrent checks (same token / same user) share one call
+        user_res = await flight.run("auth.getUser", sbase.auth.get_user, token)
         if not user_res.user:
              raise HTTPException(status_code=401, detail="Invalid Token")
         
         user_id = user_res.user.id
         
         # 2. Verify User Profile exists
-        profile_res = await sbase.table("userprofile").select("id").eq("id", user_id).execute()
-        if not profile_res.data:
+        # Batched with every other role check in flight; selects only the id (see loader.py)
+        profile = await userprofile_exists_loader.load(user_id)
+        if not profile:
             raise HTTPException(status_code=403, detail="User profile not found. Please register.")
             
         return user_id
 
+    except (UpstreamUnavailable, DeadlineExceeded):
+        # Supabase is down or slow, not the caller's credentials: 503/504 (see main.py)
+        raise
     except Exception as e:
         print(f"Auth Error: {e}")
         raise HTTPException(status_code=401, detail="Authentication Failed")
@@ -123,7 +142,8 @@ async def verify_technician(
     
     try:
         # 1. Verify Token with Supabase Auth
-        user_res = await sbase.auth.get_user(token)
+        # Identical concurrent checks (same token / same user) share one call
+        user_res = await flight.run("auth.getUser", sbase.auth.get_user, token)
         if not user_res.user:
              raise HTTPException(status_code=401, detail="Invalid Token")
         
@@ -131,12 +151,15 @@ async def verify_technician(
         
         # 2. Verify Technician exists
         # Note: We assume the 'id' in technician table matches the Supabase Auth ID (UUID)
-        tech_res = await sbase.table("technician").select("id").eq("id", user_id).execute()
-        if not tech_res.data:
+        technician = await technician_exists_loader.load(user_id)
+        if not technician:
             raise HTTPException(status_code=403, detail="Technician profile not found.")
             
         return user_id
 
+    except (UpstreamUnavailable, DeadlineExceeded):
+        # Supabase is down or slow, not the caller's credentials: 503/504 (see main.py)
+        raise
     except Exception as e:
         print(f"Auth Error: {e}")
         raise HTTPException(status_code=401, detail="Authentication Failed")
@@ -149,9 +172,10 @@ def send_push_notification(token: str, title: str, message: str, data: Optional[
         DeviceNotRegisteredError,
     )
 
+    # Returns the outcome ("sent", "no_token", "server_error", ...) for the push metrics
     if not token:
         print("No push token provided.")
-        return
+        return "no_token"
 
     try:
         # Check for access token in env (optional, for enhanced security)
@@ -165,14 +189,19 @@ def send_push_notification(token: str, title: str, message: str, data: Optional[
         )
     except PushServerError as exc:
         print(f"Push Server Error: {exc.errors}")
+        return "server_error"
     except (ConnectionError, ValueError) as exc:
         print(f"Push Connection/Value Error: {exc}")
+        return "connection_error"
 
     try:
         response.validate_response()
     except DeviceNotRegisteredError:
         print(f"Device not registered: {token}")
+        return "device_not_registered"
     except Exception as exc:
         print(f"Push Notification Error: {exc}")
+        return "error"
     else:
         print(f"Push Notification sent to {token}: {title} - {message}")
+        return "sent"
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import time
+from typing import Any, Callable, Optional
+from pydantic import TypeAdapter
+from models import BookingRead, ServiceRead
+from db import get_shared_supabase
+from catalog import catalog
+from lifecycle import on_worker_start
+
+
+class WarmUp:
+    """
+    Eager per-instance initialization.
+
+    Steps run in registration order from the worker start hook and again (if
+    they never ran, e.g. the platform skipped the ASGI lifespan) from the first
+    /api/warm call. A failing step is reported but does not stop the others;
+    the next run retries only the steps that failed, and the instance counts as
+    warmed once every step has succeeded.
+    """
+
+    def __init__(self):
+        self._steps: list[tuple[str, Callable[[], Any]]] = []
+        self._timings: dict[str, float] = {}
+        self._errors: dict[str, str] = {}
+        self._done: set[str] = set()
+        self._runs = 0
+        self._finished_at: Optional[float] = None
+        self._started = time.time()
+        self._lock = asyncio.Lock()
+
+    def step(self, fn: Callable[[], Any]) -> Callable[[], Any]:
+        self._steps.append((fn.__name__, fn))
+        return fn
+
+    @property
+    def ready(self) -> bool:
+        return self._finished_at is not None and not self._errors
+
+    async def run(self, force: bool = False) -> dict:
+        runs = self._runs
+        async with self._lock:
+            # Concurrent callers wait for the run in progress instead of repeating it
+            if not force and (self._finished_at is not None or self._runs != runs):
+                return self.status()
+
+            if force:
+                self._done, self._timings = set(), {}
+            for name, fn in self._steps:
+                if name in self._done:
+                    continue
+                started = time.perf_counter()
+                try:
+                    await fn()
+                    self._done.add(name)
+                    self._errors.pop(name, None)
+                except Exception as e:
+                    print(f"Warm-up step {name} failed: {e}")
+                    self._errors[name] = str(e)
+                self._timings[name] = round((time.perf_counter() - started) * 1000, 2)
+            self._runs += 1
+            if not self._errors:
+                self._finished_at = time.time()
+            return self.status()
+
+    def status(self) -> dict:
+        return {
+            "ready": self.ready,
+            "pid": os.getpid(),
+            "uptime_s": round(time.time() - self._started, 1),
+            "warmed_at": self._finished_at,
+            "timings_ms": dict(self._timings),
+            "errors": dict(self._errors),
+        }
+
+
+warmup = WarmUp()
+
+
+@warmup.step
+async def supabase_client():
+    await get_shared_supabase()
+
+
+@warmup.step
+async def pydantic_adapters():
+    # Validating a minimal row forces pydantic-core to finish building the
+    # validators for the nested read models, not just the outer ones.
+    TypeAdapter(list[BookingRead]).validate_python([{"id": 0, "created_at": "2026-01-01T00:00:00Z", "user_id": "00000000-0000-0000-0000-000000000000", "service_id": 0, "scheduled_at": "2026-01-01T00:00:00Z", "booking_item": []}])
+    TypeAdapter(list[ServiceRead]).validate_python([{"id": 0, "created_at": "2026-01-01T00:00:00Z", "name": "", "price": 0, "sub_service": []}])
+
+
+@warmup.step
+async def catalog_cache():
+    await catalog.get()
+
+
+@on_worker_start
+async def warm_up_worker():
+    await warmup.run()